@@ -0,0 +1,478 @@
+"""
+Benchmark inference pipelines across a matrix of parameters.
+
+Every combination of input, resolution, model, inference skip and queue profile is run headless
+with gst-launch-1.0, and its frame rate, CPU usage, peak memory and wall time are recorded to
+JSON/CSV. Results can be compared against a stored baseline. SyNAP elements can be replaced by
+a stand-in element to run the sweep on machines without an NPU.
+"""
+
+from datetime import datetime
+from itertools import product
+from threading import Event, Thread
+from typing import Any, NamedTuple, Optional
+import argparse
+import asyncio
+import csv
+import json
+import os
+import platform
+import re
+import resource
+import sys
+import time
+
+from gst.pipeline import GstPipeline, GstPipelineGenerator
+from gst.queues import QUEUE_PROFILES
+from utils.common import CODECS, CAM_FRAMERATE, InputType, SinkType
+from utils.model_info import get_model_input_dims
+from utils.probe import probe_container
+from utils.user_input import validate_inp_dims
+
+# input name that selects the `videotestsrc` test pattern instead of a clip
+TEST_INPUT = "test"
+
+# inference size used with a stand-in element when the model can't be read
+DEFAULT_INF_DIMS = (640, 384)
+
+# seconds a stopped run has to finish before it is killed
+KILL_TIMEOUT = 5
+
+# seconds between two reads of the peak memory of a running pipeline
+RSS_POLL_INTERVAL = 0.1
+
+_FPS_RE = re.compile(
+    r"last-message = rendered: (\d+), dropped: (\d+), current: ([\d.]+), average: ([\d.]+)"
+)
+
+
+class BenchmarkCase(NamedTuple):
+    """One point of the parameter matrix"""
+
+    input: str
+    codec: str
+    width: Optional[int]
+    height: Optional[int]
+    model: str
+    inf_skip: int
+    queue_profile: str
+
+    @property
+    def key(self) -> str:
+        """Identifies the case in results and baselines"""
+        return "|".join(str(v) for v in self)
+
+    def __str__(self) -> str:
+        res = f"{self.width}x{self.height}" if self.width and self.height else "native"
+        return (
+            f"{os.path.basename(self.input)} ({self.codec}, {res}) "
+            f"model={os.path.basename(self.model)} skip={self.inf_skip} queues={self.queue_profile}"
+        )
+
+
+class BenchmarkPipelineGenerator(GstPipelineGenerator):
+    """
+    Generates benchmark pipelines.
+
+    The overlaid output goes to an unsynchronized `fpsdisplaysink` whose measurements are
+    read from `gst-launch-1.0 -v`. With a stand-in element, `synapinfer` is replaced by it,
+    `synapoverlay` by `overlay_stand_in` and the inference results are discarded.
+    """
+
+    def __init__(
+        self,
+        gst_params: dict[str, Any],
+        stand_in: Optional[str] = None,
+        overlay_stand_in: str = "identity",
+        num_buffers: int = 300,
+    ) -> None:
+        super().__init__({**gst_params, "sink": SinkType.FAKESINK})
+        self._num_buffers: int = num_buffers
+        if stand_in:
+            self._infer_elems = [
+                *self._infer_elems[:-2],
+                [*stand_in.split(), "name=infer"],
+                ["fakesink", "sync=false"],
+            ]
+            self._overlay_elems = [
+                *self._overlay_elems[:-1],
+                [*overlay_stand_in.split(), "name=overlay"],
+            ]
+
+    def _processing_elems(self) -> list[str, list[str]]:
+        return [
+            *self._rate_elems(),
+            *self._splitter_elems,
+            *self._infer_elems,
+            *self._overlay_elems,
+            ["fpsdisplaysink", "name=bench", "text-overlay=false", "video-sink=fakesink", "sync=false"],
+        ]
+
+    def make_test_pipeline(self, inp_w: int, inp_h: int) -> None:
+        self._pipeline.reset()
+        self._pipeline.add_elements(
+            ["videotestsrc", f"num-buffers={self._num_buffers}"],
+            f"video/x-raw,format=YUY2,width={inp_w},height={inp_h},framerate={CAM_FRAMERATE}/1",
+            *self._processing_elems(),
+        )
+        self._finish_pipeline((inp_w, inp_h), CAM_FRAMERATE)
+
+    def make_pipeline(self) -> None:
+        if self._inp_src == TEST_INPUT:
+            self.make_test_pipeline(self._inp_w, self._inp_h)
+        else:
+            super().make_pipeline()
+
+    def _live_source(self) -> bool:
+        # the test pattern stands in for a camera, so the queue profile's frame rate cap applies
+        return self._inp_src == TEST_INPUT or super()._live_source()
+
+
+class ProcessUsage:
+    """
+    Measures the `gst-launch-1.0` process of a run, installed as a spawn handler.
+
+    CPU time is the growth of the resource usage of this process's reaped children, runs
+    are sequential so it is the usage of the run's process. Its peak RSS is the VmHWM
+    high-water mark, polled from /proc while the process runs.
+    """
+
+    def __init__(self) -> None:
+        self._start: Optional[resource.struct_rusage] = None
+        self._peak_kib: int = 0
+        self._done = Event()
+        self._poller: Optional[Thread] = None
+
+    def on_spawn(self, pid: int) -> None:
+        self._start = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self._poller = Thread(target=self._poll, args=(pid,), daemon=True)
+        self._poller.start()
+
+    def _poll(self, pid: int) -> None:
+        while True:
+            try:
+                with open(f"/proc/{pid}/status") as f:
+                    hwm = [line for line in f if line.startswith("VmHWM:")]
+            except OSError:
+                return
+            # exited processes have no memory left to report
+            if not hwm:
+                return
+            self._peak_kib = max(self._peak_kib, int(hwm[0].split()[1]))
+            if self._done.wait(RSS_POLL_INTERVAL):
+                return
+
+    def finish(self) -> tuple[Optional[float], Optional[float]]:
+        """
+        Stops polling once the process has been reaped.
+
+        Returns:
+            tuple[float, float]: CPU seconds and peak RSS in MiB, None if the process wasn't spawned
+        """
+        self._done.set()
+        if not self._start:
+            return None, None
+        self._poller.join()
+        end = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu = end.ru_utime - self._start.ru_utime + end.ru_stime - self._start.ru_stime
+        return cpu, self._peak_kib / 1024
+
+
+def run_pipeline(pipeline: GstPipeline, timeout: float) -> dict[str, Any]:
+    """
+    Runs a pipeline with `gst-launch-1.0` and measures it.
+
+    The run is stopped with an EOS after `timeout` seconds, so the measurements of long
+    clips cover only the first part of the clip.
+
+    Returns:
+        dict: status, wall time, CPU usage, peak RSS and the fpsdisplaysink measurements
+    """
+    fps_stats: Optional[tuple[str, ...]] = None
+
+    def on_line(stream: str, line: str) -> None:
+        nonlocal fps_stats
+        if stream == "stdout" and (m := _FPS_RE.search(line)):
+            fps_stats = m.groups()
+
+    usage = ProcessUsage()
+    pipeline.add_launch_options("-v")
+    pipeline.add_line_handler(on_line)
+    pipeline.add_spawn_handler(usage.on_spawn)
+    start = time.perf_counter()
+    try:
+        ok = asyncio.run(
+            asyncio.wait_for(pipeline.run_async(print_err=False, eos_timeout=KILL_TIMEOUT), timeout)
+        )
+    except asyncio.TimeoutError:
+        ok = True
+    finally:
+        cpu, peak_rss = usage.finish()
+    wall = time.perf_counter() - start
+    if not ok:
+        result = "failed"
+    else:
+        result = "timeout" if pipeline.interrupted else "ok"
+    return {
+        "status": result,
+        "error": (pipeline.error or "").strip()[-500:] if result == "failed" else "",
+        "fps": float(fps_stats[3]) if fps_stats else None,
+        "rendered": int(fps_stats[0]) if fps_stats else None,
+        "dropped": int(fps_stats[1]) if fps_stats else None,
+        "cpu_pct": round(cpu / wall * 100, 1) if cpu is not None and wall else None,
+        "peak_rss_mb": round(peak_rss, 1) if peak_rss is not None else None,
+        "wall_s": round(wall, 3),
+    }
+
+
+def make_cases(args: argparse.Namespace) -> list[BenchmarkCase]:
+    """
+    Expands the command line options into the parameter matrix.
+
+    Clips are run at their own resolution, the test pattern at every requested resolution.
+    """
+    inputs: list[tuple[str, str, Optional[int], Optional[int]]] = []
+    for inp in args.input:
+        if inp == TEST_INPUT:
+            for dims in args.resolutions:
+                w, h = (int(d) for d in dims.split("x"))
+                inputs.append((inp, "raw", w, h))
+            continue
+        probe = probe_container(inp)
+        if not probe or probe.codec not in CODECS:
+            print(f"\nSkipping {inp}: unsupported container or codec\n")
+            continue
+        inputs.append((inp, probe.codec, probe.width, probe.height))
+    return [
+        BenchmarkCase(*inp, model, skip, profile)
+        for inp, model, skip, profile in product(
+            inputs, args.models, args.inference_skip, args.queue_profiles
+        )
+    ]
+
+
+def run_case(case: BenchmarkCase, args: argparse.Namespace) -> Optional[dict[str, Any]]:
+    """
+    Builds and measures the pipeline of a single case.
+
+    Returns None if the model can't be used.
+    """
+    inf_dims = get_model_input_dims(case.model) if not args.stand_in or os.path.exists(case.model) else None
+    if not inf_dims:
+        if not args.stand_in:
+            return None
+        inf_dims = DEFAULT_INF_DIMS
+    gen = BenchmarkPipelineGenerator(
+        {
+            "inp_type": InputType.FILE,
+            "inp_src": case.input,
+            "inp_w": case.width,
+            "inp_h": case.height,
+            "inp_codec": case.codec,
+            "codec_elems": CODECS.get(case.codec),
+            "inf_model": case.model,
+            "inf_w": inf_dims[0],
+            "inf_h": inf_dims[1],
+            "inf_skip": case.inf_skip,
+            "inf_max": 5,
+            "inf_thresh": 0.5,
+            "inf_labels": args.labels,
+            "fullscreen": False,
+            "queue_profile": case.queue_profile,
+            "max_fps": args.max_fps,
+        },
+        stand_in=args.stand_in,
+        overlay_stand_in=args.overlay_stand_in,
+        num_buffers=args.num_buffers,
+    )
+    gen.make_pipeline()
+    return {**case._asdict(), "key": case.key, **run_pipeline(gen.pipeline, args.timeout)}
+
+
+def write_results(results: list[dict[str, Any]], meta: dict[str, Any], json_path: str, csv_path: Optional[str]) -> None:
+    with open(json_path, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+    print(f"Results written to {json_path}")
+    if csv_path and results:
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+        print(f"Results written to {csv_path}")
+
+
+def compare_baseline(results: list[dict[str, Any]], baseline_path: str, tolerance: float) -> bool:
+    """
+    Prints the fps and peak memory of each case next to its baseline.
+
+    Returns:
+        bool: False if the fps of any case dropped by more than `tolerance` (a fraction)
+    """
+    with open(baseline_path, "r") as f:
+        baseline: dict[str, dict[str, Any]] = {r["key"]: r for r in json.load(f)["results"]}
+    passed = True
+    print(f"\nComparison against {baseline_path}:")
+    for res in results:
+        if not (base := baseline.get(res["key"])):
+            print(f"  {BenchmarkCase(*(res[f] for f in BenchmarkCase._fields))}: no baseline")
+            continue
+        line = f"  {BenchmarkCase(*(res[f] for f in BenchmarkCase._fields))}:"
+        if res["fps"] and base.get("fps"):
+            delta = (res["fps"] - base["fps"]) / base["fps"]
+            line += f" {base['fps']:.1f} -> {res['fps']:.1f} fps ({delta:+.1%})"
+            if delta < -tolerance:
+                line += " REGRESSION"
+                passed = False
+        if base.get("peak_rss_mb") and res["peak_rss_mb"] is not None:
+            line += f", {base['peak_rss_mb']:.1f} -> {res['peak_rss_mb']:.1f} MiB"
+        print(line)
+    return passed
+
+
+def main(args: argparse.Namespace) -> None:
+    cases = make_cases(args)
+    if not cases:
+        sys.exit("No benchmark cases to run")
+    meta: dict[str, Any] = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "host": platform.node(),
+        "machine": platform.machine(),
+        "stand_in": args.stand_in,
+        "num_buffers": args.num_buffers,
+        "timeout": args.timeout,
+    }
+    results: list[dict[str, Any]] = []
+    try:
+        for i, case in enumerate(cases, 1):
+            print(f"[{i}/{len(cases)}] {case} ...", end=" ", flush=True)
+            if not (res := run_case(case, args)):
+                print("skipped")
+                continue
+            results.append(res)
+            if res["status"] == "failed":
+                print(f"failed\n{res['error']}")
+                continue
+            fps = f"{res['fps']:.1f} fps" if res["fps"] is not None else "no fps"
+            print(f"{fps}, {res['cpu_pct']}% CPU, {res['peak_rss_mb']} MiB, {res['wall_s']:.1f}s")
+    except KeyboardInterrupt:
+        print("\nInterrupted, saving completed runs...")
+    write_results(results, meta, args.output, args.csv)
+    if args.baseline and not compare_baseline(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "-i", "--input",
+        type=str,
+        nargs="+",
+        default=[TEST_INPUT],
+        metavar="SRC",
+        help=f'Video clips and/or "{TEST_INPUT}" for a test pattern (default: %(default)s)',
+    )
+    parser.add_argument(
+        "-r", "--resolutions",
+        type=validate_inp_dims,
+        nargs="+",
+        default=["640x480", "1920x1080"],
+        metavar="WIDTHxHEIGHT",
+        help="Test pattern resolutions (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-m", "--models",
+        type=str,
+        nargs="+",
+        default=["/usr/share/synap/models/object_detection/coco/model/yolov8s-640x384/model.synap"],
+        metavar="FILE",
+        help="SyNAP models (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-s", "--inference_skip",
+        type=int,
+        nargs="+",
+        default=[0, 1],
+        metavar="N_FRAMES",
+        help="Inference skip values (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-q", "--queue_profiles",
+        type=str.lower,
+        nargs="+",
+        choices=list(QUEUE_PROFILES),
+        default=["max-throughput"],
+        metavar="PROFILE",
+        help="Queue profiles (default: %(default)s)",
+    )
+    # The test pattern stands in for a camera and gets the queue profile's cap on live sources.
+    parser.add_argument(
+        "--max_fps",
+        type=int,
+        metavar="FPS",
+        help="Source frame rate cap, 0 disables the queue profile's cap on the test pattern",
+    )
+    parser.add_argument(
+        "-l", "--labels",
+        type=str,
+        default="/usr/share/synap/models/object_detection/coco/info.json",
+        metavar="JSON",
+        help="Class labels for the overlay (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--num_buffers",
+        type=int,
+        default=300,
+        help="Frames generated by the test pattern (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=60,
+        metavar="SECONDS",
+        help="Stop each run after this long (default: %(default)s)",
+    )
+
+    # Stand-ins make the sweep runnable without SyNAP, e.g. --stand_in "identity sleep-time=20000"
+    # emulates a 20 ms inference.
+    parser.add_argument(
+        "--stand_in",
+        type=str,
+        metavar="ELEMENT",
+        help="Element (with properties) that replaces synapinfer",
+    )
+    parser.add_argument(
+        "--overlay_stand_in",
+        type=str,
+        default="identity",
+        metavar="ELEMENT",
+        help="Element that replaces synapoverlay when --stand_in is set (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "-o", "--output",
+        type=str,
+        default="benchmark_results.json",
+        metavar="JSON",
+        help="Results file (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--csv",
+        type=str,
+        metavar="CSV",
+        help="Also write results as CSV",
+    )
+    parser.add_argument(
+        "-b", "--baseline",
+        type=str,
+        metavar="JSON",
+        help="Results file of an earlier run to compare against",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.05,
+        help="Fps drop relative to the baseline that counts as a regression (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,209 @@
+"""
+Benchmark the box tracker on a synthetic scene.
+
+Boxes bounce around the frame at constant speeds and are "detected" with some jitter every
+inference interval. For every interval, the time the tracker takes per detector result and
+per frame is recorded, together with how well the predicted boxes follow the objects
+compared with holding the last detections, and how often a track ID switched objects.
+Runs on the CPU without GStreamer or SyNAP.
+"""
+
+from typing import Any, NamedTuple
+import argparse
+import json
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from gst.timing import StageTimer
+from gst.tracker import BoxTracker, encode_tracks, iou_matrix
+from utils.user_input import validate_inp_dims
+
+
+class TrackerResult(NamedTuple):
+    """Measurements of one inference interval"""
+
+    interval: int
+    boxes: int
+    update: dict[str, float]
+    predict: dict[str, float]
+    frame_ms: float
+    tracked_iou: float
+    held_iou: float
+    id_switches: int
+    tracks_created: int
+
+    def __str__(self) -> str:
+        return (
+            f"interval {self.interval:>2}: {self.frame_ms:.3f} ms per frame "
+            f"(update {self.update['mean_ms']:.3f} ms mean / {self.update['p95_ms']:.3f} ms p95 per result, "
+            f"predict {self.predict['mean_ms']:.3f} ms mean / {self.predict['p95_ms']:.3f} ms p95 per frame), "
+            f"IoU {self.tracked_iou:.3f} tracked vs {self.held_iou:.3f} held, "
+            f"{self.id_switches} ID switches, {self.tracks_created} tracks for {self.boxes} objects"
+        )
+
+
+class Scene:
+    """
+    Boxes moving at constant speeds, bouncing off the edges of the frame.
+
+    Args:
+        n_boxes (int): number of objects
+        width (int): frame width
+        height (int): frame height
+        max_speed (float): maximum speed in pixels per second along each axis
+        seed (int): random seed
+    """
+
+    def __init__(self, n_boxes: int, width: int, height: int, max_speed: float, seed: int) -> None:
+        rng = np.random.default_rng(seed)
+        self.sizes = rng.uniform(0.03, 0.08, (n_boxes, 2)) * (width, height)
+        self._span = np.array([width, height]) - self.sizes
+        self._start = rng.uniform(0, 1, (n_boxes, 2)) * self._span
+        self._speed = rng.uniform(-max_speed, max_speed, (n_boxes, 2))
+
+    def boxes(self, t: float) -> "np.ndarray":
+        """Returns the boxes at `t` seconds, as rows of origin x, origin y, width and height"""
+        pos = (self._start + self._speed * t) % (2 * self._span)
+        return np.concatenate([np.where(pos > self._span, 2 * self._span - pos, pos), self.sizes], axis=1)
+
+
+def run_interval(args: argparse.Namespace, width: int, height: int, interval: int) -> TrackerResult:
+    scene = Scene(args.boxes, width, height, args.max_speed, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    tracker = BoxTracker(args.iou_threshold, bounds=(width, height))
+    timers = {"update": StageTimer(), "predict": StageTimer()}
+    classes = np.zeros(args.boxes, dtype=np.int64)
+    scores = np.ones(args.boxes)
+    held = scene.boxes(0)
+    track_of: dict[int, int] = {}
+    switches = 0
+    tracked_iou: list[float] = []
+    held_iou: list[float] = []
+    total = 0.0
+    for frame in range(args.frames):
+        t = frame / args.fps
+        truth = scene.boxes(t)
+        if frame % interval == 0:
+            jitter = rng.normal(0, args.jitter, (args.boxes, 2))
+            held = truth + np.concatenate([jitter, np.zeros((args.boxes, 2))], axis=1)
+            items = [{"class_index": 0, "confidence": 1.0} for _ in range(args.boxes)]
+            start = time.perf_counter()
+            ids = tracker.update(t, held, classes, scores, items)
+            elapsed = time.perf_counter() - start
+            timers["update"].record(elapsed)
+            total += elapsed
+            for obj, track_id in enumerate(ids.tolist()):
+                switches += obj in track_of and track_of[obj] != track_id
+                track_of[obj] = track_id
+        start = time.perf_counter()
+        tracks = tracker.predict(t)
+        encode_tracks(tracks)
+        elapsed = time.perf_counter() - start
+        timers["predict"].record(elapsed)
+        total += elapsed
+        if len(tracks):
+            tracked_iou.append(float(np.mean(iou_matrix(truth, tracks.boxes).max(axis=1))))
+        held_iou.append(float(np.mean(np.diag(iou_matrix(truth, held)))))
+    return TrackerResult(
+        interval,
+        args.boxes,
+        timers["update"].stats,
+        timers["predict"].stats,
+        total / args.frames * 1000,
+        float(np.mean(tracked_iou)) if tracked_iou else 0.0,
+        float(np.mean(held_iou)),
+        switches,
+        tracker.next_id - 1,
+    )
+
+
+def main(args: argparse.Namespace) -> None:
+    if np is None:
+        raise SystemExit("Fatal: NumPy is required for the tracker benchmark")
+    width, height = [int(d) for d in args.resolution.split("x")]
+    results: list[dict[str, Any]] = []
+    print(f"\n{args.boxes} boxes, {args.frames} frames at {args.fps} fps, {width}x{height}\n")
+    for interval in args.intervals:
+        result = run_interval(args, width, height, max(1, interval))
+        print(result)
+        results.append(result._asdict())
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "-n", "--boxes",
+        type=int,
+        default=100,
+        help="Objects in the scene (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-s", "--intervals",
+        type=int,
+        nargs="+",
+        default=[1, 4, 8],
+        metavar="N_FRAMES",
+        help="Inference intervals to run (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-r", "--resolution",
+        type=validate_inp_dims,
+        default="640x384",
+        metavar="WxH",
+        help="Detector input size the boxes move in (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--frames",
+        type=int,
+        default=900,
+        help="Frames per interval (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--fps",
+        type=float,
+        default=30.0,
+        help="Frame rate (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max_speed",
+        type=float,
+        default=60.0,
+        metavar="PIXELS",
+        help="Maximum speed of the objects along each axis, in pixels per second (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=1.0,
+        metavar="PIXELS",
+        help="Standard deviation of the detected box positions (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--iou_threshold",
+        type=float,
+        default=0.3,
+        help="Tracker association threshold (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Random seed of the scene (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-o", "--output",
+        type=str,
+        metavar="JSON",
+        help="Also write results as JSON",
+    )
+    args = parser.parse_args()
+
+    main(args)
@@ -4,17 +4,50 @@ Run a GStreamer demo.
 Requires a valid input source (video / camera / RTSP) and SyNAP inference model.
 """
 
-from typing import Any
+from pathlib import Path
+from typing import Any, Callable, Optional
 import argparse
 import sys
 
-from gst.pipeline import GstPipelineGenerator
+from gst.adaptive import AdaptiveFrameInterval, FrameIntervalController
+from gst.cascade import ClassifierCascade
+from gst.detections import DetectionPublisher
+from gst.frame_tap import FrameTap
+from gst.metrics import MetricsServer, PipelineMetrics
+from gst.pipeline import GstPipelineGenerator, InferenceModel
+from gst.queues import DEFAULT_QUEUE_PROFILE, QUEUE_PROFILES
+from gst.rtsp import DEFAULT_RTSP_PROFILE, RTSP_PROFILES
+from gst.supervisor import RtspSupervisor
+from gst.tracker import DetectionTracker
+from utils.common import GstBackend, SinkType
+from utils.detection_ring import DetectionRingWriter, DEFAULT_RING_NAME
 from utils.user_input import *
 from utils.model_info import *
 
 
+def ppm_writer(out_dir: str) -> Callable[[Any, int], None]:
+    """
+    Returns a frame tap callback saving RGB frames as PPM images named after their PTS.
+    """
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+
+    def write(frame: Any, pts: int) -> None:
+        height, width = frame.shape[:2]
+        with open(Path(out_dir) / f"frame_{pts}.ppm", "wb") as f:
+            f.write(f"P6 {width} {height} 255\n".encode())
+            f.write(frame.tobytes())
+
+    return write
+
+
 def main(args: argparse.Namespace) -> None:
     gst_params: dict[str, Any] = {}
+    if args.cascade_model and args.trace:
+        raise SystemExit("Fatal: --trace runs gst-launch-1.0, the classifier cascade requires the in-process backend")
+    if args.track and args.trace:
+        raise SystemExit("Fatal: --trace runs gst-launch-1.0, box tracking requires the in-process backend")
+    if args.track and args.cascade_model:
+        raise SystemExit("Fatal: --track can't be combined with --cascade_model")
 
     try:
         if args.input_dims:
@@ -26,6 +59,9 @@ def main(args: argparse.Namespace) -> None:
                 gst_params.get("inp_h", None),
                 args.input,
                 args.input_codec if args.input else None,
+                use_cache=not args.no_cache,
+                refresh_cache=args.refresh_cache,
+                rtsp_profile=args.rtsp_profile,
             )
         ):
             sys.exit(1)
@@ -33,7 +69,7 @@ def main(args: argparse.Namespace) -> None:
             inp_src_info
         )
 
-        gst_params["inf_model"] = get_inf_model(args.model)
+        gst_params["inf_model"] = get_inf_model(args.model, args.refresh_cache)
         model_inp_dims = get_model_input_dims(
             gst_params["inf_model"]
         )
@@ -61,11 +97,72 @@ def main(args: argparse.Namespace) -> None:
             args.labels if args.model else None,
             "/usr/share/synap/models/object_detection/coco/info.json",
         )
+        gst_params["sink"] = SinkType[args.sink.upper()]
+        gst_params["sink_location"] = args.sink_location
         gst_params["fullscreen"] = (
             args.fullscreen
-            if args.fullscreen is not None
+            if args.fullscreen is not None or gst_params["sink"] != SinkType.DISPLAY
             else get_bool_prop("Launch demo in fullscreen?")
         )
+        gst_params["backend"] = GstBackend[args.backend.upper()]
+        gst_params["optimize"] = not args.no_optimize
+        gst_params["queue_profile"] = args.queue_profile
+        gst_params["max_fps"] = args.max_fps
+        gst_params["rtsp_profile"] = args.rtsp_profile
+        if args.extra_model:
+            models: list[InferenceModel] = [
+                InferenceModel(
+                    gst_params["inf_model"],
+                    gst_params["inf_w"],
+                    gst_params["inf_h"],
+                    gst_params["inf_labels"],
+                    gst_params["inf_thresh"],
+                    gst_params["inf_skip"],
+                    gst_params["inf_max"],
+                )
+            ]
+            for spec in args.extra_model:
+                model = get_inf_model(spec["model"], args.refresh_cache)
+                if not (dims := get_model_input_dims(model)):
+                    sys.exit(1)
+                models.append(
+                    InferenceModel(
+                        model,
+                        *dims,
+                        get_file_prop("Class labels file", spec.get("labels"), gst_params["inf_labels"]),
+                        spec.get("threshold", gst_params["inf_thresh"]),
+                        spec.get("interval", gst_params["inf_skip"]),
+                        spec.get("max", gst_params["inf_max"]),
+                    )
+                )
+            gst_params["models"] = models
+            gst_params["separate_model_outputs"] = args.separate_model_outputs
+        if args.cascade_model:
+            cascade_model = get_inf_model(args.cascade_model, args.refresh_cache)
+            if not (cascade_dims := get_model_input_dims(cascade_model)):
+                sys.exit(1)
+            gst_params["cascade"] = ClassifierCascade(
+                cascade_model,
+                get_file_prop(
+                    "Classifier labels file",
+                    args.cascade_labels,
+                    "/usr/share/synap/models/image_classification/imagenet/info.json",
+                ),
+                gst_params["inf_labels"],
+                *cascade_dims,
+                gst_params["inf_w"],
+                gst_params["inf_h"],
+                threshold=args.cascade_threshold,
+                budget=args.cascade_budget,
+                classes=args.cascade_classes,
+            )
+        if args.track:
+            gst_params["tracker"] = DetectionTracker(
+                gst_params["inf_w"],
+                gst_params["inf_h"],
+                iou_threshold=args.track_iou,
+                max_misses=args.track_max_misses,
+            )
     except KeyboardInterrupt:
         print("\nExiting...")
         sys.exit()
@@ -73,7 +170,82 @@ def main(args: argparse.Namespace) -> None:
     gen: GstPipelineGenerator = GstPipelineGenerator(gst_params)
 
     gen.make_pipeline()
-    gen.pipeline.run()
+    if gen.optimization_report:
+        print(f"\nPipeline optimizer: {gen.optimization_report}\n")
+    print(f"\n{gen.queue_report()}\n")
+    if args.trace:
+        gen.pipeline.enable_trace(args.trace)
+    if args.adaptive_fps:
+        if args.trace or gen.pipeline.resolve_backend() != GstBackend.INPROCESS:
+            print("\nAdaptive frame interval requires the in-process backend, ignoring --adaptive_fps\n")
+        elif len(gen.models) > 1:
+            print("\nAdaptive frame interval supports a single model, ignoring --adaptive_fps\n")
+        else:
+            AdaptiveFrameInterval(
+                FrameIntervalController(gst_params["inf_skip"], args.adaptive_fps, args.max_temp)
+            ).attach(
+                gen.pipeline,
+                display_elem="overlay" if gen.pipeline.has_element("overlay") else "infer",
+            )
+    writer: Optional[DetectionRingWriter] = None
+    if args.publish_detections:
+        if args.trace or gen.pipeline.resolve_backend() != GstBackend.INPROCESS:
+            print("\nPublishing detections requires the in-process backend, ignoring --publish_detections\n")
+        else:
+            writer = DetectionRingWriter(args.publish_detections)
+            DetectionPublisher(writer).attach(gen.pipeline)
+            print(f"\nPublishing detections to shared memory ring buffer \"{args.publish_detections}\"\n")
+    tap: Optional[FrameTap] = None
+    if args.tap_dir:
+        if args.trace or gen.pipeline.resolve_backend() != GstBackend.INPROCESS:
+            print("\nFrame taps require the in-process backend, ignoring --tap_dir\n")
+        else:
+            tap = FrameTap(ppm_writer(args.tap_dir), fmt="RGB", max_rate=args.tap_fps)
+            tap.attach(gen.pipeline)
+            print(f"\nSaving {args.tap_fps} frames per second to {args.tap_dir}\n")
+    supervisor: Optional[RtspSupervisor] = None
+    if gen.rtsp_sources and not args.no_reconnect:
+        supervisor = RtspSupervisor(gen.pipeline, gen.rtsp_sources, stall_timeout=args.stall_timeout)
+    inprocess = not args.trace and gen.pipeline.resolve_backend() == GstBackend.INPROCESS
+    count_drops = args.count_drops or bool(args.metrics_port)
+    if count_drops:
+        gen.count_drops()
+    server: Optional[MetricsServer] = None
+    if args.metrics_port:
+        metrics = PipelineMetrics()
+        metrics.attach(
+            gen.pipeline,
+            gen.queues,
+            gen.drop_counter,
+            inprocess=inprocess,
+        )
+        server = MetricsServer(args.metrics_port, args.metrics_host, args.metrics_interval)
+        server.add(metrics)
+        try:
+            server.start()
+        except OSError as e:
+            raise SystemExit(f"Fatal: can't serve metrics on port {args.metrics_port}: {e}")
+        print(f"\nServing metrics at {server.url}\n")
+    try:
+        if supervisor:
+            supervisor.run()
+        else:
+            gen.pipeline.run()
+    finally:
+        if writer:
+            writer.close()
+        if server:
+            server.stop()
+    if supervisor:
+        print(f"\nRTSP outages: {supervisor.stats}\n")
+    if gen.drop_counter.queues and (inprocess or count_drops):
+        print(f"\nDropped frames: {gen.drop_counter}\n")
+    if gen.cascade:
+        print(f"\nClassifier cascade: {gen.cascade}\n")
+    if gen.tracker:
+        print(f"\nBox tracking: {gen.tracker}\n")
+    if tap:
+        print(f"\nFrame tap: {tap}\n")
 
 
 if __name__ == "__main__":
@@ -101,11 +273,12 @@ if __name__ == "__main__":
     )
 
     # The codec used to compress the input video. Required only for video and RTSP.
+    # "auto" detects the codec of video files from their container and means h264 for RTSP.
     parser.add_argument(
         "-c",
         "--input_codec",
         type=str,
-        default="h264",
+        default="auto",
         help="Input codec for file/RTSP (default: %(default)s)",
     )
 
@@ -117,6 +290,177 @@ if __name__ == "__main__":
         help="Launch demo in fullscreen",
     )
 
+    # Where the overlaid output goes. "fakesink" runs inference only, without any overlay.
+    # The file, udp and snapshot sinks use --sink_location as output file, HOST:PORT and file name pattern.
+    parser.add_argument(
+        "--sink",
+        type=str.lower,
+        choices=[s.name.lower() for s in SinkType],
+        default="display",
+        help="Output sink (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--sink_location",
+        type=str,
+        metavar="LOCATION",
+        help="Output file, HOST:PORT or snapshot file pattern for the file, udp and snapshot sinks",
+    )
+
+    # How to run the pipeline: in this process through PyGObject or by spawning gst-launch-1.0.
+    # "auto" runs in-process when PyGObject is installed and falls back to gst-launch-1.0 otherwise.
+    parser.add_argument(
+        "--backend",
+        type=str.lower,
+        choices=[b.name.lower() for b in GstBackend],
+        default="auto",
+        help="Pipeline execution backend (default: %(default)s)",
+    )
+
+    # Redundant videoconvert elements are removed and scaling is done before color conversion.
+    # Use this option to run the pipeline exactly as generated.
+    parser.add_argument(
+        "--no_optimize",
+        action="store_true",
+        help="Don't optimize the generated pipeline",
+    )
+
+    # How queues trade latency for throughput: standard uses GStreamer's defaults, low-latency keeps
+    # only the newest frame, balanced keeps a few frames and caps live sources, max-throughput never
+    # drops frames.
+    parser.add_argument(
+        "--queue_profile",
+        type=str.lower,
+        choices=list(QUEUE_PROFILES),
+        default=DEFAULT_QUEUE_PROFILE,
+        help="Queue profile (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max_fps",
+        type=int,
+        metavar="FPS",
+        help="Cap the source frame rate, 0 disables the queue profile's cap on live sources",
+    )
+    # In-process, drops are always counted. gst-launch-1.0 needs the queue debug log, which is
+    # verbose, so it is only enabled with this flag or --metrics_port.
+    parser.add_argument(
+        "--count_drops",
+        action="store_true",
+        help="Count the frames dropped by leaky queues with gst-launch-1.0 too",
+    )
+
+    # How RTSP streams are received: standard keeps rtspsrc's defaults, low-latency uses a short
+    # jitterbuffer over UDP and drops late packets, robust uses a long jitterbuffer over TCP.
+    parser.add_argument(
+        "--rtsp_profile",
+        type=str.lower,
+        choices=list(RTSP_PROFILES),
+        default=DEFAULT_RTSP_PROFILE,
+        help="RTSP source profile (default: %(default)s)",
+    )
+
+    # RTSP streams that stop or stall are reconnected without validating the inputs and model again.
+    parser.add_argument(
+        "--no_reconnect",
+        action="store_true",
+        help="Exit when an RTSP stream is lost instead of reconnecting",
+    )
+    parser.add_argument(
+        "--stall_timeout",
+        type=float,
+        default=5.0,
+        metavar="SECONDS",
+        help="Reconnect RTSP streams that deliver no data for this long (default: %(default)s)",
+    )
+
+    # Profile the pipeline with the GStreamer tracers, always runs with gst-launch-1.0.
+    # A latency/framerate/queue level report and the pipeline graph are written to DIR on exit.
+    parser.add_argument(
+        "--trace",
+        type=str,
+        metavar="DIR",
+        help="Write a tracer report and pipeline graph to DIR",
+    )
+
+    # Adjust the inference skip while running to hold the display at FPS and the board
+    # below --max_temp. The inference skip option sets the starting value.
+    parser.add_argument(
+        "--adaptive_fps",
+        type=float,
+        metavar="FPS",
+        help="Adapt the inference skip to hold this display frame rate",
+    )
+    parser.add_argument(
+        "--max_temp",
+        type=float,
+        default=85.0,
+        metavar="CELSIUS",
+        help="Temperature ceiling for --adaptive_fps (default: %(default)s)",
+    )
+
+    # Share each frame's detections with other processes through a shared memory ring buffer.
+    # Read them with `python3 -m utils.detection_ring NAME` or `DetectionRingReader`.
+    parser.add_argument(
+        "--publish_detections",
+        type=str,
+        nargs="?",
+        const=DEFAULT_RING_NAME,
+        metavar="NAME",
+        help=f"Publish detections to a shared memory ring buffer (default name: {DEFAULT_RING_NAME})",
+    )
+
+    # Hand decoded frames to Python through a FrameTap, here saving them as PPM images.
+    # The tap skips frames instead of slowing down the pipeline when writing falls behind.
+    parser.add_argument(
+        "--tap_dir",
+        type=str,
+        metavar="DIR",
+        help="Save frames from a Python frame tap to DIR",
+    )
+    parser.add_argument(
+        "--tap_fps",
+        type=int,
+        default=1,
+        metavar="FPS",
+        help="Frames per second saved by --tap_dir (default: %(default)s)",
+    )
+
+    # Serve fps, inference rate, dropped frames, queue levels, restarts and CPU/memory usage
+    # at http://HOST:PORT/metrics for Prometheus.
+    parser.add_argument(
+        "--metrics_port",
+        type=int,
+        metavar="PORT",
+        help="Serve pipeline metrics for Prometheus on this port",
+    )
+    parser.add_argument(
+        "--metrics_host",
+        type=str,
+        default="127.0.0.1",
+        metavar="HOST",
+        help="Address to serve metrics on (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--metrics_interval",
+        type=float,
+        default=5.0,
+        metavar="SECONDS",
+        help="Seconds between metrics samples (default: %(default)s)",
+    )
+
+    # Inputs that passed validation recently are not validated again.
+    # These options skip the validation cache or force a new validation that refreshes it.
+    cache_group = parser.add_mutually_exclusive_group()
+    cache_group.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Always validate the input and don't use the validation cache",
+    )
+    cache_group.add_argument(
+        "--refresh_cache",
+        action="store_true",
+        help="Validate the input and model again and refresh their cache entries",
+    )
+
     inf_group = parser.add_argument_group("Inference parameters")
 
     # The path to the inference model to use. Must be a vaild SyNAP model with a ".synap" file extension.
@@ -166,6 +510,93 @@ if __name__ == "__main__":
         help="JSON file containing class labels to use with inference results",
     )
 
+    # More models run on the same decoded input, each with its own inference branch.
+    # Their results are layered on the output, or shown on separate outputs with --separate_model_outputs.
+    # Options not given in the spec are taken from the inference parameters above.
+    inf_group.add_argument(
+        "--extra_model",
+        type=validate_model_spec,
+        action="append",
+        metavar="FILE[,labels=JSON][,threshold=SCORE][,interval=N_FRAMES][,max=N_RESULTS]",
+        help="Another SyNAP model to run on the input, can be repeated",
+    )
+    inf_group.add_argument(
+        "--separate_model_outputs",
+        action="store_true",
+        help="Send each model's results to its own output instead of layering them",
+    )
+
+    cascade_group = parser.add_argument_group("Classifier cascade")
+
+    # A classification model run on the detections, e.g. to classify attributes of each person.
+    # The classifier's label is added to the detector's label in the overlay.
+    cascade_group.add_argument(
+        "--cascade_model",
+        type=str,
+        metavar="FILE",
+        help="SyNAP classification model to run on detected regions",
+    )
+    cascade_group.add_argument(
+        "--cascade_labels",
+        type=str,
+        metavar="JSON",
+        help="JSON file containing the classifier's class labels",
+    )
+
+    # Only detections scoring at least this are classified.
+    cascade_group.add_argument(
+        "--cascade_threshold",
+        type=float,
+        metavar="SCORE",
+        default=0.5,
+        help="Minimum detection score to classify (default: %(default)s)",
+    )
+
+    # The highest scoring detections of each frame are classified, up to this many.
+    # Use the timings printed on exit to size it.
+    cascade_group.add_argument(
+        "--cascade_budget",
+        type=int,
+        metavar="N_CROPS",
+        default=4,
+        help="Maximum detections classified per frame (default: %(default)s)",
+    )
+
+    # Detector class indices to classify, e.g. 0 for people with the COCO labels. All classes by default.
+    cascade_group.add_argument(
+        "--cascade_classes",
+        type=int,
+        nargs="+",
+        metavar="CLASS",
+        help="Detector classes to classify (default: all)",
+    )
+
+    track_group = parser.add_argument_group("Box tracking")
+
+    # Boxes are predicted on every displayed frame from the last detections and get track IDs,
+    # so a high --inference_skip still gives smooth overlays.
+    track_group.add_argument(
+        "--track",
+        action="store_true",
+        help="Track detections and predict their boxes on the frames that aren't inferred",
+    )
+
+    # Lower values keep IDs on fast objects, higher values avoid swapping IDs in crowds.
+    track_group.add_argument(
+        "--track_iou",
+        type=float,
+        metavar="IOU",
+        default=0.3,
+        help="Minimum overlap between a track and a detection to match them (default: %(default)s)",
+    )
+    track_group.add_argument(
+        "--track_max_misses",
+        type=int,
+        metavar="N_RESULTS",
+        default=2,
+        help="Inference results a track can go undetected before it is dropped (default: %(default)s)",
+    )
+
     args = parser.parse_args()
 
     main(args)
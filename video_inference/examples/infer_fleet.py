@@ -0,0 +1,312 @@
+"""
+Run a fleet of GStreamer demos, one process per stream.
+
+Reads the streams from a JSON file, pins each stream to its own CPU cores and restarts
+streams whose pipeline exits. The frame rate, CPU and memory usage of every stream are
+reported periodically.
+"""
+
+from typing import Any, Optional
+import argparse
+import json
+import os
+import sys
+
+from gst.fleet import FleetSupervisor, ProcessLimits, assign_cpus
+from gst.metrics import MetricsServer
+from gst.pipeline import GstPipelineGenerator
+from gst.queues import DEFAULT_QUEUE_PROFILE
+from gst.rtsp import DEFAULT_RTSP_PROFILE
+from utils.common import CAM_FRAMERATE, GstBackend, SinkType
+from utils.model_info import get_model_input_dims
+from utils.model_registry import ModelRegistry
+from utils.user_input import get_inp_src_info
+
+# input that selects a `videotestsrc` test pattern instead of a real source
+TEST_INPUT = "test"
+
+# resolution of the test pattern and inference size of stand-ins without a model
+DEFAULT_TEST_DIMS = (1280, 720)
+DEFAULT_INF_DIMS = (640, 384)
+
+DEFAULT_LABELS = "/usr/share/synap/models/object_detection/coco/info.json"
+
+# stream list keys and their defaults
+STREAM_DEFAULTS: dict[str, Any] = {
+    "input": None,
+    "codec": "auto",
+    "dims": None,
+    "model": None,
+    "labels": DEFAULT_LABELS,
+    "threshold": 0.5,
+    "interval": 1,
+    "max": 5,
+    "sink": "fakesink",
+    "sink_location": None,
+    "queue_profile": DEFAULT_QUEUE_PROFILE,
+    "max_fps": None,
+    "rtsp_profile": DEFAULT_RTSP_PROFILE,
+    "stand_in": None,
+    "overlay_stand_in": "identity",
+    "cpus": None,
+    "nice": 0,
+    "max_memory_mb": None,
+}
+
+
+class FleetPipelineGenerator(GstPipelineGenerator):
+    """
+    Generates the pipeline of one fleet stream.
+
+    The "test" input is a live `videotestsrc` pattern. With a stand-in element, `synapinfer`
+    is replaced by it and `synapoverlay` by `overlay_stand_in`, so the fleet can be tried
+    without SyNAP.
+    """
+
+    def __init__(
+        self,
+        gst_params: dict[str, Any],
+        stand_in: Optional[str] = None,
+        overlay_stand_in: str = "identity",
+    ) -> None:
+        super().__init__(gst_params)
+        if stand_in:
+            self._infer_elems = [
+                *self._infer_elems[:-2],
+                [*stand_in.split(), "name=infer"],
+                ["fakesink", "sync=false"],
+            ]
+            self._overlay_elems = [
+                *self._overlay_elems[:-1],
+                [*overlay_stand_in.split(), "name=overlay"],
+            ]
+
+    def make_test_pipeline(self, inp_w: int, inp_h: int) -> None:
+        self._pipeline.reset()
+        self._pipeline.add_elements(
+            ["videotestsrc", "is-live=true", "pattern=ball"],
+            f"video/x-raw,format=YUY2,width={inp_w},height={inp_h},framerate={CAM_FRAMERATE}/1",
+            *self._processing_elems(),
+        )
+        self._finish_pipeline((inp_w, inp_h), CAM_FRAMERATE)
+
+    def make_pipeline(self) -> None:
+        if self._inp_src == TEST_INPUT:
+            self.make_test_pipeline(self._inp_w, self._inp_h)
+        else:
+            super().make_pipeline()
+
+
+def load_streams(path: str) -> list[dict[str, Any]]:
+    """
+    Reads a stream list: a JSON list of streams, or an object with a "streams" list and
+    "defaults" applied to every stream.
+
+    Returns:
+        list[dict]: every stream with all keys of `STREAM_DEFAULTS` and a unique "name"
+    """
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise SystemExit(f'Fatal: can\'t read stream list "{path}": {e}')
+    defaults: dict[str, Any] = {}
+    if isinstance(data, dict):
+        defaults = data.get("defaults", {})
+        data = data.get("streams", [])
+    if not isinstance(data, list) or not data:
+        raise SystemExit(f'Fatal: no streams in "{path}"')
+    streams: list[dict[str, Any]] = []
+    for i, entry in enumerate(data):
+        stream = {**STREAM_DEFAULTS, "name": f"stream{i}", **defaults, **entry}
+        if unknown := set(stream) - set(STREAM_DEFAULTS) - {"name"}:
+            raise SystemExit(f"Fatal: stream {stream['name']}: unknown keys {', '.join(sorted(unknown))}")
+        if not stream["input"]:
+            raise SystemExit(f"Fatal: stream {stream['name']}: missing input")
+        if not stream["model"] and not stream["stand_in"]:
+            raise SystemExit(f"Fatal: stream {stream['name']}: missing model")
+        streams.append(stream)
+    if len({s["name"] for s in streams}) < len(streams):
+        raise SystemExit("Fatal: stream names must be unique")
+    return streams
+
+
+def make_stream_pipeline(stream: dict[str, Any], registry: ModelRegistry, use_cache: bool) -> FleetPipelineGenerator:
+    """
+    Validates the input and model of a stream and generates its pipeline.
+    """
+    name = stream["name"]
+    gst_params: dict[str, Any] = {}
+    if stream["dims"]:
+        gst_params["inp_w"], gst_params["inp_h"] = [int(d) for d in stream["dims"].split("x")]
+    if stream["input"] == TEST_INPUT:
+        gst_params["inp_w"] = gst_params.get("inp_w") or DEFAULT_TEST_DIMS[0]
+        gst_params["inp_h"] = gst_params.get("inp_h") or DEFAULT_TEST_DIMS[1]
+        gst_params["inp_type"], gst_params["inp_src"] = None, TEST_INPUT
+    else:
+        print(f"\nValidating stream {name}...")
+        if not (
+            inp_src_info := get_inp_src_info(
+                gst_params.get("inp_w"),
+                gst_params.get("inp_h"),
+                stream["input"],
+                stream["codec"],
+                use_cache=use_cache,
+                rtsp_profile=stream["rtsp_profile"],
+            )
+        ):
+            raise SystemExit(f"Fatal: stream {name}: invalid input \"{stream['input']}\"")
+        gst_params["inp_type"], gst_params["inp_src"], gst_params["inp_codec"], gst_params["codec_elems"] = (
+            inp_src_info
+        )
+
+    inf_dims: Optional[tuple[int, int]] = None
+    if stream["model"]:
+        valid, error, _ = registry.validate(stream["model"])
+        if not valid and not stream["stand_in"]:
+            raise SystemExit(f"Fatal: stream {name}: invalid SyNAP model \"{stream['model']}\"\n{error}")
+        inf_dims = get_model_input_dims(stream["model"], registry) if valid else None
+    if not inf_dims:
+        if not stream["stand_in"]:
+            sys.exit(1)
+        inf_dims = DEFAULT_INF_DIMS
+
+    gst_params["inf_model"] = stream["model"] or "stand-in"
+    gst_params["inf_w"], gst_params["inf_h"] = inf_dims
+    gst_params["inf_skip"] = stream["interval"]
+    gst_params["inf_max"] = stream["max"]
+    gst_params["inf_thresh"] = stream["threshold"]
+    gst_params["inf_labels"] = stream["labels"]
+    try:
+        gst_params["sink"] = SinkType[stream["sink"].upper()]
+    except KeyError:
+        raise SystemExit(f"Fatal: stream {name}: invalid sink \"{stream['sink']}\"")
+    gst_params["sink_location"] = stream["sink_location"]
+    gst_params["fullscreen"] = False
+    gst_params["backend"] = GstBackend.SUBPROCESS
+    gst_params["queue_profile"] = stream["queue_profile"]
+    gst_params["max_fps"] = stream["max_fps"]
+    gst_params["rtsp_profile"] = stream["rtsp_profile"]
+
+    gen = FleetPipelineGenerator(gst_params, stream["stand_in"], stream["overlay_stand_in"])
+    gen.make_pipeline()
+    return gen
+
+
+def main(args: argparse.Namespace) -> None:
+    streams = load_streams(args.streams)
+    # streams without their own cores share out the ones left over
+    auto = [s for s in streams if s["cpus"] is None]
+    reserved = {c for s in streams if s["cpus"] for c in s["cpus"]}
+    free = sorted(os.sched_getaffinity(0) - reserved) or sorted(os.sched_getaffinity(0))
+    for stream, cpus in zip(auto, assign_cpus(len(auto), free if not args.no_pin else [])):
+        stream["cpus"] = cpus or None
+
+    registry = ModelRegistry()
+    # the metrics server samples the streams itself, reports show its samples
+    fleet = FleetSupervisor(
+        max_restarts=args.max_restarts,
+        report_interval=args.report_interval,
+        sample_metrics=not args.metrics_port,
+    )
+    try:
+        for stream in streams:
+            gen = make_stream_pipeline(stream, registry, not args.no_cache)
+            limits = ProcessLimits(
+                tuple(stream["cpus"]) if stream["cpus"] else None, stream["nice"], stream["max_memory_mb"]
+            )
+            try:
+                # drops and queue levels are only served as metrics, their logs are costly otherwise
+                fleet.add(
+                    stream["name"],
+                    gen.pipeline,
+                    limits,
+                    gen.count_drops() if args.metrics_port else None,
+                    gen.queues if args.metrics_port else None,
+                )
+            except ValueError as e:
+                raise SystemExit(f"Fatal: {e}")
+            print(f"Stream {stream['name']}: {stream['input']} ({limits})")
+    except KeyboardInterrupt:
+        print("\nExiting...")
+        sys.exit()
+
+    server: Optional[MetricsServer] = None
+    if args.metrics_port:
+        server = MetricsServer(args.metrics_port, args.metrics_host, args.metrics_interval)
+        for metrics in fleet.metrics:
+            server.add(metrics)
+        try:
+            server.start()
+        except OSError as e:
+            raise SystemExit(f"Fatal: can't serve metrics on port {args.metrics_port}: {e}")
+        print(f"\nServing metrics at {server.url}")
+
+    print(f"\nRunning {len(streams)} streams...\n")
+    try:
+        fleet.run_until_interrupted()
+    finally:
+        if server:
+            server.stop()
+    print(f"\n{fleet.report()}\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    # JSON list of streams, each with an input, a model and optional inference, output and
+    # resource parameters, see STREAM_DEFAULTS. "test" inputs with a "stand_in" element need neither.
+    parser.add_argument(
+        "streams",
+        type=str,
+        metavar="JSON",
+        help="Stream list file",
+    )
+
+    # Streams without "cpus" are spread over the cores left over by the streams with them.
+    parser.add_argument(
+        "--no_pin",
+        action="store_true",
+        help="Don't pin streams without \"cpus\" to CPU cores",
+    )
+    parser.add_argument(
+        "--report_interval",
+        type=float,
+        default=5.0,
+        metavar="SECONDS",
+        help="Seconds between stats reports, 0 disables them (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max_restarts",
+        type=int,
+        metavar="N",
+        help="Give up on a stream after N quick consecutive failures (default: never)",
+    )
+    parser.add_argument(
+        "--metrics_port",
+        type=int,
+        metavar="PORT",
+        help="Serve the metrics of every stream for Prometheus on this port",
+    )
+    parser.add_argument(
+        "--metrics_host",
+        type=str,
+        default="127.0.0.1",
+        metavar="HOST",
+        help="Address to serve metrics on (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--metrics_interval",
+        type=float,
+        default=5.0,
+        metavar="SECONDS",
+        help="Seconds between metrics samples (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Always validate the inputs and don't use the validation cache",
+    )
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,322 @@
+"""
+Run a GStreamer demo on several inputs at once.
+
+All inputs share a single inference stage, their outputs are shown as a mosaic or in separate windows.
+Requires valid input sources (video / camera / RTSP) and a SyNAP inference model.
+"""
+
+from typing import Any, Optional
+import argparse
+import sys
+
+from gst.adaptive import AdaptiveFrameInterval, FrameIntervalController
+from gst.detections import DetectionPublisher
+from gst.pipeline import GstMultiPipelineGenerator
+from gst.queues import DEFAULT_QUEUE_PROFILE, QUEUE_PROFILES
+from gst.rtsp import DEFAULT_RTSP_PROFILE, RTSP_PROFILES
+from gst.supervisor import RtspSupervisor
+from utils.common import GstBackend, SinkType
+from utils.detection_ring import DetectionRingWriter, DEFAULT_RING_NAME
+from utils.user_input import *
+from utils.model_info import *
+
+
+def main(args: argparse.Namespace) -> None:
+    gst_params: dict[str, Any] = {}
+    inputs: list[dict[str, Any]] = []
+
+    try:
+        for inp_src in args.input:
+            if not (
+                inp_src_info := get_inp_src_info(
+                    None, None, inp_src, args.input_codec, rtsp_profile=args.rtsp_profile
+                )
+            ):
+                sys.exit(1)
+            inp_type, inp_src, inp_codec, codec_elems = inp_src_info
+            inputs.append(
+                {
+                    "inp_type": inp_type,
+                    "inp_src": inp_src,
+                    "inp_codec": inp_codec,
+                    "codec_elems": codec_elems,
+                }
+            )
+
+        gst_params["inf_model"] = get_inf_model(args.model)
+        model_inp_dims = get_model_input_dims(gst_params["inf_model"])
+        if not model_inp_dims:
+            sys.exit(1)
+        gst_params["inf_w"], gst_params["inf_h"] = model_inp_dims
+        gst_params["inf_skip"] = args.inference_skip
+        gst_params["inf_max"] = args.num_inferences
+        gst_params["inf_thresh"] = args.confidence_threshold
+        gst_params["inf_labels"] = args.labels
+        gst_params["fullscreen"] = args.fullscreen
+        gst_params["sink"] = SinkType[args.sink.upper()]
+        gst_params["sink_location"] = args.sink_location
+        gst_params["mosaic_w"], gst_params["mosaic_h"] = [int(d) for d in args.mosaic_dims.split("x")]
+        gst_params["backend"] = GstBackend[args.backend.upper()]
+        gst_params["optimize"] = not args.no_optimize
+        gst_params["queue_profile"] = args.queue_profile
+        gst_params["max_fps"] = args.max_fps
+        gst_params["rtsp_profile"] = args.rtsp_profile
+    except KeyboardInterrupt:
+        print("\nExiting...")
+        sys.exit()
+
+    gen: GstMultiPipelineGenerator = GstMultiPipelineGenerator(
+        gst_params, inputs, args.separate_outputs
+    )
+
+    gen.make_pipeline()
+    if gen.optimization_report:
+        print(f"\nPipeline optimizer: {gen.optimization_report}\n")
+    print(f"\n{gen.queue_report()}\n")
+    if args.trace:
+        gen.pipeline.enable_trace(args.trace)
+    if args.adaptive_fps:
+        if args.trace or gen.pipeline.resolve_backend() != GstBackend.INPROCESS:
+            print("\nAdaptive frame interval requires the in-process backend, ignoring --adaptive_fps\n")
+        else:
+            AdaptiveFrameInterval(
+                FrameIntervalController(gst_params["inf_skip"], args.adaptive_fps, args.max_temp)
+            ).attach(
+                gen.pipeline,
+                display_elem="overlay" if gen.pipeline.has_element("overlay") else "infer",
+            )
+    writer: Optional[DetectionRingWriter] = None
+    if args.publish_detections:
+        if args.trace or gen.pipeline.resolve_backend() != GstBackend.INPROCESS:
+            print("\nPublishing detections requires the in-process backend, ignoring --publish_detections\n")
+        else:
+            writer = DetectionRingWriter(args.publish_detections)
+            DetectionPublisher(writer).attach(gen.pipeline)
+            print(f"\nPublishing detections to shared memory ring buffer \"{args.publish_detections}\"\n")
+    inprocess = not args.trace and gen.pipeline.resolve_backend() == GstBackend.INPROCESS
+    if args.count_drops:
+        gen.count_drops()
+    supervisor: Optional[RtspSupervisor] = None
+    if gen.rtsp_sources and not args.no_reconnect:
+        supervisor = RtspSupervisor(gen.pipeline, gen.rtsp_sources, stall_timeout=args.stall_timeout)
+    try:
+        if supervisor:
+            supervisor.run()
+        else:
+            gen.pipeline.run()
+    finally:
+        if writer:
+            writer.close()
+    if supervisor:
+        print(f"\nRTSP outages: {supervisor.stats}\n")
+    if gen.drop_counter.queues and (inprocess or args.count_drops):
+        print(f"\nDropped frames: {gen.drop_counter}\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    # Input video sources: any mix of camera devices, video files and RTSP stream URLs
+    parser.add_argument(
+        "-i",
+        "--input",
+        type=str,
+        nargs="+",
+        required=True,
+        metavar="SRC",
+        help="Input sources (file / camera / RTSP)",
+    )
+
+    # The codec used to compress the input videos. Required only for video and RTSP.
+    # "auto" detects the codec of video files from their container and means h264 for RTSP.
+    parser.add_argument(
+        "-c",
+        "--input_codec",
+        type=str,
+        default="auto",
+        help="Input codec for files/RTSP streams (default: %(default)s)",
+    )
+
+    # Size of the mosaic the inputs are tiled into. Inference runs on the whole mosaic.
+    parser.add_argument(
+        "--mosaic_dims",
+        type=validate_inp_dims,
+        default="1920x1080",
+        metavar="WIDTHxHEIGHT",
+        help="Size of the input mosaic (default: %(default)s)",
+    )
+
+    # Show each input in its own window instead of a single mosaic
+    parser.add_argument(
+        "--separate_outputs",
+        action="store_true",
+        help="Display each input in a separate window",
+    )
+
+    # Where the overlaid output goes. "fakesink" runs inference only, without any overlay.
+    # The file, udp and snapshot sinks use --sink_location as output file, HOST:PORT and file name pattern.
+    parser.add_argument(
+        "--sink",
+        type=str.lower,
+        choices=[s.name.lower() for s in SinkType],
+        default="display",
+        help="Output sink (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--sink_location",
+        type=str,
+        metavar="LOCATION",
+        help="Output file, HOST:PORT or snapshot file pattern for the file, udp and snapshot sinks",
+    )
+
+    parser.add_argument(
+        "--fullscreen",
+        action="store_true",
+        help="Launch demo in fullscreen",
+    )
+
+    parser.add_argument(
+        "--backend",
+        type=str.lower,
+        choices=[b.name.lower() for b in GstBackend],
+        default="auto",
+        help="Pipeline execution backend (default: %(default)s)",
+    )
+
+    # Redundant videoconvert elements are removed and scaling is done before color conversion.
+    # Use this option to run the pipeline exactly as generated.
+    parser.add_argument(
+        "--no_optimize",
+        action="store_true",
+        help="Don't optimize the generated pipeline",
+    )
+
+    # How queues trade latency for throughput: standard uses GStreamer's defaults, low-latency keeps
+    # only the newest frame, balanced keeps a few frames and caps live sources, max-throughput never
+    # drops frames.
+    parser.add_argument(
+        "--queue_profile",
+        type=str.lower,
+        choices=list(QUEUE_PROFILES),
+        default=DEFAULT_QUEUE_PROFILE,
+        help="Queue profile (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max_fps",
+        type=int,
+        metavar="FPS",
+        help="Cap the source frame rate, 0 disables the queue profile's cap on live sources",
+    )
+    # In-process, drops are always counted. gst-launch-1.0 needs the queue debug log, which is
+    # verbose, so it is only enabled with this flag.
+    parser.add_argument(
+        "--count_drops",
+        action="store_true",
+        help="Count the frames dropped by leaky queues with gst-launch-1.0 too",
+    )
+
+    # How RTSP streams are received: standard keeps rtspsrc's defaults, low-latency uses a short
+    # jitterbuffer over UDP and drops late packets, robust uses a long jitterbuffer over TCP.
+    parser.add_argument(
+        "--rtsp_profile",
+        type=str.lower,
+        choices=list(RTSP_PROFILES),
+        default=DEFAULT_RTSP_PROFILE,
+        help="RTSP source profile (default: %(default)s)",
+    )
+
+    # RTSP streams that stop or stall are reconnected without validating the inputs and model again.
+    parser.add_argument(
+        "--no_reconnect",
+        action="store_true",
+        help="Exit when an RTSP stream is lost instead of reconnecting",
+    )
+    parser.add_argument(
+        "--stall_timeout",
+        type=float,
+        default=5.0,
+        metavar="SECONDS",
+        help="Reconnect RTSP streams that deliver no data for this long (default: %(default)s)",
+    )
+
+    # Profile the pipeline with the GStreamer tracers, always runs with gst-launch-1.0.
+    # A latency/framerate/queue level report and the pipeline graph are written to DIR on exit.
+    parser.add_argument(
+        "--trace",
+        type=str,
+        metavar="DIR",
+        help="Write a tracer report and pipeline graph to DIR",
+    )
+
+    # Adjust the inference skip while running to hold the display at FPS and the board
+    # below --max_temp. The inference skip option sets the starting value.
+    parser.add_argument(
+        "--adaptive_fps",
+        type=float,
+        metavar="FPS",
+        help="Adapt the inference skip to hold this display frame rate",
+    )
+    parser.add_argument(
+        "--max_temp",
+        type=float,
+        default=85.0,
+        metavar="CELSIUS",
+        help="Temperature ceiling for --adaptive_fps (default: %(default)s)",
+    )
+
+    # Share each frame's detections with other processes through a shared memory ring buffer.
+    # Read them with `python3 -m utils.detection_ring NAME` or `DetectionRingReader`.
+    parser.add_argument(
+        "--publish_detections",
+        type=str,
+        nargs="?",
+        const=DEFAULT_RING_NAME,
+        metavar="NAME",
+        help=f"Publish detections to a shared memory ring buffer (default name: {DEFAULT_RING_NAME})",
+    )
+
+    inf_group = parser.add_argument_group("Inference parameters")
+
+    inf_group.add_argument(
+        "-m", "--model",
+        type=str,
+        default="/usr/share/synap/models/object_detection/coco/model/yolov8s-640x384/model.synap",
+        metavar="FILE",
+        help="SyNAP model file location (default: %(default)s)",
+    )
+    inf_group.add_argument(
+        "-s",
+        "--inference_skip",
+        type=int,
+        metavar="N_FRAMES",
+        default=1,
+        help="How many frames to skip between each inference (default: %(default)s)",
+    )
+    inf_group.add_argument(
+        "-n",
+        "--num_inferences",
+        type=int,
+        metavar="N_RESULTS",
+        default=5,
+        help="Maximum number of detections returned per frame (default: %(default)s)"
+    )
+    inf_group.add_argument(
+        "-t",
+        "--confidence_threshold",
+        type=float,
+        metavar="SCORE",
+        default=0.5,
+        help="Confidence threshold for inferences (default: %(default)s)"
+    )
+    inf_group.add_argument(
+        "-l",
+        "--labels",
+        type=str,
+        metavar="JSON",
+        default="/usr/share/synap/models/object_detection/coco/info.json",
+        help="JSON file containing class labels to use with inference results",
+    )
+
+    args = parser.parse_args()
+
+    main(args)
@@ -7,6 +7,8 @@ import sys
 from typing import Any
 
 from gst.pipeline import GstPipelineGenerator
+from gst.rtsp import RTSP_PROFILES
+from gst.supervisor import RtspSupervisor
 from utils.model_info import get_model_input_dims
 from utils.user_input import get_inp_src_info, get_inf_model, validate_inp_dims
 from utils.common import InputType
@@ -23,6 +25,14 @@ RTSP_URL = ""
 # Try using a different codec if the demo fails to run
 VIDEO_CODEC = "h264"
 
+# How the RTSP stream is received.
+# Must be one of: standard (rtspsrc defaults, UDP with TCP fallback), low-latency (short jitterbuffer over UDP,
+# late packets are dropped), robust (long jitterbuffer over TCP)
+RTSP_PROFILE = "standard"
+
+# Whether to reconnect when the stream stops or stalls instead of exiting.
+RECONNECT = True
+
 # The path to the inference model to use. Must be a vaild SyNAP model with a ".synap" file extension.
 MODEL = "/usr/share/synap/models/object_detection/coco/model/yolov8s-640x384/model.synap"
 
@@ -51,7 +61,9 @@ FULLSCREEN = False
 def main():
     try:
         inp_w, inp_h = [int(d) for d in args.input_dims.split("x")] if args.input_dims else (None, None)
-        inp_src_info = get_inp_src_info(inp_w, inp_h, args.input, args.input_codec, inp_type=InputType.RTSP)
+        inp_src_info = get_inp_src_info(
+            inp_w, inp_h, args.input, args.input_codec, inp_type=InputType.RTSP, rtsp_profile=args.rtsp_profile
+        )
         if not inp_src_info:
             sys.exit(1)
         model = get_inf_model(args.model)
@@ -73,6 +85,7 @@ def main():
             "inf_thresh": args.confidence_threshold,
             "inf_labels": args.labels,
             "fullscreen": args.fullscreen,
+            "rtsp_profile": args.rtsp_profile,
         }
     except KeyboardInterrupt:
         print("\nExiting...")
@@ -81,7 +94,12 @@ def main():
     gen: GstPipelineGenerator = GstPipelineGenerator(gst_params)
 
     gen.make_pipeline()
-    gen.pipeline.run()
+    if args.reconnect:
+        supervisor = RtspSupervisor(gen.pipeline, gen.rtsp_sources)
+        supervisor.run()
+        print(f"\nRTSP outages: {supervisor.stats}\n")
+    else:
+        gen.pipeline.run()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -106,6 +124,19 @@ if __name__ == "__main__":
         metavar="CODEC",
         help="RTSP stream input codec (default: %(default)s)",
     )
+    parser.add_argument(
+        "-p", "--rtsp_profile",
+        type=str,
+        default=RTSP_PROFILE,
+        choices=list(RTSP_PROFILES),
+        help="RTSP source profile (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--reconnect",
+        action=argparse.BooleanOptionalAction,
+        default=RECONNECT,
+        help="Reconnect when the stream is lost (default: %(default)s)",
+    )
     parser.add_argument(
         "-m", "--model",
         type=str,
@@ -19,9 +19,10 @@ from utils.common import InputType
 VIDEO_FILE = ""
 
 # The codec used to compress the video file.
-# Must be one of: av1, h264, h265
-# Try using a different codec if the demo fails to run
-VIDEO_CODEC = "h264"
+# Must be one of: auto, av1, h264, h265
+# "auto" detects the codec from the video file's container (MP4/MOV, MKV/WebM or MPEG-TS)
+# Try setting the codec explicitly if the demo fails to run
+VIDEO_CODEC = "auto"
 
 # The path to the inference model to use. Must be a vaild SyNAP model with a ".synap" file extension.
 MODEL = "/usr/share/synap/models/object_detection/coco/model/yolov8s-640x384/model.synap"
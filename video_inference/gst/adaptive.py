@@ -0,0 +1,223 @@
+from pathlib import Path
+from threading import Lock, Thread
+from typing import Any, Callable, NamedTuple, Optional
+import time
+
+from gst.engine import GstEngine
+from gst.pipeline import GstPipeline
+
+
+__all__ = [
+    "AdaptiveFrameInterval",
+    "FrameIntervalController",
+    "FrameIntervalDecision",
+    "RateMeter",
+    "ThermalMonitor",
+    "THERMAL_SYSFS_ROOT",
+]
+
+# sysfs class directory listing the thermal zones
+THERMAL_SYSFS_ROOT = "/sys/class/thermal"
+
+
+class ThermalMonitor:
+    """
+    Reads temperatures from the thermal zones in sysfs.
+
+    Args:
+        sysfs_root (str): thermal sysfs class directory
+        zones (list[str]): [Optional] zone types to read, e.g. ["cpu-thermal"], all zones by default
+    """
+
+    def __init__(self, sysfs_root: str = THERMAL_SYSFS_ROOT, zones: Optional[list[str]] = None) -> None:
+        self._root = Path(sysfs_root)
+        self._zones: Optional[set[str]] = set(zones) if zones else None
+
+    def read(self) -> dict[str, float]:
+        """
+        Returns the temperature of each zone in °C, keyed by zone type.
+        """
+        temps: dict[str, float] = {}
+        for zone in sorted(self._root.glob("thermal_zone*")):
+            try:
+                ztype = (zone / "type").read_text().strip() or zone.name
+                temp = int((zone / "temp").read_text().strip()) / 1000
+            except (OSError, ValueError):
+                continue
+            if self._zones is None or ztype in self._zones:
+                temps[ztype] = temp
+        return temps
+
+    def max_temp(self) -> Optional[float]:
+        """
+        Returns the hottest zone's temperature in °C, or None if no zone can be read.
+        """
+        return max(self.read().values(), default=None)
+
+
+class RateMeter:
+    """Counts events from any thread and reports their rate since the last reading"""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self._clock = clock
+        self._lock = Lock()
+        self._count: int = 0
+        self._since: float = clock()
+
+    def tick(self, *_: Any) -> None:
+        with self._lock:
+            self._count += 1
+
+    def rate(self) -> float:
+        """
+        Returns events per second since the previous call and restarts counting.
+        """
+        with self._lock:
+            now = self._clock()
+            elapsed, count = now - self._since, self._count
+            self._count, self._since = 0, now
+        return count / elapsed if elapsed > 0 else 0.0
+
+
+class FrameIntervalDecision(NamedTuple):
+    """A frame interval change and the measurements it was based on"""
+
+    old: int
+    new: int
+    reason: str
+    display_fps: float
+    infer_fps: float
+    temp: Optional[float]
+
+    def __str__(self) -> str:
+        temp = f", {self.temp:.1f}°C" if self.temp is not None else ""
+        return (
+            f"Frame interval {self.old} -> {self.new}: {self.reason} "
+            f"(display {self.display_fps:.1f} fps, inference {self.infer_fps:.1f} fps{temp})"
+        )
+
+
+class FrameIntervalController:
+    """
+    Chooses the inference frame interval that holds a target display fps under a
+    temperature ceiling.
+
+    The interval is raised as soon as the display fps falls below `target_fps - fps_margin`
+    or the temperature reaches `max_temp`. It is only lowered again after `settle`
+    consecutive updates with the display at target and the temperature at least
+    `temp_margin` below the ceiling; in between the interval is held.
+
+    The controller only does the bookkeeping, measurements are passed to `update()`, so
+    it can be driven by a live pipeline or a simulated feed alike.
+    """
+
+    def __init__(
+        self,
+        interval: int,
+        target_fps: float,
+        max_temp: float = 85.0,
+        min_interval: int = 0,
+        max_interval: int = 10,
+        fps_margin: float = 2.0,
+        temp_margin: float = 5.0,
+        settle: int = 3,
+    ) -> None:
+        self._interval: int = min(max(interval, min_interval), max_interval)
+        self._target_fps = target_fps
+        self._max_temp = max_temp
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._fps_margin = fps_margin
+        self._temp_margin = temp_margin
+        self._settle = settle
+        self._headroom: int = 0
+        self.decisions: list[FrameIntervalDecision] = []
+
+    @property
+    def interval(self) -> int:
+        return self._interval
+
+    def update(
+        self, display_fps: float, infer_fps: float, temp: Optional[float] = None
+    ) -> Optional[FrameIntervalDecision]:
+        """
+        Feeds one set of measurements to the controller.
+
+        Returns:
+            FrameIntervalDecision: the change to apply, None to keep the current interval
+        """
+        new, reason = self._interval, ""
+        if temp is not None and temp >= self._max_temp:
+            new, reason = self._interval + 1, f"temperature above {self._max_temp:.1f}°C"
+        elif display_fps < self._target_fps - self._fps_margin:
+            new, reason = self._interval + 1, f"display below {self._target_fps:.1f} fps"
+        elif display_fps >= self._target_fps - self._fps_margin / 2 and (
+            temp is None or temp < self._max_temp - self._temp_margin
+        ):
+            self._headroom += 1
+            if self._headroom >= self._settle:
+                new, reason = self._interval - 1, "headroom at target fps"
+        else:
+            self._headroom = 0
+        new = min(max(new, self._min_interval), self._max_interval)
+        if new == self._interval:
+            return None
+        self._headroom = 0
+        decision = FrameIntervalDecision(self._interval, new, reason, display_fps, infer_fps, temp)
+        self._interval = new
+        self.decisions.append(decision)
+        return decision
+
+
+class AdaptiveFrameInterval:
+    """
+    Runs a `FrameIntervalController` on a pipeline running in-process.
+
+    Buffers are counted on the src pads of the inference and display elements and every
+    `period` seconds the measured rates and the hottest thermal zone are passed to the
+    controller. Its decisions are logged and applied to the `frameinterval` property of
+    the inference element.
+    """
+
+    def __init__(
+        self,
+        controller: FrameIntervalController,
+        thermal: Optional[ThermalMonitor] = None,
+        period: float = 2.0,
+        log: Callable[[str], None] = print,
+    ) -> None:
+        self._controller = controller
+        self._thermal: ThermalMonitor = thermal or ThermalMonitor()
+        self._period = period
+        self._log = log
+        self._infer_rate = RateMeter()
+        self._display_rate = RateMeter()
+        self._infer_elem: str = "infer"
+
+    def attach(self, pipeline: GstPipeline, infer_elem: str = "infer", display_elem: str = "overlay") -> None:
+        """
+        Installs the rate probes and the control loop on `pipeline`.
+
+        Args:
+            pipeline (GstPipeline): pipeline to control, must run with the in-process backend
+            infer_elem (str): name of the `synapinfer` element
+            display_elem (str): name of the element whose output rate is the display fps
+        """
+        self._infer_elem = infer_elem
+        pipeline.add_pad_probe(infer_elem, "src", self._infer_rate.tick)
+        pipeline.add_pad_probe(display_elem, "src", self._display_rate.tick)
+        pipeline.add_start_handler(self._start)
+
+    def _start(self, engine: GstEngine) -> None:
+        Thread(target=self._loop, args=(engine,), name="adaptive-interval", daemon=True).start()
+
+    def _loop(self, engine: GstEngine) -> None:
+        self._infer_rate.rate()
+        self._display_rate.rate()
+        while not engine.wait(self._period):
+            decision = self._controller.update(
+                self._display_rate.rate(), self._infer_rate.rate(), self._thermal.max_temp()
+            )
+            if decision:
+                self._log(str(decision))
+                engine.set_property(self._infer_elem, "frameinterval", decision.new)
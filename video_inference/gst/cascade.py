@@ -0,0 +1,536 @@
+from collections import deque
+from threading import Condition, Lock, Thread
+from typing import Any, Optional
+import hashlib
+import json
+import time
+
+try:
+    import gi
+
+    gi.require_version("Gst", "1.0")
+    gi.require_version("GstVideo", "1.0")
+    from gi.repository import Gst, GstVideo
+except (ImportError, ValueError):
+    Gst = GstVideo = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from gst.engine import GstEngine
+from gst.pipeline import GstPipeline
+from gst.timing import StageTimer
+from utils.cache import CACHE_DIR, JsonCache
+
+
+__all__ = [
+    "ClassifierCascade",
+    "load_labels",
+    "CASCADE_LABELS_DIR",
+]
+
+# directory of the merged detector and classifier label files
+CASCADE_LABELS_DIR = CACHE_DIR / "cascade-labels"
+
+# captured frames kept to match detection results with, each one holds a buffer of the
+# decoder's pool, so only enough to cover the detector's latency
+_FRAMES_KEPT = 3
+
+# formats frames are captured in, crops are converted to RGB from them
+CAPTURE_FORMATS = ("NV12", "I420", "YUY2")
+
+# longest wait of the result thread, so it notices the pipeline stopping
+_POLL_INTERVAL = 0.1
+
+
+def load_labels(path: str) -> list[str]:
+    """
+    Reads the class labels of a SyNAP model info file (a JSON object with a "labels" list).
+    """
+    try:
+        with open(path, "r") as f:
+            labels = json.load(f)["labels"]
+    except (OSError, ValueError, KeyError, TypeError):
+        raise SystemExit(f"Fatal: can't read class labels from {path}")
+    return [str(label) for label in labels]
+
+
+def _sample_yuv(
+    data: "np.ndarray",
+    fmt: str,
+    strides: list[int],
+    offsets: list[int],
+    ys: "np.ndarray",
+    xs: "np.ndarray",
+) -> tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """
+    Returns the Y, U and V samples of the pixels at rows `ys` and columns `xs` of a frame in
+    one of `CAPTURE_FORMATS`, each a (len(ys), len(xs)) array.
+    """
+    rows, cols = ys[:, None], xs[None, :]
+    if fmt == "YUY2":
+        # Y0 U Y1 V for every pair of pixels
+        row = offsets[0] + rows * strides[0]
+        pair = row + cols // 2 * 4
+        return data[row + cols * 2], data[pair + 1], data[pair + 3]
+    y = data[offsets[0] + rows * strides[0] + cols]
+    c_rows, c_cols = rows // 2, cols // 2
+    if fmt == "NV12":
+        uv = offsets[1] + c_rows * strides[1] + c_cols * 2
+        return y, data[uv], data[uv + 1]
+    return y, data[offsets[1] + c_rows * strides[1] + c_cols], data[offsets[2] + c_rows * strides[2] + c_cols]
+
+
+class _PendingCrop:
+    """A crop sent to the classifier, completed by the classifier's result"""
+
+    def __init__(self, item: dict[str, Any], det_class: int) -> None:
+        self.item = item
+        self.det_class = det_class
+        self.sent: float = time.perf_counter()
+        self.pts: int = 0
+        self.result: Optional[int] = None
+        self.done: bool = False
+
+
+class _HeldResult:
+    """A detector result held until its crops are classified or its deadline passes"""
+
+    def __init__(self, result: Any, data: bytes, buffer: Any, caps: Any, received: float, deadline: float) -> None:
+        self.result = result
+        self.data = data
+        self.pts, self.dts, self.duration = buffer.pts, buffer.dts, buffer.duration
+        self.caps = caps
+        self.received = received
+        self.deadline = deadline
+        self.crops: list[_PendingCrop] = []
+
+
+class ClassifierCascade:
+    """
+    Runs a classifier on the regions found by the detector, in the same pipeline.
+
+    The detector's results are taken out of the inference branch with an `appsink`. For
+    every result, the detections of `classes` scoring at least `threshold` are cropped
+    from the matching frame, the `budget` best of them, and pushed through an `appsrc` to a
+    second `synapinfer` in classifier mode. Frames are captured from the data tee in their
+    own format when it is one of `CAPTURE_FORMATS`, without a conversion, and crops are
+    scaled and converted to RGB in NumPy at the classifier's input size only. Once the crops
+    are classified, or after `timeout` seconds, the result is passed on to the overlay with
+    the classified detections relabeled "detection: class". Results are held and released
+    in order by a thread of their own, so neither the detector's nor the classifier's
+    streaming thread waits for them.
+
+    Relabeled detections use class indices past the detector's labels, the overlay is given
+    a merged label file (see `labels_file`) that names them. Detections without a
+    classification keep their detector label. The time each stage takes is collected so
+    the crop budget can be sized, see `stats`.
+
+    Detector boxes are expected in the coordinates of the detector input, `det_w` x
+    `det_h`, and are scaled to the captured frames.
+
+    Args:
+        model (str): classifier .synap model
+        labels (str): classifier labels file
+        det_labels (str): detector labels file
+        cls_w (int): classifier input width
+        cls_h (int): classifier input height
+        det_w (int): detector input width
+        det_h (int): detector input height
+        threshold (float): minimum detection score to classify
+        budget (int): maximum crops classified per frame, the highest scoring are picked
+        classes (list[int]): [Optional] detector classes to classify, all by default
+        timeout (float): seconds a detection result is held for its classifications
+        name (str): prefix of the cascade's element names
+    """
+
+    def __init__(
+        self,
+        model: str,
+        labels: str,
+        det_labels: str,
+        cls_w: int,
+        cls_h: int,
+        det_w: int,
+        det_h: int,
+        threshold: float = 0.5,
+        budget: int = 4,
+        classes: Optional[list[int]] = None,
+        timeout: float = 0.2,
+        name: str = "cascade",
+    ) -> None:
+        if np is None:
+            raise SystemExit("Fatal: NumPy is required for the classifier cascade")
+        self._model = model
+        self._labels_path = labels
+        self._det_labels_path = det_labels
+        self._labels = load_labels(labels)
+        self._det_labels = load_labels(det_labels)
+        self._cls_w, self._cls_h = cls_w, cls_h
+        self._det_w, self._det_h = det_w, det_h
+        self._threshold = threshold
+        self._budget = max(0, budget)
+        self._classes: list[int] = classes if classes is not None else list(range(len(self._det_labels)))
+        if invalid := [c for c in self._classes if not 0 <= c < len(self._det_labels)]:
+            raise SystemExit(f"Fatal: invalid detector classes for the cascade: {invalid}")
+        self._class_slot: dict[int, int] = {c: i for i, c in enumerate(self._classes)}
+        self._timeout = timeout
+        self._name = name
+        self._lock = Lock()
+        # notified when a result is held, a crop is classified or the detector reaches EOS
+        self._changed = Condition(self._lock)
+        self._frames: deque[tuple[int, Any]] = deque(maxlen=_FRAMES_KEPT)
+        self._pending: deque[_PendingCrop] = deque()
+        self._held: deque[_HeldResult] = deque()
+        self._eos: bool = False
+        self._last_pruned: int = 0
+        self._infer_start: dict[int, float] = {}
+        self._cls_src = None
+        self._out_src = None
+        self._out_caps_set: bool = False
+        self._crop_pts: int = 0
+        self._counts: dict[str, int] = {
+            "results": 0,
+            "crops": 0,
+            "over_budget": 0,
+            "timeouts": 0,
+            "no_frame": 0,
+        }
+        self.timers: dict[str, StageTimer] = {
+            "detect": StageTimer(),
+            "crop": StageTimer(),
+            "classify": StageTimer(),
+            "hold": StageTimer(),
+        }
+
+    @property
+    def labels_file(self) -> str:
+        """
+        Writes the merged label file for the overlay and returns its path.
+
+        The detector's labels are followed by one "detection: class" label per classified
+        detector class and classifier class.
+        """
+        merged = [
+            *self._det_labels,
+            *(f"{self._det_labels[c]}: {label}" for c in self._classes for label in self._labels),
+        ]
+        digest = hashlib.blake2b(json.dumps(merged).encode(), digest_size=10).hexdigest()
+        path = CASCADE_LABELS_DIR / f"{digest}.json"
+        if not path.exists():
+            with open(self._det_labels_path, "r") as f:
+                info = json.load(f)
+            JsonCache(path).put_many({**info, "labels": merged})
+        return str(path)
+
+    def _merged_index(self, det_class: int, cls_class: int) -> int:
+        return len(self._det_labels) + self._class_slot[det_class] * len(self._labels) + cls_class
+
+    def detector_elems(self) -> list[str | list[str]]:
+        """
+        Returns the end of the inference branch: the detector's results go to the cascade
+        instead of the overlay.
+        """
+        return [["appsink", f"name={self._name}_det", "emit-signals=true", "sync=false"]]
+
+    def branches(self, out: Optional[str], tee: str = "t_data") -> list[list[str | list[str]]]:
+        """
+        Returns the frame capture, classifier and output branches.
+
+        Args:
+            out (str): [Optional] pad the relabeled results go to, e.g. "overlay.inference_sink",
+                they are discarded if None
+            tee (str): name of the data tee frames are captured from
+        """
+        return [
+            [
+                f"{tee}.",
+                ["queue", f"name=q_{self._name}_frames", "max-size-buffers=2", "leaky=downstream"],
+                # a passthrough unless the tee's format can't be cropped
+                "videoconvert",
+                f"video/x-raw,format=(string){{{','.join(CAPTURE_FORMATS)}}}",
+                ["appsink", f"name={self._name}_frames", "emit-signals=true", "max-buffers=1", "drop=true", "sync=false"],
+            ],
+            [
+                [
+                    "appsrc",
+                    f"name={self._name}_crops",
+                    "is-live=true",
+                    "format=time",
+                    f'caps="video/x-raw,format=RGB,width={self._cls_w},height={self._cls_h},framerate=0/1"',
+                ],
+                [
+                    "synapinfer",
+                    "mode=classifier",
+                    f"model={self._model}",
+                    f"name={self._name}_cls",
+                ],
+                ["fakesink", "sync=false", "async=false"],
+            ],
+            [
+                ["appsrc", f"name={self._name}_out", "is-live=true", "format=time"],
+                out if out else ["fakesink", "sync=false", "async=false"],
+            ],
+        ]
+
+    def attach(self, pipeline: GstPipeline, out: Optional[str], tee: str = "t_data", infer_elem: str = "infer") -> None:
+        """
+        Adds the cascade's branches and handlers to a generated pipeline whose inference
+        branch ends with `detector_elems`. The pipeline must run with the in-process backend.
+        """
+        for branch in self.branches(out, tee):
+            pipeline.add_branch(*branch)
+        pipeline.add_signal_handler(f"{self._name}_frames", "new-sample", self._on_frame)
+        pipeline.add_signal_handler(f"{self._name}_det", "new-sample", self._on_result)
+        pipeline.add_signal_handler(f"{self._name}_det", "eos", self._on_eos)
+        pipeline.add_pad_probe(f"{self._name}_cls", "src", self._on_classification)
+        pipeline.add_pad_probe(infer_elem, "sink", self._on_infer_input)
+        pipeline.add_pad_probe(infer_elem, "src", self._on_infer_output)
+        pipeline.add_start_handler(self._on_start)
+
+    def _on_start(self, engine: GstEngine) -> None:
+        with self._lock:
+            self._frames.clear()
+            self._pending.clear()
+            self._held.clear()
+            self._infer_start.clear()
+            self._eos = False
+            self._out_caps_set = False
+        self._cls_src = engine.get_element(f"{self._name}_crops")
+        self._out_src = engine.get_element(f"{self._name}_out")
+        Thread(target=self._release_loop, args=(engine,), name="cascade-results", daemon=True).start()
+
+    def _on_infer_input(self, buffer: Any) -> bool:
+        with self._lock:
+            self._infer_start[buffer.pts] = time.perf_counter()
+            # results of skipped frames never come out
+            while len(self._infer_start) > 64:
+                del self._infer_start[next(iter(self._infer_start))]
+        return True
+
+    def _on_infer_output(self, buffer: Any) -> bool:
+        with self._lock:
+            start = self._infer_start.pop(buffer.pts, None)
+        if start is not None:
+            self.timers["detect"].record(time.perf_counter() - start)
+        return True
+
+    def _on_frame(self, sink: Any) -> Any:
+        if (sample := sink.emit("pull-sample")) is not None:
+            with self._lock:
+                # the sample keeps its buffer alive, frames are only mapped to be cropped
+                self._frames.append((sample.get_buffer().pts, sample))
+        return Gst.FlowReturn.OK
+
+    def _frame_for(self, pts: int) -> Optional[Any]:
+        with self._lock:
+            frames = list(self._frames)
+        exact = [s for p, s in frames if p == pts]
+        if exact:
+            return exact[0]
+        # the newest frame that isn't later than the result
+        earlier = [(p, s) for p, s in frames if p <= pts]
+        return max(earlier, key=lambda f: f[0])[1] if earlier else None
+
+    def _crops(self, sample: Any, items: list[dict[str, Any]]) -> list["np.ndarray"]:
+        """
+        Crops `items` from a captured frame, scaled to the classifier input and converted to RGB.
+        """
+        video_info = GstVideo.VideoInfo.new_from_caps(sample.get_caps())
+        width, height = video_info.width, video_info.height
+        fmt = sample.get_caps().get_structure(0).get_value("format")
+        buffer = sample.get_buffer()
+        # the buffer's layout if the producer set one, otherwise the default layout of the caps
+        meta = GstVideo.buffer_get_video_meta(buffer)
+        strides, offsets = (meta.stride, meta.offset) if meta else (video_info.stride, video_info.offset)
+        ok, info = buffer.map(Gst.MapFlags.READ)
+        if not ok:
+            return []
+        data = None
+        try:
+            data = np.frombuffer(info.data, dtype=np.uint8)
+            sx, sy = width / self._det_w, height / self._det_h
+            crops: list[np.ndarray] = []
+            for item in items:
+                box = item["bounding_box"]
+                x, y = float(box["origin"]["x"]) * sx, float(box["origin"]["y"]) * sy
+                w, h = float(box["size"]["x"]) * sx, float(box["size"]["y"]) * sy
+                # nearest neighbour sampling at the classifier's input size
+                xs = np.clip((x + (np.arange(self._cls_w) + 0.5) * w / self._cls_w).astype(np.intp), 0, width - 1)
+                ys = np.clip((y + (np.arange(self._cls_h) + 0.5) * h / self._cls_h).astype(np.intp), 0, height - 1)
+                lum, u, v = _sample_yuv(data, fmt, strides, offsets, ys, xs)
+                lum = (lum.astype(np.float32) - 16) * 1.164
+                u, v = u.astype(np.float32) - 128, v.astype(np.float32) - 128
+                rgb = np.stack((lum + 1.596 * v, lum - 0.392 * u - 0.813 * v, lum + 2.017 * u), axis=-1)
+                crops.append(np.clip(rgb, 0, 255).astype(np.uint8))
+            return crops
+        finally:
+            del data
+            buffer.unmap(info)
+
+    def _classify(self, crops: list["np.ndarray"], items: list[dict[str, Any]]) -> list[_PendingCrop]:
+        pending: list[_PendingCrop] = []
+        for crop, item in zip(crops, items):
+            entry = _PendingCrop(item, int(item["class_index"]))
+            buf = Gst.Buffer.new_wrapped(crop.tobytes())
+            with self._lock:
+                self._crop_pts += 1
+                buf.pts = entry.pts = self._crop_pts
+                self._pending.append(entry)
+            if self._cls_src.emit("push-buffer", buf) != Gst.FlowReturn.OK:
+                with self._lock:
+                    self._pending.remove(entry)
+                continue
+            pending.append(entry)
+        return pending
+
+    def _on_classification(self, buffer: Any) -> bool:
+        try:
+            result = json.loads(buffer.extract_dup(0, buffer.get_size()).rstrip(b"\0"))
+            items = result.get("items", [])
+            cls_class: Optional[int] = int(items[0]["class_index"]) if items else None
+        except (ValueError, KeyError, TypeError, AttributeError, IndexError):
+            cls_class = None
+        with self._lock:
+            entry = None
+            if buffer.pts <= self._last_pruned:
+                # the crop's result was already released without it
+                pass
+            elif any(e.pts == buffer.pts for e in self._pending):
+                # crops the classifier dropped never get a result
+                while (entry := self._pending.popleft()).pts != buffer.pts:
+                    entry.done = True
+            elif self._pending:
+                entry = self._pending.popleft()
+            if entry:
+                if cls_class is not None and 0 <= cls_class < len(self._labels):
+                    entry.result = cls_class
+                entry.done = True
+                self.timers["classify"].record(time.perf_counter() - entry.sent)
+            self._changed.notify()
+        return True
+
+    def _on_result(self, sink: Any) -> Any:
+        if (sample := sink.emit("pull-sample")) is None:
+            return Gst.FlowReturn.OK
+        received = time.perf_counter()
+        buffer = sample.get_buffer()
+        data = buffer.extract_dup(0, buffer.get_size())
+        try:
+            result = json.loads(data.rstrip(b"\0"))
+            items: list[dict[str, Any]] = result.get("items", [])
+        except (ValueError, AttributeError):
+            result, items = None, []
+        candidates = sorted(
+            (
+                item
+                for item in items
+                if item.get("class_index") in self._class_slot
+                and float(item.get("confidence", 0)) >= self._threshold
+            ),
+            key=lambda item: float(item.get("confidence", 0)),
+            reverse=True,
+        )
+        selected = candidates[: self._budget]
+        with self._lock:
+            self._counts["results"] += 1
+            self._counts["over_budget"] += len(candidates) - len(selected)
+
+        held = _HeldResult(result, data, buffer, sample.get_caps(), received, received + self._timeout)
+        if selected and self._cls_src is not None:
+            if (frame := self._frame_for(buffer.pts)) is None:
+                with self._lock:
+                    self._counts["no_frame"] += 1
+            else:
+                start = time.perf_counter()
+                try:
+                    crops = self._crops(frame, selected)
+                except (KeyError, TypeError, ValueError):
+                    crops = []
+                self.timers["crop"].record(time.perf_counter() - start)
+                held.crops = self._classify(crops, selected)
+        with self._lock:
+            self._counts["crops"] += len(held.crops)
+            self._held.append(held)
+            self._changed.notify()
+        return Gst.FlowReturn.OK
+
+    def _release_loop(self, engine: GstEngine) -> None:
+        """
+        Passes the held results on to the overlay in order, each once its crops are
+        classified or its deadline has passed, and sends EOS once they are all out.
+        """
+        while not engine.wait(0):
+            with self._lock:
+                now = time.perf_counter()
+                ready: list[_HeldResult] = []
+                while self._held and (
+                    now >= self._held[0].deadline or all(c.done for c in self._held[0].crops)
+                ):
+                    ready.append(self._held.popleft())
+                timed_out = [c for held in ready for c in held.crops if not c.done]
+                if timed_out:
+                    # their results would come too late, they are dropped when they do
+                    self._counts["timeouts"] += len(timed_out)
+                    self._last_pruned = max(self._last_pruned, *(c.pts for c in timed_out))
+                    while self._pending and self._pending[0].pts <= self._last_pruned:
+                        self._pending.popleft()
+                eos = self._eos and not self._held
+                if not ready and not eos:
+                    wait = self._held[0].deadline - now if self._held else _POLL_INTERVAL
+                    self._changed.wait(min(max(wait, 0.0), _POLL_INTERVAL))
+                    continue
+            for held in ready:
+                self._release(held)
+            if eos:
+                for src in (self._cls_src, self._out_src):
+                    if src is not None:
+                        src.emit("end-of-stream")
+                return
+
+    def _release(self, held: _HeldResult) -> None:
+        data = held.data
+        if held.crops:
+            for entry in held.crops:
+                if entry.done and entry.result is not None:
+                    entry.item["class_index"] = self._merged_index(entry.det_class, entry.result)
+            data = json.dumps(held.result).encode()
+        out = Gst.Buffer.new_wrapped(data)
+        out.pts, out.dts, out.duration = held.pts, held.dts, held.duration
+        if self._out_src is not None:
+            if not self._out_caps_set:
+                self._out_src.set_property("caps", held.caps)
+                self._out_caps_set = True
+            self._out_src.emit("push-buffer", out)
+        self.timers["hold"].record(time.perf_counter() - held.received)
+
+    def _on_eos(self, _sink: Any) -> None:
+        with self._lock:
+            self._eos = True
+            self._changed.notify()
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        """
+        Counters (detector results, crops classified, detections skipped over the budget,
+        classifications that timed out, results without a captured frame) and the stats of
+        each stage: "detect" (detector inference), "crop" (all crops of a frame), "classify"
+        (one crop, queued and classified) and "hold" (delay added to the overlay).
+        """
+        with self._lock:
+            counts = dict(self._counts)
+        return {**counts, **{stage: timer.stats for stage, timer in self.timers.items()}}
+
+    def __str__(self) -> str:
+        with self._lock:
+            c = dict(self._counts)
+        per_frame = c["crops"] / c["results"] if c["results"] else 0.0
+        lines = [
+            f"{c['results']} results, {c['crops']} crops ({per_frame:.2f} per frame, budget {self._budget}), "
+            f"{c['over_budget']} over budget, {c['timeouts']} timed out"
+            + (f", {c['no_frame']} without a frame" if c["no_frame"] else "")
+        ]
+        lines += [f"  {stage:<8} {timer}" for stage, timer in self.timers.items()]
+        return "\n".join(lines)
@@ -0,0 +1,71 @@
+from typing import Any, Optional
+import json
+
+from gst.pipeline import GstPipeline
+from utils.detection_ring import Detection, DetectionRingWriter
+
+
+__all__ = [
+    "DetectionPublisher",
+    "parse_detections",
+]
+
+
+def parse_detections(data: bytes) -> Optional[list[Detection]]:
+    """
+    Parses the detector results produced by `synapinfer`.
+
+    Results are SyNAP detector JSON: a list of "items", each with a "class_index", a
+    "confidence" and a "bounding_box" made of an "origin" and a "size".
+
+    Returns:
+        list[Detection]: the detections, or None if `data` isn't a detector result
+    """
+    try:
+        result = json.loads(data.rstrip(b"\0"))
+        return [
+            Detection(
+                int(item["class_index"]),
+                float(item["confidence"]),
+                float(item["bounding_box"]["origin"]["x"]),
+                float(item["bounding_box"]["origin"]["y"]),
+                float(item["bounding_box"]["size"]["x"]),
+                float(item["bounding_box"]["size"]["y"]),
+            )
+            for item in result.get("items", [])
+        ]
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+class DetectionPublisher:
+    """
+    Publishes the results of the inference element to a shared memory ring buffer.
+
+    Results are read with a probe on the src pad of `synapinfer`, decoded and written
+    without copying the frames, so publishing costs a JSON parse per inference.
+    Consumers read them with `utils.detection_ring.DetectionRingReader`.
+    """
+
+    def __init__(self, writer: DetectionRingWriter) -> None:
+        self._writer = writer
+        self._errors: int = 0
+
+    @property
+    def errors(self) -> int:
+        """Number of inference results that couldn't be decoded"""
+        return self._errors
+
+    def attach(self, pipeline: GstPipeline, infer_elem: str = "infer") -> None:
+        """
+        Installs the publishing probe on `pipeline`, which must run with the in-process backend.
+        """
+        pipeline.add_pad_probe(infer_elem, "src", self._on_buffer)
+
+    def _on_buffer(self, buffer: Any) -> bool:
+        detections = parse_detections(buffer.extract_dup(0, buffer.get_size()))
+        if detections is None:
+            self._errors += 1
+        else:
+            self._writer.publish(buffer.pts, detections)
+        return True
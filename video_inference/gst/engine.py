@@ -0,0 +1,323 @@
+from enum import Enum, auto
+from threading import Event, Lock, Thread
+from typing import Any, Callable, NamedTuple, Optional
+import os
+
+try:
+    import gi
+
+    gi.require_version("Gst", "1.0")
+    from gi.repository import GLib, Gst
+except (ImportError, ValueError):
+    GLib = Gst = None
+
+
+__all__ = [
+    "EngineEvent",
+    "EngineEventType",
+    "GstEngine",
+    "engine_available",
+]
+
+
+class EngineEventType(Enum):
+    STATE_CHANGED = auto()
+    WARNING = auto()
+    ERROR = auto()
+    EOS = auto()
+    ELEMENT = auto()
+
+
+class EngineEvent(NamedTuple):
+    """A bus message translated into a plain Python event"""
+
+    type: EngineEventType
+    source: str
+    data: dict[str, Any]
+
+
+def engine_available() -> bool:
+    """
+    Returns True if PyGObject and the GStreamer introspection bindings are installed.
+    """
+    return Gst is not None
+
+
+class GstEngine:
+    """
+    Runs a pipeline in-process with `Gst.parse_launch` instead of spawning `gst-launch-1.0`.
+
+    The bus is watched from a GLib main loop running on a background thread and every
+    state change, warning, error, EOS and element message is forwarded to the registered
+    event handlers as an `EngineEvent`. Each engine has a main context of its own, so
+    engines running in parallel dispatch their buses independently.
+
+    The environment (`env`) is applied once, before GStreamer is initialized, by the first
+    engine of the process.
+    """
+
+    _init_lock = Lock()
+
+    def __init__(self, pipeline: list[str], env: Optional[dict[str, str]] = None) -> None:
+        if not engine_available():
+            raise RuntimeError("PyGObject GStreamer bindings are not installed")
+        self._desc: str = " ".join(pipeline)
+        self._env: dict[str, str] = env or {}
+        self._handlers: list[Callable[[EngineEvent], None]] = []
+        self._signal_handlers: list[tuple[str, str, Callable[..., Any]]] = []
+        self._pad_probes: list[tuple[str, str, Callable[[Any], Optional[bool]]]] = []
+        self._start_handlers: list[Callable[["GstEngine"], None]] = []
+        self._pipeline = None
+        self._context = None
+        self._loop = None
+        self._loop_thread: Optional[Thread] = None
+        self._done = Event()
+        self._eos = Event()
+        self._error: Optional[str] = None
+        self._interrupted: bool = False
+        self._parsed: bool = False
+
+    @property
+    def error(self) -> Optional[str]:
+        """Error message of the last failed run, if any"""
+        return self._error
+
+    @property
+    def interrupted(self) -> bool:
+        """True if the last run was shut down with a SIGINT"""
+        return self._interrupted
+
+    @property
+    def parsed(self) -> bool:
+        """True if the pipeline description of the last run could be parsed"""
+        return self._parsed
+
+    @property
+    def pipeline(self):
+        """The underlying `Gst.Pipeline`, only valid after `start()`"""
+        return self._pipeline
+
+    def add_event_handler(self, handler: Callable[[EngineEvent], None]) -> None:
+        self._handlers.append(handler)
+
+    def add_signal_handler(self, elem_name: str, signal: str, handler: Callable[..., Any]) -> None:
+        """
+        Connects `handler` to a GObject signal of a named element when the pipeline starts.
+
+        Handlers are called from streaming threads and must not block.
+        """
+        self._signal_handlers.append((elem_name, signal, handler))
+
+    def get_element(self, name: str):
+        """
+        Returns the pipeline element called `name`, or None if it doesn't exist.
+        """
+        return self._pipeline.get_by_name(name) if self._pipeline else None
+
+    def set_property(self, elem_name: str, prop: str, value: Any) -> bool:
+        """
+        Sets a property on a named element of the running pipeline.
+
+        Returns:
+            bool: True if the element exists and the property was set.
+        """
+        if not (elem := self.get_element(elem_name)):
+            return False
+        elem.set_property(prop, value)
+        return True
+
+    def add_pad_probe(
+        self, elem_name: str, pad_name: str, handler: Callable[[Any], Optional[bool]]
+    ) -> None:
+        """
+        Calls `handler` with every buffer that passes a static pad of a named element.
+
+        The buffer is dropped if the handler returns False. Handlers are called from
+        streaming threads and must not block.
+        """
+        self._pad_probes.append((elem_name, pad_name, handler))
+
+    def add_start_handler(self, handler: Callable[["GstEngine"], None]) -> None:
+        """
+        Calls `handler` with the engine once the pipeline is set to PLAYING.
+        """
+        self._start_handlers.append(handler)
+
+    def _connect_probes(self) -> None:
+        for elem_name, pad_name, handler in self._pad_probes:
+            elem = self._pipeline.get_by_name(elem_name)
+            if not elem or not (pad := elem.get_static_pad(pad_name)):
+                continue
+
+            def probe(_pad, info, handler=handler):
+                if handler(info.get_buffer()) is False:
+                    return Gst.PadProbeReturn.DROP
+                return Gst.PadProbeReturn.OK
+
+            pad.add_probe(Gst.PadProbeType.BUFFER, probe)
+
+    def _init_gst(self) -> None:
+        # GStreamer reads GST_* variables once at init, so the environment is applied then
+        # and never changed while other engines may be running
+        with GstEngine._init_lock:
+            if not Gst.is_initialized():
+                os.environ.update(self._env)
+                Gst.init(None)
+
+    def _run_loop(self) -> None:
+        self._context.push_thread_default()
+        try:
+            self._loop.run()
+        finally:
+            self._context.pop_thread_default()
+
+    def _emit(self, event: EngineEvent) -> None:
+        for handler in self._handlers:
+            handler(event)
+
+    def _on_message(self, _bus, msg) -> None:
+        src: str = msg.src.get_name() if msg.src else ""
+        if msg.type == Gst.MessageType.EOS:
+            self._eos.set()
+            self._done.set()
+            self._emit(EngineEvent(EngineEventType.EOS, src, {}))
+        elif msg.type == Gst.MessageType.ERROR:
+            err, debug = msg.parse_error()
+            self._error = f"{src}: {err.message}" + (f"\n{debug}" if debug else "")
+            self._done.set()
+            self._emit(
+                EngineEvent(EngineEventType.ERROR, src, {"message": err.message, "debug": debug})
+            )
+        elif msg.type == Gst.MessageType.WARNING:
+            err, debug = msg.parse_warning()
+            self._emit(
+                EngineEvent(EngineEventType.WARNING, src, {"message": err.message, "debug": debug})
+            )
+        elif msg.type == Gst.MessageType.STATE_CHANGED:
+            old, new, pending = msg.parse_state_changed()
+            self._emit(
+                EngineEvent(
+                    EngineEventType.STATE_CHANGED,
+                    src,
+                    {
+                        "old": old.value_nick,
+                        "new": new.value_nick,
+                        "pending": pending.value_nick,
+                    },
+                )
+            )
+        elif msg.type == Gst.MessageType.ELEMENT:
+            struct = msg.get_structure()
+            self._emit(
+                EngineEvent(
+                    EngineEventType.ELEMENT,
+                    src,
+                    {"name": struct.get_name(), "structure": struct.to_string()} if struct else {},
+                )
+            )
+
+    def start(self) -> None:
+        """
+        Parses the pipeline, starts the bus loop thread and sets the pipeline to PLAYING.
+
+        Raises:
+            RuntimeError: if the pipeline description can't be parsed.
+        """
+        self._init_gst()
+        self._done.clear()
+        self._eos.clear()
+        self._error = None
+        self._parsed = False
+        try:
+            self._pipeline = Gst.parse_launch(self._desc)
+        except GLib.Error as e:
+            raise RuntimeError(e.message) from e
+        self._parsed = True
+        for elem_name, signal, handler in self._signal_handlers:
+            if elem := self._pipeline.get_by_name(elem_name):
+                elem.connect(signal, handler)
+        self._connect_probes()
+        bus = self._pipeline.get_bus()
+        # the bus watch is attached to the thread-default context, the engine's own
+        self._context = GLib.MainContext.new()
+        self._context.push_thread_default()
+        try:
+            bus.add_signal_watch()
+        finally:
+            self._context.pop_thread_default()
+        bus.connect("message", self._on_message)
+        self._loop = GLib.MainLoop.new(self._context, False)
+        self._loop_thread = Thread(target=self._run_loop, name="gst-bus", daemon=True)
+        self._loop_thread.start()
+        if self._pipeline.set_state(Gst.State.PLAYING) == Gst.StateChangeReturn.FAILURE:
+            # the element that failed posts the actual reason on the bus
+            self._done.wait(1)
+            self._error = self._error or "Failed to set pipeline to PLAYING"
+            self._done.set()
+            return
+        for handler in self._start_handlers:
+            handler(self)
+
+    def abort(self, reason: str) -> None:
+        """
+        Fails the running pipeline with `reason` as its error, can be called from any thread.
+        """
+        if not self._done.is_set():
+            self._error = reason
+            self._done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until the pipeline reaches EOS or fails.
+
+        Returns:
+            bool: True if the pipeline finished (EOS or error) within `timeout`.
+        """
+        return self._done.wait(timeout)
+
+    def stop(self, timeout: float = 5) -> None:
+        """
+        Sends EOS and waits up to `timeout` seconds for it to reach the sinks before
+        tearing the pipeline down.
+        """
+        if self._pipeline is None:
+            return
+        if not self._done.is_set():
+            self._pipeline.send_event(Gst.Event.new_eos())
+            if not self._eos.wait(timeout):
+                print("Shutdown failed, forcefully stopping pipeline...")
+        self._pipeline.set_state(Gst.State.NULL)
+        self._pipeline.get_bus().remove_signal_watch()
+        if self._loop:
+            self._loop.quit()
+        if self._loop_thread:
+            self._loop_thread.join(timeout)
+        self._pipeline = None
+        self._context = None
+        self._loop = None
+        self._loop_thread = None
+
+    def run(self) -> bool:
+        """
+        Runs the pipeline until EOS or error.
+
+        Pipeline can be shutdown with a SIGINT (KeyboardInterrupt) in which case EOS is
+        sent first so sinks can finalize their output.
+
+        Returns:
+            bool: True if pipeline executed successfully, False if there was an error.
+        """
+        self._interrupted = False
+        try:
+            self.start()
+            # waiting in short slices keeps the main thread responsive to SIGINT
+            while not self.wait(0.5):
+                pass
+        except KeyboardInterrupt:
+            print("\nShutting down pipeline...")
+            self._interrupted = True
+        except RuntimeError as e:
+            self._error = str(e)
+        finally:
+            self.stop()
+        return self._error is None
@@ -0,0 +1,372 @@
+from typing import Callable, NamedTuple, Optional
+import asyncio
+import os
+import resource
+import signal
+import subprocess
+import time
+
+from gst.metrics import PipelineMetrics
+from gst.pipeline import GstPipeline, EOS_TIMEOUT, TERM_TIMEOUT
+from gst.queues import QueueDropCounter
+from gst.supervisor import Backoff
+
+
+__all__ = [
+    "FleetSupervisor",
+    "ProcessLimits",
+    "StreamStats",
+    "assign_cpus",
+]
+
+# restarts back off more slowly than RTSP reconnects, a crashing pipeline is rarely fixed in seconds
+FLEET_BACKOFF = Backoff(initial=1.0, maximum=30.0)
+
+
+def assign_cpus(n_streams: int, cpus: Optional[list[int]] = None) -> list[tuple[int, ...]]:
+    """
+    Spreads streams over CPU cores.
+
+    With at least as many cores as streams each stream gets its own contiguous set of cores,
+    e.g. 4 cores and 2 streams give (0, 1) and (2, 3). With more streams than cores they
+    are assigned round-robin, one core each.
+
+    Args:
+        n_streams (int): number of streams
+        cpus (list[int]): [Optional] cores to use, the cores this process may run on by default
+
+    Returns:
+        list[tuple[int, ...]]: the cores of each stream
+    """
+    cpus = sorted(cpus if cpus is not None else os.sched_getaffinity(0))
+    if not n_streams or not cpus:
+        return [tuple(cpus)] * n_streams
+    if n_streams > len(cpus):
+        return [(cpus[i % len(cpus)],) for i in range(n_streams)]
+    per_stream = len(cpus) // n_streams
+    return [tuple(cpus[i * per_stream : (i + 1) * per_stream]) for i in range(n_streams)]
+
+
+class ProcessLimits(NamedTuple):
+    """
+    Scheduling and resource limits of a stream's `gst-launch-1.0` process.
+
+    `max_memory_mb` limits the address space (RLIMIT_AS), which for GStreamer is several
+    times the resident memory because of thread stacks and allocator arenas, so it should
+    be set generously and is meant to stop a leaking pipeline rather than to budget memory.
+
+    The limits are applied from this process once the stream's process is spawned, a
+    `preexec_fn` isn't safe in a process running threads such as the metrics server.
+    """
+
+    cpus: Optional[tuple[int, ...]] = None
+    nice: int = 0
+    max_memory_mb: Optional[int] = None
+
+    def apply(self, pid: int) -> None:
+        """
+        Applies the limits to the running process `pid`.
+
+        CPU affinity and niceness are per thread on Linux, so they are set on every thread
+        the process has started until no new one shows up, threads started later inherit
+        them. The address space limit applies to the whole process.
+
+        Raises:
+            OSError: if a limit can't be applied, e.g. a negative niceness without privileges.
+        """
+        if self.max_memory_mb:
+            limit = self.max_memory_mb << 20
+            resource.prlimit(pid, resource.RLIMIT_AS, (limit, limit))
+        if not (self.cpus or self.nice):
+            return
+        done: set[int] = set()
+        while new := _threads(pid) - done:
+            for tid in new:
+                try:
+                    if self.cpus:
+                        os.sched_setaffinity(tid, self.cpus)
+                    if self.nice:
+                        os.setpriority(os.PRIO_PROCESS, tid, self.nice)
+                except ProcessLookupError:
+                    # the thread exited meanwhile
+                    pass
+            done |= new
+
+    def __str__(self) -> str:
+        parts = []
+        if self.cpus:
+            parts.append(f"cpus {','.join(str(c) for c in self.cpus)}")
+        if self.nice:
+            parts.append(f"nice {self.nice}")
+        if self.max_memory_mb:
+            parts.append(f"max {self.max_memory_mb} MiB")
+        return ", ".join(parts) or "no limits"
+
+
+def _threads(pid: int) -> set[int]:
+    """Returns the thread ids of process `pid`, none if it exited"""
+    try:
+        return {int(tid) for tid in os.listdir(f"/proc/{pid}/task")}
+    except OSError:
+        return set()
+
+
+class StreamStats(NamedTuple):
+    """Measurements of one stream, fps and CPU are over the last report interval"""
+
+    running: bool
+    fps: Optional[float]
+    cpu_pct: Optional[float]
+    rss_mb: Optional[float]
+    restarts: int
+
+    def __str__(self) -> str:
+        if not self.running:
+            return f"stopped, {self.restarts} restarts"
+        fps = f"{self.fps:.1f} fps" if self.fps is not None else "? fps"
+        cpu = f"{self.cpu_pct:.0f}% CPU" if self.cpu_pct is not None else "? CPU"
+        rss = f"{self.rss_mb:.0f} MiB" if self.rss_mb is not None else "? MiB"
+        return f"{fps}, {cpu}, {rss}, {self.restarts} restarts"
+
+
+class _Stream:
+    """Runtime state of a supervised stream"""
+
+    def __init__(self, pipeline: GstPipeline, limits: ProcessLimits, metrics: PipelineMetrics) -> None:
+        self.pipeline = pipeline
+        self.limits = limits
+        self.metrics = metrics
+        self.running: bool = False
+        self.restarts: int = 0
+        self.limits_error: Optional[str] = None
+
+
+class FleetSupervisor:
+    """
+    Runs one `gst-launch-1.0` process per stream and keeps them all running.
+
+    Each stream's process is pinned to its CPU cores, reniced and resource limited with
+    `ProcessLimits` as soon as it is spawned, a stream whose limits can't be applied is killed
+    and restarted like a failed one. A pipeline
+    that exits, with an error or EOS, is restarted after a jittered exponential `Backoff`
+    until the fleet is stopped. The backoff is reset once a restart has run for `settle`
+    seconds, and a stream is given up on after `max_restarts` consecutive quick failures.
+
+    The frame rate, CPU and memory usage of every stream are measured by a `PipelineMetrics`
+    and logged every `report_interval` seconds. The report loop samples them unless
+    `sample_metrics` is False, for when the metrics are served by a `MetricsServer` (see
+    `metrics`) which samples them itself, the reports then show its last samples.
+
+    Streams always run with the subprocess backend, see `GstPipeline.run_async`.
+
+    Args:
+        backoff (Backoff): [Optional] restart delays
+        settle (float): seconds a restart must run to reset the backoff
+        max_restarts (int): [Optional] consecutive quick failures before giving up on a stream
+        report_interval (float): seconds between stats reports, 0 disables them
+        sample_metrics (bool): sample the metrics before each report
+        eos_timeout (float): seconds to wait for a stream to exit after sending EOS on shutdown
+        term_timeout (float): seconds to wait for a stream to exit after a SIGTERM on shutdown
+        log (Callable[[str], None]): called with restart messages and stats reports
+        clock (Callable[[], float]): time source in seconds
+    """
+
+    def __init__(
+        self,
+        backoff: Optional[Backoff] = None,
+        settle: float = 10.0,
+        max_restarts: Optional[int] = None,
+        report_interval: float = 5.0,
+        sample_metrics: bool = True,
+        eos_timeout: float = EOS_TIMEOUT,
+        term_timeout: float = TERM_TIMEOUT,
+        log: Callable[[str], None] = print,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._backoff: Backoff = backoff or FLEET_BACKOFF
+        self._settle = settle
+        self._max_restarts = max_restarts
+        self._report_interval = report_interval
+        self._sample_metrics = sample_metrics
+        self._eos_timeout = eos_timeout
+        self._term_timeout = term_timeout
+        self._log = log
+        self._clock = clock
+        self._streams: dict[str, _Stream] = {}
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def stats(self) -> dict[str, StreamStats]:
+        return {
+            name: StreamStats(
+                s.running,
+                s.metrics.fps,
+                s.metrics.cpu_pct,
+                s.metrics.rss_bytes / (1 << 20) if s.metrics.rss_bytes is not None else None,
+                s.restarts,
+            )
+            for name, s in self._streams.items()
+        }
+
+    @property
+    def metrics(self) -> list[PipelineMetrics]:
+        """The metrics of every stream, labeled with the stream name"""
+        return [s.metrics for s in self._streams.values()]
+
+    def add(
+        self,
+        name: str,
+        pipeline: GstPipeline,
+        limits: Optional[ProcessLimits] = None,
+        drop_counter: Optional[QueueDropCounter] = None,
+        queues: Optional[list[str]] = None,
+    ) -> None:
+        """
+        Adds a stream to the fleet. Pipelines with a data tee get an `fpsdisplaysink` branch
+        measuring their frame rate.
+
+        Args:
+            name (str): stream name, used in reports and as the metrics label
+            pipeline (GstPipeline): generated pipeline of the stream
+            limits (ProcessLimits): [Optional] scheduling and resource limits of the stream's process
+            drop_counter (QueueDropCounter): [Optional] counter of the frames dropped by leaky queues
+            queues (list[str]): [Optional] names of the queues whose level is reported
+
+        Raises:
+            ValueError: if a stream was already added under `name` or the limits use cores
+            this process can't run on.
+        """
+        if name in self._streams:
+            raise ValueError(f"Duplicate stream name: {name}")
+        limits = limits or ProcessLimits()
+        if limits.cpus and not set(limits.cpus) <= os.sched_getaffinity(0):
+            raise ValueError(f"Stream {name}: invalid CPU cores {limits.cpus}")
+        metrics = PipelineMetrics(name)
+        metrics.attach(pipeline, queues, drop_counter, inprocess=False)
+        stream = _Stream(pipeline, limits, metrics)
+        pipeline.add_spawn_handler(lambda pid: self._apply_limits(stream, pid))
+        self._streams[name] = stream
+
+    @staticmethod
+    def _apply_limits(stream: _Stream, pid: int) -> None:
+        stream.limits_error = None
+        try:
+            stream.limits.apply(pid)
+        except ProcessLookupError:
+            # it already exited, its own error is reported
+            pass
+        except OSError as e:
+            stream.limits_error = f"can't apply {stream.limits}: {e}"
+            # the process runs in its own session, see `GstPipeline.run_async`
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def report(self) -> str:
+        """
+        Describes the total and per-stream frame rate and resource usage.
+        """
+        stats = self.stats
+        name_w = max((len(n) for n in stats), default=0)
+        running = [s for s in stats.values() if s.running]
+        total_fps = sum(s.fps or 0 for s in running)
+        total_cpu = sum(s.cpu_pct or 0 for s in running)
+        lines = [f"Fleet: {len(running)}/{len(stats)} streams running, {total_fps:.1f} fps, {total_cpu:.0f}% CPU"]
+        for name, s in stats.items():
+            lines.append(f"  {name:<{name_w}}  {s} ({self._streams[name].limits})")
+        return "\n".join(lines)
+
+    async def _supervise(self, name: str) -> None:
+        stream = self._streams[name]
+        failed = 0
+        while True:
+            started = self._clock()
+            stream.running = True
+            try:
+                success = await stream.pipeline.run_async(
+                    print_err=False, eos_timeout=self._eos_timeout, term_timeout=self._term_timeout
+                )
+                error = stream.limits_error or stream.pipeline.error
+            except (OSError, subprocess.SubprocessError) as e:
+                # e.g. gst-launch-1.0 can't be started
+                success, error = False, str(e)
+            finally:
+                stream.running = False
+            if self._clock() - started >= self._settle:
+                failed = 0
+            if self._max_restarts is not None and failed >= self._max_restarts:
+                self._log(f"\nStream {name} failed {failed} restarts in a row, giving up\n")
+                return
+            delay = self._backoff.delay(failed)
+            reason = "ended" if success else f"failed: {(error or 'unknown error').strip().splitlines()[-1]}"
+            self._log(f"\nStream {name} {reason}, restarting in {delay:.1f} s\n")
+            await asyncio.sleep(delay)
+            failed += 1
+            stream.restarts += 1
+
+    async def _report_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._report_interval)
+            for stream in self._streams.values() if self._sample_metrics else []:
+                stream.metrics.sample()
+            self._log(f"\n{self.report()}\n")
+
+    def stop(self) -> None:
+        """
+        Shuts down all streams, must be called from the event loop thread.
+        """
+        for task in self._tasks:
+            task.cancel()
+
+    async def run(self) -> dict[str, StreamStats]:
+        """
+        Runs all streams until the fleet is stopped or every stream has been given up on.
+
+        Returns:
+            dict[str, StreamStats]: the stats of each stream when the fleet stopped
+        """
+        supervisors = [asyncio.ensure_future(self._supervise(name)) for name in self._streams]
+        reporter = asyncio.ensure_future(self._report_loop()) if self._report_interval > 0 else None
+        self._tasks = [*supervisors, *filter(None, [reporter])]
+        try:
+            # shielded so a cancellation stops the streams and still waits for their exit
+            await asyncio.shield(asyncio.gather(*supervisors))
+        except asyncio.CancelledError:
+            self.stop()
+            await asyncio.gather(*supervisors, return_exceptions=True)
+            raise
+        finally:
+            if reporter:
+                reporter.cancel()
+            self._tasks = []
+        return self.stats
+
+    def run_until_interrupted(self) -> dict[str, StreamStats]:
+        """
+        Runs all streams in a new event loop until a SIGINT or SIGTERM is received, in which
+        case they are all shut down gracefully.
+
+        Returns:
+            dict[str, StreamStats]: the stats of each stream when the fleet stopped
+        """
+
+        async def main() -> dict[str, StreamStats]:
+            loop = asyncio.get_running_loop()
+            fleet = asyncio.ensure_future(self.run())
+
+            def interrupt() -> None:
+                self._log("\nShutting down streams...\n")
+                self.stop()
+
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, interrupt)
+            try:
+                return await fleet
+            except asyncio.CancelledError:
+                return self.stats
+            finally:
+                for sig in (signal.SIGINT, signal.SIGTERM):
+                    loop.remove_signal_handler(sig)
+
+        return asyncio.run(main())
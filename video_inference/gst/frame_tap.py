@@ -0,0 +1,196 @@
+from collections import deque
+from threading import Lock
+from typing import Any, Callable, Optional
+import time
+
+try:
+    import gi
+
+    gi.require_version("Gst", "1.0")
+    gi.require_version("GstVideo", "1.0")
+    from gi.repository import Gst, GstVideo
+except (ImportError, ValueError):
+    Gst = GstVideo = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from gst.pipeline import GstPipeline
+
+
+__all__ = [
+    "FrameTap",
+    "TAP_FORMATS",
+]
+
+# packed raw formats a tap can deliver and their bytes per pixel
+TAP_FORMATS: dict[str, int] = {
+    "RGB": 3,
+    "BGR": 3,
+    "RGBA": 4,
+    "BGRA": 4,
+    "RGBx": 4,
+    "BGRx": 4,
+    "GRAY8": 1,
+}
+
+# callback times kept for percentiles
+_TIMING_WINDOW = 1000
+
+
+class FrameTap:
+    """
+    Hands frames from the pipeline's tee to a Python callback as NumPy arrays.
+
+    The tap is a separate branch ending in an `appsink`: a leaky single-buffer queue, an
+    optional frame rate cap, conversion to the requested format and size, and an
+    appsink that only keeps the newest frame. A slow callback makes the tap skip frames
+    but never stalls the video.
+
+    The array passed to the callback is a read-only view of the mapped `Gst.Buffer`, no
+    copy is made. It is only valid during the callback, the buffer is unmapped as soon
+    as the callback returns or raises; copy the array to keep it. Mapping without a copy
+    needs the gst-python overrides, which make `Gst.MapInfo.data` a memoryview; with plain
+    PyGObject it is a copy of the buffer as bytes, the tap still works but warns once and
+    `zero_copy` is False.
+
+    Args:
+        callback (Callable[[np.ndarray, int], None]): called with a (height, width, channels)
+            uint8 array and the buffer PTS in ns
+        fmt (str): frame format, one of `TAP_FORMATS`
+        width (int): [Optional] frame width, source width by default
+        height (int): [Optional] frame height, source height by default
+        max_rate (int): [Optional] maximum frames per second passed to the callback
+        name (str): appsink element name, must be unique per pipeline
+    """
+
+    def __init__(
+        self,
+        callback: Callable[["np.ndarray", int], None],
+        fmt: str = "RGB",
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        max_rate: Optional[int] = None,
+        name: str = "tap",
+    ) -> None:
+        if np is None:
+            raise RuntimeError("NumPy is required for frame taps")
+        if fmt not in TAP_FORMATS:
+            raise ValueError(f'Unsupported tap format "{fmt}", expected one of {", ".join(TAP_FORMATS)}')
+        self._callback = callback
+        self._fmt = fmt
+        self._width = width
+        self._height = height
+        self._max_rate = max_rate
+        self._name = name
+        self._lock = Lock()
+        self._frames: int = 0
+        self._errors: int = 0
+        self._total: float = 0.0
+        self._max: float = 0.0
+        self._recent: deque[float] = deque(maxlen=_TIMING_WINDOW)
+        self._zero_copy: Optional[bool] = None
+
+    @property
+    def zero_copy(self) -> Optional[bool]:
+        """True if frames are views of the buffers, None until the first frame"""
+        return self._zero_copy
+
+    def elems(self, tee: str = "t_data") -> list[str | list[str]]:
+        """
+        Returns the tap branch, starting at the tee called `tee`.
+        """
+        caps = f"video/x-raw,format={self._fmt}"
+        if self._width and self._height:
+            caps += f",width={self._width},height={self._height}"
+        return [
+            f"{tee}.",
+            ["queue", f"name=q_{self._name}", "max-size-buffers=1", "leaky=downstream"],
+            *([["videorate", "drop-only=true", f"max-rate={self._max_rate}"]] if self._max_rate else []),
+            "videoscale",
+            "videoconvert",
+            caps,
+            ["appsink", f"name={self._name}", "emit-signals=true", "max-buffers=1", "drop=true", "sync=false"],
+        ]
+
+    def attach(self, pipeline: GstPipeline, tee: str = "t_data") -> None:
+        """
+        Adds the tap branch to a generated pipeline, which must run with the in-process backend.
+        """
+        pipeline.add_branch(*self.elems(tee))
+        pipeline.add_signal_handler(self._name, "new-sample", self._on_sample)
+
+    def _on_sample(self, sink: Any) -> Any:
+        sample = sink.emit("pull-sample")
+        if sample is None:
+            return Gst.FlowReturn.OK
+        buffer = sample.get_buffer()
+        video_info = GstVideo.VideoInfo.new_from_caps(sample.get_caps())
+        width, height = video_info.width, video_info.height
+        channels = TAP_FORMATS[self._fmt]
+        # the buffer's layout if the producer set one, otherwise the default layout of the caps
+        meta = GstVideo.buffer_get_video_meta(buffer)
+        stride, offset = (meta.stride[0], meta.offset[0]) if meta else (video_info.stride[0], video_info.offset[0])
+        ok, info = buffer.map(Gst.MapFlags.READ)
+        if not ok:
+            return Gst.FlowReturn.OK
+        frame = None
+        try:
+            if self._zero_copy is None:
+                self._zero_copy = isinstance(info.data, memoryview)
+                if not self._zero_copy:
+                    print("\nFrame tap: gst-python isn't installed, frames are copied out of the buffers\n")
+            frame = np.ndarray(
+                (height, width, channels),
+                dtype=np.uint8,
+                buffer=info.data,
+                offset=offset,
+                strides=(stride, channels, 1),
+            )
+            start = time.perf_counter()
+            try:
+                self._callback(frame, buffer.pts)
+            except Exception as e:
+                with self._lock:
+                    self._errors += 1
+                    if self._errors == 1:
+                        print(f"\nFrame tap callback failed: {e!r}\n")
+            self._record(time.perf_counter() - start)
+        finally:
+            del frame
+            buffer.unmap(info)
+        return Gst.FlowReturn.OK
+
+    def _record(self, elapsed: float) -> None:
+        with self._lock:
+            self._frames += 1
+            self._total += elapsed
+            self._max = max(self._max, elapsed)
+            self._recent.append(elapsed)
+
+    @property
+    def stats(self) -> dict[str, float]:
+        """
+        Callback cost: frames, errors and mean/p95/max callback time in ms.
+
+        The p95 is computed over the last frames only.
+        """
+        with self._lock:
+            recent = sorted(self._recent)
+            return {
+                "frames": self._frames,
+                "errors": self._errors,
+                "mean_ms": self._total / self._frames * 1000 if self._frames else 0.0,
+                "p95_ms": recent[int(0.95 * (len(recent) - 1))] * 1000 if recent else 0.0,
+                "max_ms": self._max * 1000,
+            }
+
+    def __str__(self) -> str:
+        s = self.stats
+        return (
+            f"{self._name}: {s['frames']} frames, callback {s['mean_ms']:.2f} ms mean, "
+            f"{s['p95_ms']:.2f} ms p95, {s['max_ms']:.2f} ms max"
+            + (f", {s['errors']} errors" if s["errors"] else "")
+        )
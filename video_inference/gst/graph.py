@@ -0,0 +1,214 @@
+from difflib import get_close_matches
+from typing import TYPE_CHECKING, Iterator, NamedTuple, Optional
+import re
+
+if TYPE_CHECKING:
+    from gst.registry import GstRegistry
+
+
+__all__ = [
+    "GstCaps",
+    "GstElement",
+    "GstGraph",
+    "GstNode",
+    "GstPadRef",
+]
+
+# a reference to a named element's pad, e.g. "t_data." or "overlay.inference_sink"
+_PAD_REF_RE = re.compile(r"^([A-Za-z_][\w-]*)\.([\w%-]*)$")
+# whitespace separated tokens, quoted values may contain spaces
+_TOKEN_RE = re.compile(r'(?:[^\s"]|"(?:[^"\\]|\\.)*")+')
+
+
+class GstElement(NamedTuple):
+    """An element and the properties it is created with, values are kept as written"""
+
+    factory: str
+    props: dict[str, str]
+
+    @property
+    def name(self) -> Optional[str]:
+        return self.props.get("name")
+
+    @property
+    def tokens(self) -> list[str]:
+        return [self.factory, *(f"{k}={v}" for k, v in self.props.items())]
+
+
+class GstCaps(NamedTuple):
+    """A caps filter, e.g. "video/x-raw,format=NV12" """
+
+    media: str
+    fields: dict[str, str]
+
+    @classmethod
+    def parse(cls, text: str) -> "GstCaps":
+        media, *fields = text.split(",")
+        return cls(media.strip(), {k.strip(): v.strip() for k, _, v in (f.partition("=") for f in fields)})
+
+    @property
+    def tokens(self) -> list[str]:
+        return [",".join([self.media, *(f"{k}={v}" for k, v in self.fields.items())])]
+
+
+class GstPadRef(NamedTuple):
+    """
+    A pad of a named element. A chain that starts with a reference links from that
+    element's pad (e.g. a tee's request pads), a reference at the end of a chain links to it.
+    """
+
+    element: str
+    pad: str = ""
+
+    @property
+    def tokens(self) -> list[str]:
+        return [f"{self.element}.{self.pad}"]
+
+
+GstNode = GstElement | GstCaps | GstPadRef
+
+
+def _is_caps(token: str) -> bool:
+    return "/" in token.split(",")[0] and "=" not in token.split(",")[0]
+
+
+class GstGraph:
+    """
+    Typed model of a pipeline: chains of elements, caps filters and pad references.
+
+    Nodes within a chain are linked in order and chains are only joined through pad
+    references, which is how `gst-launch-1.0` reads a launch line. `launch_args` compiles
+    the graph back to launch syntax and `check` verifies it against a `GstRegistry`
+    without starting anything.
+    """
+
+    def __init__(self) -> None:
+        self.chains: list[list[GstNode]] = []
+
+    def add_chain(self, *nodes: GstNode) -> None:
+        self.chains.append(list(nodes))
+
+    @classmethod
+    def from_elems(cls, elems: list[str | list[str]], branch_starts: set[int]) -> "GstGraph":
+        """
+        Builds the graph of a `GstPipeline` element list.
+
+        Elements are lists of tokens or strings. An element starts a new chain if it is the
+        first one, its index is in `branch_starts` or it references the pads of a tee; pad
+        references that follow an element's properties (e.g. "demux.video_0") start a new
+        chain from that pad.
+        """
+        graph = cls()
+        tokenized = [list(e) if isinstance(e, list) else _TOKEN_RE.findall(e) for e in elems]
+        tees = {
+            t[5:]
+            for tokens in tokenized
+            if tokens and tokens[0] == "tee"
+            for t in tokens[1:]
+            if t.startswith("name=")
+        }
+        for i, tokens in enumerate(tokenized):
+            if not tokens:
+                continue
+            if i == 0 or i in branch_starts:
+                graph.chains.append([])
+            chain = graph.chains[-1]
+            if isinstance(elems[i], str) and _is_caps(elems[i]):
+                chain.append(GstCaps.parse(elems[i]))
+                continue
+            if m := _PAD_REF_RE.match(tokens[0]):
+                ref = GstPadRef(*m.groups())
+                if ref.element in tees and chain:
+                    graph.chains.append([ref])
+                else:
+                    chain.append(ref)
+                continue
+            props: dict[str, str] = {}
+            for token in tokens[1:]:
+                if m := _PAD_REF_RE.match(token):
+                    # the element's pad feeds the next elements
+                    chain.append(GstElement(tokens[0], props))
+                    graph.chains.append([GstPadRef(*m.groups())])
+                    break
+                key, _, value = token.partition("=")
+                props[key] = value
+            else:
+                chain.append(GstElement(tokens[0], props))
+        return graph
+
+    def elements(self) -> Iterator[GstElement]:
+        for chain in self.chains:
+            for node in chain:
+                if isinstance(node, GstElement):
+                    yield node
+
+    def launch_args(self) -> list[str]:
+        """
+        Compiles the graph to `gst-launch-1.0` arguments.
+        """
+        args: list[str] = []
+        for chain in self.chains:
+            for i, node in enumerate(chain):
+                if i > 0:
+                    args.append("!")
+                args.extend(node.tokens)
+        return args
+
+    def __str__(self) -> str:
+        return " ".join(self.launch_args())
+
+    def check(self, registry: "GstRegistry") -> list[str]:
+        """
+        Checks element factories, property names and values, element names and pad
+        references against `registry`.
+
+        Returns:
+            list[str]: a description of every problem found, empty if the graph is valid
+        """
+        errors: list[str] = []
+        named: dict[str, GstElement] = {}
+        for elem in self.elements():
+            if elem.name is None:
+                continue
+            if elem.name in named:
+                errors.append(f'duplicate element name "{elem.name}"')
+            named[elem.name] = elem
+
+        for elem in self.elements():
+            info = registry.element(elem.factory)
+            if info is None:
+                errors.append(f'no element "{elem.factory}"' + _suggest(elem.factory, registry.factories))
+                continue
+            if info.properties is None:
+                continue
+            for key, value in elem.props.items():
+                # "pad::prop" sets properties of request pads, they aren't listed by the registry
+                if "::" in key:
+                    continue
+                if (prop := info.properties.get(key)) is None:
+                    errors.append(
+                        f'{elem.factory} has no property "{key}"' + _suggest(key, info.properties)
+                    )
+                elif not prop.writable:
+                    errors.append(f'{elem.factory} property "{key}" is read-only')
+                elif problem := prop.check(value.strip('"')):
+                    errors.append(f'{elem.factory} property "{key}": {problem}')
+
+        for chain in self.chains:
+            for node in chain:
+                if not isinstance(node, GstPadRef):
+                    continue
+                if node.element not in named:
+                    errors.append(f'no element named "{node.element}" for pad reference "{node.tokens[0]}"')
+                    continue
+                info = registry.element(named[node.element].factory)
+                if node.pad and info and info.pads and not info.has_pad(node.pad):
+                    errors.append(
+                        f'{named[node.element].factory} "{node.element}" has no pad "{node.pad}"'
+                    )
+        return errors
+
+
+def _suggest(word: str, candidates) -> str:
+    matches = get_close_matches(word, list(candidates), n=1)
+    return f', did you mean "{matches[0]}"?' if matches else ""
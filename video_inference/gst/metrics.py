@@ -0,0 +1,481 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Lock, Thread
+from typing import Any, NamedTuple, Optional
+import os
+import re
+import time
+
+from gst.engine import EngineEvent, EngineEventType, GstEngine
+from gst.pipeline import GstPipeline
+from gst.queues import QueueDropCounter
+from gst.tracer import TRACER_DEBUG, parse_tracer_line
+from utils.common import GstBackend
+
+
+__all__ = [
+    "FPS_SINK_NAME",
+    "MetricsServer",
+    "PipelineMetrics",
+    "ProcessSampler",
+    "fps_branch_elems",
+    "render_metrics",
+]
+
+# name of the fpsdisplaysink measuring a `gst-launch-1.0` pipeline, read from `gst-launch-1.0 -v`
+FPS_SINK_NAME = "metrics_fps"
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_FPS_RE = re.compile(
+    rf"{FPS_SINK_NAME}: last-message = rendered: (\d+), dropped: (\d+), current: ([\d.]+), average: ([\d.]+)"
+)
+
+_CLK_TCK = os.sysconf("SC_CLK_TCK")
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def fps_branch_elems(tee: str = "t_data") -> list[str, list[str]]:
+    """
+    Returns a branch measuring the frame rate at `tee` with an unsynchronized `fpsdisplaysink`.
+
+    The leaky queue keeps the measurement from ever holding back the other branches.
+    """
+    return [
+        f"{tee}.",
+        ["queue", "leaky=downstream", "max-size-buffers=1"],
+        ["fpsdisplaysink", f"name={FPS_SINK_NAME}", "text-overlay=false", "video-sink=fakesink", "sync=false"],
+    ]
+
+
+class ProcessSampler:
+    """
+    Measures the CPU usage and resident memory of a process from /proc.
+
+    CPU usage is averaged over the time between two samples, 100% is one core.
+    """
+
+    def __init__(self, pid: int) -> None:
+        self.pid = pid
+        self.cpu_pct: Optional[float] = None
+        self.rss_bytes: Optional[int] = None
+        self._last: Optional[tuple[int, float]] = None
+
+    def sample(self, now: float) -> bool:
+        """
+        Returns:
+            bool: False if the process can't be read, e.g. because it has exited.
+        """
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                # fields after the parenthesized command name, utime and stime are the 12th and 13th
+                fields = f.read().rpartition(")")[2].split()
+            with open(f"/proc/{self.pid}/statm") as f:
+                rss_pages = int(f.read().split()[1])
+            ticks = int(fields[11]) + int(fields[12])
+        except (OSError, IndexError, ValueError):
+            return False
+        if self._last and now > self._last[1]:
+            self.cpu_pct = (ticks - self._last[0]) / _CLK_TCK / (now - self._last[1]) * 100
+        self._last = (ticks, now)
+        self.rss_bytes = rss_pages * _PAGE_SIZE
+        return True
+
+
+class _Counter:
+    """Counts events from streaming threads and turns them into a rate when sampled"""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self.total: int = 0
+        self.rate: Optional[float] = None
+        self._last: Optional[tuple[int, float]] = None
+
+    def tick(self, *_: Any) -> None:
+        with self._lock:
+            self.total += 1
+
+    def sample(self, now: float) -> None:
+        with self._lock:
+            total = self.total
+        if self._last and now > self._last[1]:
+            self.rate = (total - self._last[0]) / (now - self._last[1])
+        self._last = (total, now)
+
+    def reset_rate(self) -> None:
+        self.rate = None
+        self._last = None
+
+
+class _Sample(NamedTuple):
+    name: str
+    labels: dict[str, str]
+    value: float
+
+
+# metric families: name, type and help, in exposition order
+_FAMILIES: list[tuple[str, str, str]] = [
+    ("synap_pipeline_up", "gauge", "1 if the pipeline is running"),
+    ("synap_pipeline_restarts_total", "counter", "Times the pipeline was started again after its first start"),
+    ("synap_pipeline_errors_total", "counter", "Error messages posted on the pipeline bus"),
+    ("synap_pipeline_warnings_total", "counter", "Warning messages posted on the pipeline bus"),
+    ("synap_frames_total", "counter", "Frames that entered the data tee"),
+    ("synap_fps", "gauge", "Frames per second entering the data tee"),
+    ("synap_inferences_total", "counter", "Inference results produced"),
+    ("synap_inference_fps", "gauge", "Inference results per second"),
+    ("synap_queue_dropped_frames_total", "counter", "Frames dropped by a leaky queue"),
+    ("synap_queue_level_buffers", "gauge", "Buffers held by a queue"),
+    ("synap_process_cpu_percent", "gauge", "CPU usage of the process running the pipeline, 100 is one core"),
+    ("synap_process_resident_bytes", "gauge", "Resident memory of the process running the pipeline"),
+]
+
+
+class PipelineMetrics:
+    """
+    Collects the metrics of one pipeline for a `MetricsServer`.
+
+    Streaming threads only increment counters: frames are counted on the sink pad of the
+    data tee and inferences on the src pad of `synapinfer`. Everything else, the rates,
+    queue levels and the CPU and memory usage of the process running the pipeline from
+    /proc, is read when the metrics are sampled, from the thread of the caller. Rates are
+    measured over the time between two samples, so each pipeline's metrics should be
+    sampled by a single owner, e.g. the `MetricsServer` they were added to, and other
+    readers use the values of its last sample.
+
+    With `gst-launch-1.0` the pad probes and queue levels aren't available: the frame rate is
+    read from an `fpsdisplaysink` branch added on the data tee and printed by `gst-launch-1.0 -v`,
+    and dropped frames from the queue debug log parsed by the `QueueDropCounter`. The inference
+    rate and queue levels come from the GstShark `framerate` and `queuelevel` tracers, see
+    `TRACERS`, and are left out if GstShark isn't installed. Only the rate is known, not the
+    total number of inferences.
+
+    Args:
+        name (str): value of the "pipeline" label
+    """
+
+    def __init__(self, name: str = "pipeline") -> None:
+        self.name = name
+        self._lock = Lock()
+        # serializes samples, held while reading /proc and the queues
+        self._sample_lock = Lock()
+        self._frames = _Counter()
+        self._inferences = _Counter()
+        self._errors: int = 0
+        self._warnings: int = 0
+        self._starts: int = 0
+        self._queues: list[str] = []
+        self._drop_counter: Optional[QueueDropCounter] = None
+        self._queue_levels: dict[str, int] = {}
+        self._engine: Optional[GstEngine] = None
+        self._process: Optional[ProcessSampler] = None
+        self._up: bool = False
+        self._fps: Optional[float] = None
+        self._rendered: Optional[int] = None
+        self._infer_pads: set[str] = set()
+        self._inference_fps: Optional[float] = None
+        self._traced_levels: dict[str, int] = {}
+
+    @property
+    def fps(self) -> Optional[float]:
+        """Frame rate at the last sample, None if not measured yet"""
+        return self._frames.rate if self._engine else self._fps
+
+    @property
+    def inference_fps(self) -> Optional[float]:
+        """Inference rate at the last sample, None if not measured yet"""
+        return self._inferences.rate if self._engine else self._inference_fps
+
+    @property
+    def cpu_pct(self) -> Optional[float]:
+        return self._process.cpu_pct if self._process else None
+
+    @property
+    def rss_bytes(self) -> Optional[int]:
+        return self._process.rss_bytes if self._process else None
+
+    @property
+    def up(self) -> bool:
+        return self._up
+
+    @property
+    def restarts(self) -> int:
+        return max(self._starts - 1, 0)
+
+    def attach(
+        self,
+        pipeline: GstPipeline,
+        queues: Optional[list[str]] = None,
+        drop_counter: Optional[QueueDropCounter] = None,
+        infer_elem: str = "infer",
+        tee: str = "t_data",
+        inprocess: Optional[bool] = None,
+    ) -> None:
+        """
+        Installs the probes and handlers on a generated pipeline.
+
+        Args:
+            pipeline (GstPipeline): pipeline to measure
+            queues (list[str]): [Optional] names of the queues whose level is reported
+            drop_counter (QueueDropCounter): [Optional] counter of the frames dropped by leaky queues
+            infer_elem (str): name of the `synapinfer` element
+            tee (str): name of the data tee
+            inprocess (bool): [Optional] whether the pipeline runs in-process, resolved from its backend by default
+        """
+        self._queues = list(queues or [])
+        self._drop_counter = drop_counter
+        if inprocess is None:
+            inprocess = pipeline.resolve_backend() == GstBackend.INPROCESS
+        if inprocess:
+            if pipeline.has_element(tee):
+                pipeline.add_pad_probe(tee, "sink", self._frames.tick)
+            if pipeline.has_element(infer_elem):
+                pipeline.add_pad_probe(infer_elem, "src", self._inferences.tick)
+            pipeline.add_event_handler(self._on_event)
+            pipeline.add_start_handler(self._on_start)
+        else:
+            if pipeline.has_element(tee) and not pipeline.has_element(FPS_SINK_NAME):
+                pipeline.add_branch(*fps_branch_elems(tee))
+            pipeline.add_launch_options("-v")
+            pipeline.add_line_handler(self._on_line)
+            pipeline.add_spawn_handler(self._on_spawn)
+            tracers = []
+            if pipeline.has_element(infer_elem):
+                # the tracer names pads "element_pad", older releases "element:pad"
+                self._infer_pads = {f"{infer_elem}_src", f"{infer_elem}:src"}
+                tracers.append("framerate")
+            if self._queues:
+                tracers.append("queuelevel")
+            if tracers:
+                pipeline.add_tracers(*tracers)
+                pipeline.add_log_handler(self._on_tracer, TRACER_DEBUG)
+
+    def _on_event(self, event: EngineEvent) -> None:
+        with self._lock:
+            if event.type == EngineEventType.ERROR:
+                self._errors += 1
+            elif event.type == EngineEventType.WARNING:
+                self._warnings += 1
+
+    def _on_start(self, engine: GstEngine) -> None:
+        with self._lock:
+            self._engine = engine
+            self._process = ProcessSampler(os.getpid())
+            self._starts += 1
+            self._up = True
+            self._frames.reset_rate()
+            self._inferences.reset_rate()
+
+    def _on_spawn(self, pid: int) -> None:
+        with self._lock:
+            self._process = ProcessSampler(pid)
+            self._starts += 1
+            self._up = True
+            self._fps = self._rendered = self._inference_fps = None
+            self._traced_levels = {}
+
+    def _on_line(self, stream: str, line: str) -> None:
+        if stream == "stdout" and (m := _FPS_RE.search(line)):
+            self._rendered, self._fps = int(m.group(1)), float(m.group(3))
+        elif stream == "stderr" and line.startswith("ERROR:"):
+            with self._lock:
+                self._errors += 1
+        elif stream == "stderr" and line.startswith("WARNING:"):
+            with self._lock:
+                self._warnings += 1
+
+    def _on_tracer(self, line: str) -> None:
+        if not (record := parse_tracer_line(line)):
+            return
+        _, name, fields = record
+        if name == "framerate" and fields.get("pad") in self._infer_pads:
+            self._inference_fps = float(fields.get("fps", 0))
+        elif name == "queuelevel" and (queue := fields.get("queue")) in self._queues:
+            with self._lock:
+                self._traced_levels[queue] = int(fields.get("size_buffers", 0))
+
+    def sample(self, now: Optional[float] = None) -> None:
+        """
+        Updates the rates, queue levels and process usage.
+        """
+        with self._sample_lock:
+            now = time.monotonic() if now is None else now
+            with self._lock:
+                engine, process = self._engine, self._process
+            self._frames.sample(now)
+            self._inferences.sample(now)
+            up = process.sample(now) if process else False
+            levels: dict[str, int] = {}
+            if engine:
+                up = up and not engine.wait(0)
+                for name in self._queues if up else []:
+                    try:
+                        if elem := engine.get_element(name):
+                            levels[name] = int(elem.get_property("current-level-buffers"))
+                    except AttributeError:
+                        # the pipeline was torn down while reading
+                        break
+            with self._lock:
+                if not engine and up:
+                    levels = dict(self._traced_levels)
+                self._up = up
+                self._queue_levels = levels
+
+    def samples(self) -> list[_Sample]:
+        """
+        Returns the current value of every metric that is available.
+        """
+        labels = {"pipeline": self.name}
+        with self._lock:
+            out = [
+                _Sample("synap_pipeline_up", labels, int(self._up)),
+                _Sample("synap_pipeline_restarts_total", labels, self.restarts),
+                _Sample("synap_pipeline_errors_total", labels, self._errors),
+                _Sample("synap_pipeline_warnings_total", labels, self._warnings),
+            ]
+            levels = dict(self._queue_levels)
+            process = self._process
+        inprocess = self._engine is not None
+        frames = self._frames.total if inprocess else self._rendered
+        if frames is not None:
+            out.append(_Sample("synap_frames_total", labels, frames))
+        if self.fps is not None:
+            out.append(_Sample("synap_fps", labels, self.fps))
+        if inprocess:
+            out.append(_Sample("synap_inferences_total", labels, self._inferences.total))
+        if self.inference_fps is not None:
+            out.append(_Sample("synap_inference_fps", labels, self.inference_fps))
+        if self._drop_counter:
+            for queue, drops in self._drop_counter.drops.items():
+                out.append(_Sample("synap_queue_dropped_frames_total", {**labels, "queue": queue}, drops))
+        for queue, level in levels.items():
+            out.append(_Sample("synap_queue_level_buffers", {**labels, "queue": queue}, level))
+        if process and process.cpu_pct is not None:
+            out.append(_Sample("synap_process_cpu_percent", labels, process.cpu_pct))
+        if process and process.rss_bytes is not None:
+            out.append(_Sample("synap_process_resident_bytes", labels, process.rss_bytes))
+        return out
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render_metrics(samples: list[_Sample]) -> str:
+    """
+    Formats samples in the Prometheus text exposition format.
+    """
+    by_name: dict[str, list[_Sample]] = {}
+    for sample in samples:
+        by_name.setdefault(sample.name, []).append(sample)
+    lines: list[str] = []
+    for name, mtype, help_text in _FAMILIES:
+        if name not in by_name:
+            continue
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {mtype}"]
+        for sample in by_name[name]:
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in sample.labels.items())
+            value = sample.value if isinstance(sample.value, int) else round(sample.value, 3)
+            lines.append(f"{name}{{{labels}}} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """
+    Serves the metrics of running pipelines at http://`host`:`port`/metrics for Prometheus.
+
+    The metrics are sampled and rendered every `interval` seconds by a background thread,
+    scrapes only return the last rendered page, so they never wait on a pipeline. The server
+    owns the sampling of the metrics added to it, nothing else should sample them.
+
+    Args:
+        port (int): TCP port to listen on
+        host (str): address to listen on, only local clients by default
+        interval (float): seconds between samples
+    """
+
+    def __init__(self, port: int, host: str = "127.0.0.1", interval: float = 5.0) -> None:
+        self._address = (host, port)
+        self._interval = interval
+        self._metrics: list[PipelineMetrics] = []
+        self._lock = Lock()
+        self._page: bytes = b""
+        self._stop = Event()
+        self._httpd: Optional[ThreadingHTTPServer] = None
+        self._threads: list[Thread] = []
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2] if self._httpd else self._address
+        return f"http://{host}:{port}/metrics"
+
+    def add(self, metrics: PipelineMetrics) -> None:
+        with self._lock:
+            self._metrics.append(metrics)
+
+    def sample(self) -> None:
+        """
+        Samples all pipelines and renders the page served to scrapes.
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+        now = time.monotonic()
+        samples: list[_Sample] = []
+        for m in metrics:
+            m.sample(now)
+            samples += m.samples()
+        page = render_metrics(samples).encode()
+        with self._lock:
+            self._page = page
+
+    def _page_bytes(self) -> bytes:
+        with self._lock:
+            return self._page
+
+    def _sampler(self) -> None:
+        while not self._stop.wait(self._interval):
+            self.sample()
+
+    def start(self) -> None:
+        """
+        Starts serving from background threads.
+
+        Raises:
+            OSError: if the port can't be bound.
+        """
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = server._page_bytes()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_: Any) -> None:
+                pass
+
+        self._httpd = ThreadingHTTPServer(self._address, Handler)
+        self._httpd.daemon_threads = True
+        self._stop.clear()
+        self.sample()
+        self._threads = [
+            Thread(target=self._httpd.serve_forever, name="metrics-http", daemon=True),
+            Thread(target=self._sampler, name="metrics-sampler", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self._threads = []
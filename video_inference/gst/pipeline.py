@@ -1,29 +1,112 @@
+from math import ceil, sqrt
 from os import environ
-from typing import Any
+from pathlib import Path
+from collections import deque
+from threading import Thread
+from typing import IO, TYPE_CHECKING, Any, Callable, NamedTuple, Optional
+import asyncio
+import re
+import signal
 import subprocess
 
-from utils.common import InputType, CAM_DEFAULT_WIDTH, CAM_DEFAULT_HEIGHT
+from gst.engine import EngineEvent, GstEngine, engine_available
+from gst.graph import GstGraph
+from gst.tracer import GstTraceReport, TRACER_DEBUG, TRACERS
+from gst.queues import (
+    QueueDropCounter,
+    QueueLimits,
+    QueueProfile,
+    DEFAULT_QUEUE_PROFILE,
+    QUEUE_DEBUG,
+    QUEUE_PROFILES,
+    RAW_BYTES_PER_PIXEL,
+)
+from gst.registry import GstRegistry, default_registry
+from gst.rtsp import rtsp_src_elems, DEFAULT_RTSP_PROFILE, RTSP_PROFILES
+from gst.stagger import FrameStagger
+from utils.common import (
+    GstBackend,
+    InputType,
+    SinkType,
+    CAM_DEFAULT_WIDTH,
+    CAM_DEFAULT_HEIGHT,
+    CAM_FRAMERATE,
+    H264_ENC_ELEMS,
+    MUXERS,
+    SINK_DEFAULT_LOCATIONS,
+    SNAPSHOT_FRAMERATE,
+)
+from utils.probe import demux_elems, probe_container
 
+if TYPE_CHECKING:
+    from gst.cascade import ClassifierCascade
+    from gst.tracker import DetectionTracker
 
-def get_env() -> dict[str, str]:
+# GStreamer debug log lines start with the running time, e.g. "0:00:01.234567890"
+GST_LOG_LINE_RE = re.compile(r"^\d+:\d{2}:\d{2}\.\d+\s")
+
+# number of non-log stderr lines kept for error messages
+STDERR_TAIL_LINES = 100
+
+# printed by gst-launch-1.0 when the pipeline description can't be parsed
+ERRONEOUS_PIPELINE = "erroneous pipeline"
+
+# longest output line read by the asyncio runner, longer lines are dropped
+MAX_LINE_BYTES = 1 << 20
+READ_CHUNK_BYTES = 1 << 16
+
+# seconds to wait for EOS to reach the sinks after a SIGINT, then for the exit after a SIGTERM
+EOS_TIMEOUT = 5.0
+TERM_TIMEOUT = 2.0
+
+
+def get_env(display: bool = True, trace_dir: Optional[str] = None) -> dict[str, str]:
     """
     Returns an environment with specific exports required to run GStreamer pipelines in a Wayland environment.
+
+    The Wayland exports are left out for pipelines without a display sink.
+    If `trace_dir` is set the tracers are enabled and pipeline graphs are dumped there.
     """
 
     env = environ.copy()
-    env["XDG_RUNTIME_DIR"] = "/var/run/user/0"
-    env["WESTON_DISABLE_GBM_MODIFIERS"] = "true"
-    env["WAYLAND_DISPLAY"] = "wayland-1"
-    env["QT_QPA_PLATFORM"] = "wayland"
+    if display:
+        env["XDG_RUNTIME_DIR"] = "/var/run/user/0"
+        env["WESTON_DISABLE_GBM_MODIFIERS"] = "true"
+        env["WAYLAND_DISPLAY"] = "wayland-1"
+        env["QT_QPA_PLATFORM"] = "wayland"
+    if trace_dir:
+        env["GST_TRACERS"] = TRACERS
+        env["GST_DEBUG_DUMP_DOT_DIR"] = str(Path(trace_dir).resolve())
     return env
 
 
 class GstPipeline:
     """Abstraction of a GStreamer pipeline"""
 
-    def __init__(self) -> None:
+    def __init__(
+        self, backend: GstBackend = GstBackend.AUTO, display: bool = True, preflight: bool = True
+    ) -> None:
         self._elems: list[str, list[str]] = []
+        self._branch_starts: set[int] = set()
         self._pipeline: list[str] = []
+        self._backend: GstBackend = backend
+        self._display: bool = display
+        self._preflight: bool = preflight
+        self._event_handlers: list[Callable[[EngineEvent], None]] = []
+        self._signal_handlers: list[tuple[str, str, Callable[..., Any]]] = []
+        self._pad_probes: list[tuple[str, str, Callable[[Any], Optional[bool]]]] = []
+        self._start_handlers: list[Callable[[GstEngine], None]] = []
+        self._log_handlers: list[Callable[[str], None]] = []
+        self._log_debug: list[str] = []
+        self._line_handlers: list[Callable[[str, str], None]] = []
+        self._launch_options: list[str] = []
+        self._spawn_handlers: list[Callable[[int], None]] = []
+        self._tracers: list[str] = []
+        self._trace_dir: Optional[str] = None
+        self._trace: Optional[GstTraceReport] = None
+        self._interrupted: bool = False
+        self._invalid: bool = False
+        self._error: Optional[str] = None
 
     def __repr__(self) -> str:
         """
@@ -38,38 +121,455 @@ class GstPipeline:
                 pipeline_str += "\\\n"
         return pipeline_str
 
+    @property
+    def interrupted(self) -> bool:
+        """True if the last run was shut down with a SIGINT rather than ending by itself"""
+        return self._interrupted
+
+    @property
+    def error(self) -> Optional[str]:
+        """Error message of the last failed run, if any"""
+        return self._error
+
+    @property
+    def invalid(self) -> bool:
+        """
+        True if the last run failed because the pipeline itself is wrong: it failed the
+        preflight check or couldn't be parsed, so running it again can't succeed.
+        """
+        return self._invalid
+
+    @property
+    def launch_args(self) -> list[str]:
+        """The current pipeline as `gst-launch-1.0` arguments"""
+        self._format_pipeline()
+        return list(self._pipeline)
+
+    @property
+    def graph(self) -> GstGraph:
+        """The current pipeline as a typed graph"""
+        return GstGraph.from_elems(self._elems, self._branch_starts)
+
     def _format_pipeline(self) -> None:
         """
-        Updates pipeline by adding link operators between elements.
+        Updates pipeline by compiling the elements to launch syntax.
         """
-        self._pipeline.clear()
-        self._pipeline.extend(self._elems[0])
-        for elem in self._elems[1:]:
-            if isinstance(elem, list):
-                self._pipeline.extend(["!", *elem])
-            else:
-                if elem != "t_data.":
-                    self._pipeline.append("!")
-                self._pipeline.append(elem)
+        self._pipeline = self.graph.launch_args()
+
+    def check(self, registry: Optional[GstRegistry] = None) -> list[str]:
+        """
+        Checks the pipeline against the installed GStreamer elements without running it,
+        see `GstGraph.check`.
+
+        Returns:
+            list[str]: the problems found, empty if the pipeline is valid or no registry
+            is available (`gst-inspect-1.0` isn't installed)
+        """
+        registry = registry or default_registry()
+        return self.graph.check(registry) if registry else []
 
     def add_elements(self, *elements: str | list[str]) -> None:
         self._elems.extend(elements)
 
+    def add_branch(self, *elements: str | list[str]) -> None:
+        """
+        Adds elements as a new chain that isn't linked to the previous element.
+        """
+        self._branch_starts.add(len(self._elems))
+        self._elems.extend(elements)
+
+    def add_event_handler(self, handler: Callable[[EngineEvent], None]) -> None:
+        """
+        Registers a handler for bus events (state changes, errors, EOS).
+
+        Events are only emitted by the in-process backend.
+        """
+        self._event_handlers.append(handler)
+
+    def add_signal_handler(self, elem_name: str, signal: str, handler: Callable[..., Any]) -> None:
+        """
+        Connects `handler` to a signal of a named element.
+
+        Signals are only connected by the in-process backend.
+        """
+        self._signal_handlers.append((elem_name, signal, handler))
+
+    def add_pad_probe(
+        self, elem_name: str, pad_name: str, handler: Callable[[Any], Optional[bool]]
+    ) -> None:
+        """
+        Calls `handler` with every buffer on a pad of a named element, see `GstEngine.add_pad_probe`.
+
+        Probes are only installed by the in-process backend.
+        """
+        self._pad_probes.append((elem_name, pad_name, handler))
+
+    def add_start_handler(self, handler: Callable[[GstEngine], None]) -> None:
+        """
+        Calls `handler` with the running `GstEngine` once the pipeline is playing.
+
+        Start handlers are only called by the in-process backend.
+        """
+        self._start_handlers.append(handler)
+
+    def add_log_handler(self, handler: Callable[[str], None], debug: str) -> None:
+        """
+        Registers a handler for GStreamer debug log lines.
+
+        Logs are only parsed by the `gst-launch-1.0` subprocess backend.
+
+        Args:
+            handler (Callable[[str], None]): called with every debug log line
+            debug (str): GST_DEBUG categories to enable, e.g. "queue_dataflow:5"
+        """
+        self._log_handlers.append(handler)
+        self._log_debug.append(debug)
+
+    def add_line_handler(self, handler: Callable[[str, str], None]) -> None:
+        """
+        Registers a handler for the output of `gst-launch-1.0` other than debug logs.
+
+        Lines are only read from the `gst-launch-1.0` subprocess backend. Handlers are called
+        from a reader thread, or from the event loop with `run_async`, and must not block.
+
+        Args:
+            handler (Callable[[str, str], None]): called with the stream, "stdout" or "stderr", and every line
+        """
+        self._line_handlers.append(handler)
+
+    def add_launch_options(self, *options: str) -> None:
+        """
+        Adds command line options for `gst-launch-1.0`, e.g. "-v" to print property changes.
+        """
+        self._launch_options.extend(o for o in options if o not in self._launch_options)
+
+    def add_tracers(self, *tracers: str) -> None:
+        """
+        Enables GStreamer tracers, e.g. "framerate", for `gst-launch-1.0`. Their output is
+        logged to `TRACER_DEBUG` and can be parsed with `add_log_handler`.
+        """
+        self._tracers.extend(t for t in tracers if t not in self._tracers)
+
+    def add_spawn_handler(self, handler: Callable[[int], None]) -> None:
+        """
+        Calls `handler` with the pid of the `gst-launch-1.0` process once it is spawned, e.g.
+        to set its CPU affinity or resource limits.
+        """
+        self._spawn_handlers.append(handler)
+
+    def enable_trace(self, trace_dir: str) -> GstTraceReport:
+        """
+        Runs the pipeline with the GStreamer tracers enabled and writes a report to `trace_dir`
+        when it exits.
+
+        Tracer output is parsed from the stderr of `gst-launch-1.0`, so traced pipelines always
+        run with the subprocess backend. See `GstTraceReport` for the report contents.
+        """
+        Path(trace_dir).mkdir(parents=True, exist_ok=True)
+        self._trace_dir = trace_dir
+        self._trace = GstTraceReport()
+        self.add_log_handler(self._trace.parse_log, TRACER_DEBUG)
+        return self._trace
+
+    def has_element(self, name: str) -> bool:
+        """
+        Returns True if the pipeline has an element called `name`.
+        """
+        return any(elem.name == name for elem in self.graph.elements())
+
     def reset(self) -> None:
+        """
+        Removes all elements along with their signal and log handlers.
+        """
         self._elems.clear()
+        self._branch_starts.clear()
         self._pipeline.clear()
+        self._signal_handlers.clear()
+        self._pad_probes.clear()
+        self._start_handlers.clear()
+        self._log_handlers.clear()
+        self._log_debug.clear()
+        self._line_handlers.clear()
+        self._launch_options.clear()
+        self._spawn_handlers.clear()
+        self._tracers.clear()
+        self._trace_dir = None
+        self._trace = None
+
+    def optimize(
+        self,
+        src_size: tuple[Optional[int], Optional[int]] = (None, None),
+        shared_format: str = "NV12",
+    ) -> "OptimizationReport":
+        """
+        Removes redundant conversions and scaling from the current pipeline.
+
+        See `GstPipelineOptimizer` for details.
+        """
+        self._elems, self._branch_starts, report = GstPipelineOptimizer(shared_format).optimize(
+            self._elems, self._branch_starts, src_size
+        )
+        return report
+
+    def resolve_backend(self, backend: Optional[GstBackend] = None) -> GstBackend:
+        """
+        Resolves `GstBackend.AUTO` to the in-process backend if PyGObject is available,
+        otherwise to the `gst-launch-1.0` subprocess backend.
+        """
+        backend = backend or self._backend
+        if backend == GstBackend.INPROCESS and not engine_available():
+            print("PyGObject not available, falling back to gst-launch-1.0")
+            return GstBackend.SUBPROCESS
+        if backend == GstBackend.AUTO:
+            return GstBackend.INPROCESS if engine_available() else GstBackend.SUBPROCESS
+        return backend
 
     def run(
         self,
         run_prompt: str = "Running pipeline...",
         print_err: bool = True,
+        backend: Optional[GstBackend] = None,
     ) -> bool:
+        """
+        Attempts to run current pipeline with the selected backend.
+
+        Traced pipelines always run with `gst-launch-1.0`, see `enable_trace`.
+
+        Returns:
+            bool: True if pipeline executed successfully, False if there was an error.
+        """
+        if not self._prepare_run(print_err):
+            return False
+        if self._trace:
+            success = self._run_subprocess(run_prompt, print_err)
+            self._write_trace()
+            return success
+        if self.resolve_backend(backend) == GstBackend.INPROCESS:
+            return self._run_inprocess(run_prompt, print_err)
+        return self._run_subprocess(run_prompt, print_err)
+
+    async def run_async(
+        self,
+        run_prompt: str = "",
+        print_err: bool = True,
+        eos_timeout: float = EOS_TIMEOUT,
+        term_timeout: float = TERM_TIMEOUT,
+    ) -> bool:
+        """
+        Runs current pipeline with `gst-launch-1.0` as an asyncio subprocess, so many pipelines
+        can be run and awaited from one event loop, see `GstRunner`.
+
+        stdout and stderr are read line by line while the pipeline runs: debug log lines go to
+        the log handlers, other lines to the line handlers, and only the last
+        `STDERR_TAIL_LINES` stderr lines are kept for the error message.
+
+        Cancelling the task shuts the pipeline down gracefully: `gst-launch-1.0` is interrupted
+        so it sends EOS and sinks can finalize their output, then terminated after `eos_timeout`
+        seconds and killed after another `term_timeout` seconds. The cancellation is re-raised
+        once the process has exited, cancelling again meanwhile doesn't interrupt the shutdown.
+
+        Returns:
+            bool: True if pipeline executed successfully, False if there was an error.
+        """
+        if not self._prepare_run(print_err):
+            return False
+        self._format_pipeline()
+        tail: deque[str] = deque(maxlen=STDERR_TAIL_LINES)
+        if run_prompt:
+            print(run_prompt)
+        process = await asyncio.create_subprocess_exec(
+            *self._launch_cmd(),
+            stdout=asyncio.subprocess.PIPE if self._line_handlers else asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+            env=self._subprocess_env(),
+            start_new_session=True,
+        )
+        for handler in self._spawn_handlers:
+            handler(process.pid)
+        readers = [
+            asyncio.ensure_future(self._read_stream_async(stream, name, tail))
+            for stream, name in ((process.stdout, "stdout"), (process.stderr, "stderr"))
+            if stream is not None
+        ]
+        try:
+            returncode = await process.wait()
+            await asyncio.gather(*readers)
+        except asyncio.CancelledError:
+            self._interrupted = True
+            shutdown = asyncio.ensure_future(self._shutdown_async(process, readers, eos_timeout, term_timeout))
+            # further cancellations wait for the shutdown, so the process is never left running
+            while not shutdown.done():
+                try:
+                    await asyncio.shield(shutdown)
+                except asyncio.CancelledError:
+                    pass
+            raise
+        finally:
+            for reader in readers:
+                reader.cancel()
+            if self._trace:
+                self._write_trace()
+        if returncode != 0:
+            self._error = "\n".join(tail)
+            self._invalid = any(ERRONEOUS_PIPELINE in line for line in tail)
+            if print_err:
+                print(f"Pipeline failed with error: {self._error}")
+            return False
+        return True
+
+    def _prepare_run(self, print_err: bool) -> bool:
+        """
+        Resets the state of the last run and runs the preflight check if enabled.
+
+        Returns:
+            bool: False if the pipeline failed the preflight check.
+        """
+        self._interrupted = False
+        self._invalid = False
+        self._error = None
+        if self._preflight and (errors := self.check()):
+            self._error = "\n".join(errors)
+            self._invalid = True
+            if print_err:
+                print("\nPipeline failed preflight check:\n  " + "\n  ".join(errors) + "\n")
+            return False
+        return True
+
+    def _write_trace(self) -> None:
+        written = self._trace.write(self._trace_dir)
+        print(f"\nTrace report written to {', '.join(str(p) for p in written)}\n")
+
+    def _run_inprocess(self, run_prompt: str, print_err: bool) -> bool:
+        """
+        Runs current pipeline in this process with `GstEngine`.
+
+        Pipeline can be shutdown with a SIGINT (KeyboardInterrupt) in which case EOS is sent
+        and the pipeline is torn down once it reaches the sinks or after a timeout.
+
+        Returns:
+            bool: True if pipeline executed successfully, False if there was an error.
+        """
+        self._format_pipeline()
+        if run_prompt:
+            print(run_prompt)
+        # the environment is applied once per process, before the first pipeline, which may
+        # be a headless validation pipeline, so it always has the display exports
+        engine = GstEngine(self._pipeline, get_env())
+        for handler in self._event_handlers:
+            engine.add_event_handler(handler)
+        for elem_name, sig, handler in self._signal_handlers:
+            engine.add_signal_handler(elem_name, sig, handler)
+        for elem_name, pad_name, handler in self._pad_probes:
+            engine.add_pad_probe(elem_name, pad_name, handler)
+        for handler in self._start_handlers:
+            engine.add_start_handler(handler)
+        success = engine.run()
+        self._interrupted = engine.interrupted
+        if not success:
+            self._error = engine.error
+            self._invalid = not engine.parsed
+            if print_err:
+                print(f"Pipeline failed with error: {engine.error}")
+            return False
+        return True
+
+    def _subprocess_env(self) -> dict[str, str]:
+        env = get_env(self._display, self._trace_dir)
+        if self._log_debug:
+            env["GST_DEBUG"] = ",".join(filter(None, [env.get("GST_DEBUG", ""), *self._log_debug]))
+            env["GST_DEBUG_NO_COLOR"] = "1"
+        if self._tracers:
+            enabled = env.get("GST_TRACERS", "")
+            # tracers already enabled by trace mode aren't loaded twice
+            names = {t.split("(")[0] for t in enabled.split(";")}
+            env["GST_TRACERS"] = ";".join(
+                filter(None, [enabled, *(t for t in self._tracers if t.split("(")[0] not in names)])
+            )
+        return env
+
+    def _launch_cmd(self) -> list[str]:
+        return ["gst-launch-1.0", "-e", *self._launch_options, *self._pipeline]
+
+    def _handle_line(self, raw: bytes, stream: str, tail: deque[str]) -> None:
+        """
+        Passes debug log lines to the log handlers and other lines to the line handlers,
+        keeping the last other stderr lines in `tail`.
+        """
+        line = raw.decode(errors="replace").rstrip("\n")
+        if GST_LOG_LINE_RE.match(line):
+            for handler in self._log_handlers:
+                handler(line)
+            return
+        if stream == "stderr":
+            tail.append(line)
+        for handler in self._line_handlers:
+            handler(stream, line)
+
+    def _read_stream(self, stream: IO[bytes], name: str, tail: deque[str]) -> None:
+        for raw in stream:
+            self._handle_line(raw, name, tail)
+
+    async def _read_stream_async(self, stream: asyncio.StreamReader, name: str, tail: deque[str]) -> None:
+        buf = b""
+        skip = False
+        while chunk := await stream.read(READ_CHUNK_BYTES):
+            lines = (buf + chunk).split(b"\n")
+            buf = lines.pop()
+            for raw in lines:
+                if skip:
+                    skip = False
+                else:
+                    self._handle_line(raw, name, tail)
+            if len(buf) > MAX_LINE_BYTES:
+                # the rest of an overlong line is dropped up to the next newline
+                buf, skip = b"", True
+        if buf and not skip:
+            self._handle_line(buf, name, tail)
+
+    async def _shutdown_async(
+        self,
+        process: asyncio.subprocess.Process,
+        readers: list[asyncio.Future],
+        eos_timeout: float,
+        term_timeout: float,
+    ) -> None:
+        await self._stop_process_async(process, eos_timeout, term_timeout)
+        # the last lines explain a failed shutdown
+        await asyncio.wait(readers, timeout=1)
+
+    @staticmethod
+    async def _stop_process_async(
+        process: asyncio.subprocess.Process, eos_timeout: float, term_timeout: float
+    ) -> None:
+        """
+        Interrupts `process` so it sends EOS, escalating to SIGTERM and SIGKILL if it doesn't
+        exit within the timeouts.
+        """
+        for sig, timeout in ((signal.SIGINT, eos_timeout), (signal.SIGTERM, term_timeout), (signal.SIGKILL, None)):
+            if process.returncode is not None:
+                return
+            if sig == signal.SIGKILL:
+                print("Shutdown failed, forcefully killing pipeline...")
+            try:
+                process.send_signal(sig)
+            except ProcessLookupError:
+                pass
+            try:
+                await asyncio.wait_for(asyncio.shield(process.wait()), timeout)
+                return
+            except asyncio.TimeoutError:
+                pass
+
+    def _run_subprocess(self, run_prompt: str, print_err: bool) -> bool:
         """
         Attempts to run current pipeline with `gst-launch-1.0` through a subprocess.
 
         An erroneous pipeline will cause the subprocess to terminate with an exit message.
+        Output is read while the pipeline runs so debug logs can be parsed without buffering them,
+        see `run_async` for the handling of each line.
 
-        Pipeline can be shutdown with a SIGINT (KeyboardInterrupt) in which case a graceful exit is attempted.
+        Pipeline can be shutdown with a SIGINT (KeyboardInterrupt) in which case a graceful exit is attempted:
+        `gst-launch-1.0` is interrupted once so it sends EOS and sinks can finalize their output.
         The pipeline is forcefully shut down if the exit fails.
 
         Returns:
@@ -77,39 +577,400 @@ class GstPipeline:
         """
         self._format_pipeline()
         process = None
+        readers: list[Thread] = []
+        tail: deque[str] = deque(maxlen=STDERR_TAIL_LINES)
         try:
             if run_prompt:
                 print(run_prompt)
+            # the child gets its own session so a terminal Ctrl+C only interrupts it once, from here
             process = subprocess.Popen(
-                ["gst-launch-1.0", *self._pipeline],
-                stdout=subprocess.PIPE,
+                self._launch_cmd(),
+                stdout=subprocess.PIPE if self._line_handlers else subprocess.DEVNULL,
                 stderr=subprocess.PIPE,
-                env=get_env(),
+                env=self._subprocess_env(),
+                start_new_session=True,
             )
-            stdout, stderr = process.communicate()
+            for handler in self._spawn_handlers:
+                handler(process.pid)
+            for stream, name in ((process.stdout, "stdout"), (process.stderr, "stderr")):
+                if stream is not None:
+                    readers.append(Thread(target=self._read_stream, args=(stream, name, tail), daemon=True))
+                    readers[-1].start()
+            process.wait()
+            for reader in readers:
+                reader.join()
             if process.returncode != 0:
                 raise subprocess.CalledProcessError(
-                    process.returncode, process.args, output=stdout, stderr=stderr
+                    process.returncode, process.args, stderr="\n".join(tail).encode()
                 )
         except subprocess.CalledProcessError as e:
+            self._error = e.stderr.decode()
+            self._invalid = ERRONEOUS_PIPELINE in self._error
             if print_err:
-                print(f"Pipeline failed with error: {e.stderr.decode()}")
+                print(f"Pipeline failed with error: {self._error}")
             return False
         except KeyboardInterrupt:
             print("\nShutting down pipeline...")
+            self._interrupted = True
             if process:
-                process.terminate()
+                process.send_signal(signal.SIGINT)
                 try:
-                    process.wait(timeout=5)
+                    process.wait(timeout=EOS_TIMEOUT)
                 except subprocess.TimeoutExpired:
-                    print("Shutdown failed, forcefully killing pipeline...")
-                    process.kill()
-                    process.wait()
+                    process.terminate()
+                    try:
+                        process.wait(timeout=TERM_TIMEOUT)
+                    except subprocess.TimeoutExpired:
+                        print("Shutdown failed, forcefully killing pipeline...")
+                        process.kill()
+                        process.wait()
+        finally:
+            for reader in readers:
+                reader.join(timeout=2)
         return True
 
 
+# raw formats produced by decoders
+DECODER_FORMATS: dict[str, str] = {
+    "avdec_h264": "I420",
+    "avdec_h265": "I420",
+    "v4l2h264dec": "NV12",
+    "v4l2h265dec": "NV12",
+    "v4l2av1dec": "NV12",
+}
+
+# raw formats accepted without a conversion by sinks and encoders, None accepts any format
+ACCEPTED_FORMATS: dict[str, Optional[set[str]]] = {
+    "waylandsink": {"NV12", "I420", "YUY2", "BGRx", "BGRA", "RGB16"},
+    "v4l2h264enc": {"NV12"},
+    "fakesink": None,
+}
+
+# elements that pass frames through without changing their format or size, synapoverlay
+# isn't one of them: the formats it takes aren't known, so the conversions around it are kept
+PASSTHROUGH_ELEMS: set[str] = {"queue", "tee", "identity", "valve", "videorate"}
+
+
+class OptimizationReport(NamedTuple):
+    """Expected per-frame copies made by conversion and scaling elements"""
+
+    copies_before: int
+    copies_after: int
+    frames_before: float
+    frames_after: float
+
+    def __str__(self) -> str:
+        return (
+            f"{self.copies_before} -> {self.copies_after} per-frame copies "
+            f"({self.frames_before:.2f} -> {self.frames_after:.2f} full-frame equivalents)"
+        )
+
+
+class GstPipelineOptimizer:
+    """
+    Removes redundant colour conversions and scaling from a pipeline's element list.
+
+    - the conversion in front of the tee is dropped when every branch takes the decoded
+      format, and only converts to a single shared format (NV12 by default) when a sink or
+      encoder behind the tee can't take it
+    - conversions in front of sinks that accept the format reaching them are dropped
+    - the inference branch scales in the source format first and converts only the
+      downscaled frame instead of converting full frames
+    - conversions whose input format already matches their output format are dropped
+
+    Formats and sizes are tracked along each chain from caps filters and decoders. An
+    element whose output can't be determined is assumed to make a full copy, so the
+    reported copy counts are an upper bound.
+    """
+
+    def __init__(self, shared_format: str = "NV12") -> None:
+        self._shared_format: str = shared_format
+
+    @staticmethod
+    def _factory(elem: str | list[str]) -> str:
+        token = elem[0] if isinstance(elem, list) else elem
+        if token.startswith("video/") or "." in token.split(" ")[0]:
+            return ""
+        return token.split(" ")[0]
+
+    @staticmethod
+    def _caps(elem: str | list[str]) -> Optional[dict[str, str]]:
+        if not isinstance(elem, str) or not elem.startswith("video/x-raw"):
+            return None
+        fields: dict[str, str] = {}
+        for field in elem.split(",")[1:]:
+            key, _, val = field.partition("=")
+            fields[key.strip()] = val.split(")")[-1].strip()
+        return fields
+
+    @staticmethod
+    def _tee_name(elem: str | list[str]) -> Optional[str]:
+        if isinstance(elem, list) and elem[0] == "tee":
+            for prop in elem[1:]:
+                if prop.startswith("name="):
+                    return prop[5:]
+        return None
+
+    @staticmethod
+    def _split_chains(
+        elems: list[str | list[str]], branch_starts: set[int]
+    ) -> list[list[str | list[str]]]:
+        chains: list[list[str | list[str]]] = []
+        for i, elem in enumerate(elems):
+            if i == 0 or i in branch_starts or elem == "t_data.":
+                chains.append([])
+            chains[-1].append(elem)
+        return chains
+
+    def _update(self, state: dict[str, Any], elem: str | list[str]) -> None:
+        """
+        Updates the tracked format and size after `elem`.
+        """
+        if caps := self._caps(elem):
+            for key in ("format", "width", "height"):
+                if key in caps:
+                    state[key] = caps[key] if key == "format" else int(caps[key])
+            return
+        factory = self._factory(elem)
+        if factory in DECODER_FORMATS:
+            state["format"] = DECODER_FORMATS[factory]
+        elif factory == "videoconvert":
+            state["format"] = None
+        elif factory == "videoscale":
+            state["width"] = state["height"] = None
+        elif factory and factory not in PASSTHROUGH_ELEMS:
+            state.update(format=None, width=None, height=None)
+
+    def _known_formats(self, elem: str | list[str]) -> bool:
+        """Whether the formats `elem` accepts are known, from its caps or `ACCEPTED_FORMATS`"""
+        return "format" in (self._caps(elem) or {}) or self._factory(elem) in ACCEPTED_FORMATS
+
+    def _accepts(self, elem: Optional[str | list[str]], fmt: Optional[str]) -> bool:
+        if elem is None or not fmt:
+            return False
+        if caps := self._caps(elem):
+            return caps.get("format") == fmt
+        factory = self._factory(elem)
+        if factory not in ACCEPTED_FORMATS:
+            return False
+        return ACCEPTED_FORMATS[factory] is None or fmt in ACCEPTED_FORMATS[factory]
+
+    def _head_state(
+        self,
+        chain: list[str | list[str]],
+        tees: dict[str, dict[str, Any]],
+        src_size: tuple[Optional[int], Optional[int]],
+    ) -> dict[str, Any]:
+        """
+        Returns the format and size at the start of `chain`, the state of its tee if it
+        starts at one.
+        """
+        head = chain[0]
+        if isinstance(head, str) and head.endswith(".") and head[:-1] in tees:
+            return dict(tees[head[:-1]])
+        return {"format": None, "width": src_size[0], "height": src_size[1]}
+
+    def _takes(
+        self, chains: list[list[str | list[str]]], chain: list[str | list[str]], pos: int, fmt: Optional[str]
+    ) -> bool:
+        """
+        Whether the elements from `chain[pos]` on take frames in `fmt` without converting
+        them first, looking through elements that keep the format and into every branch
+        of a tee. A `videoconvert` takes any format, it negotiates its own conversion.
+        """
+        if not fmt:
+            return False
+        for elem in chain[pos:]:
+            if tee := self._tee_name(elem):
+                branches = [c for c in chains if c[0] == f"{tee}."]
+                return bool(branches) and all(self._takes(chains, c, 1, fmt) for c in branches)
+            caps = self._caps(elem)
+            factory = self._factory(elem)
+            if factory == "videoconvert":
+                return True
+            if factory in (*PASSTHROUGH_ELEMS, "videoscale") or (caps is not None and "format" not in caps):
+                continue
+            return self._accepts(elem, fmt)
+        return False
+
+    def _needs_format(self, branch: list[str | list[str]], fmt: str) -> Optional[bool]:
+        """
+        Whether the consumer of a tee branch can't take `fmt`: a sink, encoder or caps
+        filter right after the tee that doesn't accept it, or one behind a `videoconvert`
+        that takes the shared format but not `fmt`. Branches converting to a format of
+        their own, e.g. RGB for inference, don't need any.
+
+        Returns:
+            bool: whether the branch needs another format, None if its consumer is unknown
+        """
+        elems = [
+            e
+            for e in branch[1:]
+            if self._factory(e) not in (*PASSTHROUGH_ELEMS, "videoscale")
+            and not (self._caps(e) is not None and "format" not in self._caps(e))
+        ]
+        if not elems:
+            return None
+        if self._factory(elems[0]) == "videoconvert":
+            # the branch converts on its own, the shared format only helps if it makes the
+            # conversion a passthrough
+            consumer = elems[1] if len(elems) > 1 else None
+            return (
+                consumer is not None
+                and self._known_formats(consumer)
+                and not self._accepts(consumer, fmt)
+                and self._accepts(consumer, self._shared_format)
+            )
+        return not self._accepts(elems[0], fmt) if self._known_formats(elems[0]) else None
+
+    def count_copies(
+        self,
+        chains: list[list[str | list[str]]],
+        src_size: tuple[Optional[int], Optional[int]],
+    ) -> tuple[int, float]:
+        """
+        Estimates the per-frame copies made by conversion and scaling elements.
+
+        A `videoconvert` whose downstream elements take the incoming format negotiates a
+        passthrough and isn't counted.
+
+        Returns:
+            tuple[int, float]: the number of copies and their size in full source frames
+        """
+        src_px = (src_size[0] or 0) * (src_size[1] or 0)
+        copies, frames = 0, 0.0
+        tees: dict[str, dict[str, Any]] = {}
+        for chain in chains:
+            state = self._head_state(chain, tees, src_size)
+            for i, elem in enumerate(chain):
+                factory = self._factory(elem)
+                nxt = chain[i + 1] if i + 1 < len(chain) else None
+                in_px = (state["width"] or 0) * (state["height"] or 0)
+                out_state = dict(state)
+                if factory in ("videoconvert", "videoscale") and nxt is not None:
+                    self._update(out_state, nxt)
+                out_px = (out_state["width"] or 0) * (out_state["height"] or 0)
+                if factory == "videoconvert":
+                    if self._takes(chains, chain, i + 1, state["format"]):
+                        # passthrough, the format is unchanged
+                        continue
+                    copies += 1
+                    frames += in_px / src_px if in_px and src_px else 1.0
+                elif factory == "videoscale" and not (in_px and in_px == out_px):
+                    copies += 1
+                    frames += max(in_px, out_px) / src_px if in_px and src_px else 1.0
+                self._update(state, elem)
+                if name := self._tee_name(elem):
+                    tees[name] = dict(state)
+        return copies, frames
+
+    def optimize(
+        self,
+        elems: list[str | list[str]],
+        branch_starts: set[int],
+        src_size: tuple[Optional[int], Optional[int]] = (None, None),
+    ) -> tuple[list[str | list[str]], set[int], OptimizationReport]:
+        """
+        Optimizes an element list.
+
+        Chains are rewritten in order, so the branches of a tee start from the format the
+        tee is fed after its own chain was rewritten.
+
+        Args:
+            elems (list): the pipeline's elements
+            branch_starts (set[int]): indices of elements that start an unlinked chain
+            src_size (tuple[int, int]): [Optional] source resolution, used for the report
+
+        Returns:
+            tuple: the optimized elements, their branch start indices and a report
+        """
+        chains = self._split_chains(elems, branch_starts)
+        tee_branches: dict[str, list[list[str | list[str]]]] = {}
+        for chain in chains:
+            if isinstance(chain[0], str) and chain[0].endswith("."):
+                tee_branches.setdefault(chain[0][:-1], []).append(chain)
+
+        out_chains: list[list[str | list[str]]] = []
+        tees: dict[str, dict[str, Any]] = {}
+        for chain in chains:
+            state = self._head_state(chain, tees, src_size)
+            out: list[str | list[str]] = []
+            i = 0
+            while i < len(chain):
+                elem = chain[i]
+                nxt = chain[i + 1] if i + 1 < len(chain) else None
+                if self._factory(elem) == "videoconvert" and nxt is not None:
+                    scale_caps = self._caps(chain[i + 2]) if i + 2 < len(chain) else None
+                    if (
+                        self._factory(nxt) == "videoscale"
+                        and scale_caps
+                        and {"width", "height", "format"} <= scale_caps.keys()
+                    ):
+                        # scale in the source format, then convert the smaller frame
+                        scaled = f"video/x-raw,width={scale_caps['width']},height={scale_caps['height']}"
+                        out.extend(["videoscale", scaled, "videoconvert", chain[i + 2]])
+                        for e in chain[i : i + 3]:
+                            self._update(state, e)
+                        i += 3
+                        continue
+                    if tee := self._tee_name(nxt):
+                        branches = tee_branches.get(tee, [])
+                        needs = [self._needs_format(b, state["format"]) if state["format"] else None for b in branches]
+                        if len(branches) > 1 and any(needs):
+                            # a single conversion to the shared format feeds all branches
+                            out.extend([elem, f"video/x-raw,format={self._shared_format}"])
+                            state["format"] = self._shared_format
+                        elif len(branches) > 1 and None in needs:
+                            # the tee's format or what a branch takes is unknown, leave it to negotiation
+                            out.append(elem)
+                            self._update(state, elem)
+                        # otherwise every branch takes the format as is or does its own conversion
+                        i += 1
+                        continue
+                    if self._accepts(nxt, state["format"]):
+                        i += 1
+                        continue
+                out.append(elem)
+                self._update(state, elem)
+                if name := self._tee_name(elem):
+                    tees[name] = dict(state)
+                i += 1
+            out_chains.append(out)
+
+        new_elems: list[str | list[str]] = []
+        new_starts: set[int] = set()
+        for idx, chain in enumerate(out_chains):
+            if idx > 0 and chain[0] != "t_data.":
+                new_starts.add(len(new_elems))
+            new_elems.extend(chain)
+        before = self.count_copies(chains, src_size)
+        after = self.count_copies(out_chains, src_size)
+        return new_elems, new_starts, OptimizationReport(*before[:1], *after[:1], before[1], after[1])
+
+
+class InferenceModel(NamedTuple):
+    """A model run on the input and how its results are shown"""
+
+    model: str
+    # model input size
+    width: int
+    height: int
+    labels: str
+    threshold: float = 0.5
+    # infer every `interval` frames
+    interval: int = 1
+    max_results: int = 5
+
+
 class GstPipelineGenerator:
-    """Generates a `GstPipeline` for different input sources"""
+    """
+    Generates a `GstPipeline` for different input sources.
+
+    Several models can run on the same decoded input (see the "models" parameter): each
+    gets its own inference branch off the data tee, scaled to its input size, and their
+    results are drawn by a chain of overlays on one output, or each on a separate output.
+    The frames each model infers on are staggered so they don't use the NPU at the same time.
+    """
 
     def __init__(
         self,
@@ -121,47 +982,83 @@ class GstPipelineGenerator:
         self._inp_src: str = gst_params["inp_src"]
         self._inp_codec: str = gst_params.get("inp_codec", None)
         self._codec_elems: tuple[str, str] = gst_params.get("codec_elems", None)
-        self._inf_model: str = gst_params["inf_model"]
-        self._inf_w: int = gst_params["inf_w"]
-        self._inf_h: int = gst_params["inf_h"]
-        self._inf_skip: int = gst_params["inf_skip"]
-        self._inf_max: int = gst_params["inf_max"]
-        self._inf_thresh: float = gst_params["inf_thresh"]
-        self._inf_labels: str = gst_params["inf_labels"]
+        # the first model is the primary one, the inference parameters describe it
+        self._models: list[InferenceModel] = gst_params.get("models", None) or [
+            InferenceModel(
+                gst_params["inf_model"],
+                gst_params["inf_w"],
+                gst_params["inf_h"],
+                gst_params["inf_labels"],
+                gst_params["inf_thresh"],
+                gst_params["inf_skip"],
+                gst_params["inf_max"],
+            )
+        ]
+        self._inf_model: str = self._models[0].model
+        self._inf_w: int = self._models[0].width
+        self._inf_h: int = self._models[0].height
+        self._inf_skip: int = self._models[0].interval
+        self._inf_max: int = self._models[0].max_results
+        self._inf_thresh: float = self._models[0].threshold
+        self._inf_labels: str = self._models[0].labels
+        # overlay each model's results on its own output instead of layering them on one
+        self._separate_model_outputs: bool = gst_params.get("separate_model_outputs", False)
         self._fullscreen: bool = gst_params["fullscreen"]
-        self._pipeline: GstPipeline = GstPipeline()
+        self._sink: SinkType = gst_params.get("sink", SinkType.DISPLAY)
+        self._sink_location: Optional[str] = gst_params.get("sink_location", None)
+        self._optimize: bool = gst_params.get("optimize", True)
+        self._opt_report: Optional[OptimizationReport] = None
+        self._queue_profile_name: str = gst_params.get("queue_profile", DEFAULT_QUEUE_PROFILE)
+        if self._queue_profile_name not in QUEUE_PROFILES:
+            raise SystemExit(f'Fatal: invalid queue profile "{self._queue_profile_name}"')
+        self._queue_profile: QueueProfile = QUEUE_PROFILES[self._queue_profile_name]
+        # None uses the profile's cap on live sources, 0 disables it
+        self._max_fps: Optional[int] = gst_params.get("max_fps", None)
+        self._queues: dict[str, tuple[QueueLimits, bool]] = {}
+        self._drop_counter: QueueDropCounter = QueueDropCounter([])
+        self._rtsp_profile: str = gst_params.get("rtsp_profile", DEFAULT_RTSP_PROFILE)
+        if self._rtsp_profile not in RTSP_PROFILES:
+            raise SystemExit(f'Fatal: invalid RTSP profile "{self._rtsp_profile}"')
+        self._src_size: tuple[Optional[int], Optional[int]] = (None, None)
+        self._src_fps: Optional[float] = None
+        self._pipeline: GstPipeline = GstPipeline(
+            gst_params.get("backend", GstBackend.AUTO),
+            display=self._sink == SinkType.DISPLAY,
+        )
+        # optional second stage classifying the detections, runs in-process only
+        self._cascade: Optional["ClassifierCascade"] = gst_params.get("cascade", None)
+        if self._cascade and self._pipeline.resolve_backend() != GstBackend.INPROCESS:
+            raise SystemExit("Fatal: the classifier cascade requires the in-process backend")
+        # optional stage predicting the detections on every displayed frame, runs in-process only
+        self._tracker: Optional["DetectionTracker"] = gst_params.get("tracker", None)
+        if self._tracker and self._cascade:
+            raise SystemExit("Fatal: box tracking can't be combined with the classifier cascade")
+        if self._tracker and self._pipeline.resolve_backend() != GstBackend.INPROCESS:
+            raise SystemExit("Fatal: box tracking requires the in-process backend")
 
         # GStreamer elements
         self._splitter_elems: list[str, list[str]] = [
             "videoconvert",
             ["tee", "name=t_data"],
         ]
-        self._infer_elems: list[str, list[str]] = [
-            "t_data.",
-            "queue",
-            "videoconvert",
-            "videoscale",
-            f"video/x-raw,width={self._inf_w},height={self._inf_h},format=RGB",
-            [
-                "synapinfer",
-                "mode=detector",
-                f"model={self._inf_model}",
-                f"threshold={self._inf_thresh}",
-                f"numinference={self._inf_max}",
-                f"frameinterval={self._inf_skip}",
-                "name=infer",
-            ],
-            "overlay.inference_sink",
-        ]
+        self._infer_elems: list[str, list[str]] = self._model_infer_elems(0)
         self._overlay_elems: list[str, list[str]] = [
             "t_data.",
-            "queue",
+            self._queue("q_overlay", self._queue_profile.output),
             [
                 "synapoverlay",
                 "name=overlay",
-                f"label={self._inf_labels}",
+                f"label={self._cascade.labels_file if self._cascade else self._inf_labels}",
             ],
         ]
+        # inference branches and overlays of the other models
+        self._model_elems: list[list[str, list[str]]] = [
+            self._model_infer_elems(i) for i in range(1, len(self._models))
+        ]
+        self._model_overlays: list[list[str]] = [
+            ["synapoverlay", f"name=overlay{i}", f"label={self._models[i].labels}"]
+            for i in range(1, len(self._models))
+        ]
         self._display_elems: list[str, list[str]] = [
             "videoconvert",
             ["waylandsink", f"fullscreen={str(self._fullscreen).lower()}"],
@@ -171,53 +1068,351 @@ class GstPipelineGenerator:
     def pipeline(self) -> GstPipeline:
         return self._pipeline
 
-    def make_file_pipeline(self, video_file: str, codec_elems: tuple[str, str]) -> None:
-        self._pipeline.reset()
+    @property
+    def optimization_report(self) -> Optional[OptimizationReport]:
+        """Copies saved by the pipeline optimizer, None if the optimizer is disabled"""
+        return self._opt_report
+
+    @property
+    def drop_counter(self) -> QueueDropCounter:
+        """Frames dropped by the leaky queues of the last generated pipeline"""
+        return self._drop_counter
+
+    @property
+    def queues(self) -> list[str]:
+        """Names of the queues of the last generated pipeline"""
+        return [name for name in self._queues if self._pipeline.has_element(name)]
+
+    @property
+    def models(self) -> list[InferenceModel]:
+        return list(self._models)
+
+    @property
+    def cascade(self) -> Optional["ClassifierCascade"]:
+        """The classifier stage run on the detections, if any"""
+        return self._cascade
+
+    @property
+    def tracker(self) -> Optional["DetectionTracker"]:
+        """The stage tracking the detections between inferences, if any"""
+        return self._tracker
+
+    @property
+    def rtsp_sources(self) -> list[str]:
+        """Names of the `rtspsrc` elements, each depayloader is named after its source"""
+        return ["rtsp"] if self._inp_type == InputType.RTSP else []
+
+    def memory_ceiling(self) -> dict[str, Optional[int]]:
+        """
+        Returns the most memory each queue of the generated pipeline can hold, in bytes.
+
+        Raw frames are sized at `RAW_BYTES_PER_PIXEL` for the source resolution. A queue
+        is None if its limits don't bound it, e.g. a time limit with an unknown frame rate.
+        """
+        w, h = self._src_size
+        frame_bytes = w * h * RAW_BYTES_PER_PIXEL if w and h else None
+        fps = min(filter(None, (self._src_fps, self._fps_cap())), default=None)
+        return {
+            name: limits.ceiling(frame_bytes if raw else None, fps)
+            for name, (limits, raw) in self._queues.items()
+            if self._pipeline.has_element(name)
+        }
+
+    def queue_report(self) -> str:
+        """
+        Describes the queue profile and the memory ceiling it implies.
+        """
+        ceilings = self.memory_ceiling()
+        total = "unbounded" if None in ceilings.values() else f"{sum(ceilings.values()) / (1 << 20):.1f} MiB"
+        per_queue = ", ".join(
+            f"{name}: {'unbounded' if c is None else f'{c / (1 << 20):.1f} MiB'}"
+            for name, c in ceilings.items()
+        )
+        fps_cap = f", source capped at {cap} fps" if (cap := self._fps_cap()) else ""
+        return f"Queue profile {self._queue_profile_name}{fps_cap}: memory ceiling {total} ({per_queue})"
+
+    def _model_infer_elems(self, idx: int) -> list[str, list[str]]:
+        """
+        Returns the inference branch of the `idx`-th model, ending at its overlay. The
+        primary model's elements are called "infer" and "overlay", the others are numbered.
+        """
+        model = self._models[idx]
+        suffix = str(idx) if idx else ""
+        return [
+            "t_data.",
+            self._queue(f"q_infer{suffix}", self._queue_profile.infer),
+            "videoconvert",
+            "videoscale",
+            f"video/x-raw,width={model.width},height={model.height},format=RGB",
+            [
+                "synapinfer",
+                "mode=detector",
+                f"model={model.model}",
+                f"threshold={model.threshold}",
+                f"numinference={model.max_results}",
+                f"frameinterval={model.interval}",
+                f"name=infer{suffix}",
+            ],
+            f"overlay{suffix}.inference_sink",
+        ]
+
+    def _model_branches(self, overlay: bool = True) -> list[str, list[str]]:
+        """
+        Returns the inference branches of the models after the first, ending at their
+        overlays or, without overlays, at fakesinks.
+        """
+        return [
+            elem
+            for branch in self._model_elems
+            for elem in (branch if overlay else [*branch[:-1], ["fakesink", "sync=false"]])
+        ]
+
+    def _overlay_chain(self) -> list[str, list[str]]:
+        """
+        Returns the overlay branch with the overlays of all models layered on the video.
+        """
+        return [*self._overlay_elems, *self._model_overlays]
+
+    def _queue(self, name: str, limits: QueueLimits, raw: bool = True) -> list[str]:
+        """
+        Returns a named queue with the given limits.
+
+        Args:
+            name (str): element name, used to report dropped frames
+            limits (QueueLimits): size limits and leaky mode
+            raw (bool): whether the queue holds raw frames or compressed data
+        """
+        self._queues[name] = (limits, raw)
+        return ["queue", f"name={name}", *limits.props]
+
+    def _live_source(self) -> bool:
+        """
+        Whether the input is live, files are played at their own rate.
+        """
+        return self._inp_type != InputType.FILE
+
+    def _fps_cap(self) -> Optional[int]:
+        """
+        Returns the source frame rate cap: the "max_fps" parameter if given, otherwise the
+        queue profile's cap for live sources only, so files aren't played at a lower rate.
+        """
+        if self._max_fps is None:
+            return self._queue_profile.max_fps if self._live_source() else None
+        return self._max_fps or None
+
+    def _rate_elems(self) -> list[str, list[str]]:
+        """
+        Returns the frame rate cap applied after the source, if any.
+        """
+        if not (cap := self._fps_cap()):
+            return []
+        return [["videorate", "drop-only=true", f"max-rate={cap}"]]
+
+    def _finish_pipeline(
+        self, src_size: tuple[Optional[int], Optional[int]], src_fps: Optional[float] = None
+    ) -> None:
+        """
+        Runs the pipeline optimizer on the generated pipeline unless it is disabled and
+        starts counting the frames dropped by its leaky queues in-process, see `count_drops`
+        for gst-launch-1.0.
+        """
+        self._src_size, self._src_fps = src_size, src_fps
+        if self._cascade:
+            self._cascade.attach(
+                self._pipeline, "overlay.inference_sink" if self._pipeline.has_element("overlay") else None
+            )
+        if self._tracker:
+            overlay = self._pipeline.has_element("overlay")
+            self._tracker.attach(
+                self._pipeline,
+                "overlay.inference_sink" if overlay else None,
+                frame_elem="q_overlay" if overlay and self._pipeline.has_element("q_overlay") else None,
+            )
+        if len(self._models) > 1:
+            suffixes = ["", *(str(i) for i in range(1, len(self._models)))]
+            FrameStagger([m.interval for m in self._models]).attach(
+                self._pipeline, [f"q_infer{s}" for s in suffixes], [f"infer{s}" for s in suffixes]
+            )
+        self._opt_report = self._pipeline.optimize(src_size) if self._optimize else None
+        leaky: list[str] = [
+            name
+            for name, (limits, _) in self._queues.items()
+            if limits.leaky != "no" and self._pipeline.has_element(name)
+        ]
+        self._drop_counter = QueueDropCounter(leaky)
+        for name in leaky:
+            self._pipeline.add_signal_handler(name, "overrun", self._drop_counter.overrun_handler(name))
+
+    def count_drops(self) -> QueueDropCounter:
+        """
+        Counts the frames dropped by the leaky queues of the generated pipeline with
+        gst-launch-1.0 too, by parsing the queue debug log. The log is verbose, so it is only
+        enabled for pipelines whose drops are reported. In-process, drops are always counted.
+
+        Returns:
+            QueueDropCounter: the pipeline's drop counter
+        """
+        if self._drop_counter.queues:
+            self._pipeline.add_log_handler(self._drop_counter.parse_log, QUEUE_DEBUG)
+        return self._drop_counter
+
+    def _sink_elems(self, idx: Optional[int] = None) -> list[str, list[str]]:
+        """
+        Returns the output stage for the selected sink type.
+
+        `idx` numbers the output locations of pipelines with more than one sink.
+        """
+        location: str = self._sink_location or SINK_DEFAULT_LOCATIONS.get(self._sink, "")
+        if self._sink == SinkType.DISPLAY:
+            return self._display_elems
+        if self._sink == SinkType.FAKESINK:
+            return [["fakesink", "sync=false"]]
+        if self._sink == SinkType.FILE:
+            path = Path(location)
+            if idx is not None:
+                path = path.with_name(f"{path.stem}_{idx}{path.suffix}")
+            return [
+                "videoconvert",
+                *H264_ENC_ELEMS,
+                MUXERS.get(path.suffix.lower(), "matroskamux"),
+                ["filesink", f'location="{path}"'],
+            ]
+        if self._sink == SinkType.UDP:
+            host, _, port = location.rpartition(":")
+            if not host or not port.isdigit():
+                raise SystemExit(f'Fatal: invalid UDP sink location "{location}", expected HOST:PORT')
+            return [
+                "videoconvert",
+                H264_ENC_ELEMS[0],
+                [*H264_ENC_ELEMS[1:], "config-interval=-1"],
+                ["rtph264pay", "pt=96"],
+                ["udpsink", f"host={host}", f"port={int(port) + (idx or 0)}", "sync=false"],
+            ]
+        if self._sink == SinkType.SNAPSHOT:
+            if idx is not None:
+                location = str(Path(location).with_name(f"{idx}_{Path(location).name}"))
+            return [
+                "videoconvert",
+                "videorate",
+                f"video/x-raw,framerate={SNAPSHOT_FRAMERATE}",
+                "jpegenc",
+                ["multifilesink", f'location="{location}"'],
+            ]
+        raise SystemExit(f"Fatal: invalid sink type {self._sink}")
+
+    def _processing_elems(self) -> list[str, list[str]]:
+        """
+        Returns the elements that follow the input source: inference, overlay and output.
+
+        The overlay branch is left out when there is no visual output.
+        """
+        if self._sink == SinkType.FAKESINK:
+            return [
+                *self._rate_elems(),
+                *self._splitter_elems,
+                *self._inference_elems(overlay=False),
+                *self._model_branches(overlay=False),
+            ]
+        if self._separate_model_outputs and self._model_overlays:
+            outputs: list[str, list[str]] = [*self._overlay_elems, *self._sink_elems(0)]
+            for i, overlay in enumerate(self._model_overlays, 1):
+                outputs += [
+                    "t_data.",
+                    self._queue(f"q_overlay{i}", self._queue_profile.output),
+                    overlay,
+                    *self._sink_elems(i),
+                ]
+        else:
+            outputs = [*self._overlay_chain(), *self._sink_elems()]
+        return [
+            *self._rate_elems(),
+            *self._splitter_elems,
+            *self._inference_elems(),
+            *self._model_branches(),
+            *outputs,
+        ]
+
+    def _inference_elems(self, overlay: bool = True) -> list[str, list[str]]:
+        """
+        Returns the inference branch, which ends at the overlay or, without one, a fakesink.
+        With a cascade or a tracker the results go to that stage, which passes them on to
+        the overlay.
+        """
+        if self._cascade:
+            return [*self._infer_elems[:-1], *self._cascade.detector_elems()]
+        if self._tracker:
+            return [*self._infer_elems[:-1], *self._tracker.detector_elems()]
+        return self._infer_elems if overlay else [*self._infer_elems[:-1], ["fakesink", "sync=false"]]
+
+    def _file_src_elems(
+        self,
+        video_file: str,
+        codec_elems: tuple[str, str],
+        demux_name: str = "demux",
+        queue_name: str = "q_src",
+    ) -> list[str, list[str]]:
         if not codec_elems:
             raise SystemExit(
                 "Fatal: codec information not provided to pipeline generator"
             )
-        self._pipeline.add_elements(
+        probe = probe_container(video_file)
+        return [
             ["filesrc", f'location="{video_file}"'],
-            ["qtdemux", "name=demux", "demux.video_0"],
-            "queue",
+            probe.demux_elems(demux_name) if probe else demux_elems("mp4", demux_name),
+            self._queue(queue_name, self._queue_profile.src, raw=False),
             *codec_elems,
-            *self._splitter_elems,
-            *self._infer_elems,
-            *self._overlay_elems,
-            *self._display_elems,
+        ]
+
+    def _cam_src_elems(
+        self, cam_device: str, inp_w: Optional[int], inp_h: Optional[int]
+    ) -> list[str, list[str]]:
+        return [
+            ["v4l2src", f"device={cam_device}"],
+            f"video/x-raw,framerate={CAM_FRAMERATE}/1,format=YUY2,width={inp_w or CAM_DEFAULT_WIDTH},height={inp_h or CAM_DEFAULT_HEIGHT}",
+        ]
+
+    def _rtsp_src_elems(
+        self,
+        rtsp_url: str,
+        inp_codec: str,
+        codec_elems: tuple[str, str],
+        inp_w: Optional[int],
+        inp_h: Optional[int],
+        name: str = "rtsp",
+    ) -> list[str, list[str]]:
+        return rtsp_src_elems(rtsp_url, inp_codec, codec_elems, inp_w, inp_h, self._rtsp_profile, name)
+
+    def make_file_pipeline(self, video_file: str, codec_elems: tuple[str, str]) -> None:
+        self._pipeline.reset()
+        # missing input dimensions are read from the container headers
+        probe = probe_container(video_file)
+        if not (self._inp_w and self._inp_h) and probe:
+            self._inp_w, self._inp_h = probe.width, probe.height
+        self._pipeline.add_elements(
+            *self._file_src_elems(video_file, codec_elems),
+            *self._processing_elems(),
         )
+        self._finish_pipeline((self._inp_w, self._inp_h), probe.fps if probe else None)
 
     def make_cam_pipeline(self, cam_device: str) -> None:
         self._pipeline.reset()
         self._pipeline.add_elements(
-            ["v4l2src", f"device={cam_device}"],
-            f"video/x-raw,framerate=30/1,format=YUY2,width={self._inp_w or CAM_DEFAULT_WIDTH},height={self._inp_h or CAM_DEFAULT_HEIGHT}",
-            *self._splitter_elems,
-            *self._infer_elems,
-            *self._overlay_elems,
-            *self._display_elems,
+            *self._cam_src_elems(cam_device, self._inp_w, self._inp_h),
+            *self._processing_elems(),
+        )
+        self._finish_pipeline(
+            (self._inp_w or CAM_DEFAULT_WIDTH, self._inp_h or CAM_DEFAULT_HEIGHT), CAM_FRAMERATE
         )
 
     def make_rtsp_pipeline(
         self, rtsp_url: str, inp_codec: str, codec_elems: tuple[str, str]
     ) -> None:
         self._pipeline.reset()
-        if not inp_codec or not codec_elems:
-            raise SystemExit(
-                "Fatal: codec information not provided to pipeline generator"
-            )
         self._pipeline.add_elements(
-            ["rtspsrc", f'location="{rtsp_url}"', "latency=2000"],
-            "rtpjitterbuffer",
-            ["rtph264depay", "wait-for-keyframe=true"],
-            f"video/x-{inp_codec},width={self._inp_w},height={self._inp_h}" if (self._inp_w and self._inp_h) else f"video/x-{inp_codec}",
-            *codec_elems,
-            *self._splitter_elems,
-            *self._infer_elems,
-            *self._overlay_elems,
-            *self._display_elems,
+            *self._rtsp_src_elems(rtsp_url, inp_codec, codec_elems, self._inp_w, self._inp_h),
+            *self._processing_elems(),
         )
+        self._finish_pipeline((self._inp_w, self._inp_h))
 
     def make_pipeline(self) -> None:
         """
@@ -239,3 +1434,125 @@ class GstPipelineGenerator:
                 raise SystemExit(f"Fatal: invalid input type {self._inp_type}")
         except KeyError as e:
             raise SystemExit(f'Fatal: missing pipeline paramemeter "{e.args[0]}"')
+
+
+class GstMultiPipelineGenerator(GstPipelineGenerator):
+    """
+    Generates a single `GstPipeline` that runs several input sources through one shared
+    inference stage.
+
+    Each input is decoded and scaled into a tile of a `compositor` mosaic, and inference and
+    overlay run once on the mosaic. The overlaid mosaic is either displayed as is or split
+    back into one output per input with `videocrop`.
+    """
+
+    def __init__(
+        self,
+        gst_params: dict[str, Any],
+        inputs: list[dict[str, Any]],
+        separate_outputs: bool = False,
+    ) -> None:
+        """
+        Args:
+            gst_params (dict): inference and display parameters, same as `GstPipelineGenerator`
+            inputs (list[dict]): per input "inp_type", "inp_src" and optional "inp_w",
+                "inp_h", "inp_codec", "codec_elems"
+            separate_outputs (bool): send each input to its own sink instead of a mosaic
+        """
+        if not inputs:
+            raise SystemExit("Fatal: no inputs provided to pipeline generator")
+        super().__init__({**inputs[0], **gst_params})
+        self._inputs: list[dict[str, Any]] = inputs
+        self._separate_outputs: bool = separate_outputs
+        self._mosaic_w: int = gst_params.get("mosaic_w", 1920)
+        self._mosaic_h: int = gst_params.get("mosaic_h", 1080)
+        self._cols: int = ceil(sqrt(len(inputs)))
+        self._rows: int = ceil(len(inputs) / self._cols)
+        # tiles are kept even sized for subsampled YUV formats
+        self._tile_w: int = self._mosaic_w // self._cols // 2 * 2
+        self._tile_h: int = self._mosaic_h // self._rows // 2 * 2
+
+    @property
+    def rtsp_sources(self) -> list[str]:
+        return [f"rtsp{i}" for i, inp in enumerate(self._inputs) if inp["inp_type"] == InputType.RTSP]
+
+    def _live_source(self) -> bool:
+        return all(inp["inp_type"] != InputType.FILE for inp in self._inputs)
+
+    def _tile_pos(self, idx: int) -> tuple[int, int]:
+        return (idx % self._cols) * self._tile_w, (idx // self._cols) * self._tile_h
+
+    def _src_elems(self, idx: int, inp: dict[str, Any]) -> list[str, list[str]]:
+        inp_type: InputType = inp["inp_type"]
+        if inp_type == InputType.FILE:
+            return self._file_src_elems(
+                inp["inp_src"], inp.get("codec_elems"), f"demux{idx}", f"q_src{idx}"
+            )
+        if inp_type == InputType.CAMERA:
+            return self._cam_src_elems(inp["inp_src"], inp.get("inp_w"), inp.get("inp_h"))
+        if inp_type == InputType.RTSP:
+            return self._rtsp_src_elems(
+                inp["inp_src"],
+                inp.get("inp_codec"),
+                inp.get("codec_elems"),
+                inp.get("inp_w"),
+                inp.get("inp_h"),
+                f"rtsp{idx}",
+            )
+        raise SystemExit(f"Fatal: invalid input type {inp_type}")
+
+    def make_pipeline(self) -> None:
+        """
+        Creates the multi-source pipeline.
+        """
+        self._pipeline.reset()
+        comp: list[str] = ["compositor", "name=comp"]
+        for i in range(len(self._inputs)):
+            xpos, ypos = self._tile_pos(i)
+            comp.extend(
+                [
+                    f"sink_{i}::xpos={xpos}",
+                    f"sink_{i}::ypos={ypos}",
+                    f"sink_{i}::width={self._tile_w}",
+                    f"sink_{i}::height={self._tile_h}",
+                ]
+            )
+        self._pipeline.add_elements(
+            comp,
+            f"video/x-raw,width={self._tile_w * self._cols},height={self._tile_h * self._rows}",
+        )
+        if self._sink == SinkType.FAKESINK or not self._separate_outputs:
+            self._pipeline.add_elements(*self._processing_elems())
+        else:
+            self._pipeline.add_elements(
+                *self._rate_elems(),
+                *self._splitter_elems,
+                *self._inference_elems(),
+                *self._model_branches(),
+                *self._overlay_chain(),
+            )
+            out_w, out_h = self._tile_w * self._cols, self._tile_h * self._rows
+            self._pipeline.add_elements(["tee", "name=t_out"])
+            for i in range(len(self._inputs)):
+                xpos, ypos = self._tile_pos(i)
+                self._pipeline.add_branch(
+                    "t_out.",
+                    self._queue(f"q_out{i}", self._queue_profile.output),
+                    [
+                        "videocrop",
+                        f"left={xpos}",
+                        f"top={ypos}",
+                        f"right={out_w - xpos - self._tile_w}",
+                        f"bottom={out_h - ypos - self._tile_h}",
+                    ],
+                    *self._sink_elems(i),
+                )
+        for i, inp in enumerate(self._inputs):
+            self._pipeline.add_branch(
+                *self._src_elems(i, inp),
+                "videoconvert",
+                "videoscale",
+                f"video/x-raw,width={self._tile_w},height={self._tile_h}",
+                f"comp.sink_{i}",
+            )
+        self._finish_pipeline((self._tile_w * self._cols, self._tile_h * self._rows))
@@ -0,0 +1,144 @@
+from math import ceil
+from threading import Lock
+from typing import Callable, NamedTuple, Optional
+import re
+
+
+__all__ = [
+    "QueueDropCounter",
+    "QueueLimits",
+    "QueueProfile",
+    "DEFAULT_QUEUE_PROFILE",
+    "QUEUE_DEBUG",
+    "QUEUE_PROFILES",
+    "RAW_BYTES_PER_PIXEL",
+]
+
+# bytes per pixel of the largest raw format that reaches the queues (YUY2 camera frames)
+RAW_BYTES_PER_PIXEL = 2
+
+# GST_DEBUG categories that log dropped buffers, used when running with gst-launch-1.0
+QUEUE_DEBUG = "queue_dataflow:5"
+
+_LEAK_RE = re.compile(r":<([^>]+)> queue is full, leaking")
+
+
+class QueueLimits(NamedTuple):
+    """Size limits and leaky mode of a single queue, a limit of 0 is disabled"""
+
+    max_buffers: int
+    max_bytes: int = 0
+    max_time_ms: int = 0
+    leaky: str = "no"
+
+    @property
+    def props(self) -> list[str]:
+        """Queue element properties, all limits are set so GStreamer's defaults don't apply"""
+        return [
+            f"max-size-buffers={self.max_buffers}",
+            f"max-size-bytes={self.max_bytes}",
+            f"max-size-time={self.max_time_ms * 1_000_000}",
+            f"leaky={self.leaky}",
+        ]
+
+    def ceiling(self, frame_bytes: Optional[int], fps: Optional[float]) -> Optional[int]:
+        """
+        Returns the most memory the queue can hold, or None if it is unbounded.
+
+        Args:
+            frame_bytes (int): [Optional] size of a single buffer, None for compressed data
+            fps (float): [Optional] buffer rate, needed to bound time limits
+        """
+        bounds: list[int] = []
+        if self.max_bytes:
+            bounds.append(self.max_bytes)
+        if frame_bytes:
+            if self.max_buffers:
+                bounds.append(self.max_buffers * frame_bytes)
+            if self.max_time_ms and fps:
+                bounds.append(ceil(self.max_time_ms * fps / 1000) * frame_bytes)
+        return min(bounds) if bounds else None
+
+
+class QueueProfile(NamedTuple):
+    """Queue limits for each stage of a pipeline and an optional source frame rate cap"""
+
+    src: QueueLimits
+    infer: QueueLimits
+    output: QueueLimits
+    max_fps: Optional[int] = None
+
+
+QUEUE_PROFILES: dict[str, QueueProfile] = {
+    # GStreamer's queue defaults, no frame is dropped and the source isn't capped
+    "standard": QueueProfile(
+        src=QueueLimits(200, 10 << 20, 1000),
+        infer=QueueLimits(200, 10 << 20, 1000),
+        output=QueueLimits(200, 10 << 20, 1000),
+    ),
+    # only the newest frame is kept, late frames are dropped instead of delaying the display
+    "low-latency": QueueProfile(
+        src=QueueLimits(4, 2 << 20),
+        infer=QueueLimits(1, leaky="downstream"),
+        output=QueueLimits(1, leaky="downstream"),
+    ),
+    # short leaky queues absorb jitter and live sources are capped at 30 fps
+    "balanced": QueueProfile(
+        src=QueueLimits(30, 4 << 20),
+        infer=QueueLimits(2, leaky="downstream"),
+        output=QueueLimits(4, 0, 200, leaky="downstream"),
+        max_fps=30,
+    ),
+    # no frame is dropped, the pipeline runs at the pace of its slowest stage
+    "max-throughput": QueueProfile(
+        src=QueueLimits(0, 16 << 20, 2000),
+        infer=QueueLimits(8),
+        output=QueueLimits(30, 0, 1000),
+    ),
+}
+
+DEFAULT_QUEUE_PROFILE = "standard"
+
+
+class QueueDropCounter:
+    """
+    Counts the buffers dropped by leaky queues.
+
+    In-process, a leaky queue emits `overrun` once for every buffer it drops. With
+    gst-launch-1.0 the queue debug log (`QUEUE_DEBUG`) is parsed instead, when enabled by
+    `GstPipelineGenerator.count_drops`.
+    """
+
+    def __init__(self, queues: list[str]) -> None:
+        self._drops: dict[str, int] = dict.fromkeys(queues, 0)
+        self._lock = Lock()
+
+    def __str__(self) -> str:
+        return ", ".join(f"{name}: {count} dropped" for name, count in self.drops.items())
+
+    @property
+    def drops(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._drops)
+
+    @property
+    def queues(self) -> list[str]:
+        return list(self._drops)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            if name in self._drops:
+                self._drops[name] += 1
+
+    def overrun_handler(self, name: str) -> Callable[..., None]:
+        """
+        Returns a handler for the `overrun` signal of the queue called `name`.
+        """
+        return lambda *_: self._count(name)
+
+    def parse_log(self, line: str) -> None:
+        """
+        Counts a drop if `line` is a queue leak debug message.
+        """
+        if m := _LEAK_RE.search(line):
+            self._count(m.group(1))
@@ -0,0 +1,377 @@
+"""
+Collect the installed GStreamer plugins, elements and properties from gst-inspect-1.0 into a cache.
+"""
+
+from fnmatch import fnmatchcase
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, NamedTuple, Optional
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import time
+
+from utils.cache import CACHE_DIR, JsonCache
+
+
+__all__ = [
+    "GstElementInfo",
+    "GstPropertyInfo",
+    "GstRegistry",
+    "default_registry",
+    "parse_inspect",
+]
+
+# directory of the registry caches, one file per GStreamer version
+REGISTRY_CACHE_DIR = CACHE_DIR / "gst-registry"
+
+_LIST_RE = re.compile(r"^([\w.+-]+):\s+([\w.+-]+):\s")
+_VERSION_RE = re.compile(r"GStreamer\s+(\d+\.\d+\.\d+)")
+_PROP_RE = re.compile(r"^  ([A-Za-z][\w-]*)\s+: ")
+_PAD_RE = re.compile(r"^\s+(SRC|SINK) template: '([^']+)'")
+_ENUM_VALUE_RE = re.compile(r"^\s+\((-?\d+|0x[0-9a-fA-F]+)\): (\S+)\s")
+_RANGE_RE = re.compile(r"Range: (-?[\d.e+]+) - (-?[\d.e+]+)")
+
+_NUMBER_RE = re.compile(r"-?\d+|0x[0-9a-fA-F]+")
+
+_BOOL_VALUES = {"true", "false", "yes", "no", "1", "0"}
+
+
+def _parse_int(value: str) -> int:
+    return int(value, 16) if value.lower().startswith("0x") else int(value)
+
+
+def _fmt(number: float) -> str:
+    return str(int(number)) if number.is_integer() else f"{number:g}"
+
+
+class GstPropertyInfo(NamedTuple):
+    """Type and accepted values of an element property"""
+
+    type: str
+    writable: bool = True
+    # enum or flags value nicks
+    values: Optional[list[str]] = None
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+
+    def check(self, value: str) -> Optional[str]:
+        """
+        Returns why `value` isn't accepted, or None if it is or can't be checked.
+        """
+        if self.type == "boolean":
+            return None if value.lower() in _BOOL_VALUES else f'"{value}" is not a boolean'
+        if self.type in ("integer", "float"):
+            try:
+                number = float(value) if self.type == "float" else _parse_int(value)
+            except ValueError:
+                return f'"{value}" is not {"a number" if self.type == "float" else "an integer"}'
+            if self.minimum is not None and self.maximum is not None and not (
+                self.minimum <= number <= self.maximum
+            ):
+                return f"{value} is out of range [{_fmt(self.minimum)}, {_fmt(self.maximum)}]"
+            return None
+        if self.type in ("enum", "flags") and self.values:
+            parts = value.split("+") if self.type == "flags" else [value]
+            for part in parts:
+                if part not in self.values and not _NUMBER_RE.fullmatch(part):
+                    return f'"{part}" is not one of {", ".join(self.values)}'
+        return None
+
+
+class GstElementInfo(NamedTuple):
+    """An element factory's plugin, properties and pad templates"""
+
+    plugin: str
+    # None if gst-inspect-1.0 output couldn't be parsed, properties are then not checked
+    properties: Optional[dict[str, GstPropertyInfo]]
+    # (template name, direction, availability)
+    pads: list[tuple[str, str, str]]
+
+    def has_pad(self, pad: str) -> bool:
+        """
+        Returns True if a pad template matches `pad`, e.g. "sink_0" matches "sink_%u".
+        """
+        return any(
+            fnmatchcase(pad, re.sub(r"%[uds]", "*", name)) for name, _, _ in self.pads
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "plugin": self.plugin,
+            "properties": (
+                {k: p._asdict() for k, p in self.properties.items()}
+                if self.properties is not None
+                else None
+            ),
+            "pads": [list(p) for p in self.pads],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "GstElementInfo":
+        props = data.get("properties")
+        return cls(
+            data.get("plugin", ""),
+            {k: GstPropertyInfo(**p) for k, p in props.items()} if props is not None else None,
+            [tuple(p) for p in data.get("pads", [])],
+        )
+
+
+def _prop_type(line: str) -> str:
+    for prefix, typ in (
+        ("Boolean", "boolean"),
+        ("Integer", "integer"),
+        ("Unsigned Integer", "integer"),
+        ("Integer64", "integer"),
+        ("Unsigned Integer64", "integer"),
+        ("Long", "integer"),
+        ("Unsigned Long", "integer"),
+        ("Float", "float"),
+        ("Double", "float"),
+        ("Enum", "enum"),
+        ("Flags", "flags"),
+        ("String", "string"),
+    ):
+        if re.match(rf"{prefix}[. ]", line):
+            return typ
+    return "other"
+
+
+def parse_inspect(text: str) -> GstElementInfo:
+    """
+    Parses the output of `gst-inspect-1.0 <element>`.
+    """
+    plugin = ""
+    pads: list[tuple[str, str, str]] = []
+    props: dict[str, dict[str, Any]] = {}
+    section = ""
+    prop: Optional[dict[str, Any]] = None
+    pad: Optional[list[str]] = None
+    for line in text.splitlines():
+        if line and not line[0].isspace():
+            section = line.rstrip(":").strip()
+            prop = pad = None
+            continue
+        stripped = line.strip()
+        if section == "Plugin Details" and stripped.startswith("Name") and not plugin:
+            plugin = stripped.split(None, 1)[1] if " " in stripped else ""
+        elif section == "Pad Templates":
+            if m := _PAD_RE.match(line):
+                pad = [m.group(2), m.group(1).lower(), ""]
+                pads.append(pad)
+            elif pad is not None and stripped.startswith("Availability:"):
+                pad[2] = stripped.split(":", 1)[1].strip().lower()
+        elif section == "Element Properties":
+            if m := _PROP_RE.match(line):
+                prop = props[m.group(1)] = {"type": "other", "writable": True}
+            elif prop is None:
+                continue
+            elif stripped.startswith("flags:"):
+                prop["writable"] = "writable" in stripped
+                prop["_flags"] = True
+            elif prop.get("_flags") and not prop.get("_typed"):
+                # the type follows the flags, e.g. "Unsigned Integer. Range: 0 - 4294967295 Default: 2000"
+                prop["_typed"] = True
+                prop["type"] = _prop_type(stripped)
+                if m := _RANGE_RE.search(stripped):
+                    prop["minimum"], prop["maximum"] = float(m.group(1)), float(m.group(2))
+            elif m := _ENUM_VALUE_RE.match(line):
+                # enum and flags values are listed as "(number): nick - description"
+                prop.setdefault("values", []).append(m.group(2))
+    properties = {
+        name: GstPropertyInfo(**{k: v for k, v in p.items() if not k.startswith("_")})
+        for name, p in props.items()
+    }
+    return GstElementInfo(plugin, properties if props else None, [tuple(p) for p in pads])
+
+
+def _inspect(*args: str, timeout: float = 30) -> Optional[str]:
+    try:
+        result = subprocess.run(
+            ["gst-inspect-1.0", *args], capture_output=True, text=True, timeout=timeout
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+
+class GstRegistry:
+    """
+    The GStreamer elements available on this system, for offline pipeline checks.
+
+    The element list is collected once with `gst-inspect-1.0` and cached per GStreamer
+    version in `REGISTRY_CACHE_DIR`. Element details (properties and pad templates) are
+    inspected the first time an element is looked up, or all at once with `collect()`.
+    The cache is collected again after a GStreamer upgrade or when the plugin directories
+    change, which is detected from file timestamps without running `gst-inspect-1.0`.
+    """
+
+    def __init__(self, version: str, cache: JsonCache) -> None:
+        self._version = version
+        self._cache = cache
+        self._factories: dict[str, str] = {}
+        self._details: dict[str, GstElementInfo] = {}
+
+    @property
+    def version(self) -> str:
+        return self._version
+
+    @property
+    def factories(self) -> dict[str, str]:
+        """Element factory names mapped to their plugin"""
+        return self._factories
+
+    @staticmethod
+    def _version_stamp(inspect: str, cache_dir: Path) -> Optional[str]:
+        """
+        Returns the GStreamer version, only running `gst-inspect-1.0 --version` if the
+        binary changed since it was last run.
+        """
+        st = os.stat(inspect)
+        stamps = JsonCache(cache_dir / "version.json")
+        stat = [st.st_size, st.st_mtime_ns]
+        entry = stamps.get(inspect)
+        if entry and entry.get("stat") == stat:
+            return entry["version"]
+        if not (out := _inspect("--version")) or not (m := _VERSION_RE.search(out)):
+            return None
+        stamps.put(inspect, {"stat": stat, "version": m.group(1)})
+        return m.group(1)
+
+    @staticmethod
+    def _dir_stamps(dirs: list[str]) -> dict[str, int]:
+        stamps: dict[str, int] = {}
+        for d in dirs:
+            try:
+                stamps[d] = os.stat(d).st_mtime_ns
+            except OSError:
+                stamps[d] = 0
+        return stamps
+
+    @classmethod
+    def load(cls, cache_dir: Path = REGISTRY_CACHE_DIR, refresh: bool = False) -> Optional["GstRegistry"]:
+        """
+        Returns the registry of the installed GStreamer, or None if `gst-inspect-1.0`
+        isn't installed.
+        """
+        if not (inspect := shutil.which("gst-inspect-1.0")):
+            return None
+        if not (version := cls._version_stamp(inspect, cache_dir)):
+            return None
+        registry = cls(version, JsonCache(cache_dir / f"{version}.json"))
+        if refresh or not registry._load_cached():
+            if not registry._collect_factories():
+                return None
+        return registry
+
+    def _load_cached(self) -> bool:
+        if not (factories := self._cache.get("factories")):
+            return False
+        dirs = self._cache.get("plugin_dirs") or {}
+        if self._dir_stamps(list(dirs)) != dirs:
+            return False
+        self._factories = factories
+        return True
+
+    def _collect_factories(self) -> bool:
+        if not (out := _inspect()):
+            return False
+        self._factories = {
+            m.group(2): m.group(1) for line in out.splitlines() if (m := _LIST_RE.match(line))
+        }
+        self._details.clear()
+        self._cache.clear()
+        self._cache.put_many(
+            {"factories": self._factories, "plugin_dirs": self._dir_stamps(self._plugin_dirs())}
+        )
+        return True
+
+    def _plugin_dirs(self) -> list[str]:
+        """
+        Directories GStreamer loads plugins from, taken from the coreelements plugin
+        location and the plugin path variables.
+        """
+        dirs: set[str] = set()
+        for var in ("GST_PLUGIN_PATH", "GST_PLUGIN_PATH_1_0", "GST_PLUGIN_SYSTEM_PATH", "GST_PLUGIN_SYSTEM_PATH_1_0"):
+            dirs.update(d for d in os.environ.get(var, "").split(os.pathsep) if d)
+        if out := _inspect("coreelements"):
+            for line in out.splitlines():
+                if line.strip().startswith("Filename"):
+                    dirs.add(str(Path(line.split(None, 1)[1].strip()).parent))
+                    break
+        return sorted(dirs)
+
+    def element(self, factory: str) -> Optional[GstElementInfo]:
+        """
+        Returns the details of an element factory, None if no plugin provides it.
+        """
+        if factory not in self._factories:
+            return None
+        if info := self._details.get(factory):
+            return info
+        if cached := self._cache.get(f"element:{factory}"):
+            info = GstElementInfo.from_dict(cached)
+        else:
+            if (out := _inspect(factory)) is None:
+                return None
+            info = parse_inspect(out)
+            self._cache.put(f"element:{factory}", info.to_dict())
+        self._details[factory] = info
+        return info
+
+    def collect(self, max_workers: int = 4) -> int:
+        """
+        Inspects every element in parallel so later lookups never run `gst-inspect-1.0`.
+
+        Returns:
+            int: the number of elements inspected
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        missing = [f for f in self._factories if self._cache.get(f"element:{f}") is None]
+
+        def inspect(factory: str) -> Optional[GstElementInfo]:
+            out = _inspect(factory)
+            return parse_inspect(out) if out is not None else None
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            results = list(pool.map(inspect, missing))
+        entries = {f"element:{f}": info.to_dict() for f, info in zip(missing, results) if info}
+        if entries:
+            self._cache.put_many(entries)
+        return len(entries)
+
+
+@lru_cache(maxsize=1)
+def default_registry() -> Optional[GstRegistry]:
+    """
+    Returns the registry of the installed GStreamer, loaded once per process.
+    """
+    return GstRegistry.load()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=4,
+        help="Number of elements to inspect in parallel (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Collect the element list again even if it is cached",
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if not (registry := GstRegistry.load(refresh=args.refresh)):
+        raise SystemExit("Fatal: gst-inspect-1.0 not found or failed")
+    inspected = registry.collect(args.jobs)
+    print(
+        f"GStreamer {registry.version}: {len(registry.factories)} elements, "
+        f"{inspected} inspected in {time.perf_counter() - start:.2f}s"
+    )
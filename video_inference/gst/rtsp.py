@@ -0,0 +1,90 @@
+from typing import NamedTuple, Optional
+
+from utils.common import RTP_DEPAYLOADERS
+
+
+__all__ = [
+    "RtspProfile",
+    "rtsp_src_elems",
+    "DEFAULT_RTSP_PROFILE",
+    "RTSP_PROFILES",
+]
+
+
+class RtspProfile(NamedTuple):
+    """
+    How an RTSP stream is received.
+
+    `latency_ms` is the size of the jitterbuffer inside `rtspsrc`, the delay it adds before
+    frames reach the decoder. With `drop_on_latency` packets that arrive later than that are
+    dropped instead of growing the delay. `protocols` is the RTP transport, "udp" or "tcp".
+    `buffer_mode` selects how buffer timestamps are derived: "slave" smooths the sender's
+    clock against the receiver's, "none" uses the RTP timestamps as they arrive, which adds
+    no delay but passes network jitter on to the display. Fields left as None keep the
+    `rtspsrc` defaults.
+    """
+
+    latency_ms: int
+    protocols: Optional[str] = None
+    drop_on_latency: Optional[bool] = None
+    buffer_mode: Optional[str] = None
+
+    @property
+    def props(self) -> list[str]:
+        """`rtspsrc` properties"""
+        props = [f"latency={self.latency_ms}"]
+        if self.protocols is not None:
+            props.append(f"protocols={self.protocols}")
+        if self.drop_on_latency is not None:
+            props.append(f"drop-on-latency={str(self.drop_on_latency).lower()}")
+        if self.buffer_mode is not None:
+            props.append(f"buffer-mode={self.buffer_mode}")
+        return props
+
+
+RTSP_PROFILES: dict[str, RtspProfile] = {
+    # rtspsrc's defaults with a 2 s jitterbuffer: UDP falling back to TCP
+    "standard": RtspProfile(2000),
+    # a short jitterbuffer over UDP, late packets are dropped to keep glass-to-glass delay low
+    "low-latency": RtspProfile(200, "udp", drop_on_latency=True, buffer_mode="none"),
+    # a long jitterbuffer over TCP, no packet loss and smooth timestamps at the cost of delay
+    "robust": RtspProfile(2000, "tcp", drop_on_latency=False, buffer_mode="slave"),
+}
+
+DEFAULT_RTSP_PROFILE = "standard"
+
+
+def rtsp_src_elems(
+    rtsp_url: str,
+    inp_codec: str,
+    codec_elems: tuple[str, str],
+    inp_w: Optional[int] = None,
+    inp_h: Optional[int] = None,
+    profile: str = DEFAULT_RTSP_PROFILE,
+    name: str = "rtsp",
+) -> list[str, list[str]]:
+    """
+    Returns the elements that receive, depayload, parse and decode an RTSP stream.
+
+    Args:
+        rtsp_url (str): RTSP stream URL
+        inp_codec (str): stream codec, one of `RTP_DEPAYLOADERS`
+        codec_elems (tuple[str, str]): parser and decoder for the codec
+        inp_w (int): [Optional] stream width
+        inp_h (int): [Optional] stream height
+        profile (str): name of the `RTSP_PROFILES` entry to use
+        name (str): name of the `rtspsrc` element, the depayloader is called "`name`_depay"
+    """
+    if not inp_codec or not codec_elems:
+        raise SystemExit("Fatal: codec information not provided to pipeline generator")
+    if inp_codec not in RTP_DEPAYLOADERS:
+        raise SystemExit(f'Fatal: no RTP depayloader for codec "{inp_codec}"')
+    if profile not in RTSP_PROFILES:
+        raise SystemExit(f'Fatal: invalid RTSP profile "{profile}"')
+    # rtspsrc has its own jitterbuffer, configured by the profile
+    return [
+        ["rtspsrc", f"name={name}", f'location="{rtsp_url}"', *RTSP_PROFILES[profile].props],
+        [*RTP_DEPAYLOADERS[inp_codec], f"name={name}_depay"],
+        f"video/x-{inp_codec},width={inp_w},height={inp_h}" if (inp_w and inp_h) else f"video/x-{inp_codec}",
+        *codec_elems,
+    ]
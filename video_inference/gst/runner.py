@@ -0,0 +1,130 @@
+from typing import NamedTuple, Optional
+import asyncio
+import signal
+
+from gst.pipeline import GstPipeline, EOS_TIMEOUT, TERM_TIMEOUT
+
+
+__all__ = [
+    "GstRunner",
+    "RunResult",
+]
+
+
+class RunResult(NamedTuple):
+    """Outcome of one pipeline run by `GstRunner`"""
+
+    success: bool
+    interrupted: bool
+    error: Optional[str]
+
+    def __str__(self) -> str:
+        if self.interrupted:
+            return "interrupted"
+        return "finished" if self.success else f"failed: {self.error}"
+
+
+class GstRunner:
+    """
+    Runs several pipelines concurrently with `gst-launch-1.0` from one asyncio event loop.
+
+    Each pipeline runs as an asyncio subprocess whose output is read line by line, see
+    `GstPipeline.run_async`, so long running pipelines don't accumulate their logs in memory.
+    Stopping the runner, or cancelling the task awaiting `run`, interrupts every pipeline
+    that is still running so they all send EOS at once, then escalates to SIGTERM and
+    SIGKILL for the ones that don't exit within the timeouts.
+
+    Args:
+        eos_timeout (float): seconds to wait for a pipeline to exit after sending EOS
+        term_timeout (float): seconds to wait for a pipeline to exit after a SIGTERM
+        print_err (bool): print the error of every failed pipeline
+    """
+
+    def __init__(
+        self, eos_timeout: float = EOS_TIMEOUT, term_timeout: float = TERM_TIMEOUT, print_err: bool = True
+    ) -> None:
+        self._eos_timeout = eos_timeout
+        self._term_timeout = term_timeout
+        self._print_err = print_err
+        self._pipelines: dict[str, GstPipeline] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    def add(self, name: str, pipeline: GstPipeline) -> None:
+        """
+        Adds a pipeline to be run under `name`.
+
+        Raises:
+            ValueError: if a pipeline was already added under `name`.
+        """
+        if name in self._pipelines:
+            raise ValueError(f"Duplicate pipeline name: {name}")
+        self._pipelines[name] = pipeline
+
+    def stop(self) -> None:
+        """
+        Shuts down all running pipelines, must be called from the event loop thread.
+        """
+        for task in self._tasks.values():
+            task.cancel()
+
+    async def _run_one(self, name: str, pipeline: GstPipeline) -> RunResult:
+        try:
+            success = await pipeline.run_async(
+                print_err=False, eos_timeout=self._eos_timeout, term_timeout=self._term_timeout
+            )
+        except asyncio.CancelledError:
+            return RunResult(False, True, None)
+        if not success and self._print_err:
+            print(f"\nPipeline {name} failed with error: {pipeline.error}\n")
+        return RunResult(success, False, pipeline.error)
+
+    async def run(self) -> dict[str, RunResult]:
+        """
+        Runs all added pipelines and waits until every one of them has exited.
+
+        Returns:
+            dict[str, RunResult]: the outcome of each pipeline by name
+        """
+        self._tasks = {
+            name: asyncio.ensure_future(self._run_one(name, pipeline)) for name, pipeline in self._pipelines.items()
+        }
+        try:
+            # shielded so a cancellation stops the pipelines and still waits for their exit
+            await asyncio.shield(asyncio.gather(*self._tasks.values()))
+        except asyncio.CancelledError:
+            self.stop()
+            await asyncio.gather(*self._tasks.values())
+            raise
+        finally:
+            results = {name: task.result() for name, task in self._tasks.items() if task.done()}
+            self._tasks = {}
+        return results
+
+    def run_until_interrupted(self, run_prompt: str = "Running pipelines...") -> dict[str, RunResult]:
+        """
+        Runs all added pipelines in a new event loop until they exit or a SIGINT or SIGTERM
+        is received, in which case they are all shut down gracefully.
+
+        Returns:
+            dict[str, RunResult]: the outcome of each pipeline by name
+        """
+
+        async def main() -> dict[str, RunResult]:
+            loop = asyncio.get_running_loop()
+            runner = asyncio.ensure_future(self.run())
+
+            def interrupt() -> None:
+                print("\nShutting down pipelines...")
+                self.stop()
+
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, interrupt)
+            try:
+                return await runner
+            finally:
+                for sig in (signal.SIGINT, signal.SIGTERM):
+                    loop.remove_signal_handler(sig)
+
+        if run_prompt:
+            print(run_prompt)
+        return asyncio.run(main())
@@ -0,0 +1,132 @@
+from collections import OrderedDict
+from math import gcd
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+if TYPE_CHECKING:
+    from gst.engine import GstEngine
+    from gst.pipeline import GstPipeline
+
+
+__all__ = [
+    "FrameStagger",
+    "stagger_offsets",
+]
+
+# frame numbers remembered per PTS, enough to cover the frames buffered in the branch queues
+_FRAMES_KEPT = 256
+
+# longest period searched for collisions when picking offsets
+_MAX_PERIOD = 3600
+
+
+def stagger_offsets(intervals: list[int]) -> list[int]:
+    """
+    Picks a frame offset for each interval so that as few frames as possible are used by
+    more than one of them.
+
+    Offsets are chosen one interval at a time, each minimizing the frames it shares with
+    the intervals already placed over their common period. Models with the same interval
+    are spread evenly, e.g. [2, 2] gives [0, 1] and [3, 3, 3] gives [0, 1, 2].
+
+    Returns:
+        list[int]: the offset of each interval, `0 <= offset < interval`
+    """
+    intervals = [max(1, i) for i in intervals]
+    period = 1
+    for interval in intervals:
+        period = min(period * interval // gcd(period, interval), _MAX_PERIOD)
+    load = [0] * period
+    offsets: list[int] = []
+    for interval in intervals:
+        offset = min(
+            range(interval),
+            key=lambda o: sum(load[f] for f in range(o, period, interval)),
+        )
+        for f in range(offset, period, interval):
+            load[f] += 1
+        offsets.append(offset)
+    return offsets
+
+
+class FrameStagger:
+    """
+    Spreads the inferences of several models over different frames.
+
+    Frames are numbered as they enter the data tee, and the inference branch of each model
+    only lets frame `n` through if `(n - offset) % interval == 0`, with offsets from
+    `stagger_offsets`. Once the pipeline is playing the `synapinfer` elements are set to
+    infer every frame they receive, the stagger does the skipping. Frames dropped by a
+    branch never reach its queue, so a busy model doesn't delay the others.
+
+    With `gst-launch-1.0` none of this applies and every model skips frames on its own, so
+    their inferences can land on the same frames. A warning is printed when such a pipeline
+    is spawned.
+
+    Args:
+        intervals (list[int]): frame interval of each model
+        offsets (list[int]): [Optional] frame offset of each model, picked automatically by default
+    """
+
+    def __init__(self, intervals: list[int], offsets: Optional[list[int]] = None) -> None:
+        self._intervals: list[int] = [max(1, i) for i in intervals]
+        self._offsets: list[int] = offsets if offsets is not None else stagger_offsets(self._intervals)
+        self._lock = Lock()
+        self._frames: OrderedDict[int, int] = OrderedDict()
+        self._count: int = 0
+        self._warned: bool = False
+
+    @property
+    def offsets(self) -> list[int]:
+        return list(self._offsets)
+
+    def attach(self, pipeline: "GstPipeline", queues: list[str], infer_elems: list[str], tee: str = "t_data") -> None:
+        """
+        Installs the stagger on a generated pipeline.
+
+        Args:
+            pipeline (GstPipeline): pipeline to install the stagger on
+            queues (list[str]): name of the queue at the start of each model's inference branch
+            infer_elems (list[str]): name of each model's `synapinfer` element
+            tee (str): name of the data tee
+        """
+        pipeline.add_pad_probe(tee, "sink", self._on_frame)
+        for i, queue in enumerate(queues):
+            pipeline.add_pad_probe(queue, "sink", self._branch_filter(i))
+
+        def on_start(engine: "GstEngine") -> None:
+            with self._lock:
+                self._frames.clear()
+                self._count = 0
+            for elem in infer_elems:
+                engine.set_property(elem, "frameinterval", 1)
+
+        pipeline.add_start_handler(on_start)
+        pipeline.add_spawn_handler(self._on_spawn)
+
+    def _on_spawn(self, _pid: int) -> None:
+        if not self._warned:
+            self._warned = True
+            print(
+                f"\nWarning: inferences of the {len(self._intervals)} models aren't staggered with "
+                "gst-launch-1.0, run in-process to spread them over different frames\n"
+            )
+
+    def _on_frame(self, buffer: Any) -> bool:
+        with self._lock:
+            self._frames[buffer.pts] = self._count
+            self._count += 1
+            if len(self._frames) > _FRAMES_KEPT:
+                self._frames.popitem(last=False)
+        return True
+
+    def _branch_filter(self, idx: int) -> Callable[[Any], bool]:
+        interval, offset = self._intervals[idx], self._offsets[idx]
+
+        def probe(buffer: Any) -> bool:
+            with self._lock:
+                frame = self._frames.get(buffer.pts)
+            # frames that weren't numbered, e.g. without timestamps, are let through
+            return frame is None or (frame - offset) % interval == 0
+
+        return probe
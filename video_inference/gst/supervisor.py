@@ -0,0 +1,217 @@
+from threading import Event, Lock, Thread
+from typing import Any, Callable, NamedTuple, Optional
+import random
+import time
+
+from gst.engine import GstEngine
+from gst.pipeline import GstPipeline
+
+
+__all__ = [
+    "Backoff",
+    "RtspSupervisor",
+    "SupervisorStats",
+]
+
+
+class Backoff(NamedTuple):
+    """
+    Jittered exponential backoff: the n-th retry waits a random time between half and all
+    of `min(initial * factor ** n, maximum)` seconds.
+
+    The ceiling is kept low by default so a stream that comes back is picked up within a
+    couple of seconds, the jitter keeps several clients from reconnecting in lockstep.
+    """
+
+    initial: float = 0.25
+    maximum: float = 2.0
+    factor: float = 2.0
+
+    def delay(self, attempt: int) -> float:
+        ceiling = min(self.initial * self.factor**attempt, self.maximum)
+        return random.uniform(ceiling / 2, ceiling)
+
+
+class SupervisorStats(NamedTuple):
+    """Outages of a supervised stream and how long it took to recover from them"""
+
+    outages: int
+    reconnects: int
+    recovery_s: list[float]
+
+    def __str__(self) -> str:
+        if not self.outages:
+            return "no outages"
+        recovered = (
+            f", recovered in {sum(self.recovery_s) / len(self.recovery_s):.2f} s mean / "
+            f"{max(self.recovery_s):.2f} s max"
+            if self.recovery_s
+            else ""
+        )
+        return f"{self.outages} outages, {self.reconnects} reconnect attempts{recovered}"
+
+
+class RtspSupervisor:
+    """
+    Keeps a pipeline with RTSP sources running through stream outages.
+
+    The pipeline is restarted whenever it ends by itself, with an error or EOS, until it
+    is interrupted with a SIGINT. A pipeline that fails the preflight check or can't be
+    parsed is never retried, and every failed attempt prints its error. Restarts reuse the
+    generated pipeline and its handlers, so the model and inputs are not validated again.
+    Retries are spaced by a jittered exponential `Backoff` that is reset once the stream
+    recovers.
+
+    With the in-process backend the depayloader of each source is also watched: a source
+    that delivers no data for `stall_timeout` seconds fails the pipeline, and recovery is
+    timed up to the first buffer after the restart. `gst-launch-1.0` can only be watched
+    for exits, a restart counts as recovered once it has been running for `settle` seconds.
+
+    Args:
+        pipeline (GstPipeline): generated pipeline to supervise
+        sources (list[str]): names of the `rtspsrc` elements, see `GstPipelineGenerator.rtsp_sources`
+        backoff (Backoff): [Optional] retry delays
+        stall_timeout (float): seconds without data after which a source is considered lost
+        settle (float): seconds a `gst-launch-1.0` restart must run to count as recovered
+        max_reconnects (int): [Optional] consecutive failed reconnects before giving up
+        log (Callable[[str], None]): called with a message for every outage and recovery
+        clock (Callable[[], float]): time source in seconds
+    """
+
+    def __init__(
+        self,
+        pipeline: GstPipeline,
+        sources: list[str],
+        backoff: Optional[Backoff] = None,
+        stall_timeout: float = 5.0,
+        settle: float = 2.0,
+        max_reconnects: Optional[int] = None,
+        log: Callable[[str], None] = print,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._pipeline = pipeline
+        self._sources = sources
+        self._backoff: Backoff = backoff or Backoff()
+        self._stall_timeout = stall_timeout
+        self._settle = settle
+        self._max_reconnects = max_reconnects
+        self._log = log
+        self._clock = clock
+        self._lock = Lock()
+        self._last_data: dict[str, float] = {}
+        self._outage_start: Optional[float] = None
+        self._stalled: Optional[str] = None
+        self._watched: bool = False
+        self._outages: int = 0
+        self._reconnects: int = 0
+        self._recovery: list[float] = []
+        for src in sources:
+            pipeline.add_pad_probe(f"{src}_depay", "src", self._on_data(src))
+        pipeline.add_start_handler(self._start_watchdog)
+
+    @property
+    def stats(self) -> SupervisorStats:
+        with self._lock:
+            return SupervisorStats(self._outages, self._reconnects, list(self._recovery))
+
+    def _on_data(self, src: str) -> Callable[[Any], None]:
+        def probe(_buffer: Any) -> None:
+            now = self._clock()
+            with self._lock:
+                self._last_data[src] = now
+                if self._outage_start is not None and len(self._last_data) == len(self._sources):
+                    self._recovered(now)
+
+        return probe
+
+    def _recovered(self, now: float) -> None:
+        # called with the lock held
+        elapsed = now - self._outage_start
+        self._recovery.append(elapsed)
+        self._outage_start = None
+        self._log(f"\nStream recovered after {elapsed:.2f} s\n")
+
+    def _start_watchdog(self, engine: GstEngine) -> None:
+        with self._lock:
+            self._last_data.clear()
+            self._stalled = None
+            self._watched = True
+        Thread(target=self._watchdog, args=(engine, self._clock()), name="rtsp-watchdog", daemon=True).start()
+
+    def _watchdog(self, engine: GstEngine, started: float) -> None:
+        while not engine.wait(min(0.5, self._stall_timeout / 4)):
+            now = self._clock()
+            with self._lock:
+                stalled = [
+                    src
+                    for src in self._sources
+                    if now - self._last_data.get(src, started) > self._stall_timeout
+                ]
+                if stalled:
+                    self._stalled = stalled[0]
+            if stalled:
+                engine.abort(f"no data from {', '.join(stalled)} for {self._stall_timeout:.1f} s")
+                return
+
+    def _settle_watch(self, attempt_start: float, ended: Event) -> None:
+        if ended.wait(self._settle):
+            return
+        with self._lock:
+            # watched pipelines recover on their first buffer instead
+            if self._outage_start is not None and not self._watched:
+                self._recovered(attempt_start)
+
+    def run(self, run_prompt: str = "Running pipeline...") -> bool:
+        """
+        Runs the pipeline until it is interrupted, it turns out to be invalid or
+        `max_reconnects` consecutive reconnects fail.
+
+        Returns:
+            bool: True if the pipeline was interrupted, False if the supervisor gave up.
+        """
+        failed = 0
+        first = True
+        while True:
+            attempt_start = self._clock()
+            ended = Event()
+            with self._lock:
+                self._last_data.clear()
+                self._stalled = None
+                self._watched = False
+            if not first:
+                Thread(target=self._settle_watch, args=(attempt_start, ended), daemon=True).start()
+            self._pipeline.run(run_prompt if first else "")
+            ended.set()
+            if self._pipeline.interrupted:
+                return True
+            if self._pipeline.invalid:
+                self._log("\nThe pipeline is invalid, not reconnecting\n")
+                return False
+            now = self._clock()
+            with self._lock:
+                stalled = self._stalled
+                new_outage = self._outage_start is None
+                if new_outage:
+                    # a stall is timed from the last data, not from when it was detected
+                    self._outage_start = (
+                        self._last_data.get(stalled, attempt_start) if stalled else now
+                    )
+                    self._outages += 1
+            first = False
+            if new_outage:
+                failed = 0
+                self._log(
+                    f"\nStream lost ({f'no data from {stalled}' if stalled else 'pipeline stopped'}), "
+                    "reconnecting...\n"
+                )
+            else:
+                failed += 1
+            if self._max_reconnects is not None and failed >= self._max_reconnects:
+                self._log(f"\nStream didn't come back after {failed} reconnect attempts, giving up\n")
+                return False
+            try:
+                time.sleep(self._backoff.delay(failed))
+            except KeyboardInterrupt:
+                return True
+            with self._lock:
+                self._reconnects += 1
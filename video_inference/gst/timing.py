@@ -0,0 +1,43 @@
+from collections import deque
+from threading import Lock
+
+
+__all__ = [
+    "StageTimer",
+]
+
+# stage times kept for percentiles
+_TIMING_WINDOW = 1000
+
+
+class StageTimer:
+    """Durations of a processing stage: count, mean, p95 over the last samples and max"""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._count: int = 0
+        self._total: float = 0.0
+        self._max: float = 0.0
+        self._recent: deque[float] = deque(maxlen=_TIMING_WINDOW)
+
+    def record(self, elapsed: float) -> None:
+        with self._lock:
+            self._count += 1
+            self._total += elapsed
+            self._max = max(self._max, elapsed)
+            self._recent.append(elapsed)
+
+    @property
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            recent = sorted(self._recent)
+            return {
+                "count": self._count,
+                "mean_ms": self._total / self._count * 1000 if self._count else 0.0,
+                "p95_ms": recent[int(0.95 * (len(recent) - 1))] * 1000 if recent else 0.0,
+                "max_ms": self._max * 1000,
+            }
+
+    def __str__(self) -> str:
+        s = self.stats
+        return f"{s['mean_ms']:.2f} ms mean, {s['p95_ms']:.2f} ms p95, {s['max_ms']:.2f} ms max"
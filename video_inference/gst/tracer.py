@@ -0,0 +1,269 @@
+from pathlib import Path
+from threading import Lock
+from typing import Any, Optional
+import json
+import random
+import re
+import shutil
+import time
+
+
+__all__ = [
+    "GstTraceReport",
+    "TRACER_DEBUG",
+    "TRACERS",
+    "parse_tracer_line",
+]
+
+# tracers enabled by trace mode; framerate, interlatency, proctime and queuelevel come from GstShark
+TRACERS = "latency(flags=pipeline+element);proctime;framerate;interlatency;queuelevel"
+
+# GST_DEBUG category the tracers log to
+TRACER_DEBUG = "GST_TRACER:7"
+
+# samples kept per metric for percentiles, longer runs are sampled uniformly
+MAX_SAMPLES = 10_000
+
+_TIMESTAMP_RE = re.compile(r"^(\d+):(\d{2}):(\d{2}\.\d+)\s")
+_FIELD_RE = re.compile(r'([\w-]+)=\(([\w]+)\)("(?:[^"\\]|\\.)*"|[^,;]*)')
+_CLOCK_RE = re.compile(r"^(\d+):(\d{2}):(\d{2})\.(\d{1,9})$")
+
+
+def _clock_to_ns(value: str) -> Optional[int]:
+    """
+    Converts a "H:MM:SS.nnnnnnnnn" clock time to nanoseconds.
+    """
+    if not (m := _CLOCK_RE.match(value)):
+        return None
+    h, mins, secs, frac = m.groups()
+    return ((int(h) * 60 + int(mins)) * 60 + int(secs)) * 1_000_000_000 + int(frac.ljust(9, "0"))
+
+
+def _parse_structure(text: str) -> tuple[str, dict[str, Any]]:
+    """
+    Parses a serialized GstStructure, e.g. "framerate, pad=(string)src, fps=(uint)30;".
+    """
+    name, _, body = text.partition(",")
+    fields: dict[str, Any] = {}
+    for key, typ, raw in _FIELD_RE.findall(body):
+        value: Any = raw.strip().strip('"')
+        if typ in ("uint", "int", "guint64", "gint64", "guint", "gint"):
+            try:
+                value = int(value)
+            except ValueError:
+                pass
+        elif typ in ("double", "float", "gdouble"):
+            try:
+                value = float(value)
+            except ValueError:
+                pass
+        fields[key] = value
+    return name.strip(), fields
+
+
+def parse_tracer_line(line: str) -> Optional[tuple[int, str, dict[str, Any]]]:
+    """
+    Parses a tracer debug log line.
+
+    Returns:
+        tuple[int, str, dict[str, Any]]: [Optional] the second of running time it was logged
+        at, the tracer record name and its fields, None for other lines
+    """
+    if "GST_TRACER" not in line or not (m := _TIMESTAMP_RE.match(line)):
+        return None
+    second = (int(m.group(1)) * 60 + int(m.group(2))) * 60 + int(float(m.group(3)))
+    # the structure follows the "file:line:function:object" location field
+    _, sep, text = line.partition(":: ")
+    if not sep:
+        return None
+    return (second, *_parse_structure(text))
+
+
+def _time_ns(value: Any) -> Optional[int]:
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        return int(value) if value.isdigit() else _clock_to_ns(value)
+    return None
+
+
+class _Samples:
+    """Reservoir of at most `MAX_SAMPLES` values"""
+
+    def __init__(self) -> None:
+        self.count: int = 0
+        self.values: list[float] = []
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        if len(self.values) < MAX_SAMPLES:
+            self.values.append(value)
+        elif (idx := random.randrange(self.count)) < MAX_SAMPLES:
+            self.values[idx] = value
+
+    def summary(self) -> dict[str, float]:
+        ordered = sorted(self.values)
+
+        def pct(p: float) -> float:
+            return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+        return {
+            "count": self.count,
+            "mean": sum(ordered) / len(ordered),
+            "p50": pct(50),
+            "p95": pct(95),
+            "p99": pct(99),
+            "max": ordered[-1],
+        }
+
+
+class GstTraceReport:
+    """
+    Collects GStreamer tracer output and writes it as a JSON and text report.
+
+    Log lines are parsed one at a time as they are produced, so memory stays bounded
+    for long runs: latencies are kept as reservoir samples and queue levels and frame
+    rates as one value per second of running time.
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._latency: dict[str, _Samples] = {}
+        self._element_latency: dict[str, _Samples] = {}
+        self._proctime: dict[str, _Samples] = {}
+        self._interlatency: dict[str, _Samples] = {}
+        self._fps: dict[str, dict[int, float]] = {}
+        self._queue_level: dict[str, dict[int, dict[str, int]]] = {}
+        self._lines: int = 0
+        self._started: float = time.time()
+
+    @staticmethod
+    def _sample(table: dict[str, _Samples], key: str, value: Optional[int]) -> None:
+        if value is not None:
+            table.setdefault(key, _Samples()).add(value / 1e6)
+
+    def parse_log(self, line: str) -> None:
+        """
+        Parses a single tracer debug log line, other lines are ignored.
+        """
+        if not (record := parse_tracer_line(line)):
+            return
+        second, name, fields = record
+        with self._lock:
+            self._lines += 1
+            if name == "latency":
+                key = f"{fields.get('src-element', '?')} -> {fields.get('sink-element', '?')}"
+                self._sample(self._latency, key, _time_ns(fields.get("time")))
+            elif name == "element-latency":
+                self._sample(self._element_latency, fields.get("element", "?"), _time_ns(fields.get("time")))
+            elif name == "proctime":
+                self._sample(self._proctime, fields.get("element", "?"), _time_ns(fields.get("time")))
+            elif name == "interlatency":
+                key = f"{fields.get('from_pad', '?')} -> {fields.get('to_pad', '?')}"
+                self._sample(self._interlatency, key, _time_ns(fields.get("time")))
+            elif name == "framerate":
+                self._fps.setdefault(fields.get("pad", "?"), {})[second] = float(fields.get("fps", 0))
+            elif name == "queuelevel":
+                levels = self._queue_level.setdefault(fields.get("queue", "?"), {})
+                cur = levels.setdefault(second, {"buffers": 0, "bytes": 0, "max_buffers": 0})
+                cur["buffers"] = max(cur["buffers"], int(fields.get("size_buffers", 0)))
+                cur["bytes"] = max(cur["bytes"], int(fields.get("size_bytes", 0)))
+                cur["max_buffers"] = int(fields.get("max_size_buffers", 0))
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        Returns the report: latency percentiles in milliseconds, frame rates per pad and
+        the peak fill of each queue for every second of running time.
+        """
+        with self._lock:
+            return {
+                "tracer_lines": self._lines,
+                "pipeline_latency_ms": {k: v.summary() for k, v in self._latency.items()},
+                "element_latency_ms": {k: v.summary() for k, v in self._element_latency.items()},
+                "proctime_ms": {k: v.summary() for k, v in self._proctime.items()},
+                "interlatency_ms": {k: v.summary() for k, v in self._interlatency.items()},
+                "fps": {
+                    pad: {
+                        "mean": sum(series.values()) / len(series),
+                        "min": min(series.values()),
+                        "series": [[t, fps] for t, fps in sorted(series.items())],
+                    }
+                    for pad, series in self._fps.items()
+                    if series
+                },
+                "queue_level": {
+                    queue: [{"t": t, **lvl} for t, lvl in sorted(series.items())]
+                    for queue, series in self._queue_level.items()
+                },
+            }
+
+    def to_text(self, report: Optional[dict[str, Any]] = None) -> str:
+        """
+        Formats the report as plain text tables.
+        """
+        report = report or self.to_dict()
+        lines: list[str] = []
+        for section, title in (
+            ("pipeline_latency_ms", "Pipeline latency (ms)"),
+            ("element_latency_ms", "Element latency (ms)"),
+            ("proctime_ms", "Processing time (ms)"),
+            ("interlatency_ms", "Inter-element latency (ms)"),
+        ):
+            if not report[section]:
+                continue
+            width = max(len(k) for k in report[section])
+            lines += [title, f"{'':<{width}}  {'count':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}"]
+            for key, s in sorted(report[section].items(), key=lambda kv: -kv[1]["p95"]):
+                lines.append(
+                    f"{key:<{width}}  {s['count']:>7} {s['p50']:>9.3f} {s['p95']:>9.3f} "
+                    f"{s['p99']:>9.3f} {s['max']:>9.3f}"
+                )
+            lines.append("")
+        if report["fps"]:
+            width = max(len(k) for k in report["fps"])
+            lines += ["Frame rate", f"{'':<{width}}  {'mean':>7} {'min':>7}"]
+            for pad, f in sorted(report["fps"].items()):
+                lines.append(f"{pad:<{width}}  {f['mean']:>7.1f} {f['min']:>7.1f}")
+            lines.append("")
+        if report["queue_level"]:
+            width = max(len(k) for k in report["queue_level"])
+            lines += ["Queue level (buffers)", f"{'':<{width}}  {'mean':>7} {'peak':>7} {'limit':>7}"]
+            for queue, series in sorted(report["queue_level"].items()):
+                if not series:
+                    continue
+                fill = [lvl["buffers"] for lvl in series]
+                lines.append(
+                    f"{queue:<{width}}  {sum(fill) / len(fill):>7.1f} {max(fill):>7} "
+                    f"{series[-1]['max_buffers']:>7}"
+                )
+            lines.append("")
+        if not lines:
+            lines.append("No tracer output, check that the GstShark tracers are installed")
+        return "\n".join(lines)
+
+    def write(self, trace_dir: str) -> list[Path]:
+        """
+        Writes report.json, report.txt and pipeline.dot to `trace_dir`.
+
+        pipeline.dot is the graph `gst-launch-1.0` dumps when the pipeline starts playing.
+
+        Returns:
+            list[Path]: the written files
+        """
+        out_dir = Path(trace_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        report = self.to_dict()
+        json_path = out_dir / "report.json"
+        json_path.write_text(json.dumps(report, indent=2))
+        txt_path = out_dir / "report.txt"
+        txt_path.write_text(self.to_text(report) + "\n")
+        written = [json_path, txt_path]
+        # graphs left over from earlier runs are ignored, with a margin for coarse file timestamps
+        dots = [
+            p for p in out_dir.glob("*PAUSED_PLAYING*.dot") if p.stat().st_mtime >= self._started - 1
+        ]
+        if dots:
+            dot_path = out_dir / "pipeline.dot"
+            shutil.copyfile(max(dots, key=lambda p: p.stat().st_mtime), dot_path)
+            written.append(dot_path)
+        return written
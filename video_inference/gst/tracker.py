@@ -0,0 +1,526 @@
+from threading import Lock
+from typing import Any, NamedTuple, Optional
+import json
+import time
+
+try:
+    import gi
+
+    gi.require_version("Gst", "1.0")
+    from gi.repository import Gst
+except (ImportError, ValueError):
+    Gst = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from gst.engine import GstEngine
+from gst.pipeline import GstPipeline
+from gst.timing import StageTimer
+
+
+__all__ = [
+    "BoxTracker",
+    "DetectionTracker",
+    "Tracks",
+    "encode_tracks",
+    "iou_matrix",
+]
+
+# Kalman filter noise as fractions of the box size: process noise of the position and velocity
+# per second, and measurement noise of the detector's boxes
+_POS_NOISE = 0.05
+_VEL_NOISE = 0.5
+_MEAS_NOISE = 0.05
+
+
+def iou_matrix(a: "np.ndarray", b: "np.ndarray") -> "np.ndarray":
+    """
+    Returns the intersection over union of every pair of boxes.
+
+    Args:
+        a (np.ndarray): N boxes as rows of origin x, origin y, width and height
+        b (np.ndarray): M boxes in the same format
+
+    Returns:
+        np.ndarray: N x M IoU matrix
+    """
+    a = a[:, None, :]
+    b = b[None, :, :]
+    iw = np.minimum(a[..., 0] + a[..., 2], b[..., 0] + b[..., 2]) - np.maximum(a[..., 0], b[..., 0])
+    ih = np.minimum(a[..., 1] + a[..., 3], b[..., 1] + b[..., 3]) - np.maximum(a[..., 1], b[..., 1])
+    inter = np.clip(iw, 0, None) * np.clip(ih, 0, None)
+    union = a[..., 2] * a[..., 3] + b[..., 2] * b[..., 3] - inter
+    return np.where(union > 0, inter / np.where(union > 0, union, 1), 0.0)
+
+
+class Tracks(NamedTuple):
+    """Predicted boxes of the tracks shown at a point in time, one row per track"""
+
+    ids: "np.ndarray"
+    boxes: "np.ndarray"
+    classes: "np.ndarray"
+    scores: "np.ndarray"
+    items: list[Optional[dict[str, Any]]]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class BoxTracker:
+    """
+    Tracks detected boxes between inferences with a constant velocity Kalman filter.
+
+    Every track's state is the center, size and their velocities. On each detector result
+    all tracks are predicted to the result's time, associated with the detections of the
+    same class by greedy IoU matching, then center distance, and corrected with the matched boxes. Unmatched
+    detections start new tracks with a new ID, and tracks that miss more than `max_misses`
+    results in a row are dropped. Between results, `predict` extrapolates the tracks to any
+    time without changing their state, so boxes move smoothly on the frames that aren't
+    inferred.
+
+    The filter runs on all tracks at once with NumPy, without a Python loop per track.
+    Times are in seconds and only need to increase.
+
+    Args:
+        iou_threshold (float): minimum IoU between a track and a detection to associate them
+        max_distance (float): maximum distance between the centers of a track and a detection
+            that don't overlap enough to associate them, in detection sizes
+        max_misses (int): results a track can go unmatched before it is dropped
+        min_hits (int): matched results before a track is shown
+        bounds (tuple[float, float]): [Optional] width and height predicted boxes are clipped to
+    """
+
+    def __init__(
+        self,
+        iou_threshold: float = 0.3,
+        max_distance: float = 1.0,
+        max_misses: int = 2,
+        min_hits: int = 1,
+        bounds: Optional[tuple[float, float]] = None,
+    ) -> None:
+        if np is None:
+            raise SystemExit("Fatal: NumPy is required for box tracking")
+        self._iou_threshold = iou_threshold
+        self._max_distance = max_distance
+        self._max_misses = max(0, max_misses)
+        self._min_hits = max(1, min_hits)
+        self._bounds = bounds
+        self._next_id: int = 1
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Drops all tracks, IDs keep increasing.
+        """
+        self._t: Optional[float] = None
+        # state: center x, center y, width, height and their velocities
+        self._x = np.zeros((0, 8))
+        self._p = np.zeros((0, 8, 8))
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._classes = np.zeros(0, dtype=np.int64)
+        self._scores = np.zeros(0)
+        self._hits = np.zeros(0, dtype=np.int64)
+        self._misses = np.zeros(0, dtype=np.int64)
+        self._items: list[Optional[dict[str, Any]]] = []
+
+    @property
+    def count(self) -> int:
+        """Number of live tracks, including the ones not shown"""
+        return len(self._ids)
+
+    @property
+    def next_id(self) -> int:
+        """ID of the next new track, one more than the number of tracks created"""
+        return self._next_id
+
+    def _predict(self, dt: float) -> None:
+        f = np.eye(8)
+        f[:4, 4:] = np.eye(4) * dt
+        size = np.maximum(self._x[:, 2], self._x[:, 3])
+        noise = np.empty((len(size), 8))
+        noise[:, :4] = (_POS_NOISE * size)[:, None]
+        noise[:, 4:] = (_VEL_NOISE * size)[:, None]
+        self._x = self._x @ f.T
+        self._p = f @ self._p @ f.T
+        self._p += (noise**2 * dt)[:, :, None] * np.eye(8)
+
+    def _correct(self, idx: "np.ndarray", z: "np.ndarray") -> None:
+        x, p = self._x[idx], self._p[idx]
+        r = (_MEAS_NOISE * np.maximum(z[:, 2], z[:, 3])) ** 2
+        s = p[:, :4, :4] + r[:, None, None] * np.eye(4)
+        # Kalman gain K = P H^T S^-1, with H selecting the box from the state
+        gain = np.linalg.solve(s, p[:, :4, :]).transpose(0, 2, 1)
+        self._x[idx] = x + (gain @ (z - x[:, :4])[:, :, None])[:, :, 0]
+        self._p[idx] = p - gain @ p[:, :4, :]
+
+    def _associate(self, boxes: "np.ndarray", classes: "np.ndarray") -> tuple["np.ndarray", "np.ndarray"]:
+        """
+        Matches tracks with detections of the same class, the highest IoU pairs first. Tracks
+        and detections left over are then matched by the distance between their centers,
+        the closest first, which catches small or fast objects whose boxes no longer overlap
+        the prediction, e.g. new tracks that don't have a velocity yet.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: track and detection indices of the matches
+        """
+        if not len(self._ids) or not len(boxes):
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+        same_class = self._classes[:, None] == classes[None, :]
+        iou = iou_matrix(_to_xywh(self._x[:, :4]), boxes)
+        centers = boxes[:, :2] + boxes[:, 2:] / 2
+        # center distance in detection sizes
+        dist = np.linalg.norm(self._x[:, None, :2] - centers[None, :, :], axis=2) / np.maximum(
+            np.maximum(boxes[:, 2], boxes[:, 3]), 1.0
+        )
+        track_used = np.zeros(len(self._ids), dtype=bool)
+        det_used = np.zeros(len(boxes), dtype=bool)
+        matches: list[tuple[int, int]] = []
+        for candidates, score in (
+            (same_class & (iou >= self._iou_threshold), -iou),
+            (same_class & (dist <= self._max_distance), dist),
+        ):
+            rows, cols = np.nonzero(candidates & ~track_used[:, None] & ~det_used[None, :])
+            order = np.argsort(score[rows, cols], kind="stable")
+            # one pass over the candidate pairs, which are few since most boxes are far apart
+            for r, c in zip(rows[order].tolist(), cols[order].tolist()):
+                if not track_used[r] and not det_used[c]:
+                    track_used[r] = det_used[c] = True
+                    matches.append((r, c))
+        if not matches:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+        tracks, dets = np.array(matches, dtype=np.intp).T
+        return tracks, dets
+
+    def update(
+        self,
+        t: float,
+        boxes: "np.ndarray",
+        classes: "np.ndarray",
+        scores: "np.ndarray",
+        items: Optional[list[dict[str, Any]]] = None,
+    ) -> "np.ndarray":
+        """
+        Updates the tracks with a detector result.
+
+        Args:
+            t (float): time of the inferred frame in seconds
+            boxes (np.ndarray): M detected boxes as rows of origin x, origin y, width and height
+            classes (np.ndarray): class index of each detection
+            scores (np.ndarray): confidence of each detection
+            items (list[dict]): [Optional] detector result item of each detection, returned
+                by `predict` with the track
+
+        Returns:
+            np.ndarray: the track ID of each detection
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        classes = np.asarray(classes, dtype=np.int64)
+        scores = np.asarray(scores, dtype=np.float64)
+        items = items if items is not None else [None] * len(boxes)
+        if self._t is not None and len(self._ids):
+            self._predict(max(0.0, t - self._t))
+        self._t = t if self._t is None else max(t, self._t)
+
+        tracks, dets = self._associate(boxes, classes)
+        z = _to_cxcywh(boxes)
+        if len(tracks):
+            self._correct(tracks, z[dets])
+            self._scores[tracks] = scores[dets]
+            for track, det in zip(tracks.tolist(), dets.tolist()):
+                self._items[track] = items[det]
+        self._hits[tracks] += 1
+        missed = np.ones(len(self._ids), dtype=bool)
+        missed[tracks] = False
+        self._misses[missed] += 1
+        self._misses[tracks] = 0
+
+        det_ids = np.zeros(len(boxes), dtype=np.int64)
+        det_ids[dets] = self._ids[tracks]
+        new = np.ones(len(boxes), dtype=bool)
+        new[dets] = False
+        if n_new := int(new.sum()):
+            new_ids = np.arange(self._next_id, self._next_id + n_new)
+            self._next_id += n_new
+            det_ids[new] = new_ids
+            size = np.maximum(z[new, 2], z[new, 3])
+            x = np.zeros((n_new, 8))
+            x[:, :4] = z[new]
+            std = np.empty((n_new, 8))
+            std[:, :4] = (2 * _MEAS_NOISE * size)[:, None]
+            std[:, 4:] = (10 * _VEL_NOISE * size)[:, None]
+            self._x = np.concatenate([self._x, x])
+            self._p = np.concatenate([self._p, (std**2)[:, :, None] * np.eye(8)])
+            self._ids = np.concatenate([self._ids, new_ids])
+            self._classes = np.concatenate([self._classes, classes[new]])
+            self._scores = np.concatenate([self._scores, scores[new]])
+            self._hits = np.concatenate([self._hits, np.ones(n_new, dtype=np.int64)])
+            self._misses = np.concatenate([self._misses, np.zeros(n_new, dtype=np.int64)])
+            self._items += [items[i] for i in np.flatnonzero(new).tolist()]
+
+        if (keep := self._misses <= self._max_misses).all():
+            return det_ids
+        self._x, self._p = self._x[keep], self._p[keep]
+        self._ids, self._classes, self._scores = self._ids[keep], self._classes[keep], self._scores[keep]
+        self._hits, self._misses = self._hits[keep], self._misses[keep]
+        self._items = [item for item, k in zip(self._items, keep.tolist()) if k]
+        return det_ids
+
+    def predict(self, t: float) -> Tracks:
+        """
+        Returns the boxes of the tracks matched by the last result, extrapolated to `t`.
+        Tracks that missed the last result are kept for association but not shown.
+        """
+        shown = (self._misses == 0) & (self._hits >= self._min_hits)
+        dt = t - self._t if self._t is not None else 0.0
+        x = self._x[shown]
+        boxes = _to_xywh(x[:, :4] + x[:, 4:] * dt)
+        boxes[:, 2:] = np.maximum(boxes[:, 2:], 1.0)
+        if self._bounds:
+            # clip to the frame, keeping boxes at least a pixel wide
+            w, h = self._bounds
+            x0 = np.clip(boxes[:, 0], 0, w - 1)
+            y0 = np.clip(boxes[:, 1], 0, h - 1)
+            boxes[:, 2] = np.clip(boxes[:, 0] + boxes[:, 2], x0 + 1, w) - x0
+            boxes[:, 3] = np.clip(boxes[:, 1] + boxes[:, 3], y0 + 1, h) - y0
+            boxes[:, 0], boxes[:, 1] = x0, y0
+        return Tracks(
+            self._ids[shown],
+            boxes,
+            self._classes[shown],
+            self._scores[shown],
+            [item for item, s in zip(self._items, shown.tolist()) if s],
+        )
+
+
+def _to_cxcywh(boxes: "np.ndarray") -> "np.ndarray":
+    return np.concatenate([boxes[:, :2] + boxes[:, 2:] / 2, boxes[:, 2:]], axis=1)
+
+
+def _to_xywh(boxes: "np.ndarray") -> "np.ndarray":
+    return np.concatenate([boxes[:, :2] - boxes[:, 2:] / 2, boxes[:, 2:]], axis=1)
+
+
+def encode_tracks(tracks: Tracks, result: Optional[dict[str, Any]] = None) -> bytes:
+    """
+    Encodes tracks as a SyNAP detector result, with a "track_id" in every item.
+
+    Args:
+        tracks (Tracks): predicted tracks
+        result (dict): [Optional] detector result whose other keys are kept, its items are replaced
+
+    Returns:
+        bytes: the result JSON
+    """
+    items: list[dict[str, Any]] = []
+    for track_id, box, cls, score, item in zip(
+        tracks.ids.tolist(), tracks.boxes.tolist(), tracks.classes.tolist(), tracks.scores.tolist(), tracks.items
+    ):
+        items.append(
+            {
+                **(item or {}),
+                "class_index": cls,
+                "confidence": score,
+                "bounding_box": {
+                    "origin": {"x": round(box[0]), "y": round(box[1])},
+                    "size": {"x": round(box[2]), "y": round(box[3])},
+                },
+                "track_id": track_id,
+            }
+        )
+    return json.dumps({**(result or {}), "items": items}).encode()
+
+
+class DetectionTracker:
+    """
+    Interpolates detections on the frames that aren't inferred and gives them track IDs.
+
+    The detector's results are taken out of the inference branch with an `appsink` and
+    update a `BoxTracker`. Every frame that reaches the overlay, inferred or not, gets the
+    tracks predicted to its timestamp pushed through an `appsrc` to the overlay, so with a
+    high inference skip the boxes follow the objects instead of jumping on each inference.
+    Results keep the SyNAP detector format, with a "track_id" added to every item.
+
+    Without an overlay the tracks are still updated and the detector's results are passed
+    on with their track IDs. The time spent updating and predicting is collected, see `stats`.
+
+    Detector boxes are expected in the coordinates of the detector input, `det_w` x `det_h`.
+
+    Args:
+        det_w (int): detector input width
+        det_h (int): detector input height
+        iou_threshold (float): minimum IoU between a track and a detection to associate them
+        max_misses (int): detector results a track can go unmatched before it is dropped
+        min_hits (int): matched results before a track is shown
+        name (str): prefix of the tracker's element names
+    """
+
+    def __init__(
+        self,
+        det_w: int,
+        det_h: int,
+        iou_threshold: float = 0.3,
+        max_misses: int = 2,
+        min_hits: int = 1,
+        name: str = "tracker",
+    ) -> None:
+        self._tracker = BoxTracker(iou_threshold, max_misses=max_misses, min_hits=min_hits, bounds=(det_w, det_h))
+        self._name = name
+        self._lock = Lock()
+        self._result: Optional[dict[str, Any]] = None
+        self._out_src = None
+        self._out_caps = None
+        self._out_caps_set: bool = False
+        self._per_frame: bool = False
+        self._counts: dict[str, int] = {
+            "results": 0,
+            "frames": 0,
+            "errors": 0,
+        }
+        self.timers: dict[str, StageTimer] = {
+            "update": StageTimer(),
+            "predict": StageTimer(),
+        }
+
+    def detector_elems(self) -> list[str | list[str]]:
+        """
+        Returns the end of the inference branch: the detector's results go to the tracker
+        instead of the overlay.
+        """
+        return [["appsink", f"name={self._name}_det", "emit-signals=true", "sync=false"]]
+
+    def branches(self, out: Optional[str]) -> list[list[str | list[str]]]:
+        """
+        Returns the output branch.
+
+        Args:
+            out (str): [Optional] pad the tracked results go to, e.g. "overlay.inference_sink",
+                they are discarded if None
+        """
+        return [
+            [
+                ["appsrc", f"name={self._name}_out", "is-live=true", "format=time"],
+                out if out else ["fakesink", "sync=false", "async=false"],
+            ],
+        ]
+
+    def attach(self, pipeline: GstPipeline, out: Optional[str], frame_elem: Optional[str] = None) -> None:
+        """
+        Adds the tracker's branch and handlers to a generated pipeline whose inference
+        branch ends with `detector_elems`. The pipeline must run with the in-process backend.
+
+        Args:
+            pipeline (GstPipeline): generated pipeline
+            out (str): [Optional] pad the tracked results go to
+            frame_elem (str): [Optional] element every displayed frame goes through, e.g. the
+                overlay queue, a result is predicted for each frame on its src pad. Without it
+                only the detector's results are passed on.
+        """
+        for branch in self.branches(out):
+            pipeline.add_branch(*branch)
+        pipeline.add_signal_handler(f"{self._name}_det", "new-sample", self._on_result)
+        pipeline.add_signal_handler(f"{self._name}_det", "eos", self._on_eos)
+        if frame_elem:
+            pipeline.add_pad_probe(frame_elem, "src", self._on_frame)
+        self._per_frame = frame_elem is not None
+        pipeline.add_start_handler(self._on_start)
+
+    def _on_start(self, engine: GstEngine) -> None:
+        with self._lock:
+            self._tracker.reset()
+            self._result = None
+            self._out_caps = None
+            self._out_caps_set = False
+        self._out_src = engine.get_element(f"{self._name}_out")
+
+    def _push(self, data: bytes, pts: int, duration: Optional[int] = None) -> None:
+        if self._out_src is None or self._out_caps is None:
+            return
+        if not self._out_caps_set:
+            self._out_src.set_property("caps", self._out_caps)
+            self._out_caps_set = True
+        out = Gst.Buffer.new_wrapped(data)
+        out.pts = pts
+        if duration is not None:
+            out.duration = duration
+        self._out_src.emit("push-buffer", out)
+
+    def _on_result(self, sink: Any) -> Any:
+        if (sample := sink.emit("pull-sample")) is None:
+            return Gst.FlowReturn.OK
+        buffer = sample.get_buffer()
+        if buffer.pts == Gst.CLOCK_TIME_NONE:
+            with self._lock:
+                self._counts["errors"] += 1
+            return Gst.FlowReturn.OK
+        start = time.perf_counter()
+        try:
+            result = json.loads(buffer.extract_dup(0, buffer.get_size()).rstrip(b"\0"))
+            items: list[dict[str, Any]] = result.get("items", [])
+            boxes = [
+                (
+                    float(item["bounding_box"]["origin"]["x"]),
+                    float(item["bounding_box"]["origin"]["y"]),
+                    float(item["bounding_box"]["size"]["x"]),
+                    float(item["bounding_box"]["size"]["y"]),
+                )
+                for item in items
+            ]
+            classes = [int(item["class_index"]) for item in items]
+            scores = [float(item.get("confidence", 0)) for item in items]
+        except (ValueError, KeyError, TypeError, AttributeError):
+            with self._lock:
+                self._counts["errors"] += 1
+            return Gst.FlowReturn.OK
+        with self._lock:
+            ids = self._tracker.update(buffer.pts / Gst.SECOND, boxes, classes, scores, items)
+            self._result = {k: v for k, v in result.items() if k != "items"}
+            self._out_caps = sample.get_caps()
+            self._counts["results"] += 1
+        self.timers["update"].record(time.perf_counter() - start)
+        if not self._per_frame:
+            for item, track_id in zip(items, ids.tolist()):
+                item["track_id"] = track_id
+            self._push(json.dumps(result).encode(), buffer.pts, buffer.duration)
+        return Gst.FlowReturn.OK
+
+    def _on_frame(self, buffer: Any) -> bool:
+        if buffer.pts == Gst.CLOCK_TIME_NONE:
+            return True
+        start = time.perf_counter()
+        with self._lock:
+            if self._result is None:
+                # nothing to predict before the first result
+                return True
+            data = encode_tracks(self._tracker.predict(buffer.pts / Gst.SECOND), self._result)
+            self._counts["frames"] += 1
+        self._push(data, buffer.pts, buffer.duration)
+        self.timers["predict"].record(time.perf_counter() - start)
+        return True
+
+    def _on_eos(self, _sink: Any) -> None:
+        if self._out_src is not None:
+            self._out_src.emit("end-of-stream")
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        """
+        Counters (detector results, frames predicted, results that couldn't be decoded,
+        live tracks and tracks created) and the stats of each stage: "update" (decoding a
+        detector result and updating the tracks) and "predict" (predicting and encoding the
+        tracks of a frame).
+        """
+        with self._lock:
+            counts = {**self._counts, "tracks": self._tracker.count, "created": self._tracker.next_id - 1}
+        return {**counts, **{stage: timer.stats for stage, timer in self.timers.items()}}
+
+    def __str__(self) -> str:
+        s = self.stats
+        lines = [
+            f"{s['results']} results, {s['frames']} frames predicted, {s['created']} tracks created, "
+            f"{s['tracks']} live" + (f", {s['errors']} invalid results" if s["errors"] else "")
+        ]
+        lines += [f"  {stage:<8} {timer}" for stage, timer in self.timers.items()]
+        return "\n".join(lines)
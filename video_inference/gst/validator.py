@@ -1,17 +1,41 @@
 from typing import Optional
 
 from gst.pipeline import GstPipeline
-from utils.common import InputType, CAM_DEFAULT_WIDTH, CAM_DEFAULT_HEIGHT
+from gst.rtsp import rtsp_src_elems, DEFAULT_RTSP_PROFILE
+from utils.cache import ValidationCache
+from utils.common import InputType, CAM_DEFAULT_WIDTH, CAM_DEFAULT_HEIGHT, CAM_FRAMERATE
+from utils.probe import demux_elems, probe_container
 
 
 class GstInputValidator:
-    """Validates input sources by directing output to a fakesink"""
+    """
+    Validates input sources by directing output to a fakesink.
 
-    def __init__(self, inp_type: int, num_buffers: int = 10, verbose: int = 1) -> None:
+    Successful validations are stored in a `ValidationCache` so known inputs are not
+    validated again until their cache entry expires. `use_cache=False` bypasses the cache
+    and `refresh_cache=True` always validates but still updates the cache.
+    """
+
+    def __init__(
+        self,
+        inp_type: int,
+        num_buffers: int = 10,
+        verbose: int = 1,
+        *,
+        use_cache: bool = True,
+        refresh_cache: bool = False,
+        cache: Optional[ValidationCache] = None,
+        rtsp_profile: str = DEFAULT_RTSP_PROFILE,
+    ) -> None:
         self._inp_type = inp_type
         self._num_buffers = num_buffers
         self._verbose = verbose
-        self._val_pipeline = GstPipeline()
+        self._val_pipeline = GstPipeline(display=False)
+        self._refresh_cache = refresh_cache
+        self._rtsp_profile = rtsp_profile
+        self._cache: Optional[ValidationCache] = (
+            (cache or ValidationCache()) if use_cache else None
+        )
 
     def validate_input(
         self,
@@ -34,26 +58,32 @@ class GstInputValidator:
             inp_codec (str): [Optional] codec used in compression (for video and RTSP)
             codec_elems (str): [Optional] Gstreamer elements for codec (for video and RTSP)
         """
+        cache_key: Optional[str] = None
+        if self._cache:
+            # the same stream can pass with one RTSP profile and fail with another
+            extra = [self._rtsp_profile] if self._inp_type == InputType.RTSP else []
+            cache_key = self._cache.make_key(self._inp_type, inp_src, inp_codec, inp_w, inp_h, *extra)
+            if not self._refresh_cache and self._cache.is_valid(cache_key):
+                if self._verbose > 0:
+                    print("Input OK (cached)")
+                return True
         self._val_pipeline.reset()
         if self._inp_type == InputType.FILE:
+            probe = probe_container(inp_src)
             self._val_pipeline.add_elements(
                 ["filesrc", f'location="{inp_src}"'],
-                ["qtdemux", "name=demux", "demux.video_0"],
+                probe.demux_elems() if probe else demux_elems("mp4"),
                 "queue",
                 *codec_elems,
             )
         elif self._inp_type == InputType.CAMERA:
             self._val_pipeline.add_elements(
                 ["v4l2src", f"device={inp_src}"],
-                f"video/x-raw,framerate=30/1,format=YUY2,width={inp_w or CAM_DEFAULT_WIDTH},height={inp_h or CAM_DEFAULT_HEIGHT}",
+                f"video/x-raw,framerate={CAM_FRAMERATE}/1,format=YUY2,width={inp_w or CAM_DEFAULT_WIDTH},height={inp_h or CAM_DEFAULT_HEIGHT}",
             )
         elif self._inp_type == InputType.RTSP:
             self._val_pipeline.add_elements(
-                ["rtspsrc", f'location="{inp_src}"', "latency=2000"],
-                "rtpjitterbuffer",
-                ["rtph264depay", "wait-for-keyframe=true"],
-                f"video/x-{inp_codec},width={inp_w},height={inp_h}" if (inp_w and inp_h) else f"video/x-{inp_codec}",
-                *codec_elems,
+                *rtsp_src_elems(inp_src, inp_codec, codec_elems, inp_w, inp_h, self._rtsp_profile)
             )
         self._val_pipeline.add_elements(
             ["fakesink", f"num-buffers={self._num_buffers}"]
@@ -63,7 +93,11 @@ class GstInputValidator:
         ):
             if self._verbose > 0:
                 print("\n" + msg_on_error + "\n")
+            if self._cache and cache_key:
+                self._cache.remove(cache_key)
             return False
+        if self._cache:
+            self._cache.record(cache_key, self._inp_type)
         if self._verbose > 0:
             print("Input OK")
         return True
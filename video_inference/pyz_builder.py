@@ -2,12 +2,322 @@
 Generate .pyz archive for demo or examples
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from os import getcwd
 from pathlib import Path
-from shutil import copy2
+from statistics import median
 from tempfile import TemporaryDirectory
+from typing import Any, NamedTuple, Optional
 import argparse
-import zipapp
+import ast
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+import zipfile
+
+from utils.cache import JsonCache
+
+# bump when the archive layout changes so existing archives are rebuilt
+ARCHIVE_FORMAT = 3
+
+# compiles [source, bytecode, display name] triples read from stdin with the target interpreter
+_COMPILE_SCRIPT = """
+import json, py_compile, sys
+for src, cfile, dfile in json.load(sys.stdin):
+    py_compile.compile(
+        src, cfile, dfile, doraise=True,
+        invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH,
+    )
+"""
+
+
+def _module_file(root: Path, module: str) -> Optional[Path]:
+    """
+    Returns the source file of a module under `root`, None if it isn't part of the tree
+    (e.g. a standard library module).
+    """
+    path = root.joinpath(*module.split("."))
+    for candidate in (path.with_suffix(".py"), path / "__init__.py"):
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+def _imported_modules(source: bytes, src: Path, root: Path) -> set[str]:
+    """
+    Returns the names of the modules `src` may import, including imports inside
+    functions and `try` blocks.
+    """
+    package = ".".join(src.relative_to(root).parent.parts)
+    modules: set[str] = set()
+    for node in ast.walk(ast.parse(source, str(src))):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                parts = alias.name.split(".")
+                modules.update(".".join(parts[: i + 1]) for i in range(len(parts)))
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                base = package.split(".")[: len(package.split(".")) - node.level + 1] if package else []
+                module = ".".join([*base, node.module] if node.module else base)
+            else:
+                module = node.module
+            if module:
+                modules.add(module)
+                # "from pkg import mod" imports the submodule
+                modules.update(f"{module}.{alias.name}" for alias in node.names if alias.name != "*")
+    return modules
+
+
+class SourceInfo(NamedTuple):
+    """Content hash of a source file and the modules it imports"""
+
+    hash: str
+    imports: list[str]
+
+
+class PyzManifest(JsonCache):
+    """
+    Remembers what every archive was built from.
+
+    Source files are fingerprinted by size and mtime, their content hash and imports are
+    only computed again when either changes, so checking an unchanged tree doesn't read
+    any source. An archive is up to date if it still has the size and mtime it was built
+    with and the hash of its inputs (the sources it contains, the target Python version
+    and `ARCHIVE_FORMAT`) didn't change.
+    """
+
+    def __init__(self, path: Path) -> None:
+        super().__init__(path)
+        self._updates: dict[str, Any] = {}
+
+    def _cached(self, key: str, stat: list[int]) -> Optional[dict[str, Any]]:
+        entry = self._updates.get(key) or self.get(key)
+        return entry if entry and entry.get("stat") == stat else None
+
+    def source(self, src: Path, root: Path) -> SourceInfo:
+        st = src.stat()
+        stat = [st.st_size, st.st_mtime_ns]
+        if entry := self._cached(f"src:{src}", stat):
+            return SourceInfo(entry["hash"], entry["imports"])
+        source = src.read_bytes()
+        info = SourceInfo(
+            hashlib.blake2b(source, digest_size=20).hexdigest(),
+            sorted(_imported_modules(source, src, root)),
+        )
+        self._updates[f"src:{src}"] = {"stat": stat, **info._asdict()}
+        return info
+
+    def python_tag(self, python: str) -> str:
+        """
+        Returns the bytecode magic number of an interpreter, only running it if the
+        binary changed since it was last asked.
+        """
+        path = os.path.realpath(python)
+        st = os.stat(path)
+        stat = [st.st_size, st.st_mtime_ns]
+        if entry := self._cached(f"python:{path}", stat):
+            return entry["magic"]
+        result = subprocess.run(
+            [python, "-c", "import importlib.util; print(importlib.util.MAGIC_NUMBER.hex())"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        magic = result.stdout.strip()
+        self._updates[f"python:{path}"] = {"stat": stat, "magic": magic}
+        return magic
+
+    def is_current(self, archive: Path, digest: str) -> bool:
+        try:
+            st = archive.stat()
+        except OSError:
+            return False
+        return bool(self._cached(f"archive:{archive.name}", [st.st_size, st.st_mtime_ns, digest]))
+
+    def record(self, archive: Path, digest: str) -> None:
+        st = archive.stat()
+        self._updates[f"archive:{archive.name}"] = {"stat": [st.st_size, st.st_mtime_ns, digest]}
+
+    def save(self) -> None:
+        if self._updates:
+            self.put_many(self._updates)
+            self._updates = {}
+
+
+class PyzTarget(NamedTuple):
+    """An example to package, the modules it imports and the hash of everything it's built from"""
+
+    source: Path
+    archive: Path
+    modules: list[Path]
+    digest: str
+
+    @property
+    def module_names(self) -> list[str]:
+        return [".".join(m.with_suffix("").parts).removesuffix(".__init__") for m in self.modules]
+
+
+class PyzBuilder:
+    """
+    Builds .pyz archives of examples.
+
+    Archives only contain the modules their example imports, together with bytecode
+    precompiled by `python`. The bytecode is never checked against the sources, the archive
+    is immutable, so the interpreter loads it without compiling anything. If an archive is
+    run by a Python version other than `python` the bytecode is ignored and the sources are
+    used.
+
+    Builds are incremental: archives whose inputs didn't change since they were built are
+    skipped (see `PyzManifest`). The modules needed by the remaining archives are staged and
+    compiled once, and the archives are then written in parallel.
+
+    Args:
+        root (Path): directory of the `gst`, `utils` and `examples` packages
+        output_dir (Path): directory to write the archives and manifest to
+        python (str): interpreter of the target Python version
+        jobs (int): number of archives to write in parallel
+    """
+
+    def __init__(self, root: Path, output_dir: Path, python: str = sys.executable, jobs: int = 4) -> None:
+        self._root = root
+        self._output_dir = output_dir
+        self._python = python
+        self._jobs = jobs
+        self._manifest = PyzManifest(output_dir / ".pyz-manifest.json")
+
+    def find_modules(self, entry: Path) -> list[Path]:
+        """
+        Finds the modules under the root that `entry` imports, directly or through other modules.
+
+        Returns:
+            list[Path]: module sources relative to the root, not including `entry`
+        """
+        found: set[Path] = set()
+        pending: list[Path] = [entry]
+        while pending:
+            src = pending.pop()
+            for module in self._manifest.source(src, self._root).imports:
+                if (path := _module_file(self._root, module)) and path != entry and path not in found:
+                    found.add(path)
+                    pending.append(path)
+        return sorted(p.relative_to(self._root) for p in found)
+
+    def target(self, source: Path) -> PyzTarget:
+        modules = self.find_modules(source)
+        h = hashlib.blake2b(digest_size=20)
+        h.update(f"{ARCHIVE_FORMAT}:{self._manifest.python_tag(self._python)}".encode())
+        for name, path in [("__main__.py", source), *((str(m), self._root / m) for m in modules)]:
+            h.update(f"\0{name}:{self._manifest.source(path, self._root).hash}".encode())
+        return PyzTarget(source, self._output_dir / f"{source.stem}.pyz", modules, h.hexdigest())
+
+    def _stage(self, staging: Path, targets: list[PyzTarget]) -> None:
+        """
+        Copies and compiles the modules of all `targets` and their main modules into `staging`,
+        each module only once.
+        """
+        files: dict[str, Path] = {str(m): self._root / m for t in targets for m in t.modules}
+        files.update({f"__main__/{t.archive.stem}.py": t.source for t in targets})
+        jobs: list[list[str]] = []
+        for name, src in files.items():
+            dst = staging / name
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            dst.write_bytes(src.read_bytes())
+            display = "__main__.py" if name.startswith("__main__/") else name
+            jobs.append([str(dst), str(dst.with_suffix(".pyc")), display])
+        subprocess.run(
+            [self._python, "-c", _COMPILE_SCRIPT], input=json.dumps(jobs), text=True, check=True
+        )
+
+    @staticmethod
+    def _write_archive(staging: Path, target: PyzTarget) -> None:
+        """
+        Writes an archive from staged files. Sources are stored next to their bytecode, as
+        zipimport expects, and uncompressed so reading them costs no decompression.
+        """
+        entries: list[tuple[Path, str]] = []
+        main = staging / "__main__" / f"{target.archive.stem}.py"
+        for src, name in [(main, "__main__.py"), *((staging / m, str(m)) for m in target.modules)]:
+            entries += [(src, name), (src.with_suffix(".pyc"), name + "c")]
+        tmp = target.archive.with_name(f".{target.archive.name}.{os.getpid()}.tmp")
+        # packages without __init__.py are only found through their directory entries
+        dirs = sorted({str(p) for m in target.modules for p in m.parents if str(p) != "."})
+        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_STORED) as zf:
+            for d in dirs:
+                zf.write(staging / d, d)
+            for src, name in entries:
+                zf.write(src, name)
+        os.replace(tmp, target.archive)
+
+    def build(self, sources: list[Path], force: bool = False) -> list[tuple[PyzTarget, bool]]:
+        """
+        Builds the archives of `sources` that are out of date, or all of them if `force` is set.
+
+        Returns:
+            list[tuple[PyzTarget, bool]]: every target and whether its archive was built
+        """
+        targets = [self.target(src) for src in sources]
+        stale = [t for t in targets if force or not self._manifest.is_current(t.archive, t.digest)]
+        if stale:
+            with TemporaryDirectory() as td:
+                staging = Path(td)
+                self._stage(staging, stale)
+                with ThreadPoolExecutor(max_workers=max(1, self._jobs)) as pool:
+                    list(pool.map(lambda t: self._write_archive(staging, t), stale))
+            for t in stale:
+                self._manifest.record(t.archive, t.digest)
+        self._manifest.save()
+        return [(t, t in stale) for t in targets]
+
+
+def _evict(path: Path) -> None:
+    """
+    Drops a file from the page cache so the next read comes from storage.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    except (AttributeError, OSError):
+        pass
+
+
+def measure_startup(
+    archive: Path, modules: list[str], python: str = sys.executable, runs: int = 5
+) -> tuple[float, float]:
+    """
+    Measures how long a new interpreter takes to import the modules of an archive.
+
+    The first run is cold: the archive is evicted from the page cache before it. The warm
+    time is the median of `runs` further runs.
+
+    Returns:
+        tuple[float, float]: cold and warm import time in seconds
+    """
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        f"sys.path.insert(0, {str(archive)!r})\n"
+        f"for m in {modules!r}:\n"
+        "    __import__(m)\n"
+        "print(time.perf_counter() - start)\n"
+    )
+
+    def run() -> float:
+        # keep the interpreter from writing bytecode for anything outside the archive
+        result = subprocess.run(
+            [python, "-B", "-c", code], capture_output=True, text=True, check=True
+        )
+        return float(result.stdout.strip())
+
+    _evict(archive)
+    cold = run()
+    warm = median(run() for _ in range(max(1, runs)))
+    return cold, warm
 
 
 if __name__ == "__main__":
@@ -36,25 +346,52 @@ if __name__ == "__main__":
         metavar="DIR",
         help="Output directory for builds (default: %(default)s)"
     )
+    parser.add_argument(
+        "--python",
+        type=str,
+        default=sys.executable,
+        metavar="PYTHON",
+        help="Interpreter of the target Python version, used to precompile bytecode (default: %(default)s)"
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=4,
+        help="Number of archives to write in parallel (default: %(default)s)"
+    )
+    parser.add_argument(
+        "-f", "--force",
+        action="store_true",
+        default=False,
+        help="Rebuild archives even if they are up to date"
+    )
+    parser.add_argument(
+        "--measure-startup",
+        action="store_true",
+        default=False,
+        help="Report cold and warm import time of each archive"
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=5,
+        help="Number of warm runs for --measure-startup (default: %(default)s)"
+    )
     args = parser.parse_args()
 
     if not (output_dir := Path(args.output_dir)).exists():
         output_dir.mkdir(parents=True)
 
-    targets: list[str] = examples if args.all else args.targets
-    for target in targets:
-        with TemporaryDirectory() as td:
-            td = Path(td) / "demo-python"
-            for f in Path(".").rglob("*"):
-                if str(f.resolve()) == __file__:
-                    continue
-                if cwd / f.parent == cwd / "examples":
-                    continue
-                if f.suffix == ".py":
-                    dst = td / f.parent
-                    dst.mkdir(parents=True, exist_ok=True)
-                    copy2(f, dst)
-            target_src: Path = cwd / "examples" / target
-            copy2(target_src, td / "__main__.py")
-            zipapp.create_archive(td, f"{output_dir}/{Path(target).stem}.pyz")
-            print(f"Built {output_dir.resolve()}/{Path(target).stem}.pyz")
+    start = time.perf_counter()
+    targets: list[str] = sorted(examples) if args.all else args.targets
+    builder = PyzBuilder(cwd, output_dir.resolve(), args.python, args.jobs)
+    results = builder.build([cwd / "examples" / t for t in targets], args.force)
+    for target, built in results:
+        print(
+            f"{'Built' if built else 'Up to date'} {target.archive} ({len(target.modules)} modules, "
+            f"{target.archive.stat().st_size / 1024:.0f} KiB)"
+        )
+        if args.measure_startup:
+            cold, warm = measure_startup(target.archive, target.module_names, args.python, args.runs)
+            print(f"  import time: {cold * 1000:.1f} ms cold, {warm * 1000:.1f} ms warm")
+    print(f"{sum(built for _, built in results)} of {len(results)} archives built in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,50 @@
+from typing import Any, Callable
+
+import pytest
+
+from gst.pipeline import GstMultiPipelineGenerator, GstPipelineGenerator
+from utils.common import GstBackend, SinkType
+
+
+BASE_PARAMS: dict[str, Any] = {
+    "inf_model": "model.synap",
+    "inf_w": 640,
+    "inf_h": 384,
+    "inf_labels": "info.json",
+    "inf_thresh": 0.5,
+    "inf_skip": 1,
+    "inf_max": 5,
+    "fullscreen": False,
+    "sink": SinkType.DISPLAY,
+    "backend": GstBackend.SUBPROCESS,
+}
+
+
+@pytest.fixture
+def make_generator() -> Callable[..., GstPipelineGenerator]:
+    """Builds the pipeline of a generator with `BASE_PARAMS` and the given parameters"""
+
+    def make(**params: Any) -> GstPipelineGenerator:
+        gen = GstPipelineGenerator({**BASE_PARAMS, **params})
+        gen.make_pipeline()
+        return gen
+
+    return make
+
+
+@pytest.fixture
+def generate(make_generator: Callable[..., GstPipelineGenerator]) -> Callable[..., str]:
+    """Returns the launch line of a generated pipeline"""
+    return lambda **params: " ".join(make_generator(**params).pipeline.launch_args)
+
+
+@pytest.fixture
+def generate_multi() -> Callable[..., str]:
+    """Returns the launch line of a multi-source pipeline with `BASE_PARAMS`, unoptimized"""
+
+    def generate(inputs: list[dict[str, Any]], separate_outputs: bool = False, **params: Any) -> str:
+        gen = GstMultiPipelineGenerator({**BASE_PARAMS, "optimize": False, **params}, inputs, separate_outputs)
+        gen.make_pipeline()
+        return " ".join(gen.pipeline.launch_args)
+
+    return generate
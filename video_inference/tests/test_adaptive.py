@@ -0,0 +1,103 @@
+import pytest
+
+from gst.adaptive import FrameIntervalController, RateMeter, ThermalMonitor
+
+
+@pytest.fixture
+def fake_thermal(tmp_path):
+    """A fake thermal sysfs class directory, zone temperatures are in m°C"""
+
+    def add(num: int, ztype: str, temp: str) -> None:
+        zone = tmp_path / f"thermal_zone{num}"
+        zone.mkdir()
+        (zone / "type").write_text(f"{ztype}\n")
+        (zone / "temp").write_text(f"{temp}\n")
+
+    add(0, "cpu-thermal", "61500")
+    add(1, "gpu-thermal", "58000")
+    add(2, "broken", "n/a")
+    (tmp_path / "cooling_device0").mkdir()
+    return str(tmp_path)
+
+
+def _feed(controller: FrameIntervalController, samples: list[tuple]) -> list[int]:
+    """Feeds (display fps, temperature) samples and returns the interval after each"""
+    intervals = []
+    for display_fps, temp in samples:
+        controller.update(display_fps, display_fps / (controller.interval + 1), temp)
+        intervals.append(controller.interval)
+    return intervals
+
+
+def test_thermal_zones_are_read_from_sysfs(fake_thermal):
+    thermal = ThermalMonitor(fake_thermal)
+    # unreadable zones are skipped
+    assert thermal.read() == {"cpu-thermal": 61.5, "gpu-thermal": 58.0}
+    assert thermal.max_temp() == 61.5
+    assert ThermalMonitor(fake_thermal, zones=["gpu-thermal"]).max_temp() == 58.0
+
+
+def test_no_thermal_zones(tmp_path):
+    assert ThermalMonitor(str(tmp_path / "missing")).max_temp() is None
+
+
+def test_rate_meter_restarts_at_each_reading():
+    now = [0.0]
+    meter = RateMeter(clock=lambda: now[0])
+    for _ in range(30):
+        meter.tick()
+    now[0] = 2.0
+    assert meter.rate() == 15.0
+    now[0] = 3.0
+    assert meter.rate() == 0.0
+    assert meter.rate() == 0.0
+
+
+def test_interval_rises_when_display_falls_behind():
+    controller = FrameIntervalController(1, target_fps=30.0, max_interval=3)
+    assert _feed(controller, [(20.0, None)] * 4) == [2, 3, 3, 3]
+    decision = controller.decisions[0]
+    assert (decision.old, decision.new) == (1, 2)
+    assert str(decision) == (
+        "Frame interval 1 -> 2: display below 30.0 fps (display 20.0 fps, inference 10.0 fps)"
+    )
+
+
+def test_interval_rises_at_the_temperature_ceiling():
+    controller = FrameIntervalController(0, target_fps=30.0, max_temp=80.0)
+    assert _feed(controller, [(30.0, 79.0), (30.0, 80.0)]) == [0, 1]
+    assert "temperature above 80.0°C" in str(controller.decisions[-1])
+    assert str(controller.decisions[-1]).endswith(", 80.0°C)")
+
+
+def test_interval_is_lowered_only_after_settling():
+    controller = FrameIntervalController(3, target_fps=30.0, settle=3)
+    # a sample between the thresholds restarts the settling count
+    samples = [(30.0, None), (30.0, None), (28.5, None), (30.0, None), (30.0, None), (30.0, None)]
+    assert _feed(controller, samples) == [3, 3, 3, 3, 3, 2]
+    # each change settles again
+    assert _feed(controller, [(30.0, None)] * 3) == [2, 2, 1]
+
+
+def test_warm_device_holds_the_interval():
+    controller = FrameIntervalController(2, target_fps=30.0, max_temp=85.0, temp_margin=5.0, settle=1)
+    # at target fps but within the temperature margin, neither raised nor lowered
+    assert _feed(controller, [(30.0, 82.0)] * 5) == [2] * 5
+    assert _feed(controller, [(30.0, 79.0)]) == [1]
+
+
+def test_simulated_thermal_run_stays_within_bounds():
+    controller = FrameIntervalController(5, target_fps=30.0, max_temp=85.0, min_interval=1, max_interval=4)
+    # the initial interval is clamped
+    assert controller.interval == 4
+    # the device heats up while running at a low interval and cools down at a high one
+    temp = 70.0
+    for _ in range(200):
+        interval = controller.interval
+        temp += 1.0 if interval <= 1 else -0.5
+        controller.update(30.0, 30.0 / (interval + 1), temp)
+        assert 1 <= controller.interval <= 4
+        assert temp < 90.0
+    # it has settled into oscillating around the ceiling
+    assert any(d.new > d.old for d in controller.decisions)
+    assert any(d.new < d.old for d in controller.decisions)
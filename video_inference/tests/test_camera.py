@@ -0,0 +1,60 @@
+import pytest
+
+from utils.camera import find_valid_camera_devices, list_capture_devices
+
+
+@pytest.fixture
+def fake_v4l2(tmp_path):
+    """
+    A fake video4linux sysfs class directory, with a device prefix under which no device
+    nodes exist so only the sysfs attributes are used.
+    """
+    sysfs = tmp_path / "sys"
+
+    def add(num: int, name: str, index: int = 0) -> None:
+        node = sysfs / f"video{num}"
+        node.mkdir(parents=True)
+        (node / "name").write_text(f"{name}\n")
+        (node / "index").write_text(f"{index}\n")
+
+    add(0, "USB Camera")
+    add(1, "USB Camera", index=1)
+    add(2, "rkvdec")
+    add(10, "HDMI capture")
+    add(3, "Hantro H1 enc")
+    (sysfs / "v4l-subdev0").mkdir()
+    return str(sysfs), str(tmp_path / "dev" / "video")
+
+
+def test_capture_devices_are_listed_from_sysfs(fake_v4l2):
+    sysfs, prefix = fake_v4l2
+    # metadata and codec nodes are skipped, devices are sorted by number
+    assert list_capture_devices(sysfs, prefix) == [prefix + "0", prefix + "10"]
+
+
+def test_unqueryable_device_nodes_fall_back_to_sysfs(fake_v4l2, tmp_path):
+    sysfs, prefix = fake_v4l2
+    # regular files open but fail VIDIOC_QUERYCAP
+    (tmp_path / "dev").mkdir()
+    for num in (0, 1, 2, 3, 10):
+        (tmp_path / "dev" / f"video{num}").touch()
+    assert list_capture_devices(sysfs, prefix) == [prefix + "0", prefix + "10"]
+
+
+def test_missing_sysfs_root_lists_nothing(tmp_path):
+    assert list_capture_devices(str(tmp_path / "missing"), str(tmp_path / "video")) == []
+
+
+def test_valid_cameras_are_found_with_a_validator(fake_v4l2):
+    sysfs, prefix = fake_v4l2
+    probed = []
+
+    def validator(dev: str) -> bool:
+        probed.append(dev)
+        return dev.endswith("10")
+
+    found = find_valid_camera_devices(
+        sysfs_root=sysfs, dev_prefix=prefix, validator=validator, use_cache=False
+    )
+    assert found == [prefix + "10"]
+    assert sorted(probed) == [prefix + "0", prefix + "10"]
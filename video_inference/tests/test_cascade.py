@@ -0,0 +1,65 @@
+import json
+
+import numpy as np
+import pytest
+
+from gst.cascade import CAPTURE_FORMATS, ClassifierCascade, _sample_yuv
+
+
+W, H, PAD = 8, 6, 4
+
+
+def _planes() -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    y = np.arange(W * H, dtype=np.uint8).reshape(H, W)
+    u = 100 + np.arange(W * H // 4, dtype=np.uint8).reshape(H // 2, W // 2)
+    v = 200 + np.arange(W * H // 4, dtype=np.uint8).reshape(H // 2, W // 2)
+    return y, u, v
+
+
+def _pack(fmt: str) -> tuple[np.ndarray, list[int], list[int]]:
+    """Lays out the test planes in `fmt` with padded rows"""
+    y, u, v = _planes()
+    if fmt == "YUY2":
+        stride = W * 2 + PAD
+        frame = np.zeros((H, stride), dtype=np.uint8)
+        frame[:, 0 : W * 2 : 2] = y
+        # YUY2 has chroma on every row
+        frame[:, 1 : W * 2 : 4] = np.repeat(u, 2, axis=0)
+        frame[:, 3 : W * 2 : 4] = np.repeat(v, 2, axis=0)
+        return frame.ravel(), [stride], [0]
+    stride = W + PAD
+    luma = np.zeros((H, stride), dtype=np.uint8)
+    luma[:, :W] = y
+    if fmt == "NV12":
+        chroma = np.zeros((H // 2, stride), dtype=np.uint8)
+        chroma[:, 0:W:2], chroma[:, 1:W:2] = u, v
+        return np.concatenate([luma.ravel(), chroma.ravel()]), [stride, stride], [0, luma.size]
+    c_stride = W // 2 + PAD
+    cu = np.zeros((H // 2, c_stride), dtype=np.uint8)
+    cv = np.zeros((H // 2, c_stride), dtype=np.uint8)
+    cu[:, : W // 2], cv[:, : W // 2] = u, v
+    return (
+        np.concatenate([luma.ravel(), cu.ravel(), cv.ravel()]),
+        [stride, c_stride, c_stride],
+        [0, luma.size, luma.size + cu.size],
+    )
+
+
+@pytest.mark.parametrize("fmt", CAPTURE_FORMATS)
+def test_sample_yuv_reads_every_format(fmt):
+    data, strides, offsets = _pack(fmt)
+    y, u, v = _planes()
+    ys, xs = np.array([0, 3, 5]), np.array([1, 2, 7])
+    got_y, got_u, got_v = _sample_yuv(data, fmt, strides, offsets, ys, xs)
+    np.testing.assert_array_equal(got_y, y[ys[:, None], xs])
+    np.testing.assert_array_equal(got_u, u[(ys // 2)[:, None], xs // 2])
+    np.testing.assert_array_equal(got_v, v[(ys // 2)[:, None], xs // 2])
+
+
+def test_frames_are_captured_without_forcing_a_format(tmp_path):
+    labels = tmp_path / "labels.json"
+    labels.write_text(json.dumps({"labels": ["a", "b"]}))
+    cascade = ClassifierCascade("cls.synap", str(labels), str(labels), 224, 224, 640, 384)
+    capture = cascade.branches("overlay.inference_sink")[0]
+    # the videoconvert is a passthrough for every format that can be cropped
+    assert capture[3] == "video/x-raw,format=(string){NV12,I420,YUY2}"
@@ -0,0 +1,37 @@
+import uuid
+
+import pytest
+
+from utils.detection_ring import Detection, DetectionRingReader, DetectionRingWriter
+
+
+@pytest.fixture
+def ring_name():
+    return f"test_ring_{uuid.uuid4().hex[:8]}"
+
+
+def test_reader_sees_published_detections(ring_name):
+    with DetectionRingWriter(ring_name, capacity=8) as writer:
+        writer.publish(10, [Detection(1, 0.9, 1, 2, 3, 4), Detection(2, 0.8, 5, 6, 7, 8)])
+        writer.publish(20, [])
+        with DetectionRingReader(ring_name) as reader:
+            records = reader.latest(8)
+    assert records["pts"].tolist() == [10, 10, 20]
+    assert records["class_id"].tolist() == [1, 2, -1]
+
+
+def test_new_writer_doesnt_truncate_a_mapped_ring(ring_name):
+    first = DetectionRingWriter(ring_name, capacity=64)
+    first.publish(1, [Detection(1, 0.9, 0, 0, 1, 1)])
+    reader = DetectionRingReader(ring_name)
+    # a restarted pipeline replaces the ring with a smaller one
+    second = DetectionRingWriter(ring_name, capacity=4)
+    try:
+        # the old mapping stays readable, truncating the file would raise SIGBUS here
+        assert reader.latest(64)["pts"].tolist() == [1]
+        with DetectionRingReader(ring_name) as fresh:
+            assert fresh.head == 0
+    finally:
+        reader.close()
+        first.close(unlink=False)
+        second.close()
@@ -0,0 +1,130 @@
+import asyncio
+import os
+import resource
+import shutil
+import stat
+import subprocess
+
+import pytest
+
+from gst.fleet import FleetSupervisor, ProcessLimits, assign_cpus
+from gst.pipeline import GstPipeline
+from gst.supervisor import Backoff
+from utils.common import GstBackend
+
+
+def _fake_gst_launch(tmp_path, monkeypatch, script: str) -> None:
+    """Puts a stand-in `gst-launch-1.0` running `script` first on the PATH"""
+    exe = tmp_path / "gst-launch-1.0"
+    exe.write_text(f"#!/bin/sh\necho run >> {tmp_path / 'runs'}\n{script}\n")
+    exe.chmod(exe.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+
+
+def _runs(tmp_path) -> int:
+    runs = tmp_path / "runs"
+    return len(runs.read_text().splitlines()) if runs.exists() else 0
+
+
+def _test_pipeline(num_buffers: int = 30) -> GstPipeline:
+    pipeline = GstPipeline(backend=GstBackend.SUBPROCESS, display=False, preflight=False)
+    pipeline.add_elements(["videotestsrc", f"num-buffers={num_buffers}"], "video/x-raw,width=320,height=240")
+    pipeline.add_elements("fakesink")
+    return pipeline
+
+
+def _fleet(**kwargs) -> tuple[FleetSupervisor, list[str]]:
+    logs: list[str] = []
+    params = {"backoff": Backoff(0.0, 0.0), "settle": 60.0, "report_interval": 0.0, "log": logs.append}
+    return FleetSupervisor(**{**params, **kwargs}), logs
+
+
+def test_cpus_are_split_between_streams():
+    assert assign_cpus(2, [3, 0, 1, 2]) == [(0, 1), (2, 3)]
+    assert assign_cpus(3, [0, 1, 2, 3]) == [(0,), (1,), (2,)]
+    assert assign_cpus(3, [0, 1]) == [(0,), (1,), (0,)]
+    assert assign_cpus(0, [0, 1]) == []
+
+
+def test_limits_are_applied_to_a_running_process():
+    cpu = min(os.sched_getaffinity(0))
+    limits = ProcessLimits(cpus=(cpu,), nice=5, max_memory_mb=4096)
+    assert str(limits) == f"cpus {cpu}, nice 5, max 4096 MiB"
+    proc = subprocess.Popen(["sleep", "10"])
+    try:
+        limits.apply(proc.pid)
+        assert os.sched_getaffinity(proc.pid) == {cpu}
+        assert os.getpriority(os.PRIO_PROCESS, proc.pid) == os.getpriority(os.PRIO_PROCESS, 0) + 5
+        assert resource.prlimit(proc.pid, resource.RLIMIT_AS) == (4096 << 20, 4096 << 20)
+    finally:
+        proc.kill()
+        proc.wait()
+
+
+def test_invalid_cores_are_rejected():
+    fleet, _ = _fleet()
+    fleet.add("cam", _test_pipeline())
+    with pytest.raises(ValueError, match="Duplicate"):
+        fleet.add("cam", _test_pipeline())
+    with pytest.raises(ValueError, match="invalid CPU cores"):
+        fleet.add("other", _test_pipeline(), ProcessLimits(cpus=(max(os.sched_getaffinity(0)) + 1,)))
+
+
+def test_failing_stream_is_restarted_then_given_up(tmp_path, monkeypatch):
+    _fake_gst_launch(tmp_path, monkeypatch, 'echo "ERROR: Internal data stream error." >&2; exit 1')
+    fleet, logs = _fleet(max_restarts=2)
+    fleet.add("cam", _test_pipeline())
+    stats = asyncio.run(fleet.run())
+    # the first run and 2 restarts
+    assert _runs(tmp_path) == 3
+    assert stats["cam"].restarts == 2 and not stats["cam"].running
+    assert "Stream cam failed: ERROR: Internal data stream error., restarting in 0.0 s" in logs[0]
+    assert "giving up" in logs[-1]
+
+
+def test_backoff_is_reset_after_a_settled_run(tmp_path, monkeypatch):
+    _fake_gst_launch(tmp_path, monkeypatch, "exit 1")
+    delays: list[int] = []
+
+    class RecordingBackoff(Backoff):
+        def delay(self, attempt: int) -> float:
+            delays.append(attempt)
+            return 0.0
+
+    # start and end times of each run, the third one runs long enough to settle
+    times = iter([0, 10, 20, 30, 40, 90, 100, 110, 120, 130, 140, 150])
+    fleet, _ = _fleet(backoff=RecordingBackoff(), settle=45.0, max_restarts=3, clock=lambda: next(times))
+    fleet.add("cam", _test_pipeline())
+    asyncio.run(fleet.run())
+    assert delays == [0, 1, 0, 1, 2]
+
+
+def test_stop_shuts_running_streams_down(tmp_path, monkeypatch):
+    _fake_gst_launch(tmp_path, monkeypatch, "while :; do sleep 0.1; done")
+    fleet, _ = _fleet(eos_timeout=1.0, term_timeout=1.0)
+    fleet.add("cam", _test_pipeline())
+    fleet.add("cam2", _test_pipeline())
+
+    async def main() -> None:
+        task = asyncio.ensure_future(fleet.run())
+        await asyncio.sleep(0.5)
+        assert all(s.running for s in fleet.stats.values())
+        fleet.stop()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert _runs(tmp_path) == 2
+    assert not any(s.running or s.restarts for s in fleet.stats.values())
+
+
+@pytest.mark.skipif(shutil.which("gst-launch-1.0") is None, reason="GStreamer isn't installed")
+def test_videotestsrc_fleet_runs_pinned_streams():
+    fleet, logs = _fleet(max_restarts=1)
+    for i, cpus in enumerate(assign_cpus(2)):
+        fleet.add(f"test{i}", _test_pipeline(), ProcessLimits(cpus=cpus, nice=5))
+    stats = asyncio.run(fleet.run())
+    # each stream ends after its buffers, is restarted once and given up on
+    assert [s.restarts for s in stats.values()] == [1, 1]
+    assert sum("ended, restarting" in line for line in logs) == 2
+    assert "Fleet: 0/2 streams running" in fleet.report()
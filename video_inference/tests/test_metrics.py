@@ -0,0 +1,48 @@
+import os
+
+from gst.metrics import PipelineMetrics, render_metrics
+from gst.pipeline import GstPipeline
+from gst.tracer import TRACERS
+from utils.common import GstBackend
+
+
+def _tracer_line(record: str) -> str:
+    return f"0:00:01.500000000 4242 0x5580 TRACE GST_TRACER :0:: {record}"
+
+
+def _launched() -> tuple[GstPipeline, PipelineMetrics]:
+    pipeline = GstPipeline(backend=GstBackend.SUBPROCESS, display=False, preflight=False)
+    pipeline.add_elements("videotestsrc", ["queue", "name=q_infer"], ["synapinfer", "name=infer"], "fakesink")
+    metrics = PipelineMetrics("cam")
+    metrics.attach(pipeline, ["q_infer"], inprocess=False)
+    return pipeline, metrics
+
+
+def test_subprocess_enables_tracers_once(tmp_path):
+    pipeline, _ = _launched()
+    env = pipeline._subprocess_env()
+    assert env["GST_TRACERS"] == "framerate;queuelevel"
+    assert "GST_TRACER:7" in env["GST_DEBUG"]
+    # trace mode already loads them
+    pipeline.enable_trace(str(tmp_path))
+    assert pipeline._subprocess_env()["GST_TRACERS"] == TRACERS
+
+
+def test_subprocess_exports_inference_rate_and_queue_levels():
+    _, metrics = _launched()
+    # started by gst-launch-1.0, this process stands in for it
+    metrics._on_spawn(os.getpid())
+    for record in (
+        "framerate, pad=(string)infer_src, fps=(uint)12;",
+        "framerate, pad=(string)q_infer_src, fps=(uint)30;",
+        "queuelevel, queue=(string)q_infer, size_bytes=(uint)0, max_size_bytes=(uint)0, "
+        "size_buffers=(uint)3, max_size_buffers=(uint)4, size_time=(guint64)0, max_size_time=(guint64)0;",
+        "queuelevel, queue=(string)other, size_bytes=(uint)0, size_buffers=(uint)1;",
+    ):
+        metrics._on_tracer(_tracer_line(record))
+    metrics.sample()
+    page = render_metrics(metrics.samples())
+    assert 'synap_inference_fps{pipeline="cam"} 12.0' in page
+    assert 'synap_queue_level_buffers{pipeline="cam",queue="q_infer"} 3' in page
+    assert 'queue="other"' not in page
+    assert "synap_inferences_total" not in page
@@ -0,0 +1,82 @@
+import pytest
+
+from gst.pipeline import GstMultiPipelineGenerator
+from utils.common import CODECS, InputType, SinkType
+
+
+# standard queue profile
+Q = "max-size-buffers=200 max-size-bytes=10485760 max-size-time=1000000000 leaky=no"
+
+CAMERAS = [
+    {"inp_type": InputType.CAMERA, "inp_src": f"/dev/video{i}", "inp_w": 640, "inp_h": 480}
+    for i in (0, 2)
+]
+
+
+def _camera_branch(idx: int, dev: str, tile: str) -> str:
+    return (
+        f"v4l2src device={dev} ! video/x-raw,framerate=30/1,format=YUY2,width=640,height=480 ! "
+        f"videoconvert ! videoscale ! video/x-raw,{tile} ! comp.sink_{idx}"
+    )
+
+
+def test_mosaic_of_two_cameras(generate_multi):
+    assert generate_multi(CAMERAS) == " ".join(
+        [
+            "compositor name=comp",
+            "sink_0::xpos=0 sink_0::ypos=0 sink_0::width=960 sink_0::height=1080",
+            "sink_1::xpos=960 sink_1::ypos=0 sink_1::width=960 sink_1::height=1080",
+            "! video/x-raw,width=1920,height=1080 ! videoconvert ! tee name=t_data",
+            f"t_data. ! queue name=q_infer {Q} ! videoconvert ! videoscale",
+            "! video/x-raw,width=640,height=384,format=RGB",
+            "! synapinfer mode=detector model=model.synap threshold=0.5 numinference=5 frameinterval=1 name=infer",
+            "! overlay.inference_sink",
+            f"t_data. ! queue name=q_overlay {Q} ! synapoverlay name=overlay label=info.json",
+            "! videoconvert ! waylandsink fullscreen=false",
+            _camera_branch(0, "/dev/video0", "width=960,height=1080"),
+            _camera_branch(1, "/dev/video2", "width=960,height=1080"),
+        ]
+    )
+
+
+def test_separate_outputs_crop_the_mosaic(generate_multi):
+    pipeline = generate_multi(CAMERAS, separate_outputs=True)
+    assert "synapoverlay name=overlay label=info.json ! tee name=t_out" in pipeline
+    assert (
+        f"t_out. ! queue name=q_out0 {Q} ! videocrop left=0 top=0 right=960 bottom=0 "
+        "! videoconvert ! waylandsink fullscreen=false"
+    ) in pipeline
+    assert (
+        f"t_out. ! queue name=q_out1 {Q} ! videocrop left=960 top=0 right=0 bottom=0 "
+        "! videoconvert ! waylandsink fullscreen=false"
+    ) in pipeline
+    # inference still runs once
+    assert pipeline.count("synapinfer") == 1
+
+
+def test_fakesink_ignores_separate_outputs(generate_multi):
+    pipeline = generate_multi(CAMERAS, separate_outputs=True, sink=SinkType.FAKESINK)
+    assert "t_out" not in pipeline and "videocrop" not in pipeline
+
+
+def test_mixed_inputs_share_one_inference(generate_multi):
+    inputs = [
+        CAMERAS[0],
+        {"inp_type": InputType.FILE, "inp_src": "a.mp4", "inp_codec": "h264", "codec_elems": CODECS["h264"]},
+        {"inp_type": InputType.RTSP, "inp_src": "rtsp://h/x", "inp_codec": "h264", "codec_elems": CODECS["h264"]},
+    ]
+    pipeline = generate_multi(inputs)
+    # 3 inputs are laid out on a 2x2 grid
+    assert "sink_2::xpos=0 sink_2::ypos=540 sink_2::width=960 sink_2::height=540" in pipeline
+    assert _camera_branch(0, "/dev/video0", "width=960,height=540") in pipeline
+    assert (
+        f'filesrc location="a.mp4" ! qtdemux name=demux1 demux1.video_0 ! queue name=q_src1 {Q} '
+        "! h264parse ! avdec_h264 ! videoconvert ! videoscale ! video/x-raw,width=960,height=540 ! comp.sink_1"
+    ) in pipeline
+    assert 'rtspsrc name=rtsp2 location="rtsp://h/x" latency=2000 ! rtph264depay' in pipeline
+    assert pipeline.count("synapinfer") == 1
+
+
+def test_no_inputs_is_fatal():
+    with pytest.raises(SystemExit):
+        GstMultiPipelineGenerator({}, [])
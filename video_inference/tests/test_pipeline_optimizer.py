@@ -0,0 +1,38 @@
+from utils.common import InputType, SinkType
+
+
+def _overlay_input(pipeline: str) -> str:
+    return pipeline[: pipeline.index("synapoverlay")].rsplit("tee name=t_data", 1)[0]
+
+
+def test_camera_keeps_conversions_around_overlay(generate):
+    pipeline = generate(inp_type=InputType.CAMERA, inp_src="/dev/video0")
+    # the formats synapoverlay takes aren't known, YUY2 is converted before the tee and
+    # the overlay's output before the display
+    assert "videoconvert" in _overlay_input(pipeline)
+    assert "videoconvert ! waylandsink" in pipeline
+    assert "format=NV12" not in pipeline
+
+
+def test_inference_branch_scales_before_converting(generate):
+    for decoder in ("avdec_h264", "v4l2h264dec"):
+        pipeline = generate(inp_type=InputType.FILE, inp_src="/nonexistent.mp4", codec_elems=("h264parse", decoder))
+        infer = pipeline[pipeline.index("name=q_infer") : pipeline.index("synapinfer")]
+        assert infer.index("videoscale") < infer.index("videoconvert")
+        assert infer.count("videoconvert") == 1
+
+
+def test_report_counts_fewer_full_frames(make_generator):
+    report = make_generator(inp_type=InputType.CAMERA, inp_src="/dev/video0").optimization_report
+    assert report.frames_after < report.frames_before
+
+
+def test_encoder_output_is_converted(generate):
+    pipeline = generate(inp_type=InputType.CAMERA, inp_src="/dev/video0", sink=SinkType.FILE, sink_location="/tmp/out.mkv")
+    assert "videoconvert ! v4l2h264enc" in pipeline
+
+
+def test_unoptimized_pipeline_keeps_conversions(generate):
+    pipeline = generate(inp_type=InputType.CAMERA, inp_src="/dev/video0", optimize=False)
+    infer = pipeline[pipeline.index("t_data.") : pipeline.index("synapinfer")]
+    assert infer.index("videoconvert") < infer.index("videoscale")
@@ -0,0 +1,155 @@
+import struct
+
+import pytest
+
+from utils.probe import TS_SCAN_LIMIT, probe_container
+
+
+class _BitWriter:
+    def __init__(self) -> None:
+        self.bits: list[int] = []
+
+    def u(self, n: int, val: int) -> None:
+        self.bits += [(val >> (n - 1 - i)) & 1 for i in range(n)]
+
+    def ue(self, val: int) -> None:
+        n = (val + 1).bit_length()
+        self.u(n - 1, 0)
+        self.u(n, val + 1)
+
+    def bytes(self) -> bytes:
+        bits = self.bits + [1] + [0] * (-(len(self.bits) + 1) % 8)
+        return bytes(int("".join(map(str, bits[i : i + 8])), 2) for i in range(0, len(bits), 8))
+
+
+def _h264_sps(width: int, height: int, time_scale: int, num_units_in_tick: int) -> bytes:
+    """A baseline profile SPS NAL unit with its timing info in the VUI"""
+    w = _BitWriter()
+    w.u(8, 66)  # profile_idc
+    w.u(16, 30)  # constraint flags + level_idc
+    w.ue(0)  # seq_parameter_set_id
+    w.ue(0)  # log2_max_frame_num_minus4
+    w.ue(2)  # pic_order_cnt_type
+    w.ue(1)  # max_num_ref_frames
+    w.u(1, 0)  # gaps_in_frame_num_value_allowed_flag
+    w.ue(width // 16 - 1)
+    w.ue(-(-height // 16) - 1)
+    w.u(1, 1)  # frame_mbs_only_flag
+    w.u(1, 1)  # direct_8x8_inference_flag
+    crop_bottom = (-(-height // 16) * 16 - height) // 2
+    w.u(1, bool(crop_bottom))
+    if crop_bottom:
+        for val in (0, 0, 0, crop_bottom):
+            w.ue(val)
+    w.u(1, 1)  # vui_parameters_present_flag
+    w.u(4, 0)  # aspect ratio, overscan, video signal and chroma location info
+    w.u(1, 1)  # timing_info_present_flag
+    w.u(32, num_units_in_tick)
+    w.u(32, time_scale)
+    w.u(1, 1)  # fixed_frame_rate_flag
+    return b"\x67" + w.bytes()
+
+
+def _box(typ: bytes, *payload: bytes) -> bytes:
+    body = b"".join(payload)
+    return struct.pack(">I4s", 8 + len(body), typ) + body
+
+
+def _mp4(width: int, height: int, timescale: int, delta: int, frames: int) -> bytes:
+    hdlr = _box(b"hdlr", b"\0" * 8, b"vide", b"\0" * 12)
+    mdhd = _box(b"mdhd", b"\0" * 12, struct.pack(">II", timescale, delta * frames), b"\0" * 4)
+    entry = _box(b"avc1", b"\0" * 24, struct.pack(">HH", width, height), b"\0" * 50)
+    stsd = _box(b"stsd", struct.pack(">II", 0, 1), entry)
+    stts = _box(b"stts", struct.pack(">IIII", 0, 1, frames, delta))
+    trak = _box(b"trak", _box(b"mdia", mdhd, hdlr, _box(b"minf", _box(b"stbl", stsd, stts))))
+    return _box(b"ftyp", b"isom\0\0\0\0") + _box(b"moov", trak) + _box(b"mdat", b"\0" * 1024)
+
+
+def _ebml(eid: int, *payload: bytes) -> bytes:
+    body = b"".join(payload)
+    assert len(body) < 0x3FFF
+    return eid.to_bytes((eid.bit_length() + 7) // 8, "big") + (0x4000 | len(body)).to_bytes(2, "big") + body
+
+
+def _mkv(codec_id: str, width: int, height: int, fps: int) -> bytes:
+    header = _ebml(0x1A45DFA3, _ebml(0x4282, b"webm"))
+    video = _ebml(0xE0, _ebml(0xB0, width.to_bytes(2, "big")), _ebml(0xBA, height.to_bytes(2, "big")))
+    track = _ebml(
+        0xAE,
+        _ebml(0x83, b"\x01"),
+        _ebml(0x86, codec_id.encode()),
+        _ebml(0x23E383, (10**9 // fps).to_bytes(4, "big")),
+        video,
+    )
+    return header + _ebml(0x18538067, _ebml(0x1654AE6B, track), _ebml(0x1F43B675, b"\0" * 16))
+
+
+def _ts_packet(pid: int, payload: bytes, pusi: bool = False) -> bytes:
+    header = bytes([0x47, (0x40 if pusi else 0) | pid >> 8, pid & 0xFF, 0x10])
+    return (header + payload).ljust(188, b"\xff")
+
+
+def _psi(table: bytes) -> bytes:
+    # pointer field, then the section with its length covering the table and CRC
+    return b"\0" + table[:1] + struct.pack(">H", 0xB000 | len(table) - 3 + 4 + 2) + table[3:] + b"\0" * 4
+
+
+def _ts(sps: bytes, stream_type: int = 0x1B, null_packets: int = 0) -> bytes:
+    pat = _psi(b"\x00\0\0" + struct.pack(">HBBBHH", 1, 0xC1, 0, 0, 1, 0xE000 | 0x1000))
+    pmt = _psi(
+        b"\x02\0\0"
+        + struct.pack(">HBBBHH", 1, 0xC1, 0, 0, 0xE100, 0xF000)
+        + struct.pack(">BHH", stream_type, 0xE000 | 0x100, 0xF000)
+    )
+    pes = b"\x00\x00\x01\xe0\x00\x00\x80\x00\x00"
+    video = _ts_packet(0x100, pes + b"\x00\x00\x01" + sps + b"\x00\x00\x01\x68\xce", pusi=True)
+    nulls = _ts_packet(0x1FFF, b"") * null_packets
+    return _ts_packet(0, pat, pusi=True) + _ts_packet(0x1000, pmt, pusi=True) + nulls + video
+
+
+@pytest.fixture
+def container(tmp_path):
+    """Writes a synthetic container file and returns its path"""
+
+    def write(name: str, data: bytes) -> str:
+        path = tmp_path / name
+        path.write_bytes(data)
+        return str(path)
+
+    return write
+
+
+def test_mp4(container):
+    result = probe_container(container("clip.mp4", _mp4(1280, 720, 30000, 1001, 300)))
+    assert result[:4] == ("mp4", "h264", 1280, 720)
+    assert result.fps == pytest.approx(29.97, abs=0.01)
+    assert result.demux_elems() == ["qtdemux", "name=demux", "demux.video_0"]
+
+
+def test_mkv(container):
+    result = probe_container(container("clip.webm", _mkv("V_AV1", 640, 360, 25)))
+    assert result[:4] == ("mkv", "av1", 640, 360)
+    assert result.fps == pytest.approx(25)
+
+
+def test_ts_reads_resolution_from_sps(container):
+    result = probe_container(container("clip.ts", _ts(_h264_sps(1920, 1080, 60000, 1001))))
+    assert result[:4] == ("ts", "h264", 1920, 1080)
+    assert result.fps == pytest.approx(29.97, abs=0.01)
+
+
+def test_ts_scan_stops_at_limit(container):
+    late = _ts(_h264_sps(640, 480, 50, 1), null_packets=TS_SCAN_LIMIT // 188)
+    result = probe_container(container("late.ts", late))
+    assert result[:4] == ("ts", "h264", None, None)
+
+
+def test_ts_h265_codec_from_pmt(container):
+    result = probe_container(container("clip.ts", _ts(b"", stream_type=0x24)))
+    assert result[:2] == ("ts", "h265")
+
+
+def test_unknown_and_empty_files(container):
+    assert probe_container(container("empty.mp4", b"")) is None
+    assert probe_container(container("noise.bin", bytes(range(256)) * 4)) is None
+    assert probe_container(container("missing.mp4", b"") + ".gone") is None
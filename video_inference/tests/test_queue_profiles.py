@@ -0,0 +1,32 @@
+from typing import Any
+
+from gst.queues import QUEUE_DEBUG
+from utils.common import InputType
+
+
+CAMERA: dict[str, Any] = {"inp_type": InputType.CAMERA, "inp_src": "/dev/video0"}
+FILE: dict[str, Any] = {"inp_type": InputType.FILE, "inp_src": "/nonexistent.mp4", "codec_elems": ("h264parse", "avdec_h264")}
+
+
+def test_default_profile_doesnt_drop_or_cap(make_generator):
+    for source in (CAMERA, FILE):
+        gen = make_generator(**source)
+        pipeline = str(gen.pipeline)
+        assert "leaky=downstream" not in pipeline
+        assert "videorate" not in pipeline
+        assert not gen.drop_counter.queues
+
+
+def test_profile_cap_only_applies_to_live_sources(make_generator):
+    assert "max-rate=30" in str(make_generator(**CAMERA, queue_profile="balanced").pipeline)
+    assert "videorate" not in str(make_generator(**FILE, queue_profile="balanced").pipeline)
+    assert "max-rate=24" in str(make_generator(**FILE, queue_profile="balanced", max_fps=24).pipeline)
+    assert "videorate" not in str(make_generator(**CAMERA, queue_profile="balanced", max_fps=0).pipeline)
+
+
+def test_queue_log_only_parsed_when_drops_are_counted(make_generator):
+    gen = make_generator(**CAMERA, queue_profile="balanced")
+    assert gen.drop_counter.queues
+    assert QUEUE_DEBUG not in gen.pipeline._log_debug
+    assert gen.count_drops() is gen.drop_counter
+    assert QUEUE_DEBUG in gen.pipeline._log_debug
@@ -0,0 +1,73 @@
+import shutil
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from gst.rtsp import DEFAULT_RTSP_PROFILE, RTSP_PROFILES, rtsp_src_elems
+from utils.rtsp_server import GstRtspServer
+
+
+def test_default_profile_keeps_rtspsrc_transports():
+    # only the jitterbuffer size is set, rtspsrc picks UDP and falls back to TCP
+    assert RTSP_PROFILES[DEFAULT_RTSP_PROFILE].props == ["latency=2000"]
+
+
+def test_profiles_set_transport_and_buffering():
+    assert RTSP_PROFILES["robust"].props == [
+        "latency=2000", "protocols=tcp", "drop-on-latency=false", "buffer-mode=slave"
+    ]
+    assert RTSP_PROFILES["low-latency"].props == [
+        "latency=200", "protocols=udp", "drop-on-latency=true", "buffer-mode=none"
+    ]
+
+
+@pytest.mark.parametrize("codec", ["av1", "h264", "h265"])
+def test_source_elems_follow_codec(codec):
+    elems = rtsp_src_elems("rtsp://127.0.0.1/test", codec, ("parse", "dec"), 640, 480, name="cam")
+    assert elems[0][:3] == ["rtspsrc", "name=cam", 'location="rtsp://127.0.0.1/test"']
+    assert elems[1][0] == f"rtp{codec}depay" and elems[1][-1] == "name=cam_depay"
+    assert elems[2] == f"video/x-{codec},width=640,height=480"
+    assert elems[3:] == ["parse", "dec"]
+
+
+def test_invalid_profile_is_fatal():
+    with pytest.raises(SystemExit):
+        rtsp_src_elems("rtsp://127.0.0.1/test", "h264", ("h264parse", "avdec_h264"), profile="fast")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def rtsp_server():
+    """A stand-in H.264 test stream served by `utils.rtsp_server`"""
+    if GstRtspServer is None or not shutil.which("gst-launch-1.0"):
+        pytest.skip("requires GStreamer and the RTSP server bindings")
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "utils.rtsp_server", "--codec", "h264", "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    time.sleep(1)
+    yield f"rtsp://127.0.0.1:{port}/test"
+    server.terminate()
+    server.wait()
+
+
+@pytest.mark.parametrize("profile", list(RTSP_PROFILES))
+def test_profiles_receive_stand_in_stream(rtsp_server, profile):
+    elems = rtsp_src_elems(rtsp_server, "h264", ("h264parse", "avdec_h264"), profile=profile)
+    launch = [" ".join(e) if isinstance(e, list) else e for e in elems]
+    result = subprocess.run(
+        ["gst-launch-1.0", "-q", *" ! ".join([*launch, "fakesink num-buffers=30"]).split()],
+        capture_output=True,
+        timeout=30,
+    )
+    assert result.returncode == 0, result.stderr.decode()
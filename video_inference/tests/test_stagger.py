@@ -0,0 +1,23 @@
+from gst.pipeline import GstPipeline
+from gst.stagger import FrameStagger, stagger_offsets
+from utils.common import GstBackend
+
+
+def test_equal_intervals_are_spread_evenly():
+    assert stagger_offsets([2, 2]) == [0, 1]
+    assert stagger_offsets([3, 3, 3]) == [0, 1, 2]
+
+
+def test_offsets_avoid_shared_frames():
+    intervals = [2, 4]
+    offsets = stagger_offsets(intervals)
+    frames = [{f for f in range(8) if (f - o) % i == 0} for i, o in zip(intervals, offsets)]
+    assert not frames[0] & frames[1]
+
+
+def test_gst_launch_warns_once(capsys):
+    pipeline = GstPipeline(backend=GstBackend.SUBPROCESS, display=False, preflight=False)
+    FrameStagger([2, 2]).attach(pipeline, ["q_infer", "q_infer1"], ["infer", "infer1"])
+    for handler in pipeline._spawn_handlers * 2:
+        handler(1234)
+    assert capsys.readouterr().out.count("aren't staggered") == 1
@@ -0,0 +1,67 @@
+import os
+import stat
+
+from gst.pipeline import GstPipeline
+from gst.supervisor import Backoff, RtspSupervisor
+from utils.common import GstBackend
+
+
+def _fake_gst_launch(tmp_path, monkeypatch, script: str) -> None:
+    """Puts a stand-in `gst-launch-1.0` running `script` first on the PATH"""
+    exe = tmp_path / "gst-launch-1.0"
+    exe.write_text(f"#!/bin/sh\necho run >> {tmp_path / 'runs'}\n{script}\n")
+    exe.chmod(exe.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+
+
+def _runs(tmp_path) -> int:
+    runs = tmp_path / "runs"
+    return len(runs.read_text().splitlines()) if runs.exists() else 0
+
+
+def _supervise(**kwargs) -> tuple[RtspSupervisor, list[str]]:
+    pipeline = GstPipeline(backend=GstBackend.SUBPROCESS, display=False, preflight=False)
+    pipeline.add_elements(["rtspsrc", "name=cam", 'location="rtsp://127.0.0.1/test"'])
+    pipeline.add_elements(["rtph264depay", "name=cam_depay"], "fakesink")
+    logs: list[str] = []
+    supervisor = RtspSupervisor(
+        pipeline, ["cam"], backoff=Backoff(0.0, 0.0), settle=60.0, log=logs.append, **kwargs
+    )
+    return supervisor, logs
+
+
+def test_backoff_is_capped_and_jittered():
+    backoff = Backoff(initial=1.0, maximum=4.0, factor=2.0)
+    for attempt, ceiling in enumerate([1.0, 2.0, 4.0, 4.0, 4.0]):
+        assert ceiling / 2 <= backoff.delay(attempt) <= ceiling
+
+
+def test_parse_errors_are_not_retried(tmp_path, monkeypatch):
+    _fake_gst_launch(
+        tmp_path, monkeypatch, 'echo "WARNING: erroneous pipeline: no element \\"rtspsrc\\"" >&2; exit 1'
+    )
+    supervisor, logs = _supervise()
+    assert supervisor.run("") is False
+    assert _runs(tmp_path) == 1
+    assert supervisor.stats.outages == 0
+    assert "invalid" in logs[-1]
+
+
+def test_preflight_failures_are_not_retried(tmp_path, monkeypatch):
+    _fake_gst_launch(tmp_path, monkeypatch, "exit 0")
+    supervisor, _ = _supervise()
+    supervisor._pipeline._preflight = True
+    monkeypatch.setattr(GstPipeline, "check", lambda self, registry=None: ["no element rtspsrc"])
+    assert supervisor.run("") is False
+    assert _runs(tmp_path) == 0
+
+
+def test_every_failed_reconnect_reports_its_error(tmp_path, monkeypatch, capsys):
+    _fake_gst_launch(tmp_path, monkeypatch, 'echo "ERROR: Could not connect to server" >&2; exit 1')
+    supervisor, logs = _supervise(max_reconnects=2)
+    assert supervisor.run("") is False
+    # the first run and 2 failed reconnects
+    assert _runs(tmp_path) == 3
+    assert capsys.readouterr().out.count("Could not connect to server") == 3
+    assert supervisor.stats.outages == 1 and supervisor.stats.reconnects == 2
+    assert "giving up" in logs[-1]
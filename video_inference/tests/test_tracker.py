@@ -0,0 +1,80 @@
+import json
+
+import numpy as np
+import pytest
+
+from gst.timing import StageTimer
+from gst.tracker import BoxTracker, encode_tracks, iou_matrix
+
+
+def test_iou_matrix():
+    a = np.array([[0, 0, 10, 10], [20, 20, 10, 10]], dtype=float)
+    b = np.array([[0, 0, 10, 10], [5, 0, 10, 10], [100, 100, 5, 5]], dtype=float)
+    iou = iou_matrix(a, b)
+    assert iou.shape == (2, 3)
+    np.testing.assert_allclose(iou[0], [1.0, 50 / 150, 0.0])
+    np.testing.assert_allclose(iou[1], [0.0, 0.0, 0.0])
+
+
+def test_tracks_keep_their_ids_and_follow_motion():
+    tracker = BoxTracker()
+    ids = None
+    # two boxes moving right at 100 px/s, detected every 0.1 s
+    for step in range(10):
+        t = step * 0.1
+        boxes = [[10 + 100 * t, 10, 20, 20], [200 + 100 * t, 100, 30, 30]]
+        got = tracker.update(t, boxes, [0, 1], [0.9, 0.8])
+        if ids is None:
+            ids = got.tolist()
+        assert got.tolist() == ids
+    tracks = tracker.predict(1.0)
+    assert sorted(tracks.ids.tolist()) == sorted(ids)
+    by_id = dict(zip(tracks.ids.tolist(), tracks.boxes.tolist()))
+    # extrapolated one interval past the last result
+    assert by_id[ids[0]][0] == pytest.approx(110, abs=3)
+    assert by_id[ids[1]][0] == pytest.approx(300, abs=3)
+
+
+def test_classes_are_never_matched_across():
+    tracker = BoxTracker()
+    first = tracker.update(0.0, [[0, 0, 10, 10]], [0], [0.9])
+    second = tracker.update(0.1, [[0, 0, 10, 10]], [1], [0.9])
+    assert first[0] != second[0]
+
+
+def test_missed_tracks_are_hidden_then_dropped():
+    tracker = BoxTracker(max_misses=1)
+    tracker.update(0.0, [[0, 0, 10, 10]], [0], [0.9])
+    tracker.update(0.1, np.zeros((0, 4)), [], [])
+    assert tracker.count == 1 and len(tracker.predict(0.1)) == 0
+    tracker.update(0.2, np.zeros((0, 4)), [], [])
+    assert tracker.count == 0
+
+
+def test_predicted_boxes_are_clipped_to_bounds():
+    tracker = BoxTracker(bounds=(100, 100))
+    tracker.update(0.0, [[90, 90, 20, 20]], [0], [0.9])
+    x, y, w, h = tracker.predict(0.0).boxes[0]
+    assert x + w <= 100 and y + h <= 100 and w >= 1 and h >= 1
+
+
+def test_encoded_tracks_keep_result_items():
+    tracker = BoxTracker()
+    item = {"class_index": 0, "landmarks": {"points": []}}
+    tracker.update(0.0, [[1.4, 2.6, 10, 10]], [0], [0.75], [item])
+    result = json.loads(encode_tracks(tracker.predict(0.0), {"type": "detection"}))
+    assert result["type"] == "detection"
+    (out,) = result["items"]
+    assert out["track_id"] == 1 and out["landmarks"] == {"points": []}
+    assert out["bounding_box"] == {"origin": {"x": 1, "y": 3}, "size": {"x": 10, "y": 10}}
+
+
+def test_stage_timer_stats():
+    timer = StageTimer()
+    for ms in range(1, 101):
+        timer.record(ms / 1000)
+    stats = timer.stats
+    assert stats["count"] == 100
+    assert stats["mean_ms"] == pytest.approx(50.5)
+    assert stats["p95_ms"] == pytest.approx(95)
+    assert stats["max_ms"] == pytest.approx(100)
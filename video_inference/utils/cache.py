@@ -0,0 +1,169 @@
+from os import environ
+from pathlib import Path
+from threading import Lock
+from typing import Any, Optional
+# not imported lazily: warm starts read their cache entries, so every start needs it
+import json
+import os
+import time
+
+from utils.common import InputType
+
+# directory for on-disk caches, follows the XDG base directory spec
+CACHE_DIR = Path(environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "synap-examples"
+
+# how long a successful input validation is trusted, in seconds
+VAL_CACHE_TTL: dict[InputType, float] = {
+    InputType.CAMERA: 60 * 60,
+    InputType.FILE: 30 * 24 * 60 * 60,
+    InputType.RTSP: 5 * 60,
+}
+
+
+class JsonCache:
+    """
+    A small key-value cache persisted as a JSON file.
+
+    Writes merge with the file on disk so several demos can share a cache, and are atomic
+    so a crashed writer never leaves a corrupt file behind. Failing to read or write the
+    cache is never fatal, the cache just behaves as if it was empty.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self._path: Path = Path(path)
+        self._lock = Lock()
+        self._data: Optional[dict[str, Any]] = None
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def _read(self) -> dict[str, Any]:
+        try:
+            with open(self._path, "r") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, data: dict[str, Any]) -> None:
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self._path.with_name(f".{self._path.name}.{os.getpid()}.tmp")
+            with open(tmp, "w") as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+            os.replace(tmp, self._path)
+        except OSError:
+            pass
+
+    def _prune(self, data: dict[str, Any]) -> None:
+        """
+        Hook to drop stale entries before the cache is written.
+        """
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if self._data is None:
+                self._data = self._read()
+            return self._data.get(key)
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data = self._read()
+            self._data[key] = value
+            self._prune(self._data)
+            self._write(self._data)
+
+    def put_many(self, entries: dict[str, Any]) -> None:
+        """
+        Stores several entries with a single write.
+        """
+        with self._lock:
+            self._data = self._read()
+            self._data.update(entries)
+            self._prune(self._data)
+            self._write(self._data)
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            self._data = self._read()
+            if self._data.pop(key, None) is not None:
+                self._write(self._data)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data = {}
+            self._write(self._data)
+
+
+class ValidationCache(JsonCache):
+    """
+    Caches successful input validations.
+
+    Entries are keyed by input type, source, codec and dimensions. File entries also
+    include the file size and mtime and camera entries the device node's ctime, which
+    changes when the camera is replugged. Entries expire after the TTL for their input
+    type (see `VAL_CACHE_TTL`).
+    """
+
+    def __init__(
+        self,
+        path: Path = CACHE_DIR / "validation.json",
+        ttl: Optional[dict[InputType, float]] = None,
+    ) -> None:
+        super().__init__(path)
+        self._ttl: dict[InputType, float] = {**VAL_CACHE_TTL, **(ttl or {})}
+
+    @staticmethod
+    def _source_stamp(inp_type: InputType, inp_src: str) -> Optional[str]:
+        try:
+            if inp_type == InputType.FILE:
+                st = os.stat(inp_src)
+                return f"{st.st_size}:{st.st_mtime_ns}"
+            if inp_type == InputType.CAMERA:
+                return str(os.stat(inp_src).st_ctime_ns)
+        except OSError:
+            return None
+        return ""
+
+    @classmethod
+    def make_key(
+        cls,
+        inp_type: InputType,
+        inp_src: str,
+        inp_codec: Optional[str] = None,
+        inp_w: Optional[int] = None,
+        inp_h: Optional[int] = None,
+        *extra: Any,
+    ) -> Optional[str]:
+        """
+        Returns the cache key for an input, or None if the input can't be cached
+        (e.g. a file or camera that doesn't exist).
+        """
+        if (stamp := cls._source_stamp(inp_type, inp_src)) is None:
+            return None
+        return json.dumps(
+            [inp_type.name, inp_src, stamp, inp_codec, inp_w, inp_h, *extra]
+        )
+
+    def _prune(self, data: dict[str, Any]) -> None:
+        now = time.time()
+        for key in [k for k, v in data.items() if v.get("expires", 0) <= now]:
+            del data[key]
+
+    def is_valid(self, key: Optional[str]) -> bool:
+        """
+        Checks if a cached successful validation exists and hasn't expired.
+        """
+        if key is None or not (entry := self.get(key)):
+            return False
+        return entry.get("expires", 0) > time.time()
+
+    def record(self, key: Optional[str], inp_type: InputType) -> None:
+        """
+        Records a successful validation.
+        """
+        if key is None:
+            return
+        now = time.time()
+        self.put(key, {"validated": now, "expires": now + self._ttl[inp_type]})
@@ -1,21 +1,164 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Optional
+import fcntl
+import os
+import re
+import struct
+
 from gst.validator import GstInputValidator
+from utils.cache import ValidationCache
 from utils.common import InputType, CAM_DEV_PREFIX, CAM_DEFAULT_WIDTH, CAM_DEFAULT_HEIGHT
 
+# sysfs class directory listing all V4L2 device nodes
+V4L2_SYSFS_ROOT = "/sys/class/video4linux"
+
+# VIDIOC_QUERYCAP ioctl and the capability bits used to identify capture devices
+_VIDIOC_QUERYCAP = 0x80685600
+_V4L2_CAPABILITY_FMT = "16s32s32sIII3I"
+_V4L2_CAP_VIDEO_CAPTURE = 0x00000001
+_V4L2_CAP_VIDEO_CAPTURE_MPLANE = 0x00001000
+_V4L2_CAP_VIDEO_M2M_MPLANE = 0x00004000
+_V4L2_CAP_VIDEO_M2M = 0x00008000
+_V4L2_CAP_DEVICE_CAPS = 0x80000000
+
+# names of memory-to-memory codec nodes, used when device caps can't be queried
+_M2M_NAME_RE = re.compile(r"dec|enc|codec|m2m|isp|scaler", re.IGNORECASE)
+
+
+def _query_device_caps(dev: str) -> Optional[int]:
+    """
+    Returns the V4L2 device capabilities of `dev`, or None if the device can't be queried.
+    """
+    try:
+        fd = os.open(dev, os.O_RDWR | os.O_NONBLOCK)
+    except OSError:
+        return None
+    try:
+        buf = bytearray(struct.calcsize(_V4L2_CAPABILITY_FMT))
+        fcntl.ioctl(fd, _VIDIOC_QUERYCAP, buf)
+        caps, device_caps = struct.unpack(_V4L2_CAPABILITY_FMT, buf)[4:6]
+        return device_caps if caps & _V4L2_CAP_DEVICE_CAPS else caps
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+
+def _is_capture_node(node: Path, dev: str) -> bool:
+    """
+    Checks if a video4linux sysfs node is a capture device.
+
+    Uses the device capabilities when the device node can be queried, otherwise falls back
+    to the sysfs attributes: metadata nodes have a non-zero index and codec nodes are
+    identified by name.
+    """
+    caps = _query_device_caps(dev)
+    if caps is not None:
+        if caps & (_V4L2_CAP_VIDEO_M2M | _V4L2_CAP_VIDEO_M2M_MPLANE):
+            return False
+        return bool(caps & (_V4L2_CAP_VIDEO_CAPTURE | _V4L2_CAP_VIDEO_CAPTURE_MPLANE))
+    try:
+        if int((node / "index").read_text().strip() or 0) != 0:
+            return False
+    except (OSError, ValueError):
+        pass
+    try:
+        name = (node / "name").read_text().strip()
+    except OSError:
+        name = ""
+    return not _M2M_NAME_RE.search(name)
+
+
+def list_capture_devices(sysfs_root: str = V4L2_SYSFS_ROOT, dev_prefix: str = CAM_DEV_PREFIX) -> list[str]:
+    """
+    Lists capture-capable V4L2 devices by enumerating `sysfs_root`.
+
+    The device node of sysfs entry "videoN" is `dev_prefix` + N, it is opened to query the
+    device capabilities. A fake `sysfs_root` needs a matching `dev_prefix`, e.g. one where
+    no device nodes exist so only the sysfs attributes are used.
+
+    Devices are sorted by their minor number, so "/dev/video2" comes before "/dev/video10".
+    """
+    root = Path(sysfs_root)
+    if not root.is_dir():
+        return []
+    nodes: list[tuple[int, Path]] = []
+    for node in root.iterdir():
+        if not (m := re.fullmatch(r"video(\d+)", node.name)):
+            continue
+        nodes.append((int(m.group(1)), node))
+    return [
+        dev_prefix + str(num)
+        for num, node in sorted(nodes)
+        if _is_capture_node(node, dev_prefix + str(num))
+    ]
+
 
 def find_valid_camera_devices(
     inp_w: int = CAM_DEFAULT_WIDTH,
     inp_h: int = CAM_DEFAULT_HEIGHT,
+    *,
+    first_only: bool = False,
+    max_workers: int = 4,
+    sysfs_root: str = V4L2_SYSFS_ROOT,
+    dev_prefix: str = CAM_DEV_PREFIX,
+    validator: Optional[Callable[[str], bool]] = None,
+    use_cache: bool = True,
+    refresh_cache: bool = False,
 ) -> list[str]:
     """
-    Attempts to find a connected camera.
+    Attempts to find connected cameras.
+
+    Candidates are enumerated from sysfs and probed concurrently.
+
+    Args:
+        inp_w (int): width to validate camera with
+        inp_h (int): height to validate camera with
+        first_only (bool): return as soon as one valid camera is found
+        max_workers (int): maximum number of cameras probed at the same time
+        sysfs_root (str): video4linux sysfs class directory to enumerate
+        dev_prefix (str): prefix of the device nodes, see `list_capture_devices`
+        validator (Callable[[str], bool]): [Optional] replaces the GStreamer validation pipeline
+        use_cache (bool): skip cameras that passed validation recently
+        refresh_cache (bool): validate all cameras and refresh their cache entries
 
-    Only works for devices with format "dev/videoX".
+    Returns:
+        list[str]: valid camera devices, sorted by device number
     """
     if not inp_w > 0 or not inp_h > 0:
         raise ValueError("Invalid camera input dimensions")
-    val = GstInputValidator(inp_type=InputType.CAMERA, verbose=0)
+    candidates: list[str] = list_capture_devices(sysfs_root, dev_prefix)
+    if not candidates:
+        return []
+    cache: Optional[ValidationCache] = ValidationCache() if use_cache else None
+
+    def validate(dev: str) -> bool:
+        if validator:
+            return validator(dev)
+        # validators keep per-run pipeline state, so each probe gets its own
+        val = GstInputValidator(
+            inp_type=InputType.CAMERA,
+            verbose=0,
+            use_cache=use_cache,
+            refresh_cache=refresh_cache,
+            cache=cache,
+        )
+        return val.validate_input(dev, "", inp_w=inp_w, inp_h=inp_h)
+
     valid_devs: list[str] = []
-    for i in range(10):
-        if val.validate_input(CAM_DEV_PREFIX + str(i), "", inp_w=inp_w, inp_h=inp_h):
-            valid_devs.append(CAM_DEV_PREFIX + str(i))
-    return valid_devs
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(candidates))))
+    try:
+        pending = {pool.submit(validate, dev): dev for dev in candidates}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                dev = pending.pop(fut)
+                if fut.result():
+                    valid_devs.append(dev)
+            if first_only and valid_devs:
+                break
+    finally:
+        # probes that are still running finish in the background
+        pool.shutdown(wait=not first_only, cancel_futures=True)
+    return sorted(valid_devs, key=lambda d: int(d[len(dev_prefix):]))
@@ -8,6 +8,7 @@ INF_META_FILE: Final = "0/model.json"
 CAM_DEV_PREFIX = "/dev/video"
 CAM_DEFAULT_WIDTH = 640
 CAM_DEFAULT_HEIGHT = 480
+CAM_FRAMERATE = 30
 
 # video codecs
 CODECS: dict[str, tuple[str, str]] = {
@@ -16,8 +17,57 @@ CODECS: dict[str, tuple[str, str]] = {
     "h265": ("h265parse", "avdec_h265"),
 }
 
+# RTP depayloaders of the video codecs, used for RTSP streams
+RTP_DEPAYLOADERS: dict[str, tuple[str, ...]] = {
+    "av1": ("rtpav1depay",),
+    "h264": ("rtph264depay", "wait-for-keyframe=true"),
+    "h265": ("rtph265depay",),
+}
+
+# container demuxers and their video pad ("" links any compatible pad)
+DEMUXERS: dict[str, tuple[str, str]] = {
+    "mp4": ("qtdemux", "video_0"),
+    "mkv": ("matroskademux", "video_0"),
+    "ts": ("tsdemux", ""),
+}
+
+# H.264 encoder used by the file and UDP output sinks
+H264_ENC_ELEMS: tuple[str, ...] = ("v4l2h264enc", "h264parse")
+
+# file muxers by file extension, used by the file output sink
+MUXERS: dict[str, str] = {
+    ".mkv": "matroskamux",
+    ".mp4": "mp4mux",
+    ".ts": "mpegtsmux",
+}
+
+# rate at which the snapshot sink saves frames
+SNAPSHOT_FRAMERATE = "1/1"
+
 
 class InputType(Enum):
     CAMERA = auto()
     FILE = auto()
     RTSP = auto()
+
+
+class SinkType(Enum):
+    DISPLAY = auto()
+    FAKESINK = auto()
+    FILE = auto()
+    UDP = auto()
+    SNAPSHOT = auto()
+
+
+class GstBackend(Enum):
+    AUTO = auto()
+    SUBPROCESS = auto()
+    INPROCESS = auto()
+
+
+# default locations of the output sinks: file path, host:port and file name pattern
+SINK_DEFAULT_LOCATIONS: dict[SinkType, str] = {
+    SinkType.FILE: "output.mkv",
+    SinkType.UDP: "127.0.0.1:5000",
+    SinkType.SNAPSHOT: "snapshot_%05d.jpg",
+}
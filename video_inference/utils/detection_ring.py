@@ -0,0 +1,264 @@
+"""
+Read the detections published by a running pipeline from shared memory.
+"""
+
+from pathlib import Path
+from typing import Any, Iterable, NamedTuple, Optional
+import argparse
+import mmap
+import os
+import struct
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+__all__ = [
+    "Detection",
+    "DetectionRingReader",
+    "DetectionRingWriter",
+    "DEFAULT_RING_NAME",
+    "RECORD_DTYPE",
+]
+
+# shared memory objects are files in this directory
+SHM_DIR = "/dev/shm"
+DEFAULT_RING_NAME = "synap_detections"
+DEFAULT_RING_CAPACITY = 4096
+
+# header: magic, version, record size, capacity, head (records written so far), padded to 64 bytes
+_MAGIC = b"SYNDET01"
+_VERSION = 1
+_HEADER = struct.Struct("<8sIIQQ")
+_HEADER_SIZE = 64
+_HEAD_OFFSET = 24
+
+# record: seq, pts, frame, count, index, class_id, score, x, y, w, h
+_RECORD = struct.Struct("<QQIHHif4f")
+_SEQ = struct.Struct("<Q")
+
+# the same layout as a NumPy structured dtype
+RECORD_DTYPE = (
+    np.dtype(
+        [
+            ("seq", "<u8"),  # record number + 1 once the record is complete, 0 while it's written
+            ("pts", "<u8"),  # buffer PTS in ns, 2**64 - 1 if unknown
+            ("frame", "<u4"),  # frame counter
+            ("count", "<u2"),  # detections in the frame, 0 for a frame without detections
+            ("index", "<u2"),  # index of the detection within its frame
+            ("class_id", "<i4"),  # -1 for a frame without detections
+            ("score", "<f4"),
+            ("x", "<f4"),
+            ("y", "<f4"),
+            ("w", "<f4"),
+            ("h", "<f4"),
+        ]
+    )
+    if np
+    else None
+)
+
+
+class Detection(NamedTuple):
+    class_id: int
+    score: float
+    x: float
+    y: float
+    w: float
+    h: float
+
+
+def _shm_path(name: str) -> Path:
+    return Path(SHM_DIR) / name
+
+
+class DetectionRingWriter:
+    """
+    Publishes detections to a fixed-size ring buffer in shared memory.
+
+    There is a single writer and any number of readers. Readers never write to the ring,
+    so they can't slow the writer down: each record carries a sequence number that is
+    cleared while the record is written and set once it is complete, and readers drop
+    records whose sequence number changed while they were read.
+    """
+
+    def __init__(self, name: str = DEFAULT_RING_NAME, capacity: int = DEFAULT_RING_CAPACITY) -> None:
+        self._path = _shm_path(name)
+        self._capacity = capacity
+        size = _HEADER_SIZE + capacity * _RECORD.size
+        # a new ring is renamed over an existing one, truncating the file instead would make
+        # readers that still map it fault
+        tmp = self._path.with_name(f".{self._path.name}.{os.getpid()}")
+        fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            self._mm = mmap.mmap(fd, size)
+            _HEADER.pack_into(self._mm, 0, _MAGIC, _VERSION, _RECORD.size, capacity, 0)
+            os.replace(tmp, self._path)
+        except OSError:
+            tmp.unlink(missing_ok=True)
+            raise
+        finally:
+            os.close(fd)
+        self._head: int = 0
+        self._frame: int = 0
+
+    def __enter__(self) -> "DetectionRingWriter":
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()
+
+    def _write(self, pts: int, count: int, index: int, det: Optional[Detection]) -> None:
+        offset = _HEADER_SIZE + (self._head % self._capacity) * _RECORD.size
+        class_id, score, x, y, w, h = det if det else (-1, 0.0, 0.0, 0.0, 0.0, 0.0)
+        _RECORD.pack_into(
+            self._mm, offset, 0, pts, self._frame & 0xFFFFFFFF, count, index, class_id, score, x, y, w, h
+        )
+        # the sequence number is written last, it marks the record as complete
+        self._head += 1
+        _SEQ.pack_into(self._mm, offset, self._head)
+        _SEQ.pack_into(self._mm, _HEAD_OFFSET, self._head)
+
+    def publish(self, pts: int, detections: Iterable[Detection]) -> None:
+        """
+        Publishes the detections of one frame.
+
+        A frame without detections is published as a single record with a class id of -1,
+        so readers can tell it apart from a frame that hasn't been processed.
+        """
+        detections = list(detections)[:0xFFFF]
+        if not detections:
+            self._write(pts, 0, 0, None)
+        for i, det in enumerate(detections):
+            self._write(pts, len(detections), i, det)
+        self._frame += 1
+
+    def close(self, unlink: bool = True) -> None:
+        self._mm.close()
+        if unlink:
+            self._path.unlink(missing_ok=True)
+
+
+class DetectionRingReader:
+    """
+    Reads the latest records of a detection ring buffer.
+
+    The ring is mapped read-only and wrapped in a NumPy structured array with
+    `RECORD_DTYPE`, so `views()` returns zero-copy views of the shared memory.
+    """
+
+    def __init__(self, name: str = DEFAULT_RING_NAME) -> None:
+        if np is None:
+            raise RuntimeError("NumPy is required to read detections")
+        with open(_shm_path(name), "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ)
+        magic, version, record_size, capacity, _ = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or version != _VERSION or record_size != RECORD_DTYPE.itemsize:
+            self._mm.close()
+            raise ValueError(f"{name} is not a detection ring buffer")
+        self._capacity: int = capacity
+        self._head = np.frombuffer(self._mm, dtype="<u8", count=1, offset=_HEAD_OFFSET)
+        self._records = np.frombuffer(self._mm, dtype=RECORD_DTYPE, count=capacity, offset=_HEADER_SIZE)
+
+    def __enter__(self) -> "DetectionRingReader":
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()
+
+    @property
+    def head(self) -> int:
+        """Number of records written so far"""
+        return int(self._head[0])
+
+    def views(self, n: int) -> tuple["np.ndarray", ...]:
+        """
+        Returns zero-copy views of the latest `n` records, oldest first.
+
+        The records are in one view, or in two if they wrap around the end of the ring.
+        Views are live: the writer can overwrite them at any time, check `seq` or use
+        `latest()` for a consistent copy.
+        """
+        return self._views(n, self.head)
+
+    def _views(self, n: int, head: int) -> tuple["np.ndarray", ...]:
+        n = min(n, head, self._capacity)
+        start, end = (head - n) % self._capacity, head % self._capacity
+        if n == 0:
+            return (self._records[:0],)
+        if start < end or end == 0:
+            return (self._records[start : end or self._capacity],)
+        return self._records[start:], self._records[:end]
+
+    def latest(self, n: int) -> "np.ndarray":
+        """
+        Returns a copy of the latest `n` complete records, oldest first.
+
+        Records that were being written or were overwritten while they were copied are
+        left out.
+        """
+        head = self.head
+        views = self._views(n, head)
+        snapshot = np.concatenate(views) if len(views) > 1 else views[0].copy()
+        expected = np.arange(head - len(snapshot), head, dtype="<u8") + 1
+        live = np.concatenate([v["seq"] for v in views]) if len(views) > 1 else views[0]["seq"]
+        return snapshot[(snapshot["seq"] == expected) & (live == expected)]
+
+    def close(self) -> None:
+        self._head = self._records = None
+        try:
+            self._mm.close()
+        except BufferError:
+            # views handed out are still alive, the mapping is released with them
+            pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "name",
+        type=str,
+        nargs="?",
+        default=DEFAULT_RING_NAME,
+        help="Name of the ring buffer (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-n", "--num_records",
+        type=int,
+        default=10,
+        help="Number of records to print (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-f", "--follow",
+        action="store_true",
+        help="Keep printing new records",
+    )
+    args = parser.parse_args()
+
+    try:
+        reader = DetectionRingReader(args.name)
+    except FileNotFoundError:
+        raise SystemExit(f'Fatal: no detection ring buffer "{args.name}", is the pipeline running?')
+    with reader:
+        last = reader.head - args.num_records
+        try:
+            while True:
+                for rec in reader.latest(max(0, min(args.num_records, reader.head - last))):
+                    last = max(last, int(rec["seq"]))
+                    if rec["count"]:
+                        print(
+                            f"frame {rec['frame']} pts {rec['pts']}: class {rec['class_id']} "
+                            f"score {rec['score']:.2f} box ({rec['x']:.0f}, {rec['y']:.0f}, "
+                            f"{rec['w']:.0f}, {rec['h']:.0f})"
+                        )
+                    else:
+                        print(f"frame {rec['frame']} pts {rec['pts']}: no detections")
+                if not args.follow:
+                    break
+                time.sleep(0.1)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,239 @@
+"""
+Index SyNAP models: validate them with synap_cli and cache their metadata.
+"""
+
+from pathlib import Path
+from typing import Any, Optional
+import argparse
+import os
+import shutil
+import subprocess
+import time
+
+from utils.cache import CACHE_DIR, JsonCache
+from utils.common import INF_META_FILE
+
+
+__all__ = [
+    "ModelRegistry",
+    "read_model_metadata",
+    "INVALID_MODEL_TTL",
+]
+
+# how long a failed model validation is trusted, in seconds, failures can be transient
+# (e.g. the NPU is busy or the driver isn't loaded yet) so they are retried soon
+INVALID_MODEL_TTL: float = 5 * 60
+
+
+def read_model_metadata(model: str) -> dict[str, Any]:
+    """
+    Parses the metadata of a .synap model.
+
+    Returns:
+        dict: "inputs" and "outputs", each a list of tensors with their name, shape, format and dtype
+
+    Raises:
+        ValueError: if the model isn't a valid .synap archive or its metadata isn't valid JSON
+        FileNotFoundError: if the model or its metadata file is missing
+        KeyError: if the metadata is missing required fields
+    """
+    # only needed for models that aren't cached yet, they are imported on first use
+    import json
+    import zipfile
+
+    try:
+        with zipfile.ZipFile(model, "r") as mod_info:
+            if INF_META_FILE not in mod_info.namelist():
+                raise FileNotFoundError("Missing model metadata")
+            with mod_info.open(INF_META_FILE, "r") as meta_f:
+                metadata = json.load(meta_f)
+    except zipfile.BadZipFile as e:
+        raise ValueError(f"Not a .synap archive: {e}") from e
+
+    def tensors(section: str) -> list[dict[str, Any]]:
+        return [
+            {
+                "name": name,
+                "shape": info["shape"],
+                "format": info["format"],
+                "dtype": info.get("dtype"),
+            }
+            for name, info in metadata[section].items()
+        ]
+
+    return {"inputs": tensors("Inputs"), "outputs": tensors("Outputs")}
+
+
+def _hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    import hashlib
+
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _validator_stamp() -> str:
+    """
+    Identifies the installed synap_cli so validations are redone after a SyNAP upgrade.
+    """
+    if not (cli := shutil.which("synap_cli")):
+        return ""
+    st = os.stat(cli)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+class ModelRegistry(JsonCache):
+    """
+    Caches validation results and metadata of .synap models.
+
+    Models are fingerprinted by size, mtime and a content hash. The hash is only computed
+    when the size or mtime of a model changed, so a warm lookup is a single `stat()`.
+    Results are stored per content hash, which means a model that is copied or touched
+    without changing doesn't need to be validated again. Failed validations are only
+    trusted for `invalid_ttl` seconds.
+    """
+
+    def __init__(self, path: Path = CACHE_DIR / "models.json", invalid_ttl: float = INVALID_MODEL_TTL) -> None:
+        super().__init__(path)
+        self._invalid_ttl = invalid_ttl
+
+    def fingerprint(self, model: str) -> Optional[str]:
+        """
+        Returns the content hash of a model, or None if the model doesn't exist.
+        """
+        try:
+            path = os.path.realpath(model)
+            st = os.stat(path)
+        except OSError:
+            return None
+        stat = [st.st_size, st.st_mtime_ns]
+        entry = self.get("path:" + path)
+        if entry and entry.get("stat") == stat:
+            return entry["hash"]
+        digest = _hash_file(path)
+        self.put("path:" + path, {"stat": stat, "hash": digest})
+        return digest
+
+    def _entry(self, digest: str) -> dict[str, Any]:
+        return dict(self.get("hash:" + digest) or {})
+
+    def _update(self, digest: str, **fields: Any) -> None:
+        entry = self._entry(digest)
+        entry.update(fields, updated=time.time())
+        self.put("hash:" + digest, entry)
+
+    def validate(self, model: str, refresh: bool = False) -> tuple[bool, str, bool]:
+        """
+        Validates a model by running a random inference with synap_cli.
+
+        Args:
+            model (str): path to the .synap model
+            refresh (bool): ignore a cached result and validate again
+
+        Returns:
+            tuple[bool, str, bool]: whether the model is valid, the synap_cli error output
+            if it isn't, and whether the result came from the cache
+        """
+        if not (digest := self.fingerprint(model)):
+            return False, f"No such file: {model}", False
+        stamp = _validator_stamp()
+        entry = self._entry(digest)
+        if not refresh and "valid" in entry and entry.get("validator") == stamp:
+            if entry["valid"] or time.time() - entry.get("validated", 0) < self._invalid_ttl:
+                return entry["valid"], entry.get("error", ""), True
+        try:
+            # fmt: off
+            subprocess.run(
+                [
+                    "synap_cli",
+                    "-m", model,
+                    "random"
+                ],
+                check=True,
+                capture_output=True
+            )
+            # fmt: on
+            valid, error = True, ""
+        except subprocess.CalledProcessError as e:
+            valid, error = False, e.stderr.decode()
+        except FileNotFoundError:
+            # synap_cli isn't installed, don't cache anything
+            return False, "synap_cli not found", False
+        self._update(digest, valid=valid, error=error, validator=stamp, validated=time.time())
+        return valid, error, False
+
+    def metadata(self, model: str) -> dict[str, Any]:
+        """
+        Returns the parsed metadata of a model, see `read_model_metadata`.
+
+        Raises the same exceptions as `read_model_metadata` if the model can't be parsed.
+        """
+        if not (digest := self.fingerprint(model)):
+            raise FileNotFoundError(f"No such file: {model}")
+        if (meta := self._entry(digest).get("metadata")) is not None:
+            return meta
+        meta = read_model_metadata(model)
+        self._update(digest, metadata=meta)
+        return meta
+
+    def index(
+        self,
+        root: str,
+        max_workers: int = 4,
+        refresh: bool = False,
+    ) -> dict[str, bool]:
+        """
+        Validates and parses every .synap model under `root` in parallel.
+
+        Returns:
+            dict[str, bool]: model paths mapped to whether they are valid
+        """
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        def index_model(model: str) -> bool:
+            valid = self.validate(model, refresh)[0]
+            if valid:
+                try:
+                    self.metadata(model)
+                except (ValueError, FileNotFoundError, KeyError):
+                    return False
+            return valid
+
+        models: list[str] = sorted(str(p) for p in Path(root).rglob("*.synap"))
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            return dict(zip(models, pool.map(index_model, models)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "root",
+        type=str,
+        nargs="?",
+        default="/usr/share/synap/models",
+        help="Directory to search for .synap models (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=4,
+        help="Number of models to index in parallel (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Validate models again even if a cached result exists",
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = ModelRegistry().index(args.root, args.jobs, args.refresh)
+    for model, valid in results.items():
+        print(f"{'OK     ' if valid else 'INVALID'} {model}")
+    print(
+        f"Indexed {len(results)} models ({sum(results.values())} valid) "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
@@ -0,0 +1,396 @@
+from functools import lru_cache
+from typing import Iterator, NamedTuple, Optional
+import mmap
+import os
+import struct
+
+from utils.common import DEMUXERS
+
+
+__all__ = [
+    "ProbeResult",
+    "demux_elems",
+    "probe_container",
+]
+
+# MPEG-TS bytes scanned for the PAT, the PMT and the video stream's SPS: 500 packets, ~94 KB.
+# Muxers repeat the tables every 100 ms or so and encoders put an SPS before every keyframe,
+# the first of which starts the clip, so all three are in the first few dozen packets; the
+# margin covers audio and other streams interleaved before the first video frame
+TS_SCAN_LIMIT = 500 * 188
+
+
+def demux_elems(container: str, name: str = "demux") -> list[str]:
+    """
+    Returns the GStreamer demuxer element for a container type, linked to its video pad.
+    """
+    demux, pad = DEMUXERS[container]
+    return [demux, f"name={name}", f"{name}.{pad}"]
+
+
+class ProbeResult(NamedTuple):
+    """Video stream information read from container headers"""
+
+    container: str
+    codec: Optional[str]
+    width: Optional[int]
+    height: Optional[int]
+    fps: Optional[float]
+
+    def demux_elems(self, name: str = "demux") -> list[str]:
+        """GStreamer demuxer element for the container, linked to its video pad"""
+        return demux_elems(self.container, name)
+
+
+class _BitReader:
+    """Reads bits and exp-Golomb codes from an H.264 RBSP"""
+
+    def __init__(self, data: bytes) -> None:
+        self._data = data
+        self._pos = 0
+
+    def u(self, n: int) -> int:
+        val = 0
+        for _ in range(n):
+            byte = self._data[self._pos >> 3]
+            val = (val << 1) | ((byte >> (7 - (self._pos & 7))) & 1)
+            self._pos += 1
+        return val
+
+    def ue(self) -> int:
+        zeros = 0
+        while self.u(1) == 0:
+            zeros += 1
+        return (1 << zeros) - 1 + self.u(zeros)
+
+    def se(self) -> int:
+        val = self.ue()
+        return (val + 1) // 2 if val & 1 else -(val // 2)
+
+
+def _parse_h264_sps(nal: bytes) -> tuple[int, int, Optional[float]]:
+    """
+    Parses width, height and (if signalled in the VUI) frame rate from an H.264 SPS NAL unit.
+    """
+    rbsp = nal[1:].replace(b"\x00\x00\x03", b"\x00\x00")
+    r = _BitReader(rbsp)
+    profile_idc = r.u(8)
+    r.u(16)  # constraint flags + level_idc
+    r.ue()  # seq_parameter_set_id
+    chroma_format_idc = 1
+    separate_colour_plane = 0
+    if profile_idc in (100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135):
+        chroma_format_idc = r.ue()
+        if chroma_format_idc == 3:
+            separate_colour_plane = r.u(1)
+        r.ue()  # bit_depth_luma_minus8
+        r.ue()  # bit_depth_chroma_minus8
+        r.u(1)  # qpprime_y_zero_transform_bypass_flag
+        if r.u(1):  # seq_scaling_matrix_present_flag
+            for i in range(8 if chroma_format_idc != 3 else 12):
+                if r.u(1):
+                    last, nxt = 8, 8
+                    for _ in range(16 if i < 6 else 64):
+                        if nxt:
+                            nxt = (last + r.se()) % 256
+                        last = nxt or last
+    r.ue()  # log2_max_frame_num_minus4
+    poc_type = r.ue()
+    if poc_type == 0:
+        r.ue()
+    elif poc_type == 1:
+        r.u(1)
+        r.se()
+        r.se()
+        for _ in range(r.ue()):
+            r.se()
+    r.ue()  # max_num_ref_frames
+    r.u(1)  # gaps_in_frame_num_value_allowed_flag
+    width_mbs = r.ue() + 1
+    height_map_units = r.ue() + 1
+    frame_mbs_only = r.u(1)
+    if not frame_mbs_only:
+        r.u(1)
+    r.u(1)  # direct_8x8_inference_flag
+    crop = (0, 0, 0, 0)
+    if r.u(1):
+        crop = (r.ue(), r.ue(), r.ue(), r.ue())
+    if chroma_format_idc == 0 or separate_colour_plane:
+        crop_x, crop_y = 1, 2 - frame_mbs_only
+    else:
+        crop_x = 1 if chroma_format_idc == 3 else 2
+        crop_y = (2 if chroma_format_idc == 1 else 1) * (2 - frame_mbs_only)
+    width = width_mbs * 16 - crop_x * (crop[0] + crop[1])
+    height = (2 - frame_mbs_only) * height_map_units * 16 - crop_y * (crop[2] + crop[3])
+    fps = None
+    try:
+        if r.u(1):  # vui_parameters_present_flag
+            if r.u(1) and r.u(8) == 255:  # aspect_ratio_info_present_flag
+                r.u(32)
+            if r.u(1):  # overscan_info_present_flag
+                r.u(1)
+            if r.u(1):  # video_signal_type_present_flag
+                r.u(4)
+                if r.u(1):
+                    r.u(24)
+            if r.u(1):  # chroma_loc_info_present_flag
+                r.ue()
+                r.ue()
+            if r.u(1):  # timing_info_present_flag
+                num_units_in_tick, time_scale = r.u(32), r.u(32)
+                if num_units_in_tick:
+                    fps = time_scale / (2 * num_units_in_tick)
+    except IndexError:
+        pass
+    return width, height, fps
+
+
+def _iter_boxes(buf: mmap.mmap, start: int, end: int) -> Iterator[tuple[bytes, int, int]]:
+    """
+    Yields (type, payload start, box end) of the ISO BMFF boxes between `start` and `end`.
+
+    Only box headers are read, so skipping over `mdat` doesn't touch the media data.
+    """
+    off = start
+    while off + 8 <= end:
+        size, typ = struct.unpack_from(">I4s", buf, off)
+        hdr = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", buf, off + 8)[0]
+            hdr = 16
+        elif size == 0:
+            size = end - off
+        if size < hdr:
+            return
+        yield typ, off + hdr, min(off + size, end)
+        off += size
+
+
+def _find_box(buf: mmap.mmap, start: int, end: int, typ: bytes) -> Optional[tuple[int, int]]:
+    for t, s, e in _iter_boxes(buf, start, end):
+        if t == typ:
+            return s, e
+    return None
+
+
+_MP4_CODECS: dict[bytes, str] = {
+    b"avc1": "h264",
+    b"avc3": "h264",
+    b"hvc1": "h265",
+    b"hev1": "h265",
+    b"av01": "av1",
+}
+
+
+def _probe_mp4(buf: mmap.mmap) -> Optional[ProbeResult]:
+    if not (moov := _find_box(buf, 0, len(buf), b"moov")):
+        return None
+    for typ, start, end in _iter_boxes(buf, *moov):
+        if typ != b"trak" or not (mdia := _find_box(buf, start, end, b"mdia")):
+            continue
+        hdlr = _find_box(buf, *mdia, b"hdlr")
+        if not hdlr or buf[hdlr[0] + 8 : hdlr[0] + 12] != b"vide":
+            continue
+        timescale = None
+        if mdhd := _find_box(buf, *mdia, b"mdhd"):
+            timescale = struct.unpack_from(">I", buf, mdhd[0] + (20 if buf[mdhd[0]] == 1 else 12))[0]
+        if not (minf := _find_box(buf, *mdia, b"minf")) or not (
+            stbl := _find_box(buf, *minf, b"stbl")
+        ):
+            continue
+        codec = width = height = fps = None
+        if stsd := _find_box(buf, *stbl, b"stsd"):
+            for entry, e_start, _ in _iter_boxes(buf, stsd[0] + 8, stsd[1]):
+                codec = _MP4_CODECS.get(entry, entry.decode("latin-1"))
+                width, height = struct.unpack_from(">HH", buf, e_start + 24)
+                break
+        if (stts := _find_box(buf, *stbl, b"stts")) and timescale:
+            count = struct.unpack_from(">I", buf, stts[0] + 4)[0]
+            samples = duration = 0
+            for i in range(min(count, 1024)):
+                n, delta = struct.unpack_from(">II", buf, stts[0] + 8 + i * 8)
+                samples += n
+                duration += n * delta
+            if duration:
+                fps = samples * timescale / duration
+        return ProbeResult("mp4", codec, width, height, fps)
+    return ProbeResult("mp4", None, None, None, None)
+
+
+_MKV_CODECS: dict[str, str] = {
+    "V_MPEG4/ISO/AVC": "h264",
+    "V_MPEGH/ISO/HEVC": "h265",
+    "V_AV1": "av1",
+}
+
+
+def _read_vint(buf: mmap.mmap, off: int, keep_marker: bool) -> tuple[int, int]:
+    first = buf[off]
+    length = 1
+    while length <= 8 and not first & (0x80 >> (length - 1)):
+        length += 1
+    if length > 8:
+        raise ValueError("Invalid EBML variable length integer")
+    val = first if keep_marker else first & (0xFF >> length)
+    for b in buf[off + 1 : off + length]:
+        val = (val << 8) | b
+    if not keep_marker and val == (1 << (7 * length)) - 1:
+        val = -1  # unknown size
+    return val, off + length
+
+
+def _iter_ebml(buf: mmap.mmap, start: int, end: int) -> Iterator[tuple[int, int, int]]:
+    """
+    Yields (id, data start, data end) of the EBML elements between `start` and `end`.
+    """
+    off = start
+    while off < end:
+        eid, off = _read_vint(buf, off, True)
+        size, off = _read_vint(buf, off, False)
+        data_end = end if size < 0 else min(off + size, end)
+        yield eid, off, data_end
+        off = data_end
+
+
+def _probe_mkv(buf: mmap.mmap) -> Optional[ProbeResult]:
+    if buf[:4] != b"\x1a\x45\xdf\xa3":
+        return None
+    container = None
+    for eid, start, end in _iter_ebml(buf, 0, len(buf)):
+        if eid == 0x1A45DFA3:  # EBML header
+            for sub, s, e in _iter_ebml(buf, start, end):
+                if sub == 0x4282:  # DocType
+                    container = "mkv" if buf[s:e].rstrip(b"\0") in (b"matroska", b"webm") else None
+        elif eid == 0x18538067 and container:  # Segment
+            for sub, s, e in _iter_ebml(buf, start, end):
+                if sub == 0x1F43B675:  # Cluster, no track headers after this
+                    break
+                if sub != 0x1654AE6B:  # Tracks
+                    continue
+                for entry, es, ee in _iter_ebml(buf, s, e):
+                    if entry != 0xAE:  # TrackEntry
+                        continue
+                    track: dict[int, tuple[int, int]] = {
+                        tid: (ts, te) for tid, ts, te in _iter_ebml(buf, es, ee)
+                    }
+                    if 0x83 not in track or int.from_bytes(buf[slice(*track[0x83])], "big") != 1:
+                        continue
+                    codec_id = buf[slice(*track[0x86])].rstrip(b"\0").decode() if 0x86 in track else ""
+                    width = height = fps = None
+                    if 0xE0 in track:
+                        for vid, vs, ve in _iter_ebml(buf, *track[0xE0]):
+                            if vid == 0xB0:
+                                width = int.from_bytes(buf[vs:ve], "big")
+                            elif vid == 0xBA:
+                                height = int.from_bytes(buf[vs:ve], "big")
+                    if 0x23E383 in track:
+                        if default_duration := int.from_bytes(buf[slice(*track[0x23E383])], "big"):
+                            fps = 1e9 / default_duration
+                    return ProbeResult(
+                        "mkv", _MKV_CODECS.get(codec_id, codec_id or None), width, height, fps
+                    )
+            return ProbeResult("mkv", None, None, None, None)
+    return None
+
+
+_TS_PACKET = 188
+
+_TS_CODECS: dict[int, str] = {
+    0x1B: "h264",
+    0x24: "h265",
+}
+
+
+def _ts_payload(pkt: bytes) -> tuple[int, bool, bytes]:
+    pid = ((pkt[1] & 0x1F) << 8) | pkt[2]
+    pusi = bool(pkt[1] & 0x40)
+    afc = (pkt[3] >> 4) & 0x3
+    off = 4
+    if afc & 0x2:
+        off += 1 + pkt[4]
+    return pid, pusi, pkt[off:] if afc & 0x1 else b""
+
+
+def _probe_ts(buf: mmap.mmap) -> Optional[ProbeResult]:
+    if len(buf) < 2 * _TS_PACKET or buf[0] != 0x47 or buf[_TS_PACKET] != 0x47:
+        return None
+    pmt_pids: set[int] = set()
+    video_pid: Optional[int] = None
+    codec: Optional[str] = None
+    es = bytearray()
+    for off in range(0, min(len(buf), TS_SCAN_LIMIT) - _TS_PACKET + 1, _TS_PACKET):
+        pid, pusi, payload = _ts_payload(buf[off : off + _TS_PACKET])
+        if pid == 0 and pusi and not pmt_pids:
+            sec = payload[1 + payload[0] :]
+            length = ((sec[1] & 0x0F) << 8) | sec[2]
+            for i in range(8, 3 + length - 4, 4):
+                program, pmt_pid = struct.unpack_from(">HH", sec, i)
+                if program:
+                    pmt_pids.add(pmt_pid & 0x1FFF)
+        elif pid in pmt_pids and pusi and video_pid is None:
+            sec = payload[1 + payload[0] :]
+            length = ((sec[1] & 0x0F) << 8) | sec[2]
+            i = 12 + (((sec[10] & 0x0F) << 8) | sec[11])
+            while i < 3 + length - 4:
+                stream_type = sec[i]
+                es_pid = ((sec[i + 1] & 0x1F) << 8) | sec[i + 2]
+                es_info_len = ((sec[i + 3] & 0x0F) << 8) | sec[i + 4]
+                descriptors = sec[i + 5 : i + 5 + es_info_len]
+                if stream_type in _TS_CODECS:
+                    codec = _TS_CODECS[stream_type]
+                elif stream_type == 0x06 and b"AV01" in descriptors:
+                    codec = "av1"
+                if codec:
+                    video_pid = es_pid
+                    break
+                i += 5 + es_info_len
+        elif pid == video_pid and codec == "h264":
+            if pusi and payload[:3] == b"\x00\x00\x01":
+                payload = payload[9 + payload[8] :]
+            es += payload
+            # look for an SPS NAL unit (type 7), the following start code marks its end
+            pos = es.find(b"\x00\x00\x01")
+            while 0 <= pos < len(es) - 3 and es[pos + 3] & 0x1F != 7:
+                pos = es.find(b"\x00\x00\x01", pos + 3)
+            if pos >= 0 and (nal_end := es.find(b"\x00\x00\x01", pos + 4)) >= 0:
+                try:
+                    width, height, fps = _parse_h264_sps(bytes(es[pos + 3 : nal_end]))
+                    return ProbeResult("ts", codec, width, height, fps)
+                except IndexError:
+                    break
+        if video_pid is not None and codec != "h264":
+            break
+    return ProbeResult("ts", codec, None, None, None)
+
+
+@lru_cache(maxsize=32)
+def _probe(path: str, _size: int, _mtime: int) -> Optional[ProbeResult]:
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            for probe in (_probe_mp4, _probe_mkv, _probe_ts):
+                try:
+                    if result := probe(buf):
+                        return result
+                except (struct.error, IndexError, ValueError, UnicodeDecodeError):
+                    continue
+    return None
+
+
+def probe_container(video_file: str) -> Optional[ProbeResult]:
+    """
+    Reads the codec, resolution, frame rate and demuxer of a video file from its container
+    headers without decoding any frames.
+
+    Supports MP4/MOV, Matroska/WebM and MPEG-TS. The file is memory mapped and only the
+    header structures are touched, so only a few KB are read even for large files.
+
+    Returns:
+        ProbeResult: the detected stream info, or None if the container isn't recognized
+    """
+    try:
+        st = os.stat(video_file)
+        if not st.st_size:
+            return None
+        return _probe(os.path.realpath(video_file), st.st_size, st.st_mtime_ns)
+    except OSError:
+        return None
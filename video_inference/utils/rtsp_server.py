@@ -0,0 +1,130 @@
+"""
+Serve a videotestsrc pattern over RTSP, a stand-in stream for testing the RTSP demos.
+
+Requires the GStreamer RTSP server library and its Python bindings (gir1.2-gst-rtsp-server-1.0).
+"""
+
+import argparse
+
+try:
+    import gi
+
+    gi.require_version("Gst", "1.0")
+    gi.require_version("GstRtspServer", "1.0")
+    from gi.repository import GLib, Gst, GstRtspServer
+except (ImportError, ValueError):
+    GstRtspServer = None
+
+from utils.user_input import validate_inp_dims
+
+
+__all__ = [
+    "make_launch",
+    "serve",
+    "RTP_PAYLOADERS",
+    "TEST_ENCODERS",
+]
+
+# software encoders for the test stream, tuned for low delay
+TEST_ENCODERS: dict[str, str] = {
+    "av1": "av1enc usage-profile=realtime cpu-used=8",
+    "h264": "x264enc tune=zerolatency speed-preset=ultrafast key-int-max=30",
+    "h265": "x265enc tune=zerolatency speed-preset=ultrafast key-int-max=30",
+}
+
+# RTP payloaders matching `RTP_DEPAYLOADERS`
+RTP_PAYLOADERS: dict[str, str] = {
+    "av1": "rtpav1pay",
+    "h264": "rtph264pay config-interval=-1",
+    "h265": "rtph265pay config-interval=-1",
+}
+
+
+def make_launch(codec: str, width: int, height: int, fps: int, pattern: str = "ball") -> str:
+    """
+    Returns the RTSP media factory launch line for a test stream.
+    """
+    if codec not in TEST_ENCODERS:
+        raise SystemExit(f'Fatal: invalid codec "{codec}", choose from [{" / ".join(TEST_ENCODERS)}]')
+    return (
+        f"( videotestsrc is-live=true pattern={pattern} "
+        f"! video/x-raw,width={width},height={height},framerate={fps}/1 "
+        f"! videoconvert ! {TEST_ENCODERS[codec]} ! {RTP_PAYLOADERS[codec]} name=pay0 pt=96 )"
+    )
+
+
+def serve(
+    codec: str = "h264",
+    width: int = 640,
+    height: int = 480,
+    fps: int = 30,
+    port: int = 8554,
+    mount: str = "/test",
+    pattern: str = "ball",
+) -> None:
+    """
+    Serves the test stream at rtsp://127.0.0.1:`port``mount` until interrupted.
+    """
+    if GstRtspServer is None:
+        raise SystemExit("Fatal: the GStreamer RTSP server Python bindings are not installed")
+    Gst.init(None)
+    server = GstRtspServer.RTSPServer()
+    server.set_service(str(port))
+    factory = GstRtspServer.RTSPMediaFactory()
+    factory.set_launch(make_launch(codec, width, height, fps, pattern))
+    # all clients share one encoder
+    factory.set_shared(True)
+    server.get_mount_points().add_factory(mount, factory)
+    if server.attach(None) == 0:
+        raise SystemExit(f"Fatal: couldn't listen on port {port}")
+    print(f"\nServing {codec} {width}x{height}@{fps} at rtsp://127.0.0.1:{port}{mount}\n")
+    loop = GLib.MainLoop()
+    try:
+        loop.run()
+    except KeyboardInterrupt:
+        print("\nExiting...")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "-c", "--codec",
+        type=str,
+        choices=list(TEST_ENCODERS),
+        default="h264",
+        help="Stream codec (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-d", "--dims",
+        type=validate_inp_dims,
+        default="640x480",
+        metavar="WIDTHxHEIGHT",
+        help="Stream size (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--fps",
+        type=int,
+        default=30,
+        help="Stream frame rate (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-p", "--port",
+        type=int,
+        default=8554,
+        help="RTSP port (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--mount",
+        type=str,
+        default="/test",
+        help="Stream path (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--pattern",
+        type=str,
+        default="ball",
+        help="videotestsrc pattern (default: %(default)s)",
+    )
+    args = parser.parse_args()
+    width, height = [int(d) for d in args.dims.split("x")]
+    serve(args.codec, width, height, args.fps, args.port, args.mount, args.pattern)
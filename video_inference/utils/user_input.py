@@ -1,9 +1,11 @@
 from argparse import ArgumentTypeError
-from typing import Optional
-import subprocess
+from typing import Any, Optional
 
+from gst.rtsp import DEFAULT_RTSP_PROFILE
 from gst.validator import GstInputValidator
 from utils.camera import find_valid_camera_devices
+from utils.model_registry import ModelRegistry
+from utils.probe import probe_container
 from utils.common import InputType, CAM_DEV_PREFIX, CAM_DEFAULT_WIDTH, CAM_DEFAULT_HEIGHT, CODECS
 
 
@@ -15,8 +17,10 @@ __all__ = [
     "get_int_prop",
     "get_inp_type",
     "get_inp_src_info",
+    "detect_codec",
     "get_inf_model",
     "validate_inp_dims",
+    "validate_model_spec",
 ]
 
 
@@ -125,11 +129,21 @@ def get_inp_src_info(
     inp_src: Optional[str],
     inp_codec: Optional[str],
     inp_type: Optional[InputType] = None,
+    *,
+    use_cache: bool = True,
+    refresh_cache: bool = False,
+    rtsp_profile: str = DEFAULT_RTSP_PROFILE,
 ) -> Optional[tuple[int, str, str, tuple[str, str]]]:
     """
     Gets codec details from a provided input source.
 
     Prompts user for missing information and also validates the input source.
+    Inputs that passed validation recently are not validated again unless `use_cache`
+    is False or `refresh_cache` is True.
+
+    The codec of video files is detected from their container headers if `inp_codec` is
+    None or "auto", for RTSP streams "auto" means h264. RTSP streams are validated with
+    the `rtsp_profile` they will run with.
     """
     inp_src: str = inp_src or input("Input source: ")
     if not inp_type:
@@ -138,14 +152,22 @@ def get_inp_src_info(
         except FileNotFoundError:
             print(f"\nERROR: Invalid input source \"{inp_src}\"\n")
             return None
-    gst_val: GstInputValidator = GstInputValidator(inp_type)
+    gst_val: GstInputValidator = GstInputValidator(
+        inp_type, use_cache=use_cache, refresh_cache=refresh_cache, rtsp_profile=rtsp_profile
+    )
     codec_elems: Optional[tuple[str, str]] = None
     try:
         if inp_type == InputType.CAMERA:
             inp_codec = None
             if inp_src.lower() == "auto":
                 print("Finding valid camera device...")
-                valid_devs = find_valid_camera_devices(inp_w or CAM_DEFAULT_WIDTH, inp_h or CAM_DEFAULT_HEIGHT)
+                valid_devs = find_valid_camera_devices(
+                    inp_w or CAM_DEFAULT_WIDTH,
+                    inp_h or CAM_DEFAULT_HEIGHT,
+                    first_only=True,
+                    use_cache=use_cache,
+                    refresh_cache=refresh_cache,
+                )
                 if not valid_devs:
                     print("\nNo camera connected to board\n")
                     return None
@@ -156,6 +178,10 @@ def get_inp_src_info(
                 f'ERROR: Invalid camera "{inp_src}", use `v4l2-ctl --list-devices` to verify device'
             )
         elif inp_type == InputType.FILE or inp_type == InputType.RTSP:
+            if inp_type == InputType.FILE and inp_codec in (None, "auto"):
+                inp_codec = detect_codec(inp_src)
+            elif inp_codec == "auto":
+                inp_codec = "h264"
             inp_codec = inp_codec or (
                 input("[Optional] Codec [av1 / h264 (default) / h265]: ") or "h264"
             )
@@ -183,34 +209,43 @@ def get_inp_src_info(
         )
 
 
-def get_inf_model(model: Optional[str]) -> str:
+def detect_codec(video_file: str) -> Optional[str]:
+    """
+    Detects the codec of a video file from its container headers.
+
+    Returns None if the container or codec isn't supported.
+    """
+    if not (probe := probe_container(video_file)):
+        return None
+    if probe.codec not in CODECS:
+        print(f'\nUnsupported codec "{probe.codec}" in {video_file}\n')
+        return None
+    details = f"{probe.width}x{probe.height}" if probe.width and probe.height else ""
+    if probe.fps:
+        details += f" @ {probe.fps:.2f} fps"
+    print(f"Detected {probe.codec} video ({probe.container}) {details}".rstrip())
+    return probe.codec
+
+
+def get_inf_model(model: Optional[str], refresh_cache: bool = False) -> str:
     """
     Gets a valid model by verifying model with synap_cli.
 
+    Models that were validated before are looked up in the model registry instead.
     Prompts user for model file if `model` is None.
     """
+    registry = ModelRegistry()
     while True:
-        try:
-            if not model:
-                model: str = input("Model file path: ")
-            print("Validating model...")
-            # fmt: off
-            subprocess.run(
-                [
-                    "synap_cli",
-                    "-m", model,
-                    "random"
-                ],
-                check=True,
-                capture_output=True
-            )
-            # fmt: on
-            print("Model OK")
+        if not model:
+            model: str = input("Model file path: ")
+        print("Validating model...")
+        valid, error, cached = registry.validate(model, refresh_cache)
+        if valid:
+            print("Model OK (cached)" if cached else "Model OK")
             return model
-        except subprocess.CalledProcessError as e:
-            print("\n" + e.stderr.decode())
-            print(f'\nERROR: Invalid SyNAP model "{model}"\n')
-            model = None
+        print("\n" + error)
+        print(f'\nERROR: Invalid SyNAP model "{model}"\n')
+        model = None
 
 
 def validate_inp_dims(dims: Optional[str]) -> str:
@@ -230,3 +265,36 @@ def validate_inp_dims(dims: Optional[str]) -> str:
         raise ArgumentTypeError(
             "Input size must be WIDTHxHEIGHT, where both are integers."
         )
+
+
+# options of a model spec and their types
+_MODEL_SPEC_OPTIONS: dict[str, type] = {
+    "labels": str,
+    "threshold": float,
+    "interval": int,
+    "max": int,
+}
+
+
+def validate_model_spec(spec: str) -> dict[str, Any]:
+    """
+    Helper function to validate a model spec from a command line arg.
+
+    A spec is a model file optionally followed by comma separated options, e.g.
+    "pose.synap,labels=pose.json,threshold=0.4,interval=2,max=3".
+    """
+    model, *options = spec.split(",")
+    if not model:
+        raise ArgumentTypeError("Model spec must start with a model file.")
+    parsed: dict[str, Any] = {"model": model}
+    for option in options:
+        key, sep, value = option.partition("=")
+        if not sep or key not in _MODEL_SPEC_OPTIONS:
+            raise ArgumentTypeError(
+                f'Invalid model option "{option}", expected one of {", ".join(f"{k}=" for k in _MODEL_SPEC_OPTIONS)}'
+            )
+        try:
+            parsed[key] = _MODEL_SPEC_OPTIONS[key](value)
+        except ValueError:
+            raise ArgumentTypeError(f'Invalid value for model option "{key}": {value}')
+    return parsed